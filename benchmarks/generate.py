@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Generators for synthetic inputs shaped like the real kg-microbe sources, so the
+benchmarks can run at any scale without downloading anything:
+
+    -   condensed_traits_NCBI.csv (bacteria-archaea-traits) and environments.csv
+    -   OGER output TSVs for the CHEBI and GO annotation runs
+    -   chemicals/pathways SSSOM tables
+    -   small obographs JSON ontologies
+    -   KGX nodes/edges TSVs
+"""
+
+import csv
+import json
+import os
+import random
+from typing import Dict, List, Tuple
+
+import yaml
+
+
+TRAITS_SCHEMA = os.path.join('schemas', 'trait_condensed.yaml')
+
+METABOLISM = ['anaerobic', 'strictly anaerobic', 'obligate anaerobic', 'facultative',
+              'obligate aerobic', 'aerobic', 'microaerophilic', 'NA']
+CELL_SHAPES = ['bacillus', 'coccus', 'coccobacillus', 'filament', 'spiral', 'vibrio',
+               'pleomorphic', 'irregular', 'NA']
+MATCH_FIELDS = ['oio:hasExactSynonym', 'oio:hasRelatedSynonym', 'oio:hasBroadSynonym']
+
+OGER_COLUMNS = ['TaxId', 'Biolink', 'BeginTerm', 'EndTerm', 'TokenizedTerm',
+                'PreferredTerm', 'CURIE', 'NaN1', 'SentenceID', 'NaN2', 'UMLS_CUI']
+SSSOM_COLUMNS = ['subject_id', 'subject_label', 'predicate_id', 'object_id', 'object_label',
+                 'match_type', 'subject_source', 'object_source', 'mapping_tool', 'confidence',
+                 'subject_match_field', 'object_match_field', 'subject_category',
+                 'object_category', 'match_string', 'match_category', 'comment']
+OBO_PURL = 'http://purl.obolibrary.org/obo/'
+
+
+def traits_columns(schema_file: str = TRAITS_SCHEMA) -> List[str]:
+    """
+    Column names of condensed_traits_*.csv, taken from the traits LinkML schema.
+
+    :param schema_file: traits schema YAML [schemas/trait_condensed.yaml]
+    :return: list of column names
+    """
+
+    with open(schema_file) as f:
+        schema = yaml.load(f, Loader=yaml.FullLoader)
+    return schema['classes']['bacteria-archaea-traits']['slots']
+
+
+def vocabulary(n_substrates: int, n_pathways: int,
+               n_environments: int) -> Dict[str, List[str]]:
+    """
+    Term vocabularies that synthetic traits rows draw their values from.
+
+    :param n_substrates: number of distinct carbon substrates
+    :param n_pathways: number of distinct pathways
+    :param n_environments: number of distinct isolation sources
+    :return: dict of vocabulary name to terms
+    """
+
+    return {
+        'carbon_substrates': ['substrate %d' % i for i in range(n_substrates)],
+        'pathways': ['pathway_%d' % i for i in range(n_pathways)],
+        'isolation_source': ['host_environment_%d' % i for i in range(n_environments)],
+    }
+
+
+def _cell(rng: random.Random, terms: List[str], max_values: int,
+          na_fraction: float) -> str:
+    if rng.random() < na_fraction:
+        return 'NA'
+    return ', '.join(rng.sample(terms, rng.randint(1, min(max_values, len(terms)))))
+
+
+def generate_traits_csv(path: str, n_rows: int, vocab: Dict[str, List[str]],
+                        max_values_per_cell: int = 3, quote_fraction: float = 1.0,
+                        na_fraction: float = 0.2, seed: int = 0) -> List[Tuple[int, str, str]]:
+    """
+    Write a condensed_traits_NCBI.csv shaped file. Multi-valued cells are joined with
+    ', ' and quoted, as in the real file; quote_fraction of the other cells are
+    quoted too.
+
+    :param path: CSV file to write
+    :param n_rows: number of rows (one taxon per row)
+    :param vocab: vocabularies from vocabulary()
+    :param max_values_per_cell: largest number of values in a multi-valued cell [3]
+    :param quote_fraction: fraction of single-valued cells to quote [1.0]
+    :param na_fraction: fraction of multi-valued cells that are NA [0.2]
+    :param seed: random seed [0]
+    :return: (tax_id, column, term) for every multi-valued term written, for
+             generating matching OGER output
+    """
+
+    rng = random.Random(seed)
+    columns = traits_columns()
+    annotations = []
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        f.write(','.join('"%s"' % c for c in columns) + '\n')
+        for i in range(n_rows):
+            tax_id = 100000 + i
+            genus = 'Genus%d' % (i // 10)
+            row = {c: 'NA' for c in columns}
+            row.update({
+                'tax_id': str(tax_id), 'species_tax_id': str(tax_id),
+                'data_source': 'synthetic', 'org_name': '%s species%d' % (genus, i),
+                'species': '%s species%d' % (genus, i), 'genus': genus,
+                'metabolism': rng.choice(METABOLISM), 'cell_shape': rng.choice(CELL_SHAPES),
+                'ref_id': str(i),
+            })
+            for column in ['carbon_substrates', 'pathways', 'isolation_source']:
+                row[column] = _cell(rng, vocab[column], max_values_per_cell, na_fraction)
+                if row[column] != 'NA' and column != 'isolation_source':
+                    for term in row[column].split(', '):
+                        annotations.append((tax_id, column, term))
+            cells = []
+            for c in columns:
+                value = row[c]
+                if ',' in value or rng.random() < quote_fraction:
+                    value = '"%s"' % value
+                cells.append(value)
+            f.write(','.join(cells) + '\n')
+    return annotations
+
+
+def generate_environments_csv(path: str, vocab: Dict[str, List[str]],
+                              seed: int = 0) -> None:
+    """
+    Write an environments.csv conversion table (Type -> ENVO terms/ids) for the
+    isolation sources in vocab. Some types are left unmapped, as in the real table.
+
+    :param path: CSV file to write
+    :param vocab: vocabularies from vocabulary()
+    :param seed: random seed [0]
+    :return: None.
+    """
+
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Type', 'Environment', 'ENVO_terms', 'ENVO_ids'])
+        for i, source in enumerate(vocab['isolation_source']):
+            if rng.random() < 0.2:
+                writer.writerow([source, source, 'NA', 'NA'])
+            else:
+                writer.writerow([source, source, 'environment, environment %d' % i,
+                                 'ENVO:00000001, ENVO:%08d' % (1000 + i)])
+
+
+def _curie(prefix: str, i: int) -> str:
+    return '%s:%07d' % (prefix, i)
+
+
+def generate_oger_output(path: str, annotations: List[Tuple[int, str, str]], column: str,
+                         prefix: str, biolink: str, exact_fraction: float = 0.7,
+                         seed: int = 0) -> None:
+    """
+    Write an OGER output TSV (as read by nlp_utils.process_oger_output) annotating the
+    given column's terms. exact_fraction of terms get an exact PreferredTerm match;
+    the rest get a partial match that is resolved through the SSSOM table.
+
+    :param path: TSV file to write, e.g. data/nlp/output/nlpCHEBI.tsv
+    :param annotations: (tax_id, column, term) from generate_traits_csv()
+    :param column: which column's terms to annotate
+    :param prefix: CURIE prefix of the ontology, e.g. 'CHEBI'
+    :param biolink: biolink category of the matched terms
+    :param exact_fraction: fraction of terms that match exactly [0.7]
+    :param seed: random seed [0]
+    :return: None.
+    """
+
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        for n, (tax_id, col, term) in enumerate(annotations):
+            if col != column:
+                continue
+            term = term.replace('_', ' ')
+            i = int(term.split()[-1])
+            preferred = term if rng.random() < exact_fraction else term + ' (ambiguous)'
+            f.write('\t'.join([str(tax_id), biolink, '0', str(len(term)), term, preferred,
+                               _curie(prefix, i), '', str(n), '', 'CUI-less']) + '\n')
+
+
+def generate_sssom(path: str, terms: List[str], prefix: str, seed: int = 0) -> None:
+    """
+    Write an SSSOM mapping table with one mapping per term, matching the CURIEs used
+    by generate_oger_output().
+
+    :param path: TSV file to write
+    :param terms: subject labels to map
+    :param prefix: CURIE prefix of the ontology, e.g. 'GO'
+    :param seed: random seed [0]
+    :return: None.
+    """
+
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('#license: "https://creativecommons.org/publicdomain/zero/1.0/"\n')
+        f.write('#mapping_tool: "synthetic"\n')
+        f.write('\t'.join(SSSOM_COLUMNS) + '\n')
+        for term in terms:
+            i = int(term.replace('_', ' ').split()[-1])
+            row = {c: '.' for c in SSSOM_COLUMNS}
+            row.update({'subject_id': 'external_resource:' + term, 'subject_label': term,
+                        'predicate_id': 'owl:equivalentClass',
+                        'object_id': _curie(prefix, i), 'object_label': term + ' label',
+                        'object_match_field': rng.choice(MATCH_FIELDS),
+                        'match_category': 'unique'})
+            f.write('\t'.join(row[c] for c in SSSOM_COLUMNS) + '\n')
+
+
+def generate_obograph_json(path: str, prefix: str, n_nodes: int, branching: int = 4,
+                           extra_parent_fraction: float = 0.1, seed: int = 0) -> None:
+    """
+    Write a small obographs JSON ontology: a tree of is_a edges with some extra
+    parents (making it a DAG), labels, synonyms and definitions.
+
+    :param path: JSON file to write
+    :param prefix: ID prefix, e.g. 'CHEBI'
+    :param n_nodes: number of classes
+    :param branching: children per class in the underlying tree [4]
+    :param extra_parent_fraction: fraction of classes given a second parent [0.1]
+    :param seed: random seed [0]
+    :return: None.
+    """
+
+    rng = random.Random(seed)
+
+    def iri(i: int) -> str:
+        return '%s%s_%07d' % (OBO_PURL, prefix, i)
+
+    nodes, edges = [], []
+    for i in range(n_nodes):
+        nodes.append({'id': iri(i), 'lbl': '%s term %d' % (prefix.lower(), i), 'type': 'CLASS',
+                      'meta': {'definition': {'val': 'Synthetic term %d.' % i},
+                               'synonyms': [{'pred': 'hasExactSynonym',
+                                             'val': '%s synonym %d' % (prefix.lower(), i)}]}})
+        if i > 0:
+            edges.append({'sub': iri(i), 'pred': 'is_a', 'obj': iri((i - 1) // branching)})
+            if i > 1 and rng.random() < extra_parent_fraction:
+                other = rng.randrange(0, i)
+                if other != (i - 1) // branching:
+                    edges.append({'sub': iri(i), 'pred': 'is_a', 'obj': iri(other)})
+    with open(path, 'w') as f:
+        json.dump({'graphs': [{'id': OBO_PURL + prefix.lower() + '.owl',
+                               'nodes': nodes, 'edges': edges}]}, f)
+
+
+def generate_kgx(nodes_path: str, edges_path: str, n_nodes: int, edges_per_node: int = 3,
+                 provided_by: str = 'synthetic', seed: int = 0) -> None:
+    """
+    Write KGX nodes/edges TSVs for a random graph, for merge/stats/holdout benchmarks.
+
+    :param nodes_path: nodes TSV to write
+    :param edges_path: edges TSV to write
+    :param n_nodes: number of nodes
+    :param edges_per_node: average number of edges per node [3]
+    :param provided_by: provided_by value for all rows ['synthetic']
+    :param seed: random seed [0]
+    :return: None.
+    """
+
+    rng = random.Random(seed)
+    with open(nodes_path, 'w') as f:
+        f.write('id\tname\tcategory\tprovided_by\n')
+        for i in range(n_nodes):
+            f.write('NCBITaxon:%d\ttaxon %d\tbiolink:OrganismTaxon\t%s\n' % (i, i, provided_by))
+    with open(edges_path, 'w') as f:
+        f.write('subject\tpredicate\tobject\trelation\tprovided_by\n')
+        for i in range(1, n_nodes):
+            f.write('NCBITaxon:%d\tbiolink:subclass_of\tNCBITaxon:%d\trdfs:subClassOf\t%s\n'
+                    % (i, rng.randrange(0, i), provided_by))
+        for _ in range(max(0, n_nodes * (edges_per_node - 1))):
+            f.write('NCBITaxon:%d\tbiolink:interacts_with\tNCBITaxon:%d\tRO:0002438\t%s\n'
+                    % (rng.randrange(n_nodes), rng.randrange(n_nodes), provided_by))
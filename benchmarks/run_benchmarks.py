@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the kg-microbe pipeline stages on synthetic inputs (see generate.py):
+
+    python -m benchmarks.run_benchmarks -s 1 -s 10 -s 100 -o bench_results.json
+
+Each benchmark runs in a fresh process in a scratch working directory, so timings
+and peak RSS are not polluted by earlier runs. External tools are not needed: the
+ROBOT steps of the traits transform are skipped and OGER's output is replaced with
+a synthetic one, so only kg-microbe's own code is timed. Results are written as
+JSON; --compare flags benchmarks that got slower than an earlier results file.
+"""
+
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+
+import click
+import yaml
+
+from benchmarks import generate
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASE_ROWS = 1000
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_THRESHOLD = 0.2
+# seconds between checks that a benchmark's process is still alive
+POLL_SECONDS = 1.0
+
+
+class BenchmarkSkipped(Exception):
+    """Raised by a benchmark that cannot run in this environment."""
+
+
+def _require(module: str) -> None:
+    try:
+        importlib.import_module(module)
+    except Exception as e:
+        raise BenchmarkSkipped("cannot import {}: {!r}".format(module, e))
+
+
+def setup_workdir(workdir: str, rows: int, seed: int = 0) -> None:
+    """
+    Lay out synthetic traits inputs the way the traits transform expects them,
+    relative to workdir: data/raw, data/nlp/output, schemas and stopwords.yaml.
+
+    :param workdir: scratch directory to populate
+    :param rows: number of traits rows
+    :param seed: random seed [0]
+    :return: None.
+    """
+
+    raw_dir = os.path.join(workdir, 'data', 'raw')
+    schema_dir = os.path.join(workdir, 'schemas')
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(schema_dir, exist_ok=True)
+    shutil.copy(os.path.join(REPO_DIR, 'stopwords.yaml'), workdir)
+    shutil.copy(os.path.join(REPO_DIR, generate.TRAITS_SCHEMA), schema_dir)
+    shutil.copy(os.path.join(REPO_DIR, 'schemas', 'trait_mappings.yaml'), schema_dir)
+
+    vocab = generate.vocabulary(n_substrates=max(20, rows // 10), n_pathways=max(20, rows // 20),
+                                n_environments=max(10, rows // 50))
+    annotations = generate.generate_traits_csv(
+        os.path.join(raw_dir, 'condensed_traits_NCBI.csv'), rows, vocab, seed=seed)
+    generate.generate_environments_csv(os.path.join(raw_dir, 'environments.csv'), vocab, seed=seed)
+
+    nlp_output = os.path.join(workdir, 'data', 'nlp', 'output')
+    generate.generate_oger_output(os.path.join(nlp_output, 'nlpCHEBI.tsv'), annotations,
+                                  'carbon_substrates', 'CHEBI', 'biolink:ChemicalSubstance',
+                                  seed=seed)
+    generate.generate_oger_output(os.path.join(nlp_output, 'nlpGO.tsv'), annotations,
+                                  'pathways', 'GO', 'biolink:BiologicalProcess', seed=seed)
+    generate.generate_sssom(os.path.join(schema_dir, 'chemicals.sssom.tsv'),
+                            vocab['carbon_substrates'], 'CHEBI', seed=seed)
+    generate.generate_sssom(os.path.join(schema_dir, 'pathways.sssom.tsv'),
+                            vocab['pathways'], 'GO', seed=seed)
+    for prefix in ['CHEBI', 'GO']:
+        generate.generate_obograph_json(os.path.join(raw_dir, prefix.lower() + '.json'),
+                                        prefix, n_nodes=rows, seed=seed)
+
+
+def bench_traits_transform(workdir: str, rows: int) -> int:
+    _require('kg_microbe.transform_utils.traits.traits')
+    traits = importlib.import_module('kg_microbe.transform_utils.traits.traits')
+    setup_workdir(workdir, rows)
+
+    # no ROBOT or OGER here: skip the conversions and read the synthetic OGER output
+    traits.convert_to_json = lambda *args, **kwargs: None
+    traits.extract_convert_to_json = lambda *args, **kwargs: None
+    traits.create_termlist = lambda *args, **kwargs: None
+    traits.run_oger = lambda path, input_file_name, n_workers=1, load=True: \
+        traits.process_oger_output(path, input_file_name) if load else None
+
+    t = traits.TraitsTransform(os.path.join('data', 'raw'), os.path.join('data', 'transformed'))
+    t.run()
+    return rows
+
+
+def bench_termlist_build(workdir: str, rows: int) -> int:
+    _require('kg_microbe.utils.nlp_utils')
+    from kg_microbe.utils.nlp_utils import create_termlist
+
+    raw_dir = os.path.join(workdir, 'data', 'raw')
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(os.path.join(workdir, 'data', 'nlp', 'terms'), exist_ok=True)
+    generate.generate_obograph_json(os.path.join(raw_dir, 'chebi.json'), 'CHEBI', n_nodes=rows)
+    create_termlist(raw_dir, 'chebi')
+    return rows
+
+
+def _synthetic_kgx(workdir: str, rows: int, sources: int = 2) -> List[List[str]]:
+    files = []
+    for i in range(sources):
+        nodes = os.path.join(workdir, 'source%d_nodes.tsv' % i)
+        edges = os.path.join(workdir, 'source%d_edges.tsv' % i)
+        generate.generate_kgx(nodes, edges, rows, provided_by='source%d' % i, seed=i)
+        files.append([nodes, edges])
+    return files
+
+
+def bench_merge(workdir: str, rows: int) -> int:
+    _require('kgx.cli.cli_utils')
+    from kg_microbe.merge_utils.merge_kg import load_and_merge
+
+    config = {
+        'configuration': {'output_directory': os.path.join(workdir, 'merged'),
+                          'checkpoint': False},
+        'merged_graph': {
+            'name': 'benchmark graph',
+            'source': {'source%d' % i: {'input': {'name': 'source%d' % i, 'format': 'tsv',
+                                                  'filename': files}}
+                       for i, files in enumerate(_synthetic_kgx(workdir, rows))},
+            'destination': {'merged-kg-tsv': {'format': 'tsv',
+                                              'filename': os.path.join(workdir, 'merged', 'kg')}},
+        },
+    }
+    config_file = os.path.join(workdir, 'merge.yaml')
+    with open(config_file, 'w') as f:
+        yaml.dump(config, f)
+    load_and_merge(config_file)
+    return rows * 2
+
+
+def bench_stats(workdir: str, rows: int) -> int:
+    _require('kgx.cli.cli_utils')
+    from kgx.cli.cli_utils import graph_summary
+
+    files = _synthetic_kgx(workdir, rows, sources=1)[0]
+    graph_summary(inputs=files, input_format='tsv', input_compression=None,
+                  output=os.path.join(workdir, 'stats.yaml'), report_type='kgx-map')
+    return rows
+
+
+def bench_taxonomy_subset(workdir: str, rows: int) -> int:
+    _require('kg_microbe.utils.taxonomy_utils')
+    from kg_microbe.utils.obograph_utils import EDGE_COLUMNS, NODE_COLUMNS, obograph_to_tsv
+    from kg_microbe.utils.taxonomy_utils import subset_taxonomy
+    from kg_microbe.utils.transform_utils import NodeEdgeWriter
+
+    json_file = os.path.join(workdir, 'ncbitaxon.json')
+    generate.generate_obograph_json(json_file, 'NCBITaxon', n_nodes=rows * 10,
+                                    extra_parent_fraction=0)
+    nodes, edges = [os.path.join(workdir, 'ncbitaxon_%s.tsv' % k) for k in ['nodes', 'edges']]
+    with NodeEdgeWriter(nodes, edges, NODE_COLUMNS, EDGE_COLUMNS) as writer:
+        obograph_to_tsv(json_file, writer)
+    terms_file = os.path.join(workdir, 'subset_terms.tsv')
+    with open(terms_file, 'w') as f:
+        for i in range(0, rows * 10, 10):
+            f.write('NCBITaxon:%d\n' % i)
+    subset_taxonomy(nodes, edges, terms_file, os.path.join(workdir, 'subset_nodes.tsv'),
+                    os.path.join(workdir, 'subset_edges.tsv'))
+    return rows
+
+
+def bench_holdouts(workdir: str, rows: int) -> int:
+    try:
+        make_holdouts = importlib.import_module('kg_microbe.make_holdouts').make_holdouts
+    except ImportError as e:
+        raise BenchmarkSkipped("holdouts are not implemented: {!r}".format(e))
+    nodes, edges = _synthetic_kgx(workdir, rows, sources=1)[0]
+    make_holdouts(nodes=nodes, edges=edges, output_dir=os.path.join(workdir, 'holdouts'),
+                  train_fraction=0.8, validation=False)
+    return rows
+
+
+BENCHMARKS: Dict[str, Callable[[str, int], int]] = {
+    'traits_transform': bench_traits_transform,
+    'termlist_build': bench_termlist_build,
+    'merge': bench_merge,
+    'stats': bench_stats,
+    'taxonomy_subset': bench_taxonomy_subset,
+    'holdouts': bench_holdouts,
+}
+
+
+def _run_in_child(name: str, rows: int, queue: multiprocessing.Queue) -> None:
+    from kg_microbe.utils.profile_utils import profiler
+
+    result: Dict[str, Any] = {'status': 'ok'}
+    workdir = tempfile.mkdtemp(prefix='kg_microbe_bench_')
+    try:
+        os.chdir(workdir)
+        profiler.configure(enabled=True, output_dir=os.path.join(workdir, 'profile'))
+        with profiler.span('benchmark.' + name) as s:
+            result['rows'] = BENCHMARKS[name](workdir, rows)
+        result.update(s.as_dict())
+        result['spans'] = [x.as_dict() for x in profiler.spans[:-1]]
+    except BenchmarkSkipped as e:
+        result = {'status': 'skipped', 'reason': str(e)}
+    except Exception as e:
+        result = {'status': 'failed', 'reason': repr(e)}
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    queue.put(result)
+
+
+def wait_for_result(process: multiprocessing.Process, queue: multiprocessing.Queue,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Wait for the result of a benchmark process, which may die (OOM kill, segfault)
+    or hang without ever putting one.
+
+    :param process: started process of _run_in_child
+    :param queue: queue it puts its result in
+    :param timeout: seconds before the process is terminated [no limit]
+    :return: its result, or a failed result if it died or timed out
+    """
+
+    waited = 0.0
+    while True:
+        try:
+            return queue.get(timeout=POLL_SECONDS)
+        except queue_module.Empty:
+            waited += POLL_SECONDS
+        if not process.is_alive():
+            # it may have put its result just before exiting
+            try:
+                return queue.get(timeout=POLL_SECONDS)
+            except queue_module.Empty:
+                return {'status': 'failed',
+                        'reason': 'benchmark process exited with code {}'.format(
+                            process.exitcode)}
+        if timeout is not None and waited >= timeout:
+            process.terminate()
+            return {'status': 'failed', 'reason': 'timed out after {}s'.format(timeout)}
+
+
+def run_benchmark(name: str, rows: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run one benchmark in a fresh process.
+
+    :param name: a key of BENCHMARKS
+    :param rows: input size in rows
+    :param timeout: seconds before the benchmark is stopped and counted as failed [no limit]
+    :return: result dict with status, and timings if it ran
+    """
+
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_in_child, args=(name, rows, queue))
+    process.start()
+    try:
+        result = wait_for_result(process, queue, timeout)
+    finally:
+        process.join()
+    if result.get('status') == 'ok' and result.get('wall_seconds'):
+        result['rows_per_second'] = round(result['rows'] / result['wall_seconds'], 1)
+    result.update({'benchmark': name, 'input_rows': rows})
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict], baseline: List[Dict],
+            threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    Find benchmarks that are slower than in a baseline run.
+
+    :param results: benchmark results of this run
+    :param baseline: benchmark results of an earlier run
+    :param threshold: relative slowdown in wall time that counts as a regression [0.2]
+    :return: one message per regression
+    """
+
+    before = {(r['benchmark'], r['input_rows']): r for r in baseline if r.get('status') == 'ok'}
+    regressions = []
+    for r in results:
+        old = before.get((r['benchmark'], r['input_rows']))
+        if r.get('status') != 'ok' or old is None or not old['wall_seconds']:
+            continue
+        change = r['wall_seconds'] / old['wall_seconds'] - 1
+        if change > threshold:
+            regressions.append("{} x{} rows: {:.2f}s -> {:.2f}s (+{:.0%})".format(
+                r['benchmark'], r['input_rows'], old['wall_seconds'], r['wall_seconds'], change))
+    return regressions
+
+
+@click.command()
+@click.option('scales', '-s', '--scale', type=int, multiple=True,
+              help='scale factors to run, as multiples of --base-rows [1, 10, 100]')
+@click.option('names', '-b', '--benchmark', type=click.Choice(list(BENCHMARKS)), multiple=True,
+              help='benchmarks to run [all]')
+@click.option('base_rows', '--base-rows', default=DEFAULT_BASE_ROWS,
+              help='input rows at scale 1 [{}]'.format(DEFAULT_BASE_ROWS))
+@click.option('output', '-o', '--output', default='bench_results.json',
+              help='results JSON file [bench_results.json]')
+@click.option('baseline', '--compare', default=None,
+              help='earlier results JSON to check for regressions')
+@click.option('threshold', '--threshold', default=DEFAULT_THRESHOLD,
+              help='relative slowdown counted as a regression [{}]'.format(DEFAULT_THRESHOLD))
+@click.option('timeout', '--timeout', default=None, type=float,
+              help='seconds before a benchmark is stopped and counted as failed [no limit]')
+def main(scales: List[int], names: List[str], base_rows: int, output: str,
+         baseline: Optional[str], threshold: float, timeout: Optional[float]) -> None:
+    results = []
+    for name in names or list(BENCHMARKS):
+        for scale in scales or DEFAULT_SCALES:
+            result = run_benchmark(name, base_rows * scale, timeout)
+            result['scale'] = scale
+            results.append(result)
+            click.echo("{:<18} x{:<4} {:<8} {}".format(
+                name, scale, result['status'],
+                "{:.2f}s {} MB".format(result['wall_seconds'], result['peak_rss_mb'])
+                if result['status'] == 'ok' else result.get('reason', '')))
+
+    with open(output, 'w') as f:
+        json.dump({'commit': git_commit(), 'python': platform.python_version(),
+                   'platform': platform.platform(), 'base_rows': base_rows,
+                   'results': results}, f, indent=2)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)['results'], threshold)
+        for message in regressions:
+            click.echo("REGRESSION " + message)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,16 @@
 import importlib
 import logging
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional, TYPE_CHECKING
 import yaml
-import networkx as nx
-from kgx.cli.cli_utils import merge
+
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.transform_utils import TransformError
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+MERGE_ENGINES = ['auto', 'kgx', 'arrow']
 
 
 def parse_load_config(yaml_file: str) -> Dict:
@@ -22,16 +28,158 @@ def parse_load_config(yaml_file: str) -> Dict:
     return config
 
 
-def load_and_merge(yaml_file: str, processes: int = 1) -> nx.MultiDiGraph:
+def tsv_destination_files(config: Dict) -> Dict[str, List[str]]:
+    """Find the node and edge TSVs written for the uncompressed TSV destinations of a merge.
+
+    Args:
+        config: The merge config, as parsed by parse_load_config.
+
+    Returns:
+        Dict[str, List[str]]: The files of each destination filename prefix.
+
+    """
+    output_dir = config['configuration']['output_directory']
+    destinations = {}
+    for name, destination in config['merged_graph'].get('destination', {}).items():
+        if destination.get('format') != 'tsv' or destination.get('compression'):
+            continue
+        for prefix in destination['filename']:
+            files = [os.path.join(output_dir, '{}_{}.tsv'.format(prefix, kind))
+                     for kind in ['nodes', 'edges']]
+            files = [f for f in files if os.path.isfile(f)]
+            if not files:
+                logging.warning("No TSVs of destination {}".format(name))
+                continue
+            destinations[prefix] = files
+    return destinations
+
+
+def package_destinations(config: Dict, fmt: str, threads: Optional[int] = None) -> List[str]:
+    """Compress the uncompressed TSV destinations of a merge in parallel.
+
+    KGX's own tar.gz compression is single-threaded; leaving the compression out of a
+    TSV destination and packaging it with this instead gives the same tar.gz members
+    (see kg_microbe.utils.package_utils), written using all cores.
+
+    Args:
+        config: The merge config, as parsed by parse_load_config.
+        fmt: One of package_utils.PACKAGE_FORMATS, e.g. tar.gz.
+        threads: Compression threads (default: the number of CPUs).
+
+    Returns:
+        List[str]: The archives written.
+
+    """
+    from kg_microbe.utils.package_utils import package_files
+
+    output_dir = config['configuration']['output_directory']
+    archives = []
+    for prefix, files in tsv_destination_files(config).items():
+        manifest = package_files(files, output_dir, prefix, fmt, threads=threads)
+        archives.extend(os.path.join(output_dir, a['name']) for a in manifest['archives'])
+    return archives
+
+
+def merge_engine(config: Dict, engine: str = 'auto') -> str:
+    """Choose how to merge the sources of a merge config.
+
+    With 'auto', KGX merges configs of TSV (or other KGX format) sources, and Arrow
+    (see kg_microbe.utils.arrow_merge_utils) those with Parquet or Arrow IPC sources,
+    which KGX can't read.
+
+    Args:
+        config: The merge config, as parsed by parse_load_config.
+        engine: One of MERGE_ENGINES.
+
+    Returns:
+        str: kgx or arrow.
+
+    """
+    from kg_microbe.utils.arrow_merge_utils import ARROW_FORMATS, arrow_merge_problems
+
+    if engine not in MERGE_ENGINES:
+        raise ValueError("Unknown merge engine '{}', expected one of {}".format(
+            engine, MERGE_ENGINES))
+    if engine == 'auto':
+        engine = 'arrow' if any(source.get('input', source).get('format') in ARROW_FORMATS
+                                for source in config['merged_graph']['source'].values()) \
+            else 'kgx'
+    if engine == 'arrow':
+        problems = arrow_merge_problems(config)
+        if problems:
+            raise TransformError("Can't merge with Arrow: {}".format('; '.join(problems)))
+    return engine
+
+
+def load_and_merge(yaml_file: str, processes: int = 1,
+                   closure_index: Optional[str] = None,
+                   package: Optional[str] = None, sort: bool = False,
+                   parquet: bool = False, engine: str = 'auto') -> Optional['nx.MultiDiGraph']:
     """Load and merge sources defined in the config YAML.
 
     Args:
         yaml_file: A string pointing to a KGX compatible config YAML.
         processes: Number of processes to use.
+        closure_index: If given, a .npz file to save the subclass_of closure index
+            of the merged graph to (see kg_microbe.utils.closure_utils).
+        package: If given, a package format (e.g. tar.gz) to compress the uncompressed
+            TSV destinations to in parallel (see package_destinations).
+        sort: Whether to sort the uncompressed TSV destinations, nodes by id and edges
+            by (subject, predicate, object), before packaging them
+            (see kg_microbe.utils.sort_utils).
+        parquet: Whether to also write the uncompressed TSV destinations as partitioned
+            Parquet datasets, with a <filename>.duckdb database of views on them
+            (see kg_microbe.utils.parquet_utils).
+        engine: One of MERGE_ENGINES: merge with KGX, or with Arrow, reading Parquet and
+            Arrow IPC sources as they are and writing the TSV destinations at the end
+            (see merge_engine and kg_microbe.utils.arrow_merge_utils).
 
     Returns:
-        networkx.MultiDiGraph: The merged graph.
+        networkx.MultiDiGraph: The merged graph, or None if merged with Arrow.
 
     """
-    merged_graph = merge(yaml_file, processes=processes)
+    merged_graph = None
+    if merge_engine(parse_load_config(yaml_file), engine) == 'arrow':
+        from kg_microbe.utils.arrow_merge_utils import arrow_merge
+
+        arrow_merge(parse_load_config(yaml_file), threads=processes)
+        merged = True
+    else:
+        from kgx.cli.cli_utils import merge
+
+        with span('merge') as s:
+            merged_graph = merge(yaml_file, processes=processes)
+            if merged_graph is not None:
+                s.count('nodes_out', merged_graph.number_of_nodes())
+                s.count('edges_out', merged_graph.number_of_edges())
+        merged = merged_graph is not None
+    if closure_index and merged:
+        from kg_microbe.utils.closure_utils import ClosureIndex
+
+        edge_files = [f for files in tsv_destination_files(parse_load_config(yaml_file)).values()
+                      for f in files if f.endswith('_edges.tsv')]
+        if merged_graph is None and not edge_files:
+            raise TransformError("An Arrow merge builds the closure index from an uncompressed "
+                                 "TSV destination, and the merge config has none")
+        with span('merge.closure_index') as s:
+            index = ClosureIndex.from_graph(merged_graph) if merged_graph is not None \
+                else ClosureIndex.from_tsv(edge_files[0])
+            index.save(closure_index)
+            s.count('classes', len(index))
+        logging.info("Saved the subclass_of closure of {} classes to {}".format(
+            len(index), closure_index))
+    if sort and merged:
+        from kg_microbe.utils.sort_utils import sort_kgx_files
+
+        for files in tsv_destination_files(parse_load_config(yaml_file)).values():
+            sort_kgx_files(files, processes=processes)
+    if parquet and merged:
+        from kg_microbe.utils.parquet_utils import export_parquet
+
+        config = parse_load_config(yaml_file)
+        output_dir = config['configuration']['output_directory']
+        for prefix, files in tsv_destination_files(config).items():
+            export_parquet(files, database_file=os.path.join(output_dir, prefix + '.duckdb'))
+    if package and merged:
+        package_destinations(parse_load_config(yaml_file), package)
     return merged_graph
@@ -1,10 +1,37 @@
+import glob
+import gzip
 import logging
+import os
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.error import URLError
 
+import requests
 import yaml
 from SPARQLWrapper import SPARQLWrapper, JSON, XML, TURTLE, N3, RDF, RDFXML, CSV, TSV  # type: ignore
+from SPARQLWrapper.SPARQLExceptions import EndPointInternalError  # type: ignore
 
+from kg_microbe.utils.cache_utils import DEFAULT_PAGE_SIZE, QueryCache, query_cache_key
+from kg_microbe.utils.profile_utils import span
+
+
+SUMMARY_FILENAME = 'query_summary.tsv'
+SUMMARY_HEADER = ['query', 'endpoint', 'status', 'rows', 'seconds', 'error']
+
+# errors worth retrying: network trouble and endpoint-side failures (not bad queries)
+RETRYABLE_ERRORS = (URLError, EndPointInternalError, ConnectionError, socket.timeout,
+                    requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def run_query(query: str, endpoint: str, return_format=JSON,
+              session: Optional[requests.Session] = None) -> dict:
+    if session is not None:
+        return run_query_in_session(query=query, endpoint=endpoint, session=session)
 
-def run_query(query: str, endpoint: str, return_format=JSON) -> dict:
     sparql = SPARQLWrapper(endpoint)
     sparql.setQuery(query)
     sparql.setReturnFormat(return_format)
@@ -13,24 +40,372 @@ def run_query(query: str, endpoint: str, return_format=JSON) -> dict:
     return results
 
 
+def run_query_in_session(query: str, endpoint: str, session: requests.Session,
+                         timeout: float = 600) -> dict:
+    """
+    Run a query over a requests.Session, so that repeated queries to an endpoint
+    reuse the same HTTP connection. Results are always SPARQL JSON.
+
+    :param query: SPARQL query string
+    :param endpoint: SPARQL endpoint URL
+    :param session: requests.Session to send the query with
+    :param timeout: seconds to wait for the endpoint [600]
+    :return: results of the query
+    """
+
+    response = session.post(endpoint, data={'query': query}, timeout=timeout,
+                            headers={'Accept': 'application/sparql-results+json'})
+    if response.status_code >= 500 or response.status_code == 429:
+        raise EndPointInternalError(response.text)
+    response.raise_for_status()
+    return response.json()
+
+
+def run_query_with_retry(query: str, endpoint: str, retries: int = 3,
+                         backoff: float = 1.0, return_format=JSON,
+                         session: Optional[requests.Session] = None,
+                         limit: Optional[threading.Semaphore] = None) -> dict:
+    """
+    Run a query, retrying with exponential backoff on network/endpoint errors.
+
+    :param query: SPARQL query string
+    :param endpoint: SPARQL endpoint URL
+    :param retries: number of retries after the first attempt [3]
+    :param backoff: seconds to wait before the first retry, doubled on each retry [1.0]
+    :param return_format: SPARQLWrapper return format [JSON]
+    :param session: optional requests.Session to reuse connections with
+    :param limit: optional semaphore held while each request is sent, to cap the
+        number of requests in flight to the endpoint (but not while backing off)
+    :return: results of the query
+    """
+
+    attempt = 0
+    while True:
+        try:
+            if limit is None:
+                return run_query(query=query, endpoint=endpoint, return_format=return_format,
+                                 session=session)
+            with limit:
+                return run_query(query=query, endpoint=endpoint, return_format=return_format,
+                                 session=session)
+        except RETRYABLE_ERRORS as e:
+            if attempt >= retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            logging.warning("Query to %s failed (%s), retrying in %.1fs" % (endpoint, e, delay))
+            time.sleep(delay)
+            attempt += 1
+
+
+def paginate_query(query: str, page_size: int, offset: int) -> str:
+    """
+    Append LIMIT/OFFSET clauses to a query to fetch a single page of results.
+
+    :param query: SPARQL query string
+    :param page_size: number of rows per page
+    :param offset: row offset of this page
+    :return: the paged query
+    """
+
+    return "%s\nLIMIT %d\nOFFSET %d" % (query.rstrip(), page_size, offset)
+
+
+def is_pageable(query: str) -> bool:
+    """
+    Queries that already carry their own LIMIT or OFFSET can't be paged safely.
+
+    :param query: SPARQL query string
+    :return: True if LIMIT/OFFSET can be appended to the query
+    """
+
+    return re.search(r'\b(LIMIT|OFFSET)\s+\d+\s*$', query.strip(), re.IGNORECASE) is None
+
+
+def is_ordered(query: str) -> bool:
+    """
+    Whether a query orders its results (an ORDER BY after its outermost group), which
+    paging needs: without it, the endpoint may return rows in a different order for each
+    page, so that rows are repeated or missed.
+
+    :param query: SPARQL query string
+    :return: True if the query has an ORDER BY clause
+    """
+
+    solution_modifiers = query[query.rfind('}') + 1:]
+    return re.search(r'\bORDER\s+BY\b', solution_modifiers, re.IGNORECASE) is not None
+
+
+def iter_query_pages(query: str, endpoint: str, page_size: int = DEFAULT_PAGE_SIZE,
+                     workers: int = 1, retries: int = 3, backoff: float = 1.0,
+                     session: Optional[requests.Session] = None,
+                     limit: Optional[threading.Semaphore] = None) -> Iterator[dict]:
+    """
+    Yield result dicts one page at a time, in order.
+
+    Only queries with an ORDER BY clause are paged, as paging is only stable with one;
+    others are fetched at once, with a warning. With workers > 1, up to that many pages
+    are fetched concurrently ahead of the page being consumed, so at most
+    workers * page_size rows are held in memory. As requests.Session isn't thread-safe,
+    each of those workers then sends its pages over a Session of its own.
+
+    :param query: SPARQL query string
+    :param endpoint: SPARQL endpoint URL
+    :param page_size: rows per page of an ordered query; 0 disables paging [DEFAULT_PAGE_SIZE]
+    :param workers: number of pages to fetch concurrently [1]
+    :param retries: number of retries per page [3]
+    :param backoff: initial backoff in seconds between retries [1.0]
+    :param session: optional requests.Session to reuse connections with
+    :param limit: optional semaphore held while each page is fetched
+    :return: iterator of SPARQL JSON result dicts
+    """
+
+    workers = max(1, workers)
+    local = threading.local()
+    worker_sessions: List[requests.Session] = []
+
+    def worker_session() -> Optional[requests.Session]:
+        if session is None or workers == 1:
+            return session
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            worker_sessions.append(local.session)
+        return local.session
+
+    def fetch(offset: int) -> dict:
+        return run_query_with_retry(query=paginate_query(query, page_size, offset),
+                                    endpoint=endpoint, retries=retries, backoff=backoff,
+                                    session=worker_session(), limit=limit)
+
+    if page_size > 0 and is_pageable(query) and not is_ordered(query):
+        logging.warning("Query to %s has no ORDER BY, so it can't be paged stably; "
+                        "fetching all its results at once" % endpoint)
+    if page_size <= 0 or not is_pageable(query) or not is_ordered(query):
+        yield run_query_with_retry(query=query, endpoint=endpoint, retries=retries,
+                                   backoff=backoff, session=session, limit=limit)
+        return
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            next_offset = 0
+            pending: List[Any] = []
+            while True:
+                while len(pending) < workers:
+                    pending.append(executor.submit(fetch, next_offset))
+                    next_offset += page_size
+                page = pending.pop(0).result()
+                yield page
+                if len(page['results']['bindings']) < page_size:
+                    for future in pending:
+                        future.cancel()
+                    return
+    finally:
+        for worker in worker_sessions:
+            worker.close()
+
+
 def parse_query_yaml(yaml_file) -> dict:
-    return yaml.load(open(yaml_file))
+    with open(yaml_file) as f:
+        return yaml.load(f, Loader=yaml.FullLoader)
+
+
+def result_rows(result_dict: dict, columns: List[str]) -> Iterator[List[str]]:
+    """
+    Yield the values of each binding in a result dict, in column order.
+
+    :param result_dict: SPARQL JSON result dict
+    :param columns: variables to output
+    :return: iterator of row value lists
+    """
+
+    for row in result_dict['results']['bindings']:
+        row_items = []
+        for col in columns:
+            try:
+                row_items.append(row[col]['value'])
+            except KeyError:
+                logging.error('Problem retrieving result for col %s in row %s' %
+                              (col, "\t".join(row)))
+                row_items.append('ERROR')
+        yield row_items
 
 
 def result_dict_to_tsv(result_dict: dict, outfile: str) -> None:
     with open(outfile, 'wt') as f:
         # header
         f.write("\t".join(result_dict['head']['vars']) + "\n")
-        for row in result_dict['results']['bindings']:
-            row_items = []
-            for col in result_dict['head']['vars']:
-                try:
-                    row_items.append(row[col]['value'])
-                except KeyError:
-                    logging.error('Problem retrieving result for col %s in row %s' %
-                                  (col, "\t".join(row)))
-                    row_items.append('ERROR')
-            try:
+        for row_items in result_rows(result_dict, result_dict['head']['vars']):
+            f.write("\t".join(row_items) + "\n")
+
+
+def run_query_to_tsv(query: str, endpoint: str, outfile: str,
+                     page_size: int = DEFAULT_PAGE_SIZE, workers: int = 1,
+                     retries: int = 3, backoff: float = 1.0,
+                     compress: Optional[bool] = None,
+                     session: Optional[requests.Session] = None,
+                     limit: Optional[threading.Semaphore] = None) -> int:
+    """
+    Run a query page by page and write the rows to a TSV as they arrive, so memory
+    use doesn't depend on the size of the result.
+
+    :param query: SPARQL query string
+    :param endpoint: SPARQL endpoint URL
+    :param outfile: TSV file to write
+    :param page_size: rows per page of an ordered query; 0 disables paging [DEFAULT_PAGE_SIZE]
+    :param workers: number of pages to fetch concurrently [1]
+    :param retries: number of retries per page [3]
+    :param backoff: initial backoff in seconds between retries [1.0]
+    :param compress: gzip the output; by default, only if outfile ends with .gz
+    :param session: optional requests.Session to reuse connections with
+    :param limit: optional semaphore held while each page is fetched
+    :return: number of rows written
+    """
+
+    if compress is None:
+        compress = outfile.endswith('.gz')
+    opener: Any = gzip.open if compress else open
+
+    n_rows = 0
+    columns: Optional[List[str]] = None
+    with span('query.' + os.path.basename(outfile)) as s, opener(outfile, 'wt') as f:
+        for page in iter_query_pages(query=query, endpoint=endpoint, page_size=page_size,
+                                     workers=workers, retries=retries, backoff=backoff,
+                                     session=session, limit=limit):
+            s.count('pages')
+            if columns is None:
+                columns = page['head']['vars']
+                f.write("\t".join(columns) + "\n")
+            for row_items in result_rows(page, columns):
                 f.write("\t".join(row_items) + "\n")
-            except:
-                pass
+                n_rows += 1
+        s.count('rows_out', n_rows)
+    return n_rows
+
+
+def cached_query_to_tsv(query: str, endpoint: str, outfile: str,
+                        cache: Optional[QueryCache], version: str = '',
+                        **kwargs) -> bool:
+    """
+    Like run_query_to_tsv, but serve the result from an on-disk cache when the same
+    query has already been run against the same endpoint and graph version.
+
+    :param query: SPARQL query string
+    :param endpoint: SPARQL endpoint URL
+    :param outfile: TSV file to write
+    :param cache: QueryCache to use, or None to always query the endpoint
+    :param version: graph version stamp (see kg_microbe.utils.cache_utils.graph_version)
+    :param kwargs: passed on to run_query_to_tsv
+    :return: True if the result came from the cache
+    """
+
+    if cache is None:
+        run_query_to_tsv(query=query, endpoint=endpoint, outfile=outfile, **kwargs)
+        return False
+
+    compress = kwargs.get('compress')
+    if compress is None:
+        compress = outfile.endswith('.gz')
+    key = query_cache_key(query, endpoint, version, suffix='.gz' if compress else '')
+    if cache.get(key, outfile):
+        logging.info("Using cached result for {}".format(outfile))
+        return True
+    run_query_to_tsv(query=query, endpoint=endpoint, outfile=outfile, **kwargs)
+    cache.put(key, outfile)
+    return False
+
+
+def count_tsv_rows(tsv_file: str) -> int:
+    """
+    Count the rows (excluding the header) of a possibly gzipped TSV file.
+
+    :param tsv_file: TSV file
+    :return: number of rows
+    """
+
+    opener: Any = gzip.open if tsv_file.endswith('.gz') else open
+    with opener(tsv_file, 'rt') as f:
+        return max(0, sum(1 for _ in f) - 1)
+
+
+def run_query_batch(yaml_dir: str, output_dir: str, workers: int = 4,
+                    max_per_endpoint: int = 2, page_workers: int = 1,
+                    cache: Optional[QueryCache] = None,
+                    version: str = '', query_key: str = 'query',
+                    endpoint_key: str = 'endpoint', outfile_ext: str = '.tsv',
+                    **kwargs) -> List[Dict]:
+    """
+    Run every query YAML in a directory concurrently, writing one result TSV per YAML
+    and a summary TSV (query_summary.tsv) of latency, row counts and failures.
+
+    Each worker thread keeps one requests.Session per endpoint so connections are
+    reused across queries, and no more than max_per_endpoint requests, counting each
+    page of a paged query, are sent to any one endpoint at a time.
+
+    :param yaml_dir: directory of query YAML files (see tests/resources/query/)
+    :param output_dir: directory to write result TSVs and the summary to
+    :param workers: number of queries to run at once [4]
+    :param max_per_endpoint: number of requests to send at once to one endpoint [2]
+    :param page_workers: number of pages of each query to fetch concurrently [1]
+    :param cache: QueryCache to use, or None to always query the endpoints
+    :param version: graph version stamp for the cache
+    :param query_key: the key in the yaml files containing the query string
+    :param endpoint_key: the key in the yaml files containing the sparql endpoint URL
+    :param outfile_ext: file extension for output files [.tsv]
+    :param kwargs: passed on to run_query_to_tsv
+    :return: list of summary dicts, one per query, with keys SUMMARY_HEADER
+    """
+
+    yaml_files = sorted(glob.glob(os.path.join(yaml_dir, '*.yaml')) +
+                        glob.glob(os.path.join(yaml_dir, '*.yml')))
+    os.makedirs(output_dir, exist_ok=True)
+
+    lock = threading.Lock()
+    endpoint_limits: Dict[str, threading.BoundedSemaphore] = {}
+    local = threading.local()
+
+    def endpoint_limit(endpoint: str) -> threading.BoundedSemaphore:
+        with lock:
+            if endpoint not in endpoint_limits:
+                endpoint_limits[endpoint] = threading.BoundedSemaphore(max_per_endpoint)
+            return endpoint_limits[endpoint]
+
+    def thread_session(endpoint: str) -> requests.Session:
+        if not hasattr(local, 'sessions'):
+            local.sessions = {}
+        if endpoint not in local.sessions:
+            local.sessions[endpoint] = requests.Session()
+        return local.sessions[endpoint]
+
+    def run_one(yaml_file: str) -> Dict:
+        name = os.path.splitext(os.path.basename(yaml_file))[0]
+        summary: Dict = {'query': name, 'endpoint': '', 'status': 'failed',
+                         'rows': 0, 'seconds': 0.0, 'error': ''}
+        start = time.time()
+        try:
+            query = parse_query_yaml(yaml_file)
+            endpoint = query[endpoint_key]
+            summary['endpoint'] = endpoint
+            outfile = os.path.join(output_dir, name + outfile_ext)
+            if kwargs.get('compress'):
+                outfile += '.gz'
+            hit = cached_query_to_tsv(query=query[query_key], endpoint=endpoint,
+                                      outfile=outfile, cache=cache, version=version,
+                                      session=thread_session(endpoint), workers=page_workers,
+                                      limit=endpoint_limit(endpoint), **kwargs)
+            summary['status'] = 'cached' if hit else 'ok'
+            summary['rows'] = count_tsv_rows(outfile)
+        except Exception as e:
+            # one bad query shouldn't take down the batch; it's reported in the summary
+            logging.error("Query {} failed: {}".format(yaml_file, e))
+            summary['error'] = str(e).replace('\t', ' ').replace('\n', ' ')
+        summary['seconds'] = round(time.time() - start, 3)
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        summaries = list(executor.map(run_one, yaml_files))
+
+    with open(os.path.join(output_dir, SUMMARY_FILENAME), 'w') as f:
+        f.write("\t".join(SUMMARY_HEADER) + "\n")
+        for summary in summaries:
+            f.write("\t".join(str(summary[k]) for k in SUMMARY_HEADER) + "\n")
+
+    return summaries
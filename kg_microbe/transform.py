@@ -1,23 +1,42 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import importlib
 import logging
-from typing import List
-
-from kg_microbe.transform_utils.ontology import OntologyTransform
-from kg_microbe.transform_utils.ontology.ontology_transform import ONTOLOGIES
-from kg_microbe.transform_utils.traits.traits import TraitsTransform
+import os
+from typing import List, Optional
 
 
+# Transform classes are given as import paths and only imported when used, since the
+# traits transform pulls in OGER, pandas and KGX, which are slow to import.
 DATA_SOURCES = {
-    'TraitsTransform': TraitsTransform,
-    'NCBITransform': OntologyTransform,
-    'ChebiTransform': OntologyTransform,
-    'EnvoTransform' : OntologyTransform,
-    'GoTransform': OntologyTransform
+    'TraitsTransform': 'kg_microbe.transform_utils.traits.traits.TraitsTransform',
+    'NCBITransform': 'kg_microbe.transform_utils.ontology.ontology_transform.OntologyTransform',
+    'ChebiTransform': 'kg_microbe.transform_utils.ontology.ontology_transform.OntologyTransform',
+    'EnvoTransform' : 'kg_microbe.transform_utils.ontology.ontology_transform.OntologyTransform',
+    'GoTransform': 'kg_microbe.transform_utils.ontology.ontology_transform.OntologyTransform'
 }
 
+# DuckDB database with views on the Parquet output of transforms
+TRANSFORMED_DUCKDB = 'kg-microbe.duckdb'
+
+
+def get_transform_class(source: str) -> type:
+    """
+    Import and return the Transform class for a source in DATA_SOURCES.
+
+    :param source: A key of DATA_SOURCES.
+    :return: The Transform class for that source.
+    """
+
+    module_name, class_name = DATA_SOURCES[source].rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
 
-def transform(input_dir: str, output_dir: str, sources: List[str] = None) -> None:
+def transform(input_dir: str, output_dir: str, sources: List[str] = None,
+              compression: Optional[str] = None, parquet: bool = False,
+              chunk_size: Optional[int] = None, memory_limit_mb: Optional[float] = None,
+              traits_files: Optional[List[str]] = None, ontology_converter: str = 'native',
+              sort_output: bool = False) -> None:
     """
     Call scripts in kg_microbe/transform/[source name]/ to transform each source into a graph format that
     KGX can ingest directly, in either TSV or JSON format:
@@ -26,9 +45,25 @@ def transform(input_dir: str, output_dir: str, sources: List[str] = None) -> Non
     :param input_dir: A string pointing to the directory to import data from.
     :param output_dir: A string pointing to the directory to output data to.
     :param sources: A list of sources to transform.
+    :param compression: Compress node/edge TSVs with 'gz' or 'zst' (transforms that write their own output).
+    :param parquet: Also write each node/edge TSV as a partitioned Parquet dataset, and a DuckDB
+                    database (TRANSFORMED_DUCKDB in output_dir) with views on them all.
+    :param chunk_size: Process input in blocks of this many rows (transforms that support it).
+    :param memory_limit_mb: Size input blocks to stay under this many MB (transforms that support it).
+    :param traits_files: Traits CSV file(s) for TraitsTransform; several are ingested together,
+                         with per-file and combined outputs [condensed_traits_NCBI.csv].
+    :param ontology_converter: 'native' to stream ontologies' obograph JSON to TSV, falling back
+                               to KGX for anything it doesn't cover, or 'kgx' to always use KGX.
+    :param sort_output: Sort the node/edge TSVs each transform writes, nodes by id and edges by
+                        (subject, predicate, object), with an external merge sort in
+                        memory_limit_mb (or the default) of memory.
     :return: None.
     """
-    
+    from kg_microbe.transform_utils.ontology.ontology_transform import ONTOLOGIES
+    from kg_microbe.utils.parquet_utils import create_duckdb, export_parquet, parquet_datasets
+    from kg_microbe.utils.sort_utils import DEFAULT_SORT_MEMORY_MB, kgx_tsv_files, \
+        sort_kgx_files
+
     if not sources:
         # run all sources
         sources = list(DATA_SOURCES.keys())
@@ -36,8 +71,29 @@ def transform(input_dir: str, output_dir: str, sources: List[str] = None) -> Non
     for source in sources:
         if source in DATA_SOURCES:
             logging.info(f"Parsing {source}")
-            t = DATA_SOURCES[source](input_dir, output_dir)
+            t = get_transform_class(source)(input_dir, output_dir)
+            t.output_compression = compression
+            t.chunk_size = chunk_size
+            t.memory_limit_mb = memory_limit_mb
+            before = kgx_tsv_files(t.output_base_dir)
             if source in ONTOLOGIES.keys():
+                t.converter = ontology_converter
                 t.run(ONTOLOGIES[source])
+            elif source == 'TraitsTransform' and traits_files:
+                t.run(list(traits_files))
             else:
                 t.run()
+            # whatever wrote them (NodeEdgeWriter, KGX), the files new or changed
+            written = [f for f, mtime in kgx_tsv_files(t.output_base_dir).items()
+                       if before.get(f) != mtime]
+            if sort_output:
+                sort_kgx_files(written, memory_mb=memory_limit_mb or DEFAULT_SORT_MEMORY_MB)
+            if parquet:
+                export_parquet(written)
+
+    if parquet:
+        try:
+            create_duckdb(os.path.join(output_dir, TRANSFORMED_DUCKDB),
+                          parquet_datasets(output_dir))
+        except ImportError as e:
+            logging.warning(f"{e}; no DuckDB database was created")
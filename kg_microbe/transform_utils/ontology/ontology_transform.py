@@ -1,11 +1,16 @@
+import json
+import logging
 import os
 
-from typing import Optional
+from typing import Dict, Optional
 
 #from kgx.transformer import Transformer
-from kgx.cli.cli_utils import transform
 
 from kg_microbe.transform_utils.transform import Transform
+from kg_microbe.utils.io_utils import find_input
+from kg_microbe.utils.obograph_utils import NODE_COLUMNS, EDGE_COLUMNS, EDGE_KEY, \
+    UnsupportedObographError, kgx_obograph_to_tsv, obograph_to_tsv
+from kg_microbe.utils.profile_utils import span
 
 
 ONTOLOGIES = {
@@ -18,14 +23,58 @@ ONTOLOGIES = {
 }
 
 
+def subset_marker(output: str) -> str:
+    """
+    Marker file of an ontology's output written as a subset by another transform, e.g.
+    the NCBITaxon subset of the traits transform, which OntologyTransform keeps.
+
+    :param output: output path of the ontology, without _nodes.tsv
+    :return: filename
+    """
+
+    return output + '_subset.json'
+
+
+def write_subset_marker(output: str, info: Dict) -> None:
+    """
+    Mark an ontology's output as a subset to keep.
+
+    :param output: output path of the ontology, without _nodes.tsv
+    :param info: what the subset was made from, to record in the marker
+    :return: None.
+    """
+
+    with open(subset_marker(output), 'w') as f:
+        json.dump(info, f, indent=2)
+
+
+def remove_subset_marker(output: str) -> None:
+    """
+    Let OntologyTransform convert an ontology again, e.g. a new ROBOT extract.
+
+    :param output: output path of the ontology, without _nodes.tsv
+    :return: None.
+    """
+
+    if os.path.isfile(subset_marker(output)):
+        os.remove(subset_marker(output))
+
+
 class OntologyTransform(Transform):
     """
     OntologyTransform parses an Obograph JSON form of an Ontology into nodes nad edges.
 
+    By default the JSON is streamed through obograph_utils' native converter, falling
+    back to KGX for ontologies it doesn't cover; set converter to 'kgx' to always use KGX.
+
     """
     def __init__(self, input_dir: str = None, output_dir: str = None):
         source_name = "ontologies"
         super().__init__(source_name, input_dir, output_dir)
+        self.node_header = NODE_COLUMNS
+        self.edge_header = EDGE_COLUMNS
+        self.edge_key = EDGE_KEY
+        self.converter = 'native'
 
     def run(self, data_file: Optional[str] = None) -> None:
         """Method is called and performs needed transformations to process an ontology.
@@ -36,12 +85,13 @@ class OntologyTransform(Transform):
 
         if data_file:
             k = data_file.split('.')[0]
-            data_file = os.path.join(self.input_base_dir, data_file)
+            data_file = find_input(os.path.join(self.input_base_dir, data_file))
             self.parse(k, data_file, k)
         else:
             # load all ontologies
             for k in ONTOLOGIES.keys():
-                data_file = os.path.join(self.input_base_dir, ONTOLOGIES[k])
+                # the JSON may be compressed, e.g. data/raw/chebi.json.gz
+                data_file = find_input(os.path.join(self.input_base_dir, ONTOLOGIES[k]))
                 self.parse(k, data_file, k)
 
     def parse(self, name: str, data_file: str, source: str) -> None:
@@ -53,6 +103,34 @@ class OntologyTransform(Transform):
         :return: None.
         """
 
+        output = os.path.join(self.output_dir, name)
+        # the output, compressed or not (see Transform.output_compression)
+        output_nodes = find_input(output + '_nodes.tsv')
+        marker = subset_marker(output)
+        if os.path.isfile(output_nodes) and (
+                not os.path.isfile(data_file) or (
+                    os.path.isfile(marker) and
+                    os.path.getmtime(marker) >= os.path.getmtime(data_file))):
+            # e.g. the NCBITaxon subset written by the traits transform without ROBOT,
+            # newer than any ncbitaxon.json
+            logging.info(f"Keeping the existing {output_nodes} rather than converting "
+                         f"{data_file}")
+            return
+
         print(f"Parsing {data_file}")
 
-        transform(inputs=[data_file], input_format='obojson', output= os.path.join(self.output_dir, name), output_format='tsv')
\ No newline at end of file
+        if self.converter == 'native':
+            try:
+                with span('ontology.' + name) as s, \
+                        self.node_edge_writer(output + '_nodes.tsv', output + '_edges.tsv') as writer:
+                    s.count('bytes_read', os.path.getsize(data_file))
+                    s.count('rows_in', sum(obograph_to_tsv(data_file, writer)))
+                    s.count('nodes_out', writer.node_count)
+                    s.count('edges_out', writer.edge_count)
+                return
+            except UnsupportedObographError as e:
+                logging.warning(f"{e}; converting {data_file} with KGX instead")
+
+        with span('ontology.' + name) as s:
+            s.count('bytes_read', os.path.getsize(data_file))
+            kgx_obograph_to_tsv(data_file, output)
\ No newline at end of file
@@ -1,11 +1,22 @@
 import csv
+import logging
 import re
 import os
-from typing import Dict, List, Optional
-from collections import defaultdict
+from contextlib import ExitStack
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from kg_microbe.transform_utils.transform import Transform
-from kg_microbe.utils.transform_utils import parse_header, parse_line, write_node_edge_item
+from kg_microbe.transform_utils.ontology.ontology_transform import remove_subset_marker, \
+    write_subset_marker
+from kg_microbe.utils.transform_utils import parse_header, parse_line, TermDiagnostics, \
+    TransformError
+from kg_microbe.utils.mapping_utils import load_trait_mappings
+from kg_microbe.utils.resolver_utils import RESOLUTION_COLUMNS, OgerIndex, TermResolver, \
+    load_sssom
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.io_utils import find_input, open_input, strip_compression_suffix
+from kg_microbe.utils.taxonomy_utils import subset_taxonomy, taxdump_to_tsv
 
 from kg_microbe.utils.nlp_utils import *
 from kg_microbe.utils.robot_utils import *
@@ -13,6 +24,27 @@ from kg_microbe.utils.robot_utils import *
 from kgx.cli.cli_utils import transform
 
 
+# SSSOM synonym fields accepted for inexact OGER matches, in order of preference
+CHEBI_SYNONYM_FIELDS = ['oio:hasExactSynonym', 'oio:hasRelatedSynonym']
+GO_SYNONYM_FIELDS = ['oio:hasExactSynonym', 'oio:hasRelatedSynonym', 'oio:hasBroadSynonym']
+
+# Memory taken by the OGER annotations of a traits file once loaded into the
+# TermResolvers, per byte of the traits file, used to size row blocks for a memory
+# limit: 3.8 measured on the benchmarks' synthetic data (200,000 rows, 64 MB, 640,000
+# annotations: 244 MB peak RSS loaded at once, 38 MB in blocks of 10,000 rows)
+RESOLVER_BYTES_PER_INPUT_BYTE = 4
+MIN_CHUNK_SIZE = 1000
+
+# Columns holding a taxon's NCBITaxon id and name, in order of preference: the
+# condensed_species_* files have species_tax_id and species instead of tax_id and org_name
+TAX_ID_COLUMNS = ['tax_id', 'species_tax_id']
+ORG_NAME_COLUMNS = ['org_name', 'species']
+
+# Output directory, under the output base directory, of the de-duplicated union of
+# several traits files ingested together
+COMBINED_SOURCE_NAME = 'condensed_traits_combined'
+
+
 class TraitsTransform(Transform):
 
     """
@@ -21,6 +53,9 @@ class TraitsTransform(Transform):
     Essentially just ingests and transforms this file:
     https://github.com/bacteria-archaea-traits/bacteria-archaea-traits/blob/master/output/condensed_traits_NCBI.csv
 
+    or several of the repository's outputs at once (condensed_traits_NCBI/GTDB,
+    condensed_species_NCBI/GTDB), sharing one round of ROBOT, OGER and term resolution.
+
     And extracts the following columns:
         - tax_id
         - org_name
@@ -51,38 +86,132 @@ class TraitsTransform(Transform):
         self.edge_header = ['subject', 'predicate', 'object', 'relation']
         self.nlp = nlp
 
-    def run(self, data_file: Optional[str] = None):
+    @staticmethod
+    def dataset_columns(input_file: str) -> Tuple[str, str]:
+        """
+        The tax id and organism name columns of a traits file.
+
+        :param input_file: traits CSV file
+        :return: (tax id column, organism name column)
+        """
+
+        with open_input(input_file) as f:
+            header = parse_header(f.readline(), sep=',')
+        columns = []
+        for candidates in (TAX_ID_COLUMNS, ORG_NAME_COLUMNS):
+            found = [c for c in candidates if c in header]
+            if not found:
+                raise TransformError("{} has none of the columns {}".format(input_file, candidates))
+            columns.append(found[0])
+        return columns[0], columns[1]
+
+    def traits_chunk_size(self, input_files: List[str]) -> Optional[int]:
+        """
+        Number of traits rows to process per block: self.chunk_size if set, else sized
+        from self.memory_limit_mb and the size of the inputs, or None to process the
+        whole files at once.
+
+        :param input_files: traits CSV files
+        :return: rows per block, or None
+        """
+
+        if self.chunk_size:
+            return self.chunk_size
+        if not self.memory_limit_mb:
+            return None
+        resolver_bytes = sum(os.path.getsize(f) for f in input_files) * RESOLVER_BYTES_PER_INPUT_BYTE
+        budget = self.memory_limit_mb * 1024 * 1024 / 2  # leave half for everything else
+        if resolver_bytes <= budget:
+            return None
+        n_rows = 0
+        for input_file in input_files:
+            with open_input(input_file, 'rb') as f:
+                n_rows += sum(1 for _ in f)
+        chunk_size = max(MIN_CHUNK_SIZE, int(n_rows * budget / resolver_bytes))
+        logging.info("Processing {} in blocks of {} rows to stay under {} MB".format(
+            ', '.join(input_files), chunk_size, self.memory_limit_mb))
+        return chunk_size
+
+    def iter_rows(self, f: Iterable[str], chunk_size: Optional[int],
+                  oger_indexes: Dict[TermResolver, OgerIndex], tax_id_index: int = 0) -> Iterator[str]:
+        """
+        Iterate over the rows of the traits file. With a chunk_size, rows are read in
+        blocks and, before each block, every resolver is reloaded with just the OGER
+        annotations of the taxa in that block, so memory is bounded by the block size.
+        Those are read through an index of the OGER output, so each of its lines is
+        read once per block of its taxon rather than the whole file once per block.
+
+        :param f: traits file, positioned after the header
+        :param chunk_size: rows per block, or None to stream all rows with the resolvers as they are
+        :param oger_indexes: index of the OGER output to load each resolver from
+        :param tax_id_index: index of the tax_id column [0]
+        :return: iterator of rows
+        """
+
+        if not chunk_size:
+            yield from f
+            return
+        while True:
+            block = list(islice(f, chunk_size))
+            if not block:
+                return
+            tax_ids = set()
+            for row in csv.reader(block):
+                try:
+                    tax_ids.add(int(row[tax_id_index]))
+                except (IndexError, ValueError):
+                    pass
+            for resolver, oger_index in oger_indexes.items():
+                resolver.clear()
+                resolver.add_all(oger_index.annotations(tax_ids))
+            yield from block
+
+    def run(self, data_file: Optional[Union[str, List[str]]] = None):
         """
         Method is called and performs needed transformations to process the 
         trait data (NCBI/GTDB).
+
+        Given several input files, each one's nodes and edges are written to
+        <output_base_dir>/<file name without extension>/ and their de-duplicated union
+        to <output_base_dir>/condensed_traits_combined/.
         
-        :param data_file: Input file name.
+        :param data_file: Input file name, or a list of them.
         """
         
         if data_file is None:
             data_file = self.source_name + ".csv"
-        
-        input_file = os.path.join(
-            self.input_base_dir, data_file)
-            
+        data_files = [data_file] if isinstance(data_file, str) else list(data_file)
+
+        # each may be compressed (e.g. condensed_traits_NCBI.csv.gz)
+        input_files = [find_input(os.path.join(self.input_base_dir, f)) for f in data_files]
+        columns = [self.dataset_columns(f) for f in input_files]
+
         # make directory in data/transformed
-        os.makedirs(self.output_dir, exist_ok=True)
+        if len(input_files) == 1:
+            output_dirs = [self.output_dir]
+        else:
+            output_dirs = [os.path.join(self.output_base_dir, os.path.splitext(os.path.basename(strip_compression_suffix(f)))[0])
+                           for f in input_files]
+            output_dirs.append(os.path.join(self.output_base_dir, COMBINED_SOURCE_NAME))
+        for output_dir in output_dirs:
+            os.makedirs(output_dir, exist_ok=True)
 
         """
         Import SSSOM 
         """
-        sssom_columns = ['subject_label', 'object_id', 'object_label', 'object_match_field', 'match_category']
-        chem_sssom = pd.read_csv(self.chemicals_sssom, sep='\t', low_memory=False, comment='#', usecols=sssom_columns)
-        chem_sssom['subject_label'] = chem_sssom['subject_label'].str.replace(r"[\'\",]","",regex=True)
-
-        path_sssom = pd.read_csv(self.pathways_sssom, sep='\t', low_memory=False, comment='#', usecols=sssom_columns)
-        path_sssom['subject_label'] = path_sssom['subject_label'].str.replace(r"[\'\",]","",regex=True).str.replace('_',' ')
+        with span('traits.sssom_load') as s:
+            chem_sssom = load_sssom(self.chemicals_sssom)
+            path_sssom = load_sssom(self.pathways_sssom, underscores_to_spaces=True)
+            s.count('rows_in', len(chem_sssom) + len(path_sssom))
+        chem_resolver = TermResolver(chem_sssom, CHEBI_SYNONYM_FIELDS)
+        path_resolver = TermResolver(path_sssom, GO_SYNONYM_FIELDS)
 
         """
         Implement ROBOT 
         """
         # Convert OWL to JSON for CheBI Ontology
-        convert_to_json(self.input_base_dir, 'CHEBI')
+        with span('traits.robot_convert'):
+            convert_to_json(self.input_base_dir, 'CHEBI')
         #convert_to_json(self.input_base_dir, 'ECOCORE')
 
         # Extract the 'cellular organisms' tree from NCBITaxon and convert to JSON
@@ -95,42 +224,67 @@ class TraitsTransform(Transform):
 
 
         """
-        Get information from the EnvironemtTransform
+        Compile the metabolism and environment (environments.csv) mappings
         """
-        environment_file = os.path.join(self.input_base_dir, 'environments.csv')
-        env_df = pd.read_csv(environment_file, sep=',', low_memory=False, usecols=['Type', 'ENVO_terms', 'ENVO_ids'])
-        unique_env_df = env_df.drop_duplicates()
+        trait_mappings = load_trait_mappings(self.trait_mappings_file, self.input_base_dir)
+        metabolism_map = trait_mappings['metabolism']
+        environment_map = trait_mappings['environments']
         
 
         """
         Create termlist.tsv files from ontology JSON files for NLP
         TODO: Replace this code once runNER is installed and remove 'kg_microbe/utils/biohub_converter.py'
         """
-        create_termlist(self.input_base_dir, 'chebi')
-        #create_termlist(self.input_base_dir, 'ecocore')
-        create_termlist(self.input_base_dir, 'go')
+        with span('traits.termlists'):
+            create_termlist(self.input_base_dir, 'chebi')
+            #create_termlist(self.input_base_dir, 'ecocore')
+            create_termlist(self.input_base_dir, 'go')
         
 
         """
         NLP: Get 'chem_node_type' and 'org_to_chem_edge_label'
         """
+        # In chunked mode OGER's output is left on disk and the annotations for each
+        # block of rows are loaded into the resolvers as the block is reached
+        chunk_size = self.traits_chunk_size(input_files)
+        if chunk_size:
+            self.compact_dedup = True
+        oger_indexes: Dict[TermResolver, OgerIndex] = {}
         if self.nlp:
             # Prep for NLP. Make sure the first column is the ID
+            # The terms of all the input files are annotated in one run
+            id_columns = [tax_id_column for tax_id_column, _ in columns]
             # CHEBI
             cols_for_nlp = ['tax_id', 'carbon_substrates']
-            input_file_name = prep_nlp_input(input_file, cols_for_nlp, 'CHEBI')
+            input_file_name = prep_nlp_input(input_files, cols_for_nlp, 'CHEBI', id_columns)
             # Set-up the settings.ini file for OGER and run
             create_settings_file(self.nlp_dir, 'CHEBI')
-            oger_output_chebi = run_oger(self.nlp_dir, input_file_name, n_workers=5)
-            oger_output_chebi_not_exact_match = oger_output_chebi[oger_output_chebi['StringMatch'] != 'Exact']
+            with span('traits.oger_chebi') as s:
+                oger_output_chebi = run_oger(self.nlp_dir, input_file_name, n_workers=5, load=not chunk_size)
+                if oger_output_chebi is not None:
+                    s.count('rows_out', chem_resolver.add_all(oger_output_chebi.itertuples(index=False, name=None)))
+                    del oger_output_chebi
+            if chunk_size:
+                with span('traits.oger_index_chebi') as s:
+                    oger_indexes[chem_resolver] = OgerIndex(
+                        os.path.join(self.nlp_output_dir, input_file_name + '.tsv'))
+                    s.count('rows_in', len(oger_indexes[chem_resolver]))
 
             # GO
             cols_for_nlp = ['tax_id', 'pathways']
-            input_file_name = prep_nlp_input(input_file, cols_for_nlp, 'GO')
+            input_file_name = prep_nlp_input(input_files, cols_for_nlp, 'GO', id_columns)
             # Set-up the settings.ini file for OGER and run
             create_settings_file(self.nlp_dir, 'GO')
-            oger_output_go = run_oger(self.nlp_dir, input_file_name, n_workers=5)
-            oger_output_go_not_exact_match = oger_output_go[oger_output_go['StringMatch'] != 'Exact']
+            with span('traits.oger_go') as s:
+                oger_output_go = run_oger(self.nlp_dir, input_file_name, n_workers=5, load=not chunk_size)
+                if oger_output_go is not None:
+                    s.count('rows_out', path_resolver.add_all(oger_output_go.itertuples(index=False, name=None)))
+                    del oger_output_go
+            if chunk_size:
+                with span('traits.oger_index_go') as s:
+                    oger_indexes[path_resolver] = OgerIndex(
+                        os.path.join(self.nlp_output_dir, input_file_name + '.tsv'))
+                    s.count('rows_in', len(oger_indexes[path_resolver]))
             
             '''# ECOCORE
             cols_for_nlp = ['tax_id', 'metabolism']
@@ -140,409 +294,287 @@ class TraitsTransform(Transform):
             oger_output_ecocore = run_oger(self.nlp_dir, input_file_name, n_workers=5)
             #oger_output = process_oger_output(self.nlp_dir, input_file_name)'''
         
-        # Mapping table for metabolism.
-        # TODO: Find an alternative way for doing this
-        col = ['ID', 'ActualTerm', 'PreferredTerm']
-        metabolism_map_df = pd.DataFrame(columns=col)
-        metabolism_map_df = metabolism_map_df.append({'ID':'ECOCORE:00000172', 'ActualTerm':'anaerobic', 'PreferredTerm':'anaerobe'}, ignore_index=True)
-        metabolism_map_df = metabolism_map_df.append({'ID':'ECOCORE:00000172', 'ActualTerm':'strictly anaerobic', 'PreferredTerm':'anaerobe'}, ignore_index=True)
-        metabolism_map_df = metabolism_map_df.append({'ID':'ECOCORE:00000178', 'ActualTerm':'obligate anaerobic', 'PreferredTerm':'obligate anaerobe'}, ignore_index=True)
-        metabolism_map_df = metabolism_map_df.append({'ID':'ECOCORE:00000177', 'ActualTerm':'facultative', 'PreferredTerm':'facultative anaerobe'}, ignore_index=True)
-        metabolism_map_df = metabolism_map_df.append({'ID':'ECOCORE:00000179', 'ActualTerm':'obligate aerobic', 'PreferredTerm':'obligate aerobe'}, ignore_index=True)
-        metabolism_map_df = metabolism_map_df.append({'ID':'ECOCORE:00000173', 'ActualTerm':'aerobic', 'PreferredTerm':'aerobe'}, ignore_index=True)
-        metabolism_map_df = metabolism_map_df.append({'ID':'ECOCORE:00000180', 'ActualTerm':'microaerophilic', 'PreferredTerm':'microaerophilic'}, ignore_index=True)
-
-
         # transform data, something like:
-        with open(input_file, 'r') as f, \
-                open(self.output_node_file, 'w') as node, \
-                open(self.output_edge_file, 'w') as edge, \
-                open(self.subset_terms_file, 'w') as terms_file:   # If need to capture CURIEs for ROBOT STAR extraction
-
-            # write headers (change default node/edge headers if necessary
-            node.write("\t".join(self.node_header) + "\n")
-            edge.write("\t".join(self.edge_header) + "\n")
+        # (terms_file: If need to capture CURIEs for ROBOT STAR extraction)
+        # The terms file and resolution diagnostics cover all the input files and, given
+        # several, every node and edge also goes to the combined writer
+        with span('traits.main_loop') as loop_span, \
+                ExitStack() as outputs, \
+                open(self.subset_terms_file, 'w') as terms_file, \
+                TermDiagnostics(os.path.join(self.DEFAULT_NLP_OUTPUT_DIR, 'remnantsCHEBI.tsv'),
+                                RESOLUTION_COLUMNS) as chem_diagnostics, \
+                TermDiagnostics(os.path.join(self.DEFAULT_NLP_OUTPUT_DIR, 'remnantsGO.tsv'),
+                                RESOLUTION_COLUMNS) as path_diagnostics:
+
+            combined = None
+            if len(input_files) > 1:
+                combined = outputs.enter_context(self.node_edge_writer(
+                    os.path.join(output_dirs[-1], 'nodes.tsv'),
+                    os.path.join(output_dirs[-1], 'edges.tsv')))
+
+            rows_in = 0
+            for input_file, output_dir, (tax_id_column, org_name_column) in \
+                    zip(input_files, output_dirs, columns):
+                with span(os.path.basename(input_file)) as file_span, \
+                        open_input(input_file) as f, \
+                        self.node_edge_writer(os.path.join(output_dir, 'nodes.tsv'),
+                                              os.path.join(output_dir, 'edges.tsv')) as writer:
+
+                    # Nodes and edges go to this file's output and the combined output; a
+                    # node is new (for the terms file) if the combined output hadn't got it
+                    def write_node(row: List[str]) -> bool:
+                        new = writer.write_node(row)
+                        return combined.write_node(row) if combined is not None else new
+
+                    def write_edge(row: List[str]) -> None:
+                        writer.write_edge(row)
+                        if combined is not None:
+                            combined.write_edge(row)
+
+                    header_items = parse_header(f.readline(), sep=',')
+
+
+                    # Nodes
+                    org_node_type = "biolink:OrganismTaxon" # [org_name]
+                    chem_node_type = "biolink:ChemicalSubstance" # [carbon_substrate]
+                    shape_node_type = "biolink:AbstractEntity" # [cell_shape]
+                    metabolism_node_type = "biolink:ActivityAndBehavior" # [metabolism]
+                    pathway_node_type = "biolink:BiologicalProcess" # [pathways]
+                    curie = 'NEED_CURIE'
             
-            header_items = parse_header(f.readline(), sep=',')
-            seen_node: dict = defaultdict(int)
-            seen_edge: dict = defaultdict(int)
-
-
-            # Nodes
-            org_node_type = "biolink:OrganismTaxon" # [org_name]
-            chem_node_type = "biolink:ChemicalSubstance" # [carbon_substrate]
-            shape_node_type = "biolink:AbstractEntity" # [cell_shape]
-            metabolism_node_type = "biolink:ActivityAndBehavior" # [metabolism]
-            pathway_node_type = "biolink:BiologicalProcess" # [pathways]
-            curie = 'NEED_CURIE'
-            
-            #Prefixes
-            org_prefix = "NCBITaxon:"
-            chem_prefix = "microtraits.carbon_substrates:"
-            shape_prefix = "microtraits.cell_shape_enum:"
-            #metab_prefix = "microtraits.metabolism:"
-            source_prefix = "microtraits.data_source:"
-            pathway_prefix = "microtraits.pathways:"
-
-            # Edges
-            org_to_shape_edge_label = "biolink:has_phenotype" #  [org_name -> cell_shape, metabolism]
-            org_to_shape_edge_relation = "RO:0002200" #  [org_name -> has phenotype -> cell_shape, metabolism]
-            org_to_chem_edge_label = "biolink:interacts_with" # [org_name -> carbon_substrate]
-            org_to_chem_edge_relation = "RO:0002438" # [org_name -> 'trophically interacts with' -> carbon_substrate]
-            org_to_source_edge_label = "biolink:location_of" # [org -> isolation_source]
-            org_to_source_edge_relation = "RO:0001015" #[org -> location_of -> source]
-            org_to_metab_edge_label = "biolink:capable_of" # [org -> metabolism]
-            org_to_metab_edge_relation = "RO:0002215" # [org -> biological_process -> metabolism]
-            org_to_pathway_edge_label = "biolink:capable_of" # # [org -> pathway]
-            org_to_pathway_edge_relation = "RO:0002215" # [org -> biological_process -> metabolism]
-
-            ''' TEST
-                Collector of partial and NoMatches.
-            '''
-            remnants_chebi = pd.DataFrame()
-            remnants_path = pd.DataFrame()
-            
-            # transform
-            for line in f:
-                """
-                This dataset is a csv and also has commas 
-                present within a column of data. 
-                Hence a regex solution
-                """
-                # transform line into nodes and edges
-                # node.write(this_node1)
-                # node.write(this_node2)
-                # edge.write(this_edge)
+                    #Prefixes
+                    org_prefix = "NCBITaxon:"
+                    chem_prefix = "microtraits.carbon_substrates:"
+                    shape_prefix = "microtraits.cell_shape_enum:"
+                    #metab_prefix = "microtraits.metabolism:"
+                    source_prefix = "microtraits.data_source:"
+                    pathway_prefix = "microtraits.pathways:"
+
+                    # Edges
+                    org_to_shape_edge_label = "biolink:has_phenotype" #  [org_name -> cell_shape, metabolism]
+                    org_to_shape_edge_relation = "RO:0002200" #  [org_name -> has phenotype -> cell_shape, metabolism]
+                    org_to_chem_edge_label = "biolink:interacts_with" # [org_name -> carbon_substrate]
+                    org_to_chem_edge_relation = "RO:0002438" # [org_name -> 'trophically interacts with' -> carbon_substrate]
+                    org_to_source_edge_label = "biolink:location_of" # [org -> isolation_source]
+                    org_to_source_edge_relation = "RO:0001015" #[org -> location_of -> source]
+                    org_to_metab_edge_label = "biolink:capable_of" # [org -> metabolism]
+                    org_to_metab_edge_relation = "RO:0002215" # [org -> biological_process -> metabolism]
+                    org_to_pathway_edge_label = "biolink:capable_of" # # [org -> pathway]
+                    org_to_pathway_edge_relation = "RO:0002215" # [org -> biological_process -> metabolism]
+
+                    # transform
+                    file_rows_in = 0
+                    for line in self.iter_rows(f, chunk_size, oger_indexes,
+                                               header_items.index(tax_id_column)):
+                        file_rows_in += 1
+                        """
+                        This dataset is a csv and also has commas 
+                        present within a column of data. 
+                        Hence a regex solution
+                        """
+                        # transform line into nodes and edges
+                        # node.write(this_node1)
+                        # node.write(this_node2)
+                        # edge.write(this_edge)
                 
 
-                line = re.sub(r'(?!(([^"]*"){2})*[^"]*$),', '|', line) # alanine, glucose -> alanine| glucose
-                items_dict = parse_line(line, header_items, sep=',')
-                match_description = ''
-
-                org_name = items_dict['org_name']
-                tax_id = items_dict['tax_id']
-                metabolism = items_dict['metabolism']
-                carbon_substrates = set([x.strip() for x in items_dict['carbon_substrates'].split('|')])
-                cell_shape = items_dict['cell_shape']
-                isolation_source = set([x.strip() for x in items_dict['isolation_source'].split('|')])
-                pathways = set([x.strip() for x in items_dict['pathways'].replace('_',' ').split('|')])
-
-            # Write Node ['id', 'entity', 'category']
-                # Write organism node 
-                org_id = org_prefix + str(tax_id)
-                if not org_id.endswith(':na') and org_id not in seen_node:
-                    write_node_edge_item(fh=node,
-                                         header=self.node_header,
-                                         data=[org_id,
-                                               org_name,
-                                               org_node_type,
-                                               match_description])
-                    seen_node[org_id] += 1
-                    # If capture of all NCBITaxon: CURIEs are needed for ROBOT STAR extraction
-                    if org_id.startswith('NCBITaxon:'):
-                        terms_file.write(org_id + "\n")
-
-                # Write chemical node
-                for chem_name in carbon_substrates:
-                    chem_curie = curie
-                    multi_row_flag = False
-                    match_description = ''
-                    #chem_node_type = chem_name
-
-                    # Get relevant NLP results
-                    if chem_name != 'NA':
-                        relevant_tax = oger_output_chebi.loc[oger_output_chebi['TaxId'] == int(tax_id)]
-                        relevant_chem = relevant_tax.loc[relevant_tax['TokenizedTerm'] == chem_name]
-                        # Check if term exists
-                        if len(relevant_chem) >= 1:
-                            # 'Exact' string match 
-                            if any(relevant_chem['StringMatch'].str.contains('Exact')):
-                                chem_curie = relevant_chem['CURIE'].loc[relevant_chem['StringMatch']=='Exact'].item()
-                                chem_node_type = relevant_chem['Biolink'].loc[relevant_chem['StringMatch']=='Exact'].item()
-                                match_description = 'ExactStringMatch'
-                            # 'Partial' or 'No Match'
-                            else:
-                                chem_ner_sssom = relevant_chem.merge(chem_sssom, how='inner', left_on=['TokenizedTerm', 'CURIE'], right_on=['subject_label', 'object_id'])
-                                chem_ner_sssom = chem_ner_sssom.drop_duplicates()
-                                # If 'oio:hasExactSynonym' present
-                                if any(chem_ner_sssom['object_match_field'].str.contains('oio:hasExactSynonym')):
-                                    chem_curie = chem_ner_sssom['CURIE'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasExactSynonym'].item()
-                                    chem_node_type = chem_ner_sssom['Biolink'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasExactSynonym'].item()
-                                    match_description = chem_ner_sssom['object_match_field'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasExactSynonym'].item()
-                                # if 'oio:hasRelatedSynonym' present
-                                elif any(chem_ner_sssom['object_match_field'].str.contains('oio:hasRelatedSynonym')):
-                                    if len(chem_ner_sssom['CURIE'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym']) > 1:
-                                        multi_row_flag = True
-                                        chem_curie = chem_ner_sssom['CURIE'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym']
-                                        chem_node_type = chem_ner_sssom['Biolink'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym']
-                                        match_description = chem_ner_sssom['object_match_field'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym']
-                                    else:
-                                        chem_curie = chem_ner_sssom['CURIE'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym'].item()
-                                        chem_node_type = chem_ner_sssom['Biolink'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym'].item()
-                                        match_description = chem_ner_sssom['object_match_field'].loc[chem_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym'].item()
-                                else:
-                                    remnants_chebi = remnants_chebi.append(chem_ner_sssom,ignore_index=True)
-                                    #chem_curie = relevant_chem.iloc[0]['CURIE']
-                                    #chem_node_type = relevant_chem.iloc[0]['Biolink']
-                                
-                                
-                    if multi_row_flag == True:
-                        for i,v in chem_curie.items():
-                            if chem_curie[i] == curie:
+                        line = re.sub(r'(?!(([^"]*"){2})*[^"]*$),', '|', line) # alanine, glucose -> alanine| glucose
+                        items_dict = parse_line(line, header_items, sep=',')
+                        match_description = ''
+
+                        org_name = items_dict[org_name_column]
+                        tax_id = items_dict[tax_id_column]
+                        metabolism = items_dict['metabolism']
+                        carbon_substrates = set([x.strip() for x in items_dict['carbon_substrates'].split('|')])
+                        cell_shape = items_dict['cell_shape']
+                        isolation_source = set([x.strip() for x in items_dict['isolation_source'].split('|')])
+                        pathways = set([x.strip() for x in items_dict['pathways'].replace('_',' ').split('|')])
+
+                    # Write Node ['id', 'entity', 'category']
+                        # Write organism node 
+                        org_id = org_prefix + str(tax_id)
+                        if not org_id.endswith(':na') and write_node([org_id,
+                                                                     org_name,
+                                                                     org_node_type,
+                                                                     match_description]):
+                            # If capture of all NCBITaxon: CURIEs are needed for ROBOT STAR extraction
+                            if org_id.startswith('NCBITaxon:'):
+                                terms_file.write(org_id + "\n")
+
+                        # Write chemical node
+                        for chem_name in carbon_substrates:
+                            match_description = ''
+                            candidates = ()
+
+                            # Get relevant NLP results
+                            if chem_name != 'NA' and self.nlp:
+                                resolution = chem_resolver.resolve(int(tax_id), chem_name)
+                                candidates = resolution.candidates
+                                if resolution.reason:
+                                    chem_diagnostics.record(chem_name, resolution.reason, resolution.rows)
+
+                            if not candidates:
                                 chem_id = chem_prefix + chem_name.lower().replace(' ','_')
-                            else:
-                                chem_id = chem_curie[i]
-                            if  not chem_id.endswith(':na') and chem_id not in seen_node:
-                                write_node_edge_item(fh=node,
-                                                    header=self.node_header,
-                                                    data=[chem_id,
-                                                        chem_name,
-                                                        chem_node_type[i],
-                                                        match_description[i]])
-                                seen_node[chem_id] += 1
-                        
-                    else:
-                        if chem_curie == curie:
-                            chem_id = chem_prefix + chem_name.lower().replace(' ','_')
-                        else:
-                            chem_id = chem_curie
-                            
-                        if  not chem_id.endswith(':na') and  chem_id not in seen_node:
-                            write_node_edge_item(fh=node,
-                                                header=self.node_header,
-                                                data=[chem_id,
-                                                    chem_name,
-                                                    chem_node_type,
-                                                    match_description])
-                            seen_node[chem_id] += 1
-
-                # Write shape node
-                '''# Get relevant NLP results
-                if cell_shape != 'NA':
-                    relevant_tax = oger_output_pato.loc[oger_output_pato['TaxId'] == int(tax_id)]
-                    relevant_shape = relevant_tax.loc[relevant_tax['TokenizedTerm'] == cell_shape]
-                    if len(relevant_shape) == 1:
-                        cell_shape = relevant_shape.iloc[0]['CURIE']
-                        shape_node_type = relevant_shape.iloc[0]['Biolink']'''
+                                if not chem_id.endswith(':na'):
+                                    write_node([chem_id, chem_name, chem_node_type, match_description])
+                            # Several candidates (e.g. more than one 'oio:hasRelatedSynonym') each get a node
+                            for chem_id, chem_node_type, match_description in candidates:
+                                if not chem_id.endswith(':na'):
+                                    write_node([chem_id, chem_name, chem_node_type, match_description])
+
+                        # Write shape node
+                        '''# Get relevant NLP results
+                        if cell_shape != 'NA':
+                            relevant_tax = oger_output_pato.loc[oger_output_pato['TaxId'] == int(tax_id)]
+                            relevant_shape = relevant_tax.loc[relevant_tax['TokenizedTerm'] == cell_shape]
+                            if len(relevant_shape) == 1:
+                                cell_shape = relevant_shape.iloc[0]['CURIE']
+                                shape_node_type = relevant_shape.iloc[0]['Biolink']'''
                         
-                shape_id = shape_prefix + cell_shape.lower()
-
-                if  not shape_id.endswith(':na') and shape_id not in seen_node:
-                    write_node_edge_item(fh=node,
-                                         header=self.node_header,
-                                         data=[shape_id,
-                                               cell_shape,
-                                               shape_node_type,
-                                               match_description])
-                    seen_node[shape_id] += 1
-
-                # Write source node
-                for source_name in isolation_source:
-                    #   Collapse the entity
-                    #   A_B_C_D => [A, B, C, D]
-                    #   D is the entity of interest
-                    source_name_split = source_name.split('_')
-                    source_name_collapsed = source_name_split[-1]
-                    env_curie = curie
-                    env_term = source_name_collapsed
-                    source_node_type = "" # [isolation_source] left blank intentionally
-                    match_description = ''
-
-                    # Get information from the environments.csv (unique_env_df)
-                    relevant_env_df = unique_env_df.loc[unique_env_df['Type'] == source_name]
-
-                    if len(relevant_env_df) == 1:
+                        shape_id = shape_prefix + cell_shape.lower()
+
+                        if not shape_id.endswith(':na'):
+                            write_node([shape_id, cell_shape, shape_node_type, match_description])
+
+                        # Write source node
+                        for source_name in isolation_source:
+                            #   Collapse the entity
+                            #   A_B_C_D => [A, B, C, D]
+                            #   D is the entity of interest
+                            source_name_split = source_name.split('_')
+                            source_name_collapsed = source_name_split[-1]
+                            env_curie = curie
+                            env_term = source_name_collapsed
+                            source_node_type = "" # [isolation_source] left blank intentionally
+                            match_description = ''
+
+                            # Get information from the environments.csv (environment_map)
                             '''
-                            If multiple ENVOs exist, take the last one since that would be the curie of interest
+                            If multiple ENVOs exist, the last one is mapped since that would be the curie of interest
                             after collapsing the entity.
                             TODO(Maybe): If CURIE is 'nan', it could be sourced from OGER o/p (ENVO backend)
                                   of environments.csv
                             '''
-                            env_curie = str(relevant_env_df.iloc[0]['ENVO_ids']).split(',')[-1].strip()
-                            env_term = str(relevant_env_df.iloc[0]['ENVO_terms']).split(',')[-1].strip()
-                            if env_term == 'nan':
-                                env_curie = curie
-                                env_term = source_name_collapsed
-                            
-                                 
-
-                    #source_id = source_prefix + source_name.lower()
-                    if env_curie == curie:
-                        source_id = source_prefix + source_name_collapsed.lower()
-                    else:
-                        source_id = env_curie
-                        if source_id.startswith('CHEBI:'):
-                            source_node_type = chem_node_type
-
-                    if  not source_id.endswith(':na') and source_id not in seen_node:
-                        write_node_edge_item(fh=node,
-                                            header=self.node_header,
-                                            data=[source_id,
-                                                env_term,
-                                                source_node_type,
-                                                match_description])
-                        seen_node[source_id] += 1
-                    
-                # Write metabolism node
+                            env = environment_map.get(source_name)
+                            if env is not None:
+                                env_curie, env_term = env
 
-                metabolism_id = None
-                
-                if metabolism != 'NA':
-                    if metabolism_map_df['ActualTerm'].str.contains(metabolism).any():
-                        metabolism_id = metabolism_map_df.loc[metabolism_map_df['ActualTerm'] == metabolism]['ID'].item()
-                        metabolism_term = metabolism_map_df.loc[metabolism_map_df['ActualTerm'] == metabolism]['PreferredTerm'].item()
-                        if metabolism_id not in seen_node:
-                            write_node_edge_item(fh=node,
-                                                header=self.node_header,
-                                                data=[metabolism_id,
-                                                    metabolism_term,
-                                                    metabolism_node_type,
-                                                    match_description])
-                            seen_node[metabolism_id] += 1
-
-                # Write pathway node 
-                for pathway_name in pathways:
-                    pathway_curie = curie
-                    match_description = ''
-                    multi_row_flag = False
-
-                    # Get relevant NLP results
-                    if pathway_name != 'NA':
-                        relevant_tax = oger_output_go.loc[oger_output_go['TaxId'] == int(tax_id)]
-                        relevant_pathway = relevant_tax.loc[relevant_tax['TokenizedTerm'] == pathway_name]
-                        if len(relevant_pathway) >= 1:
-                            # 'Exact' string match 
-                            if any(relevant_pathway['StringMatch'].str.contains('Exact')):
-                                pathway_curie = relevant_pathway['CURIE'].loc[relevant_pathway['StringMatch']=='Exact'].item()
-                                pathway_node_type = relevant_pathway['Biolink'].loc[relevant_pathway['StringMatch']=='Exact'].item()
-                                match_description = 'ExactStringMatch'
-                            # 'Partial' or 'No Match'
+                            #source_id = source_prefix + source_name.lower()
+                            if env_curie == curie:
+                                source_id = source_prefix + source_name_collapsed.lower()
                             else:
-                                path_ner_sssom = relevant_pathway.merge(path_sssom, how='inner', left_on=['TokenizedTerm', 'CURIE'], right_on=['subject_label', 'object_id'])
-                                path_ner_sssom = path_ner_sssom.drop_duplicates()
-                                # If 'oio:hasExactSynonym' present
-                                if any(path_ner_sssom['object_match_field'].str.contains('oio:hasExactSynonym')):
-                                    pathway_curie = path_ner_sssom['CURIE'].loc[path_ner_sssom['object_match_field'] == 'oio:hasExactSynonym'].item()
-                                    pathway_node_type = path_ner_sssom['Biolink'].loc[path_ner_sssom['object_match_field'] == 'oio:hasExactSynonym'].item()
-                                    match_description = path_ner_sssom['object_match_field'].loc[path_ner_sssom['object_match_field'] == 'oio:hasExactSynonym'].item()
-                                # if 'oio:hasRelatedSynonym' present
-                                elif any(path_ner_sssom['object_match_field'].str.contains('oio:hasRelatedSynonym')):
-                                    if len(path_ner_sssom['CURIE'].loc[path_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym']) > 1:
-                                        multi_row_flag = True
-                                        pathway_curie = path_ner_sssom['CURIE'].loc[path_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym']
-                                        pathway_node_type = path_ner_sssom['Biolink'].loc[path_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym']
-                                        match_description = path_ner_sssom['object_match_field'].loc[path_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym']
-                                    else:
-                                        pathway_curie = path_ner_sssom['CURIE'].loc[path_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym'].item()
-                                        pathway_node_type = path_ner_sssom['Biolink'].loc[path_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym'].item()
-                                        match_description = path_ner_sssom['object_match_field'].loc[path_ner_sssom['object_match_field'] == 'oio:hasRelatedSynonym'].item()
-                                # if 'oio:hasBroadSynonym' present
-                                elif any(path_ner_sssom['object_match_field'].str.contains('oio:hasBroadSynonym')):
-                                    if len(path_ner_sssom['CURIE'].loc[path_ner_sssom['object_match_field'] == 'oio:hasBroadSynonym']) > 1:
-                                        multi_row_flag = True
-                                        pathway_curie = path_ner_sssom['CURIE'].loc[path_ner_sssom['object_match_field'] == 'oio:hasBroadSynonym']
-                                        pathway_node_type = path_ner_sssom['Biolink'].loc[path_ner_sssom['object_match_field'] == 'oio:hasBroadSynonym']
-                                        match_description = path_ner_sssom['object_match_field'].loc[path_ner_sssom['object_match_field'] == 'oio:hasBroadSynonym']
-                                    else:
-                                        pathway_curie = path_ner_sssom['CURIE'].loc[path_ner_sssom['object_match_field'] == 'oio:hasBroadSynonym'].item()
-                                        pathway_node_type = path_ner_sssom['Biolink'].loc[path_ner_sssom['object_match_field'] == 'oio:hasBroadSynonym'].item()
-                                        match_description = path_ner_sssom['object_match_field'].loc[path_ner_sssom['object_match_field'] == 'oio:hasBroadSynonym'].item()
-                                else:
-                                    remnants_path = remnants_path.append(path_ner_sssom,ignore_index=True)
-
-                    if multi_row_flag == True:
-                        for i,v in pathway_curie.items():
-                            if pathway_curie[i] == curie:
-                                pathway_id = pathway_prefix + pathway_name.lower().replace(' ','_')
-                            else:
-                                pathway_id = pathway_curie[i]
-                            if  not pathway_id.endswith(':na') and pathway_id not in seen_node:
-                                write_node_edge_item(fh=node,
-                                                    header=self.node_header,
-                                                    data=[pathway_id,
-                                                        pathway_name,
-                                                        pathway_node_type[i],
-                                                        match_description[i]])
-                                seen_node[pathway_id] += 1
-                        multi_row_flag = False
-                    else:
-                        if pathway_curie == curie:
-                            pathway_id = pathway_prefix + pathway_name.lower().replace(' ','_')
-                        else:
-                            pathway_id = pathway_curie
-
-                        
-                        if  not pathway_id.endswith(':na') and  pathway_id not in seen_node:
-                            write_node_edge_item(fh=node,
-                                                header=self.node_header,
-                                                data=[pathway_id,
-                                                    pathway_name,
-                                                    pathway_node_type,
-                                                    match_description])
-                            seen_node[pathway_id] += 1
-               
-                
+                                source_id = env_curie
+                                if source_id.startswith('CHEBI:'):
+                                    source_node_type = chem_node_type
 
+                            if not source_id.endswith(':na'):
+                                write_node([source_id, env_term, source_node_type, match_description])
+                    
+                        # Write metabolism node
 
-            # Write Edge
-                # org-chem edge
-                if not chem_id.endswith(':na') and org_id+chem_id not in seen_edge:
-                    write_node_edge_item(fh=edge,
-                                            header=self.edge_header,
-                                            data=[org_id,
-                                                org_to_chem_edge_label,
-                                                chem_id,
-                                                org_to_chem_edge_relation])
-                    seen_edge[org_id+chem_id] += 1
-
-                # org-shape edge
-                if  not shape_id.endswith(':na') and org_id+shape_id not in seen_edge:
-                    write_node_edge_item(fh=edge,
-                                            header=self.edge_header,
-                                            data=[org_id,
-                                                org_to_shape_edge_label,
-                                                shape_id,
-                                                org_to_shape_edge_relation])
-                    seen_edge[org_id+shape_id] += 1
+                        metabolism_id = None
+                
+                        metabolism_mapping = metabolism_map.get(metabolism)
+                        if metabolism_mapping is not None:
+                            metabolism_id, metabolism_term = metabolism_mapping
+                            write_node([metabolism_id, metabolism_term,
+                                        metabolism_node_type, match_description])
+
+                        # Write pathway node 
+                        for pathway_name in pathways:
+                            match_description = ''
+                            candidates = ()
+
+                            # Get relevant NLP results
+                            if pathway_name != 'NA' and self.nlp:
+                                resolution = path_resolver.resolve(int(tax_id), pathway_name)
+                                candidates = resolution.candidates
+                                if resolution.reason:
+                                    path_diagnostics.record(pathway_name, resolution.reason, resolution.rows)
+
+                            if not candidates:
+                                pathway_id = pathway_prefix + pathway_name.lower().replace(' ','_')
+                                if not pathway_id.endswith(':na'):
+                                    write_node([pathway_id, pathway_name, pathway_node_type, match_description])
+                            for pathway_id, pathway_node_type, match_description in candidates:
+                                if not pathway_id.endswith(':na'):
+                                    write_node([pathway_id, pathway_name, pathway_node_type, match_description])
+
+                    # Write Edge
+                        # org-chem edge
+                        if not chem_id.endswith(':na'):
+                            write_edge([org_id, org_to_chem_edge_label, chem_id, org_to_chem_edge_relation])
+
+                        # org-shape edge
+                        if not shape_id.endswith(':na'):
+                            write_edge([org_id, org_to_shape_edge_label, shape_id, org_to_shape_edge_relation])
                 
-                # org-source edge
-                if not source_id.endswith(':na') and org_id+source_id not in seen_edge:
-                    write_node_edge_item(fh=edge,
-                                            header=self.edge_header,
-                                            data=[org_id,
-                                                org_to_source_edge_label,
-                                                source_id,
-                                                org_to_source_edge_relation])
-                    seen_edge[org_id+source_id] += 1
-
-                # org-metabolism edge
-                if metabolism_id != None and not metabolism_id.endswith(':na') and org_id+metabolism_id not in seen_edge:
-                    write_node_edge_item(fh=edge,
-                                            header=self.edge_header,
-                                            data=[org_id,
-                                                org_to_metab_edge_label,
-                                                metabolism_id,
-                                                org_to_metab_edge_relation])
-                    seen_edge[org_id+metabolism_id] += 1
-
-                # org-pathway edge
-                if pathway_id != None and not pathway_id.endswith(':na') and org_id+pathway_id not in seen_edge:
-                    write_node_edge_item(fh=edge,
-                                            header=self.edge_header,
-                                            data=[org_id,
-                                                org_to_pathway_edge_label,
-                                                pathway_id,
-                                                org_to_pathway_edge_relation])
-                    seen_edge[org_id+source_id] += 1
-
-        # Files write ends
-        remnants_chebi.to_csv(os.path.join(self.DEFAULT_NLP_OUTPUT_DIR,'remnantsCHEBI.tsv'), sep='\t', index=False)
-        remnants_path.to_csv(os.path.join(self.DEFAULT_NLP_OUTPUT_DIR,'remnantsGO.tsv'), sep='\t', index=False)
+                        # org-source edge
+                        if not source_id.endswith(':na'):
+                            write_edge([org_id, org_to_source_edge_label, source_id, org_to_source_edge_relation])
+
+                        # org-metabolism edge
+                        if metabolism_id != None and not metabolism_id.endswith(':na'):
+                            write_edge([org_id, org_to_metab_edge_label, metabolism_id, org_to_metab_edge_relation])
+
+                        # org-pathway edge
+                        if pathway_id != None and not pathway_id.endswith(':na'):
+                            write_edge([org_id, org_to_pathway_edge_label, pathway_id, org_to_pathway_edge_relation])
+
+                    file_span.count('rows_in', file_rows_in)
+                    file_span.count('nodes_out', writer.node_count)
+                    file_span.count('edges_out', writer.edge_count)
+                rows_in += file_rows_in
+
+            totals = combined if combined is not None else writer
+            loop_span.count('rows_in', rows_in)
+            loop_span.count('nodes_out', totals.node_count)
+            loop_span.count('edges_out', totals.edge_count)
+            loop_span.count('unresolved_chebi', chem_diagnostics.total)
+            loop_span.count('unresolved_go', path_diagnostics.total)
 
         # Get trees from all relevant IDs from NCBITaxon and convert to JSON
         '''
         NCBITaxon_131567 = cellular organisms 
         (Source = http://www.ontobee.org/ontology/NCBITaxon?iri=http://purl.obolibrary.org/obo/NCBITaxon_131567)
         '''
+        # Given KGX TSVs of the whole NCBITaxon (data/raw/ncbitaxon_{nodes,edges}.tsv,
+        # made from NCBI's taxdump.tar.gz the first time if that has been downloaded),
+        # the ancestors of the taxa are taken from them directly and written where
+        # OntologyTransform would write them, else ROBOT extracts them from ncbitaxon.owl
+        # for OntologyTransform
+        ncbitaxon_nodes_file = find_input(self.ncbitaxon_nodes_file)
+        ncbitaxon_edges_file = find_input(self.ncbitaxon_edges_file)
+        if not (os.path.isfile(ncbitaxon_nodes_file) and os.path.isfile(ncbitaxon_edges_file)) \
+                and os.path.isfile(self.taxdump_file):
+            with span('traits.ncbitaxon_taxdump') as s:
+                s.count('bytes_read', os.path.getsize(self.taxdump_file))
+                n_nodes, n_edges = taxdump_to_tsv(self.taxdump_file, self.ncbitaxon_nodes_file,
+                                                  self.ncbitaxon_edges_file)
+                s.count('nodes_out', n_nodes)
+                s.count('edges_out', n_edges)
+            ncbitaxon_nodes_file, ncbitaxon_edges_file = \
+                self.ncbitaxon_nodes_file, self.ncbitaxon_edges_file
+        if os.path.isfile(ncbitaxon_nodes_file) and os.path.isfile(ncbitaxon_edges_file):
+            ontologies_dir = os.path.join(self.output_base_dir, 'ontologies')
+            os.makedirs(ontologies_dir, exist_ok=True)
+            output = os.path.join(ontologies_dir, 'ncbitaxon')
+            with span('traits.ncbitaxon_subset') as s:
+                n_nodes, n_edges = subset_taxonomy(
+                    ncbitaxon_nodes_file, ncbitaxon_edges_file, self.subset_terms_file,
+                    output + '_nodes.tsv', output + '_edges.tsv',
+                    compression=self.output_compression)
+                s.count('nodes_out', n_nodes)
+                s.count('edges_out', n_edges)
+            # tells OntologyTransform to keep the subset rather than convert any
+            # ncbitaxon.json, e.g. one left by an earlier run with ROBOT
+            write_subset_marker(output, {'nodes_file': ncbitaxon_nodes_file,
+                                         'edges_file': ncbitaxon_edges_file,
+                                         'terms_file': self.subset_terms_file,
+                                         'nodes': n_nodes, 'edges': n_edges})
+            return
+
+        remove_subset_marker(os.path.join(self.output_base_dir, 'ontologies', 'ncbitaxon'))
         subset_ontology_needed = 'NCBITaxon'
-        extract_convert_to_json(self.input_base_dir, subset_ontology_needed, self.subset_terms_file, 'BOT')
\ No newline at end of file
+        with span('traits.robot_ncbitaxon_subset'):
+            extract_convert_to_json(self.input_base_dir, subset_ontology_needed, self.subset_terms_file, 'BOT')
\ No newline at end of file
@@ -1,8 +1,10 @@
 import os
 import shutil
-from typing import Optional
+from typing import List, Optional
 import yaml
 
+from kg_microbe.utils.transform_utils import NodeEdgeWriter
+
 
 class Transform:
     """
@@ -41,6 +43,18 @@ class Transform:
         self.output_base_dir = output_dir if output_dir else self.DEFAULT_OUTPUT_DIR
         self.output_dir = os.path.join(self.output_base_dir, source_name)
         self.schema_dir = self.DEFAULT_SCHEMA_DIR
+
+        # output options: None/'gz'/'zst' compression
+        self.output_compression: Optional[str] = None
+
+        # memory options: transforms that support it process their input in blocks of
+        # chunk_size rows, sized to stay under memory_limit_mb if that is given instead,
+        # and de-duplicate output with compact digests (see NodeEdgeWriter)
+        self.chunk_size: Optional[int] = None
+        self.memory_limit_mb: Optional[float] = None
+        self.compact_dedup = False
+        # columns that identify an edge when de-duplicating [NodeEdgeWriter's EDGE_KEY]
+        self.edge_key: Optional[List[str]] = None
         
         
         
@@ -50,8 +64,14 @@ class Transform:
         self.output_edge_file = os.path.join(self.output_dir, "edges.tsv")
         self.output_json_file = os.path.join(self.output_dir, "nodes_edges.json")
         self.subset_terms_file = os.path.join(self.input_base_dir,"subset_terms.tsv")
+        # KGX TSVs of the whole NCBITaxon, to subset without ROBOT; they are made from
+        # NCBI's taxdump (see download.yaml) if it has been downloaded
+        self.ncbitaxon_nodes_file = os.path.join(self.input_base_dir, "ncbitaxon_nodes.tsv")
+        self.ncbitaxon_edges_file = os.path.join(self.input_base_dir, "ncbitaxon_edges.tsv")
+        self.taxdump_file = os.path.join(self.input_base_dir, "taxdump.tar.gz")
         self.chemicals_sssom = os.path.join(self.schema_dir,'chemicals.sssom.tsv')
         self.pathways_sssom = os.path.join(self.schema_dir,'pathways.sssom.tsv')
+        self.trait_mappings_file = os.path.join(self.schema_dir,'trait_mappings.yaml')
 
         
         os.makedirs(self.output_dir, exist_ok=True)
@@ -92,5 +112,23 @@ class Transform:
             
 
 
+    def node_edge_writer(self, node_file: Optional[str] = None,
+                         edge_file: Optional[str] = None) -> NodeEdgeWriter:
+        '''
+        NodeEdgeWriter for this transform's output files, using its headers and
+        output options.
+
+        :param node_file: nodes file to write [self.output_node_file]
+        :param edge_file: edges file to write [self.output_edge_file]
+        :return: NodeEdgeWriter
+        '''
+        return NodeEdgeWriter(node_file=node_file or self.output_node_file,
+                              edge_file=edge_file or self.output_edge_file,
+                              node_header=self.node_header,
+                              edge_header=self.edge_header,
+                              compression=self.output_compression,
+                              compact=self.compact_dedup,
+                              edge_key=self.edge_key)
+
     #def run(self, data_file: Optional[str] = None):
     #    pass
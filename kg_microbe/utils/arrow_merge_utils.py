@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from kg_microbe.utils.io_utils import open_binary_input
+from kg_microbe.utils.parquet_utils import PREFIX_COLUMNS, _import_pyarrow
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.transform_utils import TransformError
+
+
+# merge.yaml source formats read with pyarrow.dataset, and their pyarrow format
+ARROW_FORMATS = {'parquet': 'parquet', 'arrow': 'ipc'}
+MERGE_FORMATS = {'tsv'} | set(ARROW_FORMATS)
+MERGE_KEYS = {'nodes': ['id'], 'edges': ['subject', 'predicate', 'object']}
+# kept from the first source that has them, like KGX's core properties; the values of
+# the other columns of duplicates are combined, | separated
+CORE_COLUMNS = {'nodes': {'id', 'name'}, 'edges': {'id', 'subject', 'predicate', 'object'}}
+# the column order of KGX's TSV sink: these first, then the others sorted
+COLUMN_ORDER = {'nodes': ['id', 'category', 'name', 'description', 'xref', 'provided_by',
+                          'synonym', 'exact_synonym', 'broad_synonym', 'narrow_synonym',
+                          'related_synonym'],
+                'edges': ['id', 'subject', 'predicate', 'object', 'category', 'relation',
+                          'provided_by']}
+# columns parquet_utils adds, which are not in the TSVs
+DERIVED_COLUMNS = {c for columns in PREFIX_COLUMNS.values() for c in columns}
+SOURCE_FILE_PATTERN = re.compile(r'(^|_)(nodes|edges)\.')
+WRITE_ROWS = 1 << 16
+
+
+def arrow_merge_problems(config: Dict) -> List[str]:
+    """
+    What keeps a merge config from being merged with arrow_merge() rather than KGX:
+    sources it can't read or that have KGX operations or filters, and destinations
+    other than TSVs.
+
+    :param config: merge config, as parsed by merge_kg.parse_load_config()
+    :return: the problems, none if it can be
+    """
+
+    problems = []
+    for name, source in config['merged_graph']['source'].items():
+        source = source.get('input', source)
+        if source.get('format') not in MERGE_FORMATS:
+            problems.append("source {} is {}, not one of {}".format(
+                name, source.get('format'), ', '.join(sorted(MERGE_FORMATS))))
+        for key in ('operations', 'node_filters', 'edge_filters'):
+            if source.get(key):
+                problems.append("source {} has {}".format(name, key))
+    for name, destination in config['merged_graph'].get('destination', {}).items():
+        if destination.get('format') != 'tsv' or \
+                destination.get('compression') not in (None, 'tar.gz'):
+            problems.append("destination {} is not tsv or tar.gz compressed tsv".format(name))
+    return problems
+
+
+def _source_kind(filename: str) -> str:
+    match = SOURCE_FILE_PATTERN.search(os.path.basename(filename))
+    if not match:
+        raise TransformError("Can't tell whether {} has nodes or edges: its name should "
+                             "end in nodes.<format> or edges.<format>".format(filename))
+    return match.group(2)
+
+
+def read_kgx_table(filename: str, fmt: str) -> Any:
+    """
+    Read a KGX nodes or edges file as a pyarrow Table of strings, empty for missing
+    values, as it would be read from a TSV.
+
+    :param filename: TSV (optionally compressed), Parquet file or dataset directory (as
+                     written by parquet_utils.tsv_to_parquet(), hive partitioned), or
+                     Arrow IPC file
+    :param fmt: tsv, parquet or arrow
+    :return: pyarrow.Table
+    """
+
+    pa = _import_pyarrow()
+    import pyarrow.compute as pc  # type: ignore
+    import pyarrow.csv as pcsv  # type: ignore
+    import pyarrow.dataset as ds  # type: ignore
+
+    if fmt == 'tsv':
+        with open_binary_input(filename) as f:
+            header = f.readline().rstrip(b'\r\n').decode('utf-8').split('\t')
+        with open_binary_input(filename) as f:
+            table = pcsv.read_csv(
+                f, parse_options=pcsv.ParseOptions(delimiter='\t', quote_char=False),
+                convert_options=pcsv.ConvertOptions(
+                    column_types={c: pa.string() for c in header},
+                    strings_can_be_null=False))
+    elif fmt in ARROW_FORMATS:
+        table = ds.dataset(filename, format=ARROW_FORMATS[fmt], partitioning='hive').to_table()
+        table = table.drop([c for c in table.column_names if c in DERIVED_COLUMNS])
+    else:
+        raise TransformError("Can't read {} sources like {}".format(fmt, filename))
+
+    columns = []
+    for column in table.columns:
+        if column.type != pa.string():
+            column = column.cast(pa.string())
+        columns.append(pc.fill_null(column, ''))
+    return pa.table(columns, names=table.column_names)
+
+
+def _union(values: List[str]) -> str:
+    # the distinct | separated values, in order
+    seen: Dict[str, None] = {}
+    for value in values:
+        for v in value.split('|'):
+            if v:
+                seen[v] = None
+    return '|'.join(seen)
+
+
+def concat_tables(tables: List[Any]) -> Any:
+    """
+    Concatenate tables whose columns differ, with nulls for the missing columns.
+
+    :param tables: pyarrow Tables
+    :return: pyarrow.Table
+    """
+
+    pa = _import_pyarrow()
+    if int(pa.__version__.split('.')[0]) >= 14:
+        return pa.concat_tables(tables, promote_options='default')
+    # promote was replaced by promote_options in pyarrow 14, which needs Python 3.8
+    return pa.concat_tables(tables, promote=True)
+
+
+def merge_kgx_tables(tables: List[Any], kind: str) -> Any:
+    """
+    Merge KGX nodes or edges tables into one with a row per id, or per (subject,
+    predicate, object), as KGX merges them: the first non-empty value of each of
+    CORE_COLUMNS, and the distinct values of the other columns, | separated.
+
+    The keys are dictionary-encoded over all the tables, so that ids are compared as
+    integers, and grouped with a hash aggregation; only the rows of duplicate keys are
+    combined row by row. Rows are in the order their key first appears.
+
+    :param tables: pyarrow Tables, as read by read_kgx_table()
+    :param kind: nodes or edges
+    :return: pyarrow.Table
+    """
+
+    import numpy as np
+    pa = _import_pyarrow()
+    import pyarrow.compute as pc  # type: ignore
+
+    table = concat_tables(tables)
+    # one chunk per column, as take() is slow on the many chunks of partitioned datasets
+    table = pa.table([pc.fill_null(c, '') for c in table.columns],
+                     names=table.column_names).combine_chunks()
+    n = table.num_rows
+    if n == 0:
+        return table
+
+    # the same dictionary for subjects and objects, so their indices compare
+    keys = MERGE_KEYS[kind]
+    if kind == 'edges':
+        ids = pc.dictionary_encode(pa.chunked_array(
+            table['subject'].chunks + table['object'].chunks)).combine_chunks().indices
+        encoded = {'subject': ids[:n], 'object': ids[n:],
+                   'predicate': pc.dictionary_encode(table['predicate']).combine_chunks().indices}
+    else:
+        encoded = {'id': pc.dictionary_encode(table['id']).combine_chunks().indices}
+    key_table = pa.table(dict(encoded, _row=np.arange(n, dtype=np.int64)))
+    groups = key_table.group_by(keys).aggregate([('_row', 'min'), ('_row', 'count')])
+    single = pc.equal(groups['_row_count'], 1)
+    rows = pc.filter(groups['_row_min'], single)
+    merged = table.take(rows).append_column('_row', rows)
+
+    duplicates = groups.filter(pc.invert(single))
+    if duplicates.num_rows:
+        # the rows of each duplicate key, with the first row of the key
+        members = key_table.join(duplicates.select(keys + ['_row_min']), keys, join_type='inner')
+        members = members.sort_by('_row')
+        firsts = members['_row_min'].to_pylist()
+        core = CORE_COLUMNS[kind]
+        names = table.column_names
+        values: Dict[int, List[List[str]]] = {}
+        for first, row in zip(firsts, table.take(members['_row']).to_pylist()):
+            values.setdefault(first, []).append([row[c] for c in names])
+        combined = []
+        for first, group in values.items():
+            combined.append([next((v for v in column if v), '') if c in core else _union(column)
+                             for c, column in zip(names, zip(*group))] + [first])
+        merged = pa.concat_tables([merged, pa.table(
+            [pa.array(c, f.type) for c, f in zip(zip(*combined), merged.schema)],
+            schema=merged.schema)])
+    merged = merged.sort_by('_row')
+    return merged.drop(['_row'])
+
+
+def kgx_columns(columns: List[str], kind: str) -> List[str]:
+    """
+    Columns in the order KGX's TSV sink writes them: COLUMN_ORDER, then the others
+    sorted, those starting with _ last.
+
+    :param columns: column names
+    :param kind: nodes or edges
+    :return: ordered column names
+    """
+
+    first = [c for c in COLUMN_ORDER[kind] if c in columns]
+    rest = sorted(c for c in columns if c not in first)
+    return first + [c for c in rest if not c.startswith('_')] + \
+        [c for c in rest if c.startswith('_')]
+
+
+def write_kgx_tsv(table: Any, filename: str, kind: str) -> int:
+    """
+    Write a table of strings as a KGX TSV, without quoting, like KGX's TSV sink.
+
+    :param table: pyarrow Table of strings
+    :param filename: TSV to write
+    :param kind: nodes or edges
+    :return: number of rows written
+    """
+
+    import numpy as np
+    import pyarrow.compute as pc  # type: ignore
+
+    columns = kgx_columns(table.column_names, kind)
+    table = table.select(columns)
+    with open(filename, 'wb') as f:
+        f.write(('\t'.join(columns) + '\n').encode('utf-8'))
+        for batch in table.to_batches(WRITE_ROWS):
+            if not batch.num_rows:
+                continue
+            # each row as 'line\n', written straight from the array's data
+            lines = pc.binary_join_element_wise(
+                pc.binary_join_element_wise(*batch.columns, '\t'), '', '\n')
+            _, offsets, data = lines.buffers()
+            start, end = np.frombuffer(offsets, np.int32)[[lines.offset, lines.offset + len(lines)]]
+            f.write(memoryview(data)[start:end])
+    return table.num_rows
+
+
+def arrow_merge(config: Dict, threads: Optional[int] = None) -> Dict[str, int]:
+    """
+    Merge the sources of a merge config with Arrow rather than KGX, writing its TSV
+    destinations at the end, like kgx merge but without building a networkx graph.
+
+    Sources can be TSVs, or the Parquet (format: parquet) or Arrow IPC (format: arrow)
+    files or datasets written by the transforms (run.py transform --parquet), which are
+    read without parsing text. Sources are read in parallel and merged with
+    merge_kgx_tables(), using threads for reading, dictionary encoding and grouping.
+    KGX operations on the merged graph (e.g. graph stats) are not run.
+
+    :param config: merge config, as parsed by merge_kg.parse_load_config()
+    :param threads: threads to use [number of CPUs]
+    :return: number of nodes and edges read and written
+    """
+
+    pa = _import_pyarrow()
+    problems = arrow_merge_problems(config)
+    if problems:
+        raise TransformError("Can't merge with Arrow: {}".format('; '.join(problems)))
+    threads = threads or os.cpu_count() or 1
+    pa.set_cpu_count(threads)
+    if config['merged_graph'].get('operations'):
+        logging.warning("Graph operations of the merge config are not run by an Arrow merge")
+
+    files: List[Tuple[str, str]] = []
+    for source in config['merged_graph']['source'].values():
+        source = source.get('input', source)
+        files.extend((f, source['format']) for f in source['filename'])
+    counts: Dict[str, int] = {}
+    with span('merge.arrow') as s, ThreadPoolExecutor(threads) as executor:
+        tables: Dict[str, List[Any]] = {'nodes': [], 'edges': []}
+        for (filename, _), table in zip(files, executor.map(
+                lambda f: read_kgx_table(*f), files)):
+            tables[_source_kind(filename)].append(table)
+        for kind in ('nodes', 'edges'):
+            counts[kind + '_in'] = sum(t.num_rows for t in tables[kind])
+            s.count(kind + '_in', counts[kind + '_in'])
+            tables[kind] = merge_kgx_tables(tables[kind], kind) if tables[kind] else \
+                pa.table({c: pa.array([], pa.string()) for c in MERGE_KEYS[kind]})
+            counts[kind + '_out'] = tables[kind].num_rows
+            s.count(kind + '_out', counts[kind + '_out'])
+
+        output_dir = config['configuration']['output_directory']
+        os.makedirs(output_dir, exist_ok=True)
+        for destination in config['merged_graph'].get('destination', {}).values():
+            for prefix in destination['filename']:
+                written = [os.path.join(output_dir, '{}_{}.tsv'.format(prefix, kind))
+                           for kind in ('nodes', 'edges')]
+                for filename, kind in zip(written, ('nodes', 'edges')):
+                    write_kgx_tsv(tables[kind], filename, kind)
+                if destination.get('compression'):
+                    from kg_microbe.utils.package_utils import package_files
+
+                    package_files(written, output_dir, prefix, destination['compression'],
+                                  threads=threads)
+                    for filename in written:
+                        os.remove(filename)
+    logging.info("Merged {nodes_in} nodes into {nodes_out} and {edges_in} edges into "
+                 "{edges_out} with Arrow".format(**counts))
+    return counts
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, Optional
+
+
+# rows per page of a paged query; here rather than in kg_microbe.query so that run.py can
+# use it without importing SPARQLWrapper and requests
+DEFAULT_PAGE_SIZE = 10000
+DEFAULT_CACHE_DIR = os.path.join('data', 'queries', '.cache')
+DEFAULT_TTL = 7 * 24 * 60 * 60  # one week, in seconds
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_GRAPH_STATS_FILE = 'merged-kg_stats.yaml'
+INDEX_FILENAME = 'index.json'
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a SPARQL query so that formatting differences don't defeat the cache:
+    whole-line comments are dropped and runs of whitespace are collapsed.
+
+    :param query: SPARQL query string
+    :return: normalized query string
+    """
+
+    query = re.sub(r'(?m)^\s*#.*$', '', query)
+    return ' '.join(query.split())
+
+
+def graph_version(stats_file: str = DEFAULT_GRAPH_STATS_FILE) -> str:
+    """
+    Version stamp for the merged KG, taken as a hash of the graph stats file that
+    'run.py merge' writes alongside each build.
+
+    :param stats_file: graph stats YAML written by the merge [merged-kg_stats.yaml]
+    :return: hex digest of the stats file, or '' if there is no build to stamp
+    """
+
+    if not os.path.isfile(stats_file):
+        return ''
+    h = hashlib.sha256()
+    with open(stats_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def query_cache_key(query: str, endpoint: str, version: str, suffix: str = '') -> str:
+    """
+    Cache key for a query result.
+
+    :param query: SPARQL query string
+    :param endpoint: SPARQL endpoint URL
+    :param version: graph version stamp
+    :param suffix: anything else that changes the cached file, e.g. its extension
+    :return: hex digest key
+    """
+
+    h = hashlib.sha256()
+    for part in (normalize_query(query), endpoint, version, suffix):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class QueryCache:
+    """
+    On-disk cache of query result files with TTL expiry and LRU eviction.
+
+    Files are stored under cache_dir, named by key, with an index.json file recording
+    when each entry was created and last used.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        """
+        :param cache_dir: directory to keep cached files in
+        :param ttl: seconds after which an entry expires; 0 or less never expires
+        :param max_entries: number of entries to keep before evicting the least recently used
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index_file = os.path.join(cache_dir, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _load_index(self) -> Dict[str, Dict]:
+        if not os.path.isfile(self.index_file):
+            return {}
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except ValueError:
+            logging.warning("Corrupt query cache index {}, starting afresh".format(self.index_file))
+            return {}
+
+    def _save_index(self, index: Dict[str, Dict]) -> None:
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_file, self.index_file)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _expired(self, entry: Dict, now: float) -> bool:
+        return self.ttl > 0 and now - entry['created'] > self.ttl
+
+    def _drop(self, index: Dict[str, Dict], key: str) -> None:
+        index.pop(key, None)
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def get(self, key: str, outfile: str) -> bool:
+        """
+        Copy a cached file to outfile, if there is a live entry for key.
+
+        :param key: cache key
+        :param outfile: where to copy the cached file to
+        :return: True on a cache hit
+        """
+
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            now = time.time()
+            if entry is None or not os.path.isfile(self._path(key)):
+                return False
+            if self._expired(entry, now):
+                self._drop(index, key)
+                self._save_index(index)
+                return False
+            shutil.copyfile(self._path(key), outfile)
+            entry['accessed'] = now
+            self._save_index(index)
+            return True
+
+    def put(self, key: str, infile: str) -> None:
+        """
+        Add a file to the cache, evicting expired and least recently used entries.
+
+        :param key: cache key
+        :param infile: file to cache
+        :return: None.
+        """
+
+        with self._lock:
+            index = self._load_index()
+            shutil.copyfile(infile, self._path(key))
+            now = time.time()
+            index[key] = {'created': now, 'accessed': now}
+            for k in [k for k, v in index.items() if self._expired(v, now)]:
+                self._drop(index, k)
+            by_access = sorted(index, key=lambda k: index[k]['accessed'])
+            for k in by_access[:max(0, len(index) - self.max_entries)]:
+                self._drop(index, k)
+            self._save_index(index)
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the cache.
+
+        :return: None.
+        """
+
+        with self._lock:
+            index = self._load_index()
+            for k in list(index):
+                self._drop(index, k)
+            self._save_index(index)
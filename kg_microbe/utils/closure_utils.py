@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from kg_microbe.utils.io_utils import open_input
+from kg_microbe.utils.taxonomy_utils import SUBCLASS_PREDICATES
+from kg_microbe.utils.transform_utils import TransformError
+
+
+def _gather(offsets: np.ndarray, values: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Concatenation of the CSR rows of several nodes, without a Python loop."""
+    starts, ends = offsets[rows], offsets[rows + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return values[:0]
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return values[np.arange(total) + shifts]
+
+
+class ClosureIndex:
+
+    """
+    Transitive closure of a subclass_of hierarchy, for is-a checks and for listing
+    the descendants or ancestors of a class without walking the graph.
+
+    Classes are numbered in depth-first pre-order over a spanning forest of the
+    hierarchy, so that the descendants of a class along the tree make up the contiguous
+    range pre..post of its own number and the highest number below it. In a tree, as
+    NCBITaxon nearly is, that range is all there is and an is-a check is two comparisons.
+    Classes with descendants reached through extra parents, as in the CHEBI and GO
+    DAGs, also get the merged list of ranges covering all their descendants, searched
+    with a binary search. Listing descendants is then a matter of slicing the classes
+    in pre-order by those ranges.
+
+    Build with from_pairs(), from_tsv() or from_graph(); save() and load() keep it in
+    a .npz file.
+    """
+
+    def __init__(self, ids: np.ndarray, pre: np.ndarray, post: np.ndarray,
+                 interval_offsets: np.ndarray, intervals: np.ndarray,
+                 parent_offsets: np.ndarray, parents: np.ndarray) -> None:
+        """
+        :param ids: sorted CURIEs of the classes
+        :param pre: pre-order number of each class
+        :param post: highest pre-order number in each class's spanning subtree
+        :param interval_offsets: CSR offsets into intervals, per class
+        :param intervals: (lo, hi) pre-order ranges of classes with descendants outside pre..post
+        :param parent_offsets: CSR offsets into parents, per class
+        :param parents: parents of each class
+        """
+        self.ids = ids
+        self.pre = pre
+        self.post = post
+        self.interval_offsets = interval_offsets
+        self.intervals = intervals
+        self.parent_offsets = parent_offsets
+        self.parents = parents
+        self.by_pre = np.empty_like(pre)
+        self.by_pre[pre] = np.arange(len(pre), dtype=pre.dtype)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, curie: str) -> bool:
+        return self._index(curie) is not None
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[str, str]]) -> 'ClosureIndex':
+        """
+        Build the index from (subclass, superclass) pairs.
+
+        :param pairs: iterable of (child CURIE, parent CURIE)
+        :return: ClosureIndex
+        """
+
+        children, parents = [], []
+        for child, parent in pairs:
+            children.append(child)
+            parents.append(parent)
+        ids, codes = np.unique(np.array(children + parents, dtype=str), return_inverse=True)
+        n = len(ids)
+        child_codes = codes[:len(children)].astype(np.int64)
+        parent_codes = codes[len(children):].astype(np.int64)
+
+        # child -> parents and parent -> children, as CSR
+        order = np.lexsort((parent_codes, child_codes))
+        parent_offsets = np.searchsorted(child_codes[order], np.arange(n + 1)).astype(np.int64)
+        parent_values = parent_codes[order]
+        order = np.lexsort((child_codes, parent_codes))
+        child_offsets = np.searchsorted(parent_codes[order], np.arange(n + 1)).tolist()
+        child_values = child_codes[order].tolist()
+
+        pre = [-1] * n
+        post = [-1] * n
+        tree_parent = [-1] * n
+        extra: Dict[int, List[Tuple[int, int]]] = {}
+        counter = 0
+        cycles = 0
+        has_parent = np.zeros(n, dtype=bool)
+        has_parent[child_codes] = True
+        roots = np.flatnonzero(~has_parent).tolist()
+
+        def finish(v: int) -> None:
+            # ranges of v's descendants outside its own pre..post: those of its
+            # children's extra ranges, and the whole range of non-tree children
+            nonlocal cycles
+            own_lo, own_hi = pre[v], post[v]
+            candidates = []
+            for c in child_values[child_offsets[v]:child_offsets[v + 1]]:
+                if tree_parent[c] != v:
+                    if post[c] < 0:  # c is an ancestor of v still being visited
+                        cycles += 1
+                        continue
+                    candidates.append((pre[c], post[c]))
+                candidates.extend(extra.get(c, ()))
+            candidates = [(lo, hi) for lo, hi in candidates if lo < own_lo or hi > own_hi]
+            if not candidates:
+                return
+            candidates.append((own_lo, own_hi))
+            candidates.sort()
+            merged = [candidates[0]]
+            for lo, hi in candidates[1:]:
+                if lo <= merged[-1][1] + 1:
+                    if hi > merged[-1][1]:
+                        merged[-1] = (merged[-1][0], hi)
+                else:
+                    merged.append((lo, hi))
+            extra[v] = merged
+
+        # iterative depth-first search from the roots, then from anything left
+        # (classes only reachable through a cycle)
+        for start in roots + list(range(n)):
+            if pre[start] >= 0:
+                continue
+            pre[start] = counter
+            counter += 1
+            stack = [(start, child_offsets[start])]
+            while stack:
+                v, i = stack[-1]
+                end = child_offsets[v + 1]
+                while i < end and pre[child_values[i]] >= 0:
+                    i += 1
+                if i < end:
+                    c = child_values[i]
+                    stack[-1] = (v, i + 1)
+                    tree_parent[c] = v
+                    pre[c] = counter
+                    counter += 1
+                    stack.append((c, child_offsets[c]))
+                else:
+                    stack.pop()
+                    post[v] = counter - 1
+                    finish(v)
+        if cycles:
+            logging.warning("{} subclass_of edges close a cycle; their closure is incomplete".format(
+                cycles))
+
+        interval_offsets = np.zeros(n + 1, dtype=np.int64)
+        for v, ranges in extra.items():
+            interval_offsets[v + 1] = len(ranges)
+        interval_offsets = np.cumsum(interval_offsets)
+        intervals = np.empty((int(interval_offsets[-1]), 2), dtype=np.int32)
+        for v, ranges in extra.items():
+            intervals[interval_offsets[v]:interval_offsets[v + 1]] = ranges
+
+        return cls(ids, np.array(pre, dtype=np.int32), np.array(post, dtype=np.int32),
+                   interval_offsets, intervals, parent_offsets, parent_values.astype(np.int32))
+
+    @classmethod
+    def from_tsv(cls, edges_file: str, predicates: Iterable[str] = SUBCLASS_PREDICATES,
+                 sep: str = '\t') -> 'ClosureIndex':
+        """
+        Build the index from the subclass edges of a KGX edges TSV.
+
+        :param edges_file: KGX edges TSV, e.g. of the merged graph, optionally compressed
+        :param predicates: predicates of subclass edges [biolink:subclass_of, rdfs:subClassOf]
+        :param sep: separator [\t]
+        :return: ClosureIndex
+        """
+
+        predicates = set(predicates)
+
+        def pairs() -> Iterable[Tuple[str, str]]:
+            with open_input(edges_file) as f:
+                header = f.readline().rstrip('\n').split(sep)
+                try:
+                    s, p, o = [header.index(c) for c in ['subject', 'predicate', 'object']]
+                except ValueError:
+                    raise TransformError("{} is not a KGX edges file".format(edges_file))
+                for line in f:
+                    items = line.rstrip('\n').split(sep)
+                    if items[p] in predicates:
+                        yield items[s], items[o]
+
+        return cls.from_pairs(pairs())
+
+    @classmethod
+    def from_graph(cls, graph: Any,
+                   predicates: Iterable[str] = SUBCLASS_PREDICATES) -> 'ClosureIndex':
+        """
+        Build the index from the subclass edges of a networkx graph, such as the
+        merged graph returned by load_and_merge().
+
+        :param graph: networkx (Multi)DiGraph with a 'predicate' on each edge
+        :param predicates: predicates of subclass edges [biolink:subclass_of, rdfs:subClassOf]
+        :return: ClosureIndex
+        """
+
+        predicates = set(predicates)
+        return cls.from_pairs((s, o) for s, o, p in graph.edges(data='predicate')
+                              if p in predicates)
+
+    def save(self, filename: str) -> None:
+        """
+        Save the index.
+
+        :param filename: .npz file
+        :return: None.
+        """
+
+        np.savez(filename, ids=self.ids, pre=self.pre, post=self.post,
+                 interval_offsets=self.interval_offsets, intervals=self.intervals,
+                 parent_offsets=self.parent_offsets, parents=self.parents)
+
+    @classmethod
+    def load(cls, filename: str) -> 'ClosureIndex':
+        """
+        Load an index saved with save().
+
+        :param filename: .npz file
+        :return: ClosureIndex
+        """
+
+        with np.load(filename) as data:
+            return cls(**{k: data[k] for k in data.files})
+
+    def _index(self, curie: str) -> Optional[int]:
+        i = int(np.searchsorted(self.ids, curie))
+        return i if i < len(self.ids) and self.ids[i] == curie else None
+
+    def _require(self, curie: str) -> int:
+        i = self._index(curie)
+        if i is None:
+            raise KeyError("{} is not in the hierarchy".format(curie))
+        return i
+
+    def is_a(self, child: str, ancestor: str) -> bool:
+        """
+        Whether a class is a (reflexive, transitive) subclass of another.
+
+        :param child: CURIE of the class
+        :param ancestor: CURIE of the candidate ancestor
+        :return: True if child is ancestor or one of its descendants
+        """
+
+        c, a = self._index(child), self._index(ancestor)
+        if c is None or a is None:
+            return child == ancestor
+        p = self.pre[c]
+        if self.pre[a] <= p <= self.post[a]:
+            return True
+        lo, hi = self.interval_offsets[a], self.interval_offsets[a + 1]
+        if lo == hi:
+            return False
+        ranges = self.intervals[lo:hi]
+        k = int(np.searchsorted(ranges[:, 0], p, side='right')) - 1
+        return k >= 0 and p <= ranges[k, 1]
+
+    def descendants(self, curie: str, include_self: bool = False) -> List[str]:
+        """
+        All the subclasses of a class, direct or not.
+
+        :param curie: CURIE of the class
+        :param include_self: include the class itself [False]
+        :return: CURIEs, in pre-order
+        """
+
+        a = self._require(curie)
+        lo, hi = self.interval_offsets[a], self.interval_offsets[a + 1]
+        ranges = self.intervals[lo:hi] if hi > lo else [(self.pre[a], self.post[a])]
+        members = np.concatenate([self.by_pre[r_lo:r_hi + 1] for r_lo, r_hi in ranges])
+        if not include_self:
+            members = members[members != a]
+        return self.ids[members].tolist()
+
+    def ancestors(self, curie: str, include_self: bool = False) -> List[str]:
+        """
+        All the superclasses of a class, direct or not.
+
+        :param curie: CURIE of the class
+        :param include_self: include the class itself [False]
+        :return: sorted CURIEs
+        """
+
+        a = self._require(curie)
+        seen = np.zeros(len(self.ids), dtype=bool)
+        frontier = np.array([a])
+        seen[a] = True
+        while frontier.size:
+            frontier = np.unique(_gather(self.parent_offsets, self.parents, frontier))
+            frontier = frontier[~seen[frontier]]
+            seen[frontier] = True
+        if not include_self:
+            seen[a] = False
+        return self.ids[np.flatnonzero(seen)].tolist()
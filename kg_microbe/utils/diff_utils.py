@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import Counter, defaultdict
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from kg_microbe.utils.io_utils import open_binary_input
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.sort_utils import DEFAULT_SORT_MEMORY_MB, NODE_SORT_KEY, kgx_sort_key, \
+    sort_kgx_tsv
+from kg_microbe.utils.transform_utils import TransformError
+
+
+# columns naming where a node or edge came from, in order of preference
+SOURCE_COLUMNS = ['provided_by', 'primary_knowledge_source', 'knowledge_source']
+DIFF_STATUSES = ['added', 'removed', 'changed', 'unchanged']
+# the delta files written for each kind, in key order: added and changed rows (as in the
+# new build) and removed rows (as in the old build)
+DELTA_FILES = {status: '{}_' + status + '.tsv' for status in ['added', 'changed', 'removed']}
+
+
+class _SortedTsv:
+
+    """A sorted KGX TSV, read as groups of lines with the same key"""
+
+    def __init__(self, filename: str, key_columns: List[str]) -> None:
+        self.f = open_binary_input(filename)
+        self.header_line = self.f.readline()
+        self.header = self.header_line.rstrip(b'\r\n').decode('utf-8').split('\t')
+        missing = [c for c in key_columns if c not in self.header]
+        if missing:
+            raise TransformError("{} has no {} column".format(filename, ', '.join(missing)))
+        self.key_index = [self.header.index(c) for c in key_columns]
+
+    def key(self, line: bytes) -> Tuple[bytes, ...]:
+        fields = line.rstrip(b'\r\n').split(b'\t')
+        n = len(fields)
+        return tuple(fields[i] if i < n else b'' for i in self.key_index)
+
+    def groups(self) -> Iterator[Tuple[Tuple[bytes, ...], List[bytes]]]:
+        lines = (line if line.endswith(b'\n') else line + b'\n' for line in self.f)
+        for key, group in itertools.groupby(lines, key=self.key):
+            yield key, list(group)
+
+    def close(self) -> None:
+        self.f.close()
+
+
+def _join(*tables: _SortedTsv) -> Iterator[Tuple[Tuple[bytes, ...], List[List[bytes]]]]:
+    # merge-join sorted TSVs on their keys: each key, with the lines of each TSV with it
+    def tagged(i: int) -> Iterator[Tuple[Tuple[bytes, ...], int, List[bytes]]]:
+        for key, lines in tables[i].groups():
+            yield key, i, lines
+
+    merged = heapq.merge(*[tagged(i) for i in range(len(tables))], key=lambda item: item[0])
+    for key, items in itertools.groupby(merged, key=lambda item: item[0]):
+        groups: List[List[bytes]] = [[] for _ in tables]
+        for _, i, lines in items:
+            groups[i] = lines
+        yield key, groups
+
+
+def _projector(old_header: List[str], new_header: List[str]):
+    # old lines as lines with the new header's columns, to compare them with new lines
+    if old_header == new_header:
+        return lambda line: line
+    index = [old_header.index(c) if c in old_header else None for c in new_header]
+
+    def project(line: bytes) -> bytes:
+        fields = line.rstrip(b'\r\n').split(b'\t')
+        return b'\t'.join(fields[i] if i is not None and i < len(fields) else b''
+                          for i in index) + b'\n'
+    return project
+
+
+def _sorted_copy(filename: str, tmp_dir: str, name: str, presorted: bool,
+                 memory_mb: float, processes: Optional[int]) -> str:
+    if presorted:
+        return filename
+    output = os.path.join(tmp_dir, name)
+    sort_kgx_tsv(filename, output, memory_mb=memory_mb, processes=processes, tmp_dir=tmp_dir)
+    return output
+
+
+def diff_kgx_tsv(old_file: str, new_file: str, output_dir: str, kind: Optional[str] = None,
+                 presorted: bool = False, memory_mb: float = DEFAULT_SORT_MEMORY_MB,
+                 processes: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Compare the nodes or edges of two builds, in bounded memory, and write the delta.
+
+    Both files are sorted by key with sort_kgx_tsv (unless they already are, as
+    'transform --sorted' and 'merge --sorted' write them) and read side by side in one
+    merge-join, so that memory holds only the rows of one key at a time. A key (node id,
+    or edge subject, predicate and object) is added, removed, changed (the same key with
+    different rows) or unchanged. Rows are compared by column name, so columns added or
+    reordered between builds don't make every row differ.
+
+    The delta is <kind>_added.tsv and <kind>_changed.tsv, with the rows of those keys in the
+    new build, and <kind>_removed.tsv, with the rows of removed keys in the old build, all
+    sorted by key; apply_kgx_delta() applies it to the old build.
+
+    :param old_file: KGX TSV of the old build, optionally compressed
+    :param new_file: KGX TSV of the new build, optionally compressed
+    :param output_dir: directory for the delta files
+    :param kind: 'nodes' or 'edges', for the delta filenames [from the header]
+    :param presorted: the files are already sorted by key [False]
+    :param memory_mb: approximate memory to sort in, in MB [512]
+    :param processes: processes to sort with [number of CPUs]
+    :return: counts of keys by status, in total and by source (and by predicate, for edges)
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='diff_', dir=output_dir)
+    try:
+        with span('diff') as s:
+            old_sorted = _sorted_copy(old_file, tmp_dir, 'old.tsv', presorted, memory_mb,
+                                      processes)
+            new_sorted = _sorted_copy(new_file, tmp_dir, 'new.tsv', presorted, memory_mb,
+                                      processes)
+            with open_binary_input(new_sorted) as f:
+                new_header = f.readline().rstrip(b'\r\n').decode('utf-8').split('\t')
+            key_columns = kgx_sort_key(new_header)
+            kind = kind or ('nodes' if key_columns == NODE_SORT_KEY else 'edges')
+            old, new = _SortedTsv(old_sorted, key_columns), _SortedTsv(new_sorted, key_columns)
+            report = _merge_diff(old, new, kind, output_dir)
+            for status in DIFF_STATUSES:
+                s.count(status, report['total'][status])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    logging.info("{} {}: {}".format(kind, new_file, ', '.join(
+        '{} {}'.format(report['total'][status], status) for status in DIFF_STATUSES)))
+    return report
+
+
+def _merge_diff(old: _SortedTsv, new: _SortedTsv, kind: str, output_dir: str) -> Dict[str, Any]:
+    project = _projector(old.header, new.header)
+    same_header = old.header == new.header
+    group_columns = {'source': next((c for c in SOURCE_COLUMNS if c in new.header), None)}
+    if kind == 'edges':
+        group_columns['predicate'] = 'predicate'
+    group_index = {by: new.header.index(c) for by, c in group_columns.items() if c}
+    old_group_index = {by: old.header.index(c) for by, c in group_columns.items()
+                       if c and c in old.header}
+
+    total: Counter = Counter()
+    counts: Dict[str, Dict[str, Counter]] = {by: defaultdict(Counter) for by in group_index}
+
+    def count(status: str, line: bytes, index: Dict[str, int]) -> None:
+        total[status] += 1
+        fields = line.rstrip(b'\r\n').split(b'\t')
+        for by, i in index.items():
+            value = fields[i].decode('utf-8') if i < len(fields) else ''
+            counts[by][value][status] += 1
+
+    outputs: Dict[str, IO[bytes]] = {}
+    try:
+        for status, pattern in DELTA_FILES.items():
+            outputs[status] = open(os.path.join(output_dir, pattern.format(kind)), 'wb',
+                                   buffering=1 << 20)
+            outputs[status].write(old.header_line if status == 'removed' else new.header_line)
+        for _, (old_lines, new_lines) in _join(old, new):
+            if not old_lines:
+                status = 'added'
+            elif not new_lines:
+                status = 'removed'
+            elif (same_header and old_lines == new_lines) or \
+                    sorted(map(project, old_lines)) == sorted(new_lines):
+                status = 'unchanged'
+            else:
+                status = 'changed'
+            lines, index = (old_lines, old_group_index) if status == 'removed' else \
+                (new_lines, group_index)
+            # counted by key, under the source and predicate of its first row
+            count(status, lines[0], index)
+            if status != 'unchanged':
+                outputs[status].writelines(lines)
+    finally:
+        for f in outputs.values():
+            f.close()
+        old.close()
+        new.close()
+
+    report: Dict[str, Any] = {'total': {status: total[status] for status in DIFF_STATUSES}}
+    for by, groups in counts.items():
+        report['by_' + by] = {value: {status: c[status] for status in DIFF_STATUSES if c[status]}
+                              for value, c in sorted(groups.items())}
+    return report
+
+
+def diff_kgx(old_nodes: Optional[str], new_nodes: Optional[str], old_edges: Optional[str],
+             new_edges: Optional[str], output_dir: str, presorted: bool = False,
+             memory_mb: float = DEFAULT_SORT_MEMORY_MB,
+             processes: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Compare the nodes and edges of two builds with diff_kgx_tsv(), writing the delta
+    files and a report of what changed to diff.json in output_dir.
+
+    :param old_nodes: nodes TSV of the old build, or None to skip nodes
+    :param new_nodes: nodes TSV of the new build, or None to skip nodes
+    :param old_edges: edges TSV of the old build, or None to skip edges
+    :param new_edges: edges TSV of the new build, or None to skip edges
+    :param output_dir: directory for the delta files and diff.json
+    :param presorted: the files are already sorted by key [False]
+    :param memory_mb: approximate memory to sort in, in MB [512]
+    :param processes: processes to sort with [number of CPUs]
+    :return: the report, with the diff_kgx_tsv() counts of nodes and edges
+    """
+
+    report: Dict[str, Any] = {}
+    for kind, old_file, new_file in [('nodes', old_nodes, new_nodes),
+                                     ('edges', old_edges, new_edges)]:
+        if old_file and new_file:
+            report[kind] = dict(old=old_file, new=new_file, **diff_kgx_tsv(
+                old_file, new_file, output_dir, kind, presorted=presorted,
+                memory_mb=memory_mb, processes=processes))
+    with open(os.path.join(output_dir, 'diff.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def apply_kgx_delta(old_file: str, delta_dir: str, output_file: str,
+                    kind: Optional[str] = None, presorted: bool = False,
+                    memory_mb: float = DEFAULT_SORT_MEMORY_MB,
+                    processes: Optional[int] = None) -> int:
+    """
+    Apply a delta written by diff_kgx_tsv() to the old build's TSV, in one merge-join:
+    the rows of removed and changed keys are dropped, and those of added and changed
+    keys are written in their place. The output is sorted by key, and is the new build
+    as sort_kgx_tsv() would have sorted it.
+
+    :param old_file: KGX TSV of the old build, optionally compressed
+    :param delta_dir: directory of the delta files
+    :param output_file: TSV to write
+    :param kind: 'nodes' or 'edges' [from the header]
+    :param presorted: old_file is already sorted by key [False]
+    :param memory_mb: approximate memory to sort in, in MB [512]
+    :param processes: processes to sort with [number of CPUs]
+    :return: number of rows written, not counting the header
+    """
+
+    tmp_dir = tempfile.mkdtemp(prefix='delta_', dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        old_sorted = _sorted_copy(old_file, tmp_dir, 'old.tsv', presorted, memory_mb, processes)
+        with open_binary_input(old_sorted) as f:
+            key_columns = kgx_sort_key(f.readline().rstrip(b'\r\n').decode('utf-8').split('\t'))
+        kind = kind or ('nodes' if key_columns == NODE_SORT_KEY else 'edges')
+        tables = [_SortedTsv(old_sorted, key_columns)] + [
+            _SortedTsv(os.path.join(delta_dir, DELTA_FILES[status].format(kind)), key_columns)
+            for status in ['added', 'changed', 'removed']]
+        project = _projector(tables[0].header, tables[1].header)
+        rows = 0
+        try:
+            with open(output_file, 'wb', buffering=1 << 20) as out:
+                out.write(tables[1].header_line)
+                for _, (old_lines, added, changed, removed) in _join(*tables):
+                    lines = added or changed
+                    if not lines and not removed:
+                        # in sort_kgx_tsv's order, which projecting may have changed
+                        lines = sorted(map(project, old_lines), key=lambda l: l.rstrip(b'\n'))
+                    out.writelines(lines)
+                    rows += len(lines)
+        finally:
+            for table in tables:
+                table.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logging.info("Applied the {} delta in {} to {}: {} rows".format(
+        kind, delta_dir, old_file, rows))
+    return rows
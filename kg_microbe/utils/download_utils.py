@@ -10,6 +10,8 @@ import yaml
 from os import path
 from tqdm.auto import tqdm  # type: ignore
 
+from kg_microbe.utils.profile_utils import span
+
 def download_from_yaml(yaml_file: str, output_dir: str,
                        ignore_cache: bool = False) -> None:
     """Given an download info from an download.yaml file, download all files
@@ -21,7 +23,7 @@ def download_from_yaml(yaml_file: str, output_dir: str,
     """
 
     os.makedirs(output_dir, exist_ok=True)
-    with open(yaml_file) as f:
+    with open(yaml_file) as f, span('download') as download_span:
         data = yaml.load(f, Loader=yaml.FullLoader)
         for item in tqdm(data, desc="Downloading files"):
             if 'url' not in item:
@@ -41,11 +43,16 @@ def download_from_yaml(yaml_file: str, output_dir: str,
                     os.remove(outfile)
                 else:
                     logging.info("Using cached version of {}".format(outfile))
+                    download_span.count('files_cached')
                     continue
 
             req = Request(item['url'], headers={'User-Agent': 'Mozilla/5.0'})
-            with urlopen(req) as response, open(outfile, 'wb') as out_file:  # type: ignore
+            with span(os.path.basename(outfile)) as file_span, \
+                    urlopen(req) as response, open(outfile, 'wb') as out_file:  # type: ignore
                     data = response.read()  # a `bytes` object
                     out_file.write(data)
+                    file_span.count('bytes_written', len(data))
+            download_span.count('files_downloaded')
+            download_span.count('bytes_written', len(data))
 
     return None
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import logging
+import os
+import shutil
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from kg_microbe.utils.io_utils import open_input
+from kg_microbe.utils.transform_utils import TransformError
+
+
+IDMAPPING_COLUMNS = ['accession', 'id_type', 'id']
+NOT_FOUND = -1
+
+
+class IdMappingIndex:
+
+    """
+    A UniProt idmapping file (accession, ID type, ID per line, e.g.
+    ECOLI_83333_idmapping.dat.gz) as a sorted on-disk index of ID to accession.
+
+    The IDs, accessions and ID types are fixed-width numpy arrays, sorted by ID and saved
+    as .npy files in a directory next to the idmapping file. They are memory-mapped
+    rather than read, so that loading takes milliseconds, only the pages that lookups
+    touch are read, and processes looking up in the same index share them through the
+    page cache. Lookups are binary searches, one at a time or vectorized over a batch.
+
+    An ID mapped to several accessions maps to the last of them in the idmapping file,
+    as in the dict of uniprot_make_name_to_id_mapping(), or to all of them with get_all().
+    The index also works as the name_to_id_map of uniprot_name_to_id().
+    """
+
+    def __init__(self, ids: np.ndarray, accessions: np.ndarray, types: np.ndarray,
+                 type_names: List[str], id_types: Optional[List[str]] = None) -> None:
+        """
+        :param ids: IDs, sorted (bytes)
+        :param accessions: UniProtKB accession of each ID (bytes)
+        :param types: ID type code of each ID
+        :param type_names: names of the ID type codes, e.g. Gene_Name
+        :param id_types: ID types the index was built for, sorted [None: all]
+        """
+        self.ids = ids
+        self.accessions = accessions
+        self.types = types
+        self.type_names = type_names
+        self.id_types = id_types
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def __getitem__(self, name: str) -> str:
+        accession = self.get(name)
+        if accession is None:
+            raise KeyError(name)
+        return accession
+
+    @classmethod
+    def build(cls, dat_file: str, index_dir: str, id_types: Optional[Iterable[str]] = None,
+              chunk_size: int = 1000000) -> 'IdMappingIndex':
+        """
+        Build the index of an idmapping file and save it.
+
+        Only the (smaller) index is held in memory, not the lines or Python strings.
+
+        :param dat_file: idmapping file, optionally compressed
+        :param index_dir: directory to save the index to
+        :param id_types: ID types to index, e.g. ['Gene_Name', 'UniProtKB-ID'] [all]
+        :param chunk_size: lines read at a time [1000000]
+        :return: IdMappingIndex
+        """
+
+        id_types = sorted(set(id_types)) if id_types else None
+        ids, accessions, types = [], [], []
+        type_names: List[str] = []
+        logging.info("Indexing UniProt ID mapping {}".format(dat_file))
+        with open_input(dat_file) as f:
+            chunks = pd.read_csv(f, sep='\t', header=None, names=IDMAPPING_COLUMNS,
+                                 dtype=str, quoting=csv.QUOTE_NONE, chunksize=chunk_size,
+                                 keep_default_na=False)
+            for chunk in chunks:
+                if id_types is not None:
+                    chunk = chunk[chunk.id_type.isin(id_types)]
+                for name in chunk.id_type.unique():
+                    if name not in type_names:
+                        type_names.append(name)
+                codes = chunk.id_type.map({name: i for i, name in enumerate(type_names)})
+                ids.append(np.char.encode(chunk.id.values.astype(str), 'utf-8'))
+                accessions.append(np.char.encode(chunk.accession.values.astype(str), 'utf-8'))
+                types.append(codes.values.astype(np.int16))
+
+        ids = np.concatenate(ids) if ids else np.array([], dtype='S1')
+        # stable, so that each ID's accessions stay in file order
+        order = np.argsort(ids, kind='stable')
+        index = cls(ids[order],
+                    np.concatenate(accessions)[order] if accessions else np.array([], dtype='S1'),
+                    np.concatenate(types)[order] if types else np.array([], dtype=np.int16),
+                    type_names, id_types)
+        index.save(index_dir)
+        logging.info("Indexed {} IDs of {} types to {}".format(
+            len(index), len(type_names), index_dir))
+        return index
+
+    def save(self, index_dir: str) -> None:
+        """
+        Save the index, replacing any index in index_dir.
+
+        :param index_dir: directory
+        :return: None.
+        """
+
+        tmp_dir = index_dir.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in ['ids', 'accessions', 'types']:
+            np.save(os.path.join(tmp_dir, name + '.npy'), getattr(self, name))
+        with open(os.path.join(tmp_dir, 'types.json'), 'w') as f:
+            json.dump({'type_names': self.type_names, 'id_types': self.id_types}, f)
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.rename(tmp_dir, index_dir)
+
+    @classmethod
+    def open(cls, index_dir: str) -> 'IdMappingIndex':
+        """
+        Memory-map a saved index.
+
+        :param index_dir: directory of the index
+        :return: IdMappingIndex
+        """
+
+        arrays = [np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r')
+                  for name in ['ids', 'accessions', 'types']]
+        with open(os.path.join(index_dir, 'types.json'), 'r') as f:
+            types = json.load(f)
+        return cls(*arrays, types['type_names'], types['id_types'])
+
+    @classmethod
+    def load(cls, dat_file: str, index_dir: Optional[str] = None,
+             id_types: Optional[Iterable[str]] = None) -> 'IdMappingIndex':
+        """
+        Memory-map the index of an idmapping file, building it first if it is missing,
+        older than the file, or was built for other ID types.
+
+        :param dat_file: idmapping file, optionally compressed
+        :param index_dir: directory of the index [<dat_file>.index]
+        :param id_types: ID types to index, when building [all]
+        :return: IdMappingIndex
+        """
+
+        index_dir = index_dir or dat_file + '.index'
+        stamp = os.path.join(index_dir, 'types.json')
+        if not (os.path.isfile(stamp) and
+                os.path.getmtime(stamp) >= os.path.getmtime(dat_file) and
+                _built_for(stamp) == (sorted(set(id_types)) if id_types else None)):
+            cls.build(dat_file, index_dir, id_types)
+        return cls.open(index_dir)
+
+    def _type_code(self, id_type: Optional[str]) -> Optional[int]:
+        if id_type is None:
+            return None
+        if id_type not in self.type_names:
+            raise TransformError("ID type {} is not indexed; indexed types are {}".format(
+                id_type, ', '.join(self.type_names)))
+        return self.type_names.index(id_type)
+
+    def _positions(self, names: np.ndarray, code: Optional[int]) -> np.ndarray:
+        # position of the last match of each name, or NOT_FOUND
+        keys = np.char.encode(names.astype(str), 'utf-8')
+        lo = np.searchsorted(self.ids, keys, side='left')
+        hi = np.searchsorted(self.ids, keys, side='right')
+        positions = np.where(hi > lo, hi - 1, NOT_FOUND)
+        if code is None:
+            return positions
+        # step back through each name's (usually one or two) matches for one of the type
+        positions[:] = NOT_FOUND
+        active = np.flatnonzero(hi > lo)
+        current = hi[active] - 1
+        while active.size:
+            found = self.types[current] == code
+            positions[active[found]] = current[found]
+            current = current[~found] - 1
+            active = active[~found]
+            more = current >= lo[active]
+            active, current = active[more], current[more]
+        return positions
+
+    def lookup(self, names: Iterable[str], id_type: Optional[str] = None) -> List[Optional[str]]:
+        """
+        Accessions of a batch of IDs, in one vectorized search.
+
+        :param names: IDs, e.g. gene names
+        :param id_type: only match IDs of this type, e.g. Gene_Name [any]
+        :return: accession of each ID, or None
+        """
+
+        names = np.asarray(list(names), dtype=str)
+        if not len(names):
+            return []
+        positions = self._positions(names, self._type_code(id_type))
+        found = positions != NOT_FOUND
+        result: List[Optional[str]] = [None] * len(names)
+        for i, accession in zip(np.flatnonzero(found),
+                                self.accessions[positions[found]].tolist()):
+            result[i] = accession.decode('utf-8')
+        return result
+
+    def get(self, name: str, id_type: Optional[str] = None) -> Optional[str]:
+        """
+        Accession of an ID.
+
+        :param name: ID, e.g. a gene name
+        :param id_type: only match IDs of this type, e.g. Gene_Name [any]
+        :return: accession, or None
+        """
+
+        return self.lookup([name], id_type)[0]
+
+    def get_all(self, name: str, id_type: Optional[str] = None) -> List[str]:
+        """
+        All the accessions of an ID, in file order.
+
+        :param name: ID, e.g. a gene name
+        :param id_type: only match IDs of this type, e.g. Gene_Name [any]
+        :return: accessions
+        """
+
+        code = self._type_code(id_type)
+        key = name.encode('utf-8')
+        lo = int(np.searchsorted(self.ids, key, side='left'))
+        hi = int(np.searchsorted(self.ids, key, side='right'))
+        matches = np.arange(lo, hi)
+        if code is not None:
+            matches = matches[self.types[lo:hi] == code]
+        return [a.decode('utf-8') for a in self.accessions[matches].tolist()]
+
+
+def _built_for(stamp: str) -> Optional[List[str]]:
+    # ID types an index was built for, from its types.json; indexes saved before this
+    # was recorded are taken to be for unknown types, so that load() rebuilds them
+    with open(stamp, 'r') as f:
+        types = json.load(f)
+    return types['id_types'] if isinstance(types, dict) else ['?']
+
+
+def uniprot_make_name_to_id_index(dat_gz_file: str,
+                                  id_types: Optional[Iterable[str]] = None) -> IdMappingIndex:
+    """
+    Memory-mapped counterpart of uniprot_make_name_to_id_mapping(): the index is built
+    once, next to the idmapping file, and memory-mapped on later runs.
+
+    :param dat_gz_file: idmapping .dat.gz file
+    :param id_types: ID types to index, e.g. ['Gene_Name'] [all]
+    :return: IdMappingIndex, usable with uniprot_name_to_id()
+    """
+
+    return IdMappingIndex.load(dat_gz_file, id_types=id_types)
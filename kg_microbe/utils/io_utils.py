@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import shutil
+import subprocess
+import zipfile
+from typing import IO, List, Optional, Tuple
+
+
+# supported output compressions and the suffix each adds to a filename
+COMPRESSION_SUFFIXES = {
+    'gz': '.gz',
+    'zst': '.zst',
+}
+
+
+# input compressions, recognised by their magic bytes rather than by filename
+INPUT_MAGIC = {
+    'gz': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+    'zst': b'\x28\xb5\x2f\xfd',
+    'zip': b'PK\x03\x04',
+}
+INPUT_SUFFIXES = ['.gz', '.bz2', '.xz', '.zst', '.zip']
+
+# multi-threaded decompressors, used in a subprocess when on the PATH, in order of
+# preference; otherwise, or if parallel=False, the Python modules are used
+PARALLEL_DECOMPRESSORS = {
+    'gz': [['pigz', '-dc']],
+    'bz2': [['lbzip2', '-dc'], ['pbzip2', '-dc']],
+    'xz': [['xz', '-dc', '-T0']],
+}
+
+
+def compressed_filename(filename: str, compression: Optional[str]) -> str:
+    """
+    Add the suffix for a compression to a filename.
+
+    :param filename: uncompressed filename
+    :param compression: one of COMPRESSION_SUFFIXES, or None
+    :return: filename with the compression suffix added
+    """
+
+    if not compression:
+        return filename
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError("Unknown compression '{}', expected one of {}".format(
+            compression, sorted(COMPRESSION_SUFFIXES)))
+    return filename + COMPRESSION_SUFFIXES[compression]
+
+
+def open_output(filename: str, compression: Optional[str] = None,
+                level: Optional[int] = None) -> IO[str]:
+    """
+    Open a text file for writing, optionally compressed with gzip or zstd.
+    zstd needs the optional 'zstandard' package.
+
+    :param filename: file to write, without the compression suffix
+    :param compression: one of COMPRESSION_SUFFIXES, or None for plain text
+    :param level: compression level; the library default if None
+    :return: writable text file handle
+    """
+
+    path = compressed_filename(filename, compression)
+    if compression == 'gz':
+        return gzip.open(path, 'wt', compresslevel=6 if level is None else level)
+    if compression == 'zst':
+        try:
+            import zstandard  # type: ignore
+        except ImportError:
+            raise ImportError("zstd compression needs the 'zstandard' package "
+                              "(pip install zstandard)")
+        cctx = zstandard.ZstdCompressor(level=3 if level is None else level, threads=-1)
+        return io.TextIOWrapper(cctx.stream_writer(open(path, 'wb'), closefd=True),
+                                encoding='utf-8')
+    return open(path, 'w')
+
+
+def input_compression(filename: str) -> Optional[str]:
+    """
+    Compression of a file, from its first bytes.
+
+    :param filename: file
+    :return: one of INPUT_MAGIC, or None if uncompressed
+    """
+
+    with open(filename, 'rb') as f:
+        head = f.read(6)
+    for compression, magic in INPUT_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def find_input(filename: str) -> str:
+    """
+    The file to read for an input: the file itself if it exists, or else a compressed
+    copy of it (e.g. data/raw/chebi.json.gz for data/raw/chebi.json), so that data/raw
+    can be kept compressed.
+
+    :param filename: uncompressed filename
+    :return: filename, or that of its compressed copy if only that exists
+    """
+
+    if not os.path.exists(filename):
+        for suffix in INPUT_SUFFIXES:
+            if os.path.exists(filename + suffix):
+                return filename + suffix
+    return filename
+
+
+def strip_compression_suffix(filename: str) -> str:
+    """
+    Filename without any compression suffix, e.g. traits.csv for traits.csv.gz.
+
+    :param filename: filename
+    :return: filename
+    """
+
+    for suffix in INPUT_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+class _PipeReader(io.RawIOBase):
+    """Reads the standard output of a decompressor subprocess"""
+
+    def __init__(self, args: List[str]) -> None:
+        self.args = args
+        self.process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        return self.process.stdout.readinto(buffer)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        eof = not self.process.stdout.read(1)
+        self.process.stdout.close()
+        if not eof:
+            self.process.terminate()  # closed before the end
+        error = self.process.stderr.read()
+        self.process.stderr.close()
+        returncode = self.process.wait()
+        super().close()
+        if eof and returncode:
+            raise IOError("{} failed: {}".format(' '.join(self.args),
+                                                 error.decode(errors='replace').strip()))
+
+
+def _open_zip_member(filename: str) -> IO[bytes]:
+    with zipfile.ZipFile(filename) as z:
+        members = [m for m in z.infolist() if not m.is_dir()]
+        if len(members) != 1:
+            raise ValueError("{} has {} files; only single-file zips can be read directly".format(
+                filename, len(members)))
+        # the member stays readable after the ZipFile is closed
+        return z.open(members[0])
+
+
+def open_binary_input(filename: str, parallel: bool = True) -> IO[bytes]:
+    """
+    Open a file for reading bytes, decompressing it as it is read if it is gzip,
+    bzip2, xz, zstd (needs the optional 'zstandard' package) or single-file zip
+    compressed. Multi-threaded decompressors (pigz, lbzip2, pbzip2, xz -T0) are used
+    when available.
+
+    :param filename: file to read
+    :param parallel: use multi-threaded decompressors when available [True]
+    :return: readable binary file handle
+    """
+
+    compression = input_compression(filename)
+    if compression is None:
+        return open(filename, 'rb')
+    if parallel:
+        for args in PARALLEL_DECOMPRESSORS.get(compression, []):
+            if shutil.which(args[0]):
+                return io.BufferedReader(_PipeReader(args + [filename]), buffer_size=1 << 20)
+    if compression == 'gz':
+        return gzip.open(filename, 'rb')
+    if compression == 'bz2':
+        return bz2.open(filename, 'rb')
+    if compression == 'xz':
+        return lzma.open(filename, 'rb')
+    if compression == 'zip':
+        return _open_zip_member(filename)
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        raise ImportError("Reading zstd input needs the 'zstandard' package "
+                          "(pip install zstandard)")
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+        open(filename, 'rb'), closefd=True), buffer_size=1 << 20)
+
+
+def open_input(filename: str, mode: str = 'r', encoding: str = 'utf-8',
+               newline: Optional[str] = None, parallel: bool = True) -> IO:
+    """
+    Open an input file for reading, compressed or not (see open_binary_input), so that
+    inputs are streamed rather than decompressed to temporary copies first.
+
+    :param filename: file to read
+    :param mode: 'r' (or 'rt') for text, 'rb' for bytes ['r']
+    :param encoding: text encoding ['utf-8']
+    :param newline: as for open() [None]
+    :param parallel: use multi-threaded decompressors when available [True]
+    :return: readable file handle
+    """
+
+    if mode not in ('r', 'rt', 'rb'):
+        raise ValueError("open_input() is for reading, not mode '{}'".format(mode))
+    f = open_binary_input(filename, parallel=parallel)
+    if mode == 'rb':
+        return f
+    return io.TextIOWrapper(f, encoding=encoding, newline=newline)
+
+
+def line_ranges(filename: str, start: int, range_bytes: int) -> List[Tuple[int, int]]:
+    """
+    Split an uncompressed file into byte ranges of whole lines, for processes to read
+    parts of it in parallel.
+
+    :param filename: uncompressed file
+    :param start: offset of the first line to include, e.g. after a header
+    :param range_bytes: approximate size of each range
+    :return: (start, end) offsets
+    """
+
+    size = os.path.getsize(filename)
+    bounds = [start]
+    with open(filename, 'rb') as f:
+        for offset in range(start + range_bytes, size, range_bytes):
+            if offset <= bounds[-1]:
+                continue
+            f.seek(offset)
+            f.readline()
+            if f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import logging
+import os
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Optional
+
+import yaml
+
+
+DEFAULT_TRAIT_MAPPINGS = os.path.join('schemas', 'trait_mappings.yaml')
+
+# cell values that pandas would read as NaN, which mean "no mapping" in tables
+MISSING_VALUES = {'', 'NA', 'N/A', 'nan', 'NaN', 'NULL', 'null'}
+
+
+class TraitMapping(NamedTuple):
+    """The node a trait value maps to."""
+    id: str
+    name: str
+
+
+def compile_value_map(entries: Optional[Dict[str, Dict[str, str]]]) -> Mapping[str, TraitMapping]:
+    """
+    Compile the entries of one trait in the mappings YAML into a read-only dict.
+
+    :param entries: dict of raw value to {'id': ..., 'name': ...}
+    :return: read-only dict of raw value to TraitMapping
+    """
+
+    compiled = {}
+    for value, entry in (entries or {}).items():
+        compiled[str(value)] = TraitMapping(entry['id'], entry.get('name', str(value)))
+    return MappingProxyType(compiled)
+
+
+def compile_table_map(table_file: str, key: str, id_column: str,
+                      name_column: str) -> Mapping[str, TraitMapping]:
+    """
+    Compile a CSV conversion table, such as environments.csv, into a read-only dict.
+    Id and name cells may list several comma-separated terms; the last one is used.
+    Keys that appear with different ids or names, or with missing ones, are left out.
+
+    :param table_file: CSV conversion table
+    :param key: column holding the raw value, e.g. 'Type'
+    :param id_column: column holding the ids, e.g. 'ENVO_ids'
+    :param name_column: column holding the names, e.g. 'ENVO_terms'
+    :return: read-only dict of raw value to TraitMapping
+    """
+
+    candidates: Dict[str, set] = {}
+    with open(table_file, newline='') as f:
+        for row in csv.DictReader(f):
+            candidates.setdefault(row[key], set()).add((row[id_column] or '', row[name_column] or ''))
+
+    compiled = {}
+    for value, rows in candidates.items():
+        if len(rows) != 1:
+            logging.debug("Not mapping '{}': {} conflicting rows in {}".format(
+                value, len(rows), table_file))
+            continue
+        ids, names = next(iter(rows))
+        term_id = ids.split(',')[-1].strip()
+        name = names.split(',')[-1].strip()
+        if term_id in MISSING_VALUES or name in MISSING_VALUES:
+            continue
+        compiled[value] = TraitMapping(term_id, name)
+    return MappingProxyType(compiled)
+
+
+def load_trait_mappings(mapping_file: str = DEFAULT_TRAIT_MAPPINGS,
+                        input_dir: str = os.path.join('data', 'raw')
+                        ) -> Mapping[str, Mapping[str, TraitMapping]]:
+    """
+    Load the trait mappings YAML and compile each trait into a read-only dict, so that
+    resolving a trait value is a single dict lookup.
+
+    :param mapping_file: trait mappings YAML [schemas/trait_mappings.yaml]
+    :param input_dir: directory holding the conversion tables named in the YAML [data/raw]
+    :return: read-only dict of trait name (e.g. 'metabolism') to its compiled mappings
+    """
+
+    with open(mapping_file) as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    compiled = {}
+    for trait, entries in config.items():
+        if entries and 'table' in entries:
+            compiled[trait] = compile_table_map(os.path.join(input_dir, entries['table']),
+                                                entries['key'], entries['id'], entries['name'])
+        else:
+            compiled[trait] = compile_value_map(entries)
+        logging.info("Loaded {} {} mappings".format(len(compiled[trait]), trait))
+    return MappingProxyType(compiled)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import glob
+import logging
+import multiprocessing
+import os
+import stat
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from kg_microbe.utils.io_utils import input_compression, line_ranges, open_binary_input
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.transform_utils import TransformError
+
+
+# KGX TSVs separate the values of multi-valued fields with |, which is kept as the
+# array delimiter so that they are copied as they are
+ARRAY_DELIMITER = '|'
+MULTIVALUED_COLUMNS = {'category', 'provided_by', 'knowledge_source',
+                       'primary_knowledge_source', 'aggregator_knowledge_source', 'xref',
+                       'synonym', 'same_as', 'publications', 'qualifiers'}
+PROPERTY_TYPES = {'has_count': 'long', 'has_total': 'long'}
+DEFAULT_LABEL = 'biolink:NamedThing'
+DEFAULT_TYPE = 'biolink:related_to'
+PART_BYTES = 1 << 26
+IMPORT_SCRIPT = 'neo4j-admin-import.sh'
+
+
+def neo4j_header(header: List[str], kind: str) -> List[str]:
+    """
+    Header of a neo4j-admin import CSV for a KGX TSV header: the id column of nodes
+    becomes the :ID, their categories also the :LABELs, the subject, object and
+    predicate of edges the :START_ID, :END_ID and :TYPE, and the other columns typed
+    properties (string, string[] for multi-valued fields, long for counts).
+
+    :param header: KGX TSV header
+    :param kind: 'nodes' or 'edges'
+    :return: CSV header
+    """
+
+    required = ['id'] if kind == 'nodes' else ['subject', 'predicate', 'object']
+    missing = [c for c in required if c not in header]
+    if missing:
+        raise TransformError("KGX {} header {} has no {} column".format(
+            kind, header, ', '.join(missing)))
+    columns = []
+    for c in header:
+        if kind == 'nodes' and c == 'id':
+            columns.append('id:ID')
+        elif kind == 'edges' and c == 'subject':
+            columns.append(':START_ID')
+        elif kind == 'edges' and c == 'object':
+            columns.append(':END_ID')
+        else:
+            columns.append('{}:{}'.format(c, 'string[]' if c in MULTIVALUED_COLUMNS
+                                          else PROPERTY_TYPES.get(c, 'string')))
+    columns.append(':LABEL' if kind == 'nodes' else ':TYPE')
+    return columns
+
+
+def _rows(lines: Iterable[str], header: List[str], kind: str) -> Iterator[List[str]]:
+    # KGX TSV lines as CSV rows, with the labels or type added at the end
+    n = len(header)
+    extra = header.index('category' if kind == 'nodes' else 'predicate') \
+        if ('category' in header or kind == 'edges') else None
+    default = DEFAULT_LABEL if kind == 'nodes' else DEFAULT_TYPE
+    for line in lines:
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) < n:
+            fields += [''] * (n - len(fields))
+        fields.append(fields[extra] or default if extra is not None else default)
+        yield fields
+
+
+def _write_part(task: Tuple[Union[bytes, Tuple[str, int, int]], List[str], str, str]) -> int:
+    # write the CSV of a block of lines, given as bytes or as a byte range of a file
+    source, header, kind, part_file = task
+    if isinstance(source, tuple):
+        filename, start, end = source
+        with open(filename, 'rb') as f:
+            f.seek(start)
+            source = f.read(end - start)
+    lines = source.decode('utf-8').split('\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    with open(part_file, 'w', newline='') as f:
+        csv.writer(f, lineterminator='\n').writerows(_rows(lines, header, kind))
+    return len(lines)
+
+
+def _export_tsv(filename: str, kind: str, name: str, output_dir: str, part_bytes: int,
+                pool: Optional[Any], processes: int) -> Tuple[List[str], int]:
+    # the CSVs (header, then parts) of a KGX TSV, and its number of rows
+    with open_binary_input(filename) as f:
+        header_line = f.readline()
+    header = header_line.rstrip(b'\r\n').decode('utf-8').split('\t')
+    # parts of an earlier export would be imported too
+    for stale in glob.glob(os.path.join(output_dir, name + '_part*.csv')):
+        os.remove(stale)
+    header_file = os.path.join(output_dir, name + '_header.csv')
+    with open(header_file, 'w', newline='') as f:
+        csv.writer(f, lineterminator='\n').writerow(neo4j_header(header, kind))
+
+    def blocks() -> Iterator[Union[bytes, Tuple[str, int, int]]]:
+        if pool is not None and input_compression(filename) is None:
+            for start, end in line_ranges(filename, len(header_line), part_bytes):
+                yield filename, start, end
+            return
+        with open_binary_input(filename) as f:
+            f.readline()
+            while True:
+                lines = f.readlines(part_bytes)
+                if not lines:
+                    return
+                yield b''.join(lines)
+
+    parts, rows = [], 0
+    pending: Deque = deque()
+    for i, block in enumerate(blocks()):
+        part_file = os.path.join(output_dir, '{}_part{:04d}.csv'.format(name, i))
+        parts.append(part_file)
+        task = (block, header, kind, part_file)
+        if pool is None:
+            rows += _write_part(task)
+            continue
+        # a few blocks in flight at most, to bound memory
+        pending.append(pool.apply_async(_write_part, (task,)))
+        while len(pending) > processes:
+            rows += pending.popleft().get()
+    rows += sum(p.get() for p in pending)
+    return [header_file] + parts, rows
+
+
+def _import_script(output_dir: str, groups: Dict[str, List[str]]) -> str:
+    # shell script running neo4j-admin on the CSVs, from their directory
+    args = ["--array-delimiter='{}'".format(ARRAY_DELIMITER),
+            '--skip-bad-relationships=true', '--skip-duplicate-nodes=true']
+    for name, files in groups.items():
+        option = '--nodes' if name.startswith('nodes') else '--relationships'
+        args.append("{}='{},{}_part[0-9]+\\.csv'".format(
+            option, os.path.basename(files[0]), name))
+    script = os.path.join(output_dir, IMPORT_SCRIPT)
+    with open(script, 'w') as f:
+        f.write('#!/bin/sh\n'
+                '# Bulk-load the CSVs into an empty, stopped database [neo4j]: '
+                'sh {} [database]\n'
+                '# (Neo4j 4: neo4j-admin import --database="${{1:-neo4j}}" with the '
+                'same options)\n'
+                'cd "$(dirname "$0")" || exit 1\n'
+                'exec neo4j-admin database import full \\\n    {} \\\n    '
+                '"${{1:-neo4j}}"\n'.format(IMPORT_SCRIPT, ' \\\n    '.join(args)))
+    os.chmod(script, os.stat(script).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return script
+
+
+def export_neo4j_csv(node_files: List[str], edge_files: List[str], output_dir: str,
+                     processes: Optional[int] = None,
+                     part_bytes: int = PART_BYTES) -> Dict[str, Any]:
+    """
+    Export KGX node and edge TSVs as CSVs for neo4j-admin's offline bulk import, which
+    loads a graph the size of the merged KG in minutes rather than the hours of KGX's
+    transactional Neo4j writer.
+
+    Each TSV becomes a header CSV (see neo4j_header()) and part CSVs, written in parallel
+    from byte ranges of uncompressed TSVs (or blocks of compressed ones), and read by
+    neo4j-admin as one file. Node labels are their categories and relationship types
+    their predicates, as KGX names them, e.g. biolink:OrganismTaxon and biolink:capable_of.
+    neo4j-admin-import.sh in output_dir runs the import.
+
+    :param node_files: KGX nodes TSVs, optionally compressed
+    :param edge_files: KGX edges TSVs, optionally compressed
+    :param output_dir: directory for the CSVs and the import script
+    :param processes: processes to write the CSVs with [number of CPUs]
+    :param part_bytes: approximate TSV bytes per part CSV [64 MB]
+    :return: number of nodes and relationships, and the CSVs and script written
+    """
+
+    processes = processes or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    summary: Dict[str, Any] = {'nodes': 0, 'relationships': 0, 'files': {}}
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        with span('neo4j_export') as s:
+            for kind, files, count in [('nodes', node_files, 'nodes'),
+                                       ('edges', edge_files, 'relationships')]:
+                for i, filename in enumerate(files):
+                    name = kind if len(files) == 1 else '{}{}'.format(kind, i)
+                    written, rows = _export_tsv(filename, kind, name, output_dir, part_bytes,
+                                                pool, processes)
+                    summary['files'][name] = written
+                    summary[count] += rows
+            s.count('nodes', summary['nodes'])
+            s.count('relationships', summary['relationships'])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    summary['script'] = _import_script(output_dir, summary['files'])
+    logging.info("Exported {} nodes and {} relationships for neo4j-admin import to {}".format(
+        summary['nodes'], summary['relationships'], output_dir))
+    return summary
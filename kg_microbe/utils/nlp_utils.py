@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import logging
 import os
 import configparser
-from kgx.cli.cli_utils import transform
+from typing import List, Optional, Union
 from oger.ctrl.router import Router, PipelineServer
 from oger.ctrl.run import run as og_run
 from kg_microbe.utils import biohub_converter as bc
+from kg_microbe.utils.io_utils import find_input, open_input
+from kg_microbe.utils.obograph_utils import EDGE_COLUMNS, EDGE_KEY, NODE_COLUMNS, \
+    UnsupportedObographError, kgx_obograph_to_tsv, obograph_to_tsv
+from kg_microbe.utils.transform_utils import NodeEdgeWriter
+from kg_microbe.utils.resolver_utils import OGER_COLUMNS, string_match_rating
 import pandas as pd
 
 SETTINGS_FILENAME = 'settings.ini'
@@ -99,47 +105,68 @@ def create_termlist(path: str, ont: str) -> None:
         """
         ont_int = ont+'.json'
         
-        json_input = os.path.join(path,ont_int)
+        # the JSON may be compressed, e.g. chebi.json.gz, and is streamed either way
+        json_input = find_input(os.path.join(path,ont_int))
         tsv_output = os.path.join(path,ont)
 
-        transform(inputs=[json_input], input_format='obojson', output= tsv_output, output_format='tsv')
+        try:
+            with NodeEdgeWriter(tsv_output + '_nodes.tsv', tsv_output + '_edges.tsv',
+                                NODE_COLUMNS, EDGE_COLUMNS, edge_key=EDGE_KEY) as writer:
+                obograph_to_tsv(json_input, writer)
+        except UnsupportedObographError as e:
+            logging.warning(f"{e}; converting {json_input} with KGX instead")
+            kgx_obograph_to_tsv(json_input, tsv_output)
 
         ont_nodes = os.path.join(path, ont + '_nodes.tsv')
         ont_terms = os.path.abspath(os.path.join(os.path.dirname(json_input),'..','nlp/terms/', ont+'_termlist.tsv'))
         bc.parse(ont_nodes, ont_terms)
 
 
-def prep_nlp_input(path: str, columns: list, dic: str)-> str:
+def prep_nlp_input(path: Union[str, List[str]], columns: list, dic: str,
+                   id_columns: Optional[List[str]] = None)-> str:
     '''
     Creates a tsv which forms the input for OGER
 
-    :param path: Path to the file which has text to be analyzed
+    :param path: Path to the file which has text to be analyzed, or a list of them
+                 to be analyzed together (duplicate rows are annotated once).
     :param columns: The first column HAS to be an id column.
     :param dic: The Ontology to be used as a dictionary for NLP
+    :param id_columns: The id column of each file, if it isn't columns[0] (e.g.
+                       'species_tax_id'); it is renamed to columns[0] in the output.
     :return: Filename (str)
     '''
-    df = pd.read_csv(path, low_memory=False, usecols=columns)
-    sub_df = df.dropna()
+    paths = [path] if isinstance(path, str) else list(path)
+    frames = []
+    for i, p in enumerate(paths):
+        id_column = id_columns[i] if id_columns else columns[0]
+        with open_input(p) as f:
+            df = pd.read_csv(f, low_memory=False, usecols=[id_column] + list(columns[1:]))
+        df = df.rename(columns={id_column: columns[0]})[columns]
+        frames.append(df.dropna())
+    sub_df = frames[0] if len(frames) == 1 else pd.concat(frames).drop_duplicates()
     
     if 'pathways' in columns:
         sub_df['pathways'] = sub_df['pathways'].str.replace('_', ' ')
 
     # New way of doing this : PR submitted to Ontogene for merging code.
     fn = 'nlp'+dic
-    nlp_input = os.path.abspath(os.path.join(os.path.dirname(path),'..','nlp/input/'+fn+'.tsv'))
+    nlp_input = os.path.abspath(os.path.join(os.path.dirname(paths[0]),'..','nlp/input/'+fn+'.tsv'))
     sub_df.to_csv(nlp_input, sep='\t', index=False)
     return fn
             
 
 
-def run_oger(path: str , input_file_name: str , n_workers :int = 1 ) -> pd.DataFrame:
+def run_oger(path: str , input_file_name: str , n_workers :int = 1, load: bool = True) -> Optional[pd.DataFrame]:
     '''
     Runs OGER using the settings.ini file created previously.
 
     :param path: Path of the input file.
     :param input_file_name: Filename.
     :param n_workers: Number of threads to run (default: 1).
-    :return: Pandas DataFrame containing the output of OGER analysis.
+    :param load: Load the output with process_oger_output (default: True). If False, the
+                 output is left in <path>/output/<input_file_name>.tsv, e.g. to be streamed
+                 with resolver_utils.iter_oger_annotations.
+    :return: Pandas DataFrame containing the output of OGER analysis, or None if not loaded.
 
     '''
     config = configparser.ConfigParser()
@@ -148,6 +175,8 @@ def run_oger(path: str , input_file_name: str , n_workers :int = 1 ) -> pd.DataF
     settings = sections['Main']
     settings['n_workers'] = n_workers
     og_run(**settings)
+    if not load:
+        return None
     df = process_oger_output(path, input_file_name)
     
     return df
@@ -162,9 +191,7 @@ def process_oger_output(path: str, input_file_name: str) -> pd.DataFrame:
     :return: Pandas Dataframe containing required data for further analyses.
     """
     
-    cols = ['TaxId', 'Biolink', 'BeginTerm', 'EndTerm', 'TokenizedTerm', 'PreferredTerm', \
-            'CURIE', 'NaN1', 'SentenceID', 'NaN2', 'UMLS_CUI']
-    df = pd.read_csv(os.path.join(path, 'output',input_file_name+'.tsv'), sep='\t', names=cols)
+    df = pd.read_csv(os.path.join(path, 'output',input_file_name+'.tsv'), sep='\t', names=OGER_COLUMNS)
     sub_df = df[['TaxId', 'Biolink','TokenizedTerm', 'PreferredTerm', 'CURIE']]
 
     sub_df['StringMatch'] = sub_df.apply(lambda row : assign_string_match_rating(row), axis=1) 
@@ -195,11 +222,4 @@ def assign_string_match_rating(dfRow):
     :param dfRow: each row of the OGER output
     :returns: Same dataframe with an extra 'matchRating' column
     '''
-    result = None
-    if dfRow['TokenizedTerm'] == dfRow['PreferredTerm']:
-        result = 'Exact'
-    elif dfRow['TokenizedTerm'] in dfRow['PreferredTerm']:
-        result =  'Partial'
-    else:
-        result =  'NoMatch'
-    return result
\ No newline at end of file
+    return string_match_rating(dfRow['TokenizedTerm'], dfRow['PreferredTerm'])
\ No newline at end of file
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+import tempfile
+from typing import Any, Dict, Iterator, Tuple
+
+import ijson
+
+from kg_microbe.utils.io_utils import input_compression, open_input
+from kg_microbe.utils.transform_utils import NodeEdgeWriter, TransformError, ungzip_to_tempdir
+
+
+OBO_PURL = 'http://purl.obolibrary.org/obo/'
+HAS_OBO_NAMESPACE = 'http://www.geneontology.org/formats/oboInOwl#hasOBONamespace'
+SKOS_EXACT_MATCH = 'http://www.w3.org/2004/02/skos/core#exactMatch'
+
+# columns written, in the order KGX's TSV sink puts them
+NODE_COLUMNS = ['id', 'category', 'name', 'description', 'xref', 'synonym', 'exact_synonym',
+                'broad_synonym', 'narrow_synonym', 'related_synonym', 'deprecated', 'iri',
+                'same_as', 'subsets']
+EDGE_COLUMNS = ['subject', 'predicate', 'object', 'relation']
+# edges are told apart by relation too: several relations can share a predicate, e.g.
+# related_to, between the same terms, and KGX keeps an edge for each
+EDGE_KEY = ['subject', 'predicate', 'object', 'relation']
+
+# What follows mirrors KGX's ObographSource, which gets these from the Biolink Model:
+# Biolink categories of the OBO namespaces (oboInOwl:hasOBONamespace) of the ontologies
+# kg-microbe loads; other namespaces have no Biolink class and fall back to the prefix
+NAMESPACE_CATEGORIES = {
+    'biological_process': 'biolink:BiologicalProcess',
+    'molecular_function': 'biolink:MolecularActivity',
+    'cellular_component': 'biolink:CellularComponent',
+}
+
+PREFIX_CATEGORIES = {
+    'HP': 'biolink:PhenotypicFeature',
+    'CHEBI': 'biolink:ChemicalSubstance',
+    'MONDO': 'biolink:Disease',
+    'UBERON': 'biolink:AnatomicalEntity',
+    'SO': 'biolink:SequenceFeature',
+    'CL': 'biolink:Cell',
+    'PR': 'biolink:Protein',
+    'NCBITaxon': 'biolink:OrganismTaxon',
+}
+DEFAULT_CATEGORY = 'biolink:OntologyClass'
+
+# (predicate, relation) of obographs' shorthand predicates
+SHORTHAND_PREDICATES = {
+    'is_a': ('biolink:subclass_of', 'rdfs:subClassOf'),
+    'has_part': ('biolink:has_part', 'BFO:0000051'),
+    'part_of': ('biolink:part_of', 'BFO:0000050'),
+}
+
+# Biolink predicates of relation ontology CURIEs (the Biolink Model's exact mappings);
+# edges with other IRI predicates get RELATED_TO, as in KGX
+RELATION_PREDICATES = {
+    'BFO:0000050': 'biolink:part_of',
+    'BFO:0000051': 'biolink:has_part',
+    'BFO:0000066': 'biolink:occurs_in',
+    'RO:0000057': 'biolink:has_participant',
+    'RO:0001015': 'biolink:location_of',
+    'RO:0001025': 'biolink:located_in',
+    'RO:0002131': 'biolink:overlaps',
+    'RO:0002162': 'biolink:in_taxon',
+    'RO:0002200': 'biolink:has_phenotype',
+    'RO:0002202': 'biolink:develops_from',
+    'RO:0002206': 'biolink:expressed_in',
+    'RO:0002211': 'biolink:regulates',
+    'RO:0002212': 'biolink:negatively_regulates',
+    'RO:0002213': 'biolink:positively_regulates',
+    'RO:0002215': 'biolink:capable_of',
+    'RO:0002233': 'biolink:has_input',
+    'RO:0002234': 'biolink:has_output',
+    'RO:0002331': 'biolink:actively_involved_in',
+    'RO:0002351': 'biolink:has_member',
+}
+RELATED_TO = 'biolink:related_to'
+
+# prefixes of the non-OBO namespaces of obographs' property nodes and predicates, as KGX
+# contracts them (from the prefixcommons contexts); other IRIs are kept as they are
+NAMESPACE_PREFIXES = {
+    'http://www.geneontology.org/formats/oboInOwl#': 'OIO',
+    'http://www.w3.org/1999/02/22-rdf-syntax-ns#': 'rdf',
+    'http://www.w3.org/2000/01/rdf-schema#': 'rdfs',
+    'http://www.w3.org/2002/07/owl#': 'owl',
+    'http://www.w3.org/2004/02/skos/core#': 'skos',
+    'http://purl.org/dc/elements/1.1/': 'dc',
+    'http://purl.org/dc/terms/': 'dcterms',
+    'http://xmlns.com/foaf/0.1/': 'foaf',
+}
+
+OBO_CURIE_PATTERN = re.compile(r'^([A-Za-z][A-Za-z0-9]*)_([A-Za-z0-9]\S*)$')
+
+
+class UnsupportedObographError(TransformError):
+    """Raised for obograph content that the native converter can't map the way KGX would"""
+    pass
+
+
+def contract_iri(iri: str) -> str:
+    """
+    Contract an IRI to a CURIE the way KGX does, e.g. http://purl.obolibrary.org/obo/GO_0008150
+    to GO:0008150, http://purl.obolibrary.org/obo/ncbitaxon#species to OBO:ncbitaxon#species,
+    or http://www.geneontology.org/formats/oboInOwl#hasDbXref to OIO:hasDbXref. IRIs in
+    other namespaces are returned unchanged.
+
+    :param iri: IRI
+    :return: CURIE, or the IRI
+    """
+
+    if iri.startswith(OBO_PURL):
+        local = iri[len(OBO_PURL):]
+        match = OBO_CURIE_PATTERN.match(local)
+        if match:
+            return '{}:{}'.format(*match.groups())
+        return 'OBO:' + local
+    for namespace, prefix in NAMESPACE_PREFIXES.items():
+        if iri.startswith(namespace):
+            return '{}:{}'.format(prefix, iri[len(namespace):])
+    return iri
+
+
+def _sanitize(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return '|'.join(_sanitize(v) for v in value)
+    return str(value).replace('\n', ' ').replace('\\"', '').replace('\t', ' ')
+
+
+def node_category(curie: str, meta: Dict) -> str:
+    """
+    Biolink category of an obograph node, from its OBO namespace or else its prefix.
+
+    :param curie: the node's CURIE
+    :param meta: the node's meta
+    :return: category
+    """
+
+    for p in meta.get('basicPropertyValues', ()):
+        if p.get('pred') == HAS_OBO_NAMESPACE and p.get('val') in NAMESPACE_CATEGORIES:
+            return NAMESPACE_CATEGORIES[p['val']]
+    return PREFIX_CATEGORIES.get(curie.split(':', 1)[0], DEFAULT_CATEGORY)
+
+
+def obograph_node(node: Dict) -> Dict[str, str]:
+    """
+    KGX node properties of an obograph node. Like KGX, this converts PROPERTY nodes (the
+    relations and annotation properties an ontology declares) the same way as classes.
+
+    :param node: the node, as in graphs[].nodes[]
+    :return: dict of column to value, without empty values
+    """
+
+    if 'id' not in node:
+        raise UnsupportedObographError("Node without an id: {}".format(node))
+    curie = contract_iri(node['id'])
+    meta = node.get('meta') or {}
+    row = {'id': curie, 'category': node_category(curie, meta), 'iri': node['id']}
+    if 'lbl' in node:
+        row['name'] = node['lbl']
+    if 'definition' in meta:
+        row['description'] = meta['definition'].get('val')
+    if 'subsets' in meta:
+        row['subsets'] = [x.split('#')[1] if '#' in x else x for x in meta['subsets']]
+    if 'synonyms' in meta:
+        synonyms = meta['synonyms']
+        row['synonym'] = [s['val'] for s in synonyms if 'val' in s]
+        for kind in ['exact', 'related', 'broad', 'narrow']:
+            pred = 'has{}Synonym'.format(kind.capitalize())
+            row[kind + '_synonym'] = [s['val'] for s in synonyms if s.get('pred') == pred]
+    if 'xrefs' in meta:
+        row['xref'] = [x['val'] for x in meta['xrefs']]
+    if meta.get('deprecated'):
+        row['deprecated'] = True
+    same_as = [contract_iri(p['val']) for p in meta.get('basicPropertyValues', ())
+               if p.get('pred') == SKOS_EXACT_MATCH]
+    if same_as:
+        row['same_as'] = same_as
+    return {k: _sanitize(v) for k, v in row.items() if v not in (None, '', [])}
+
+
+def obograph_edge(edge: Dict) -> Dict[str, str]:
+    """
+    KGX edge properties of an obograph edge.
+
+    :param edge: the edge, as in graphs[].edges[]
+    :return: dict of column to value
+    """
+
+    if not all(k in edge for k in ('sub', 'pred', 'obj')):
+        raise UnsupportedObographError(
+            "Edge without a subject, predicate or object: {}".format(edge))
+    pred = edge['pred']
+    if pred.startswith('http'):
+        relation = contract_iri(pred)
+        predicate = RELATION_PREDICATES.get(relation, RELATED_TO)
+    elif pred in SHORTHAND_PREDICATES:
+        predicate, relation = SHORTHAND_PREDICATES[pred]
+    else:
+        predicate, relation = 'biolink:' + pred.replace(' ', '_'), pred
+    return {'subject': contract_iri(edge['sub']), 'predicate': predicate,
+            'object': contract_iri(edge['obj']), 'relation': relation}
+
+
+def iter_obograph(filename: str, kind: str) -> Iterator[Dict]:
+    """
+    Stream the nodes or edges of all the graphs in an obograph JSON file.
+
+    :param filename: obograph JSON, optionally compressed (see io_utils.open_input)
+    :param kind: 'nodes' or 'edges'
+    :return: iterator of nodes or edges, as in the JSON
+    """
+
+    with open_input(filename, 'rb') as f:
+        yield from ijson.items(f, 'graphs.item.{}.item'.format(kind))
+
+
+def obograph_to_tsv(filename: str, writer: NodeEdgeWriter) -> Tuple[int, int]:
+    """
+    Convert an obograph JSON file to KGX nodes and edges the way KGX's obojson input
+    does, streaming it so that memory doesn't grow with the size of the ontology.
+    Raises UnsupportedObographError for content it can't convert, in which case the
+    writer's output is incomplete.
+
+    :param filename: obograph JSON, optionally compressed (see io_utils.open_input)
+    :param writer: NodeEdgeWriter with NODE_COLUMNS and EDGE_COLUMNS headers, and EDGE_KEY
+    :return: number of nodes and edges read
+    """
+
+    n_nodes = n_edges = 0
+    for edge in iter_obograph(filename, 'edges'):
+        row = obograph_edge(edge)
+        writer.write_edge([row[c] for c in writer.edge_header])
+        n_edges += 1
+    for node in iter_obograph(filename, 'nodes'):
+        row = obograph_node(node)
+        writer.write_node([row.get(c, '') for c in writer.node_header])
+        n_nodes += 1
+    logging.info("Converted {} nodes and {} edges from {}".format(n_nodes, n_edges, filename))
+    return n_nodes, n_edges
+
+
+def kgx_obograph_to_tsv(filename: str, output: str) -> None:
+    """
+    Convert an obograph JSON file to KGX TSVs with KGX itself, for what
+    obograph_to_tsv() can't convert. KGX reads gzipped JSON; other compressions are
+    decompressed to a temporary file first.
+
+    :param filename: obograph JSON, optionally compressed
+    :param output: output prefix; KGX writes <output>_nodes.tsv and <output>_edges.tsv
+    :return: None.
+    """
+
+    from kgx.cli.cli_utils import transform
+
+    compression = input_compression(filename)
+    if compression in (None, 'gz'):
+        transform(inputs=[filename], input_format='obojson', input_compression=compression,
+                  output=output, output_format='tsv')
+        return
+    with tempfile.TemporaryDirectory() as tempdir:
+        transform(inputs=[ungzip_to_tempdir(filename, tempdir)], input_format='obojson',
+                  output=output, output_format='tsv')
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import json
+import logging
+import os
+import tarfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Any, Deque, Dict, List, Optional
+
+from kg_microbe.utils.profile_utils import span
+
+
+PACKAGE_FORMATS = ['tar.gz', 'tar.zst', 'gz', 'zst']
+DEFAULT_LEVELS = {'gz': 6, 'zst': 3}
+BLOCK_SIZE = 1 << 22
+HASH_BLOCK_SIZE = 1 << 20
+
+
+class _HashingWriter(io.RawIOBase):
+    """Passes writes through to a file, keeping their SHA-256 and size"""
+
+    def __init__(self, f: IO[bytes]) -> None:
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.sha256.update(b)
+        self.size += len(b)
+        self.f.write(b)
+        return len(b)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.f.close()
+        super().close()
+
+
+class _HashingReader(io.RawIOBase):
+    """Passes reads through from a file, keeping their SHA-256, size and line count"""
+
+    def __init__(self, f: IO[bytes]) -> None:
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.lines = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, n: int = -1) -> bytes:
+        b = self.f.read(n)
+        self.sha256.update(b)
+        self.size += len(b)
+        self.lines += b.count(b'\n')
+        return b
+
+    def summary(self, name: str) -> Dict[str, Any]:
+        return {'name': name, 'bytes': self.size, 'lines': self.lines,
+                'sha256': self.sha256.hexdigest()}
+
+
+def _gzip_member(block: bytes, level: int) -> bytes:
+    # wbits 31 is a gzip header and trailer, and zlib writes a header without a
+    # timestamp, so that the same input always gives the same output
+    # (gzip.compress(mtime=0) would need Python 3.8)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(block) + compressor.flush()
+
+
+class ParallelGzipWriter(io.RawIOBase):
+
+    """
+    Writes gzip using all cores: what is written is cut into blocks, each compressed as
+    a gzip member of its own on a thread pool (zlib releases the GIL), and the members
+    are written in order. The output is multi-member gzip, as pigz -i and bgzip write,
+    which gzip, zcat, tar and Python's gzip read like any gzip file.
+    """
+
+    def __init__(self, f: IO[bytes], level: int = DEFAULT_LEVELS['gz'],
+                 threads: Optional[int] = None, block_size: int = BLOCK_SIZE) -> None:
+        """
+        :param f: binary file to write the gzip stream to; closed with the writer
+        :param level: compression level [6]
+        :param threads: compression threads [number of CPUs]
+        :param block_size: uncompressed bytes per gzip member [4 MB]
+        """
+        self.f = f
+        self.level = level
+        self.threads = threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.pool = ThreadPoolExecutor(self.threads)
+        self.pending: Deque[Future] = deque()
+        self.members = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.buffer += b
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(b)
+
+    def _submit(self, block: bytes) -> None:
+        self.pending.append(self.pool.submit(_gzip_member, block, self.level))
+        self.members += 1
+        # bound the memory held by blocks waiting to be written
+        while len(self.pending) > 2 * self.threads:
+            self.f.write(self.pending.popleft().result())
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.buffer or not self.members:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.pending:
+            self.f.write(self.pending.popleft().result())
+        self.pool.shutdown()
+        self.f.close()
+        super().close()
+
+
+def open_compressed_output(f: IO[bytes], compression: str, level: Optional[int] = None,
+                           threads: Optional[int] = None) -> IO[bytes]:
+    """
+    Wrap a binary file in a multi-threaded compressor.
+
+    :param f: binary file to write to; closed with the compressor
+    :param compression: 'gz' or 'zst' (needs the optional 'zstandard' package)
+    :param level: compression level [6 for gz, 3 for zst]
+    :param threads: compression threads [number of CPUs]
+    :return: writable binary file handle
+    """
+
+    level = DEFAULT_LEVELS[compression] if level is None else level
+    if compression == 'gz':
+        return ParallelGzipWriter(f, level=level, threads=threads)
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        raise ImportError("zstd compression needs the 'zstandard' package "
+                          "(pip install zstandard)")
+    cctx = zstandard.ZstdCompressor(level=level, threads=threads or -1)
+    return cctx.stream_writer(f, closefd=True)
+
+
+def package_files(files: List[str], output_dir: str, name: str, fmt: str = 'tar.gz',
+                  level: Optional[int] = None, threads: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Compress files for release, using all cores, with checksums and a manifest.
+
+    With tar.gz or tar.zst, the files go in one archive, <name>.tar.gz or <name>.tar.zst,
+    with the same members as KGX's tar.gz output (each file under its base name).
+    With gz or zst, each file is compressed on its own. Either way the files are read
+    once, and <name>.sha256 (to check with sha256sum -c) and <name>.manifest.json (the
+    size, line count and SHA-256 of each file and archive) are written alongside.
+
+    :param files: files to package
+    :param output_dir: directory for the archives, checksums and manifest
+    :param name: name of the package, e.g. merged-kg
+    :param fmt: one of PACKAGE_FORMATS ['tar.gz']
+    :param level: compression level [6 for gz, 3 for zst]
+    :param threads: compression threads [number of CPUs]
+    :return: the manifest
+    """
+
+    if fmt not in PACKAGE_FORMATS:
+        raise ValueError("Unknown package format '{}', expected one of {}".format(
+            fmt, PACKAGE_FORMATS))
+    compression = fmt.split('.')[-1]
+    os.makedirs(output_dir, exist_ok=True)
+    manifest: Dict[str, Any] = {'name': name, 'format': fmt, 'files': [], 'archives': []}
+
+    def write_archive(archive: str, write) -> None:
+        with open(os.path.join(output_dir, archive), 'wb') as raw:
+            hashed = _HashingWriter(raw)
+            with open_compressed_output(hashed, compression, level, threads) as out:
+                write(out)
+            manifest['archives'].append({'name': archive, 'bytes': hashed.size,
+                                         'sha256': hashed.sha256.hexdigest()})
+
+    with span('package') as s:
+        if fmt.startswith('tar.'):
+            def write_tar(out: IO[bytes]) -> None:
+                with tarfile.open(fileobj=out, mode='w|') as tar:
+                    for filename in files:
+                        info = tar.gettarinfo(filename, arcname=os.path.basename(filename))
+                        with open(filename, 'rb') as f:
+                            reader = _HashingReader(f)
+                            tar.addfile(info, reader)
+                        manifest['files'].append(reader.summary(info.name))
+            write_archive('{}.{}'.format(name, fmt), write_tar)
+        else:
+            for filename in files:
+                def write_file(out: IO[bytes]) -> None:
+                    with open(filename, 'rb') as f:
+                        reader = _HashingReader(f)
+                        for block in iter(lambda: reader.read(HASH_BLOCK_SIZE), b''):
+                            out.write(block)
+                    manifest['files'].append(reader.summary(os.path.basename(filename)))
+                write_archive('{}.{}'.format(os.path.basename(filename), fmt), write_file)
+
+        with open(os.path.join(output_dir, name + '.sha256'), 'w') as f:
+            for entry in manifest['archives']:
+                f.write('{}  {}\n'.format(entry['sha256'], entry['name']))
+        with open(os.path.join(output_dir, name + '.manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        s.count('bytes_read', sum(e['bytes'] for e in manifest['files']))
+        s.count('bytes_written', sum(e['bytes'] for e in manifest['archives']))
+
+    logging.info("Packaged {} into {}".format(', '.join(files), ', '.join(
+        e['name'] for e in manifest['archives'])))
+    return manifest
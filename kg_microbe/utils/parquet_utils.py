@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import glob
+import logging
+import os
+import re
+import shutil
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from kg_microbe.utils.io_utils import open_binary_input, strip_compression_suffix
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.sort_utils import NODE_SORT_KEY, kgx_sort_key
+
+
+# columns with few distinct values, stored dictionary-encoded
+DICTIONARY_COLUMNS = {'category', 'predicate', 'relation', 'provided_by', 'knowledge_source',
+                      'primary_knowledge_source', 'aggregator_knowledge_source',
+                      'prefix', 'subject_prefix', 'object_prefix'}
+# CURIE prefix columns added to each kind, from the column named
+PREFIX_COLUMNS = {'nodes': {'prefix': 'id'},
+                  'edges': {'subject_prefix': 'subject', 'object_prefix': 'object'}}
+# the column each kind's dataset is partitioned (split into directories) by
+PARTITION_COLUMNS = {'nodes': 'prefix', 'edges': 'predicate'}
+BLOCK_BYTES = 1 << 24
+ROW_GROUP_ROWS = 1 << 20
+DATASET_PATTERN = re.compile(r'(^|_)(nodes|edges)\.parquet$')
+
+
+def _import_pyarrow() -> Any:
+    try:
+        import pyarrow  # type: ignore
+    except ImportError:
+        raise ImportError("Parquet output needs the 'pyarrow' package "
+                          "(pip install kg_microbe[parquet])")
+    return pyarrow
+
+
+def parquet_dataset_name(tsv_file: str) -> str:
+    """
+    Directory of the Parquet dataset of a KGX TSV: nodes.parquet for nodes.tsv(.gz).
+
+    :param tsv_file: KGX TSV
+    :return: directory name
+    """
+
+    base = strip_compression_suffix(tsv_file)
+    return (base[:-len('.tsv')] if base.endswith('.tsv') else base) + '.parquet'
+
+
+def tsv_to_parquet(tsv_file: str, dataset_dir: Optional[str] = None,
+                   block_bytes: int = BLOCK_BYTES) -> int:
+    """
+    Convert a KGX TSV to a partitioned Parquet dataset, streaming it.
+
+    Nodes are partitioned by the prefix of their id (prefix=NCBITaxon/...) and edges by
+    predicate (predicate=biolink%3Acapable_of/...), so that scans filtered on those read
+    only the files of the matching partitions. Nodes get a prefix column and edges
+    subject_prefix and object_prefix columns, and the columns in DICTIONARY_COLUMNS are
+    dictionary-encoded; the rest are strings. Within a file, readers skip row groups by
+    their statistics, which works best on TSVs sorted with sort_kgx_tsv().
+
+    pandas.read_parquet(), pyarrow.dataset and DuckDB's read_parquet(hive_partitioning)
+    read the directory as one table.
+
+    :param tsv_file: KGX nodes or edges TSV, optionally compressed
+    :param dataset_dir: directory to write [parquet_dataset_name()]
+    :param block_bytes: TSV bytes parsed at a time [16 MB]
+    :return: number of rows written
+    """
+
+    pa = _import_pyarrow()
+    import pyarrow.compute as pc  # type: ignore
+    import pyarrow.csv as pcsv  # type: ignore
+    import pyarrow.dataset as ds  # type: ignore
+
+    dataset_dir = dataset_dir or parquet_dataset_name(tsv_file)
+    with open_binary_input(tsv_file) as f:
+        header = f.readline().rstrip(b'\r\n').decode('utf-8').split('\t')
+    kind = 'nodes' if kgx_sort_key(header) == NODE_SORT_KEY else 'edges'
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    column_types = {c: dictionary if c in DICTIONARY_COLUMNS else pa.string() for c in header}
+    prefix_columns = {c: source for c, source in PREFIX_COLUMNS[kind].items()
+                      if c not in header}
+
+    rows = 0
+    with span('parquet') as s, open_binary_input(tsv_file) as f:
+        reader = pcsv.open_csv(
+            f, read_options=pcsv.ReadOptions(block_size=block_bytes),
+            parse_options=pcsv.ParseOptions(delimiter='\t', quote_char=False),
+            convert_options=pcsv.ConvertOptions(column_types=column_types,
+                                                strings_can_be_null=False))
+        schema = reader.schema
+        for c in prefix_columns:
+            schema = schema.append(pa.field(c, dictionary))
+
+        def batches() -> Iterator[Any]:
+            nonlocal rows
+            for batch in reader:
+                prefixes = [pc.dictionary_encode(pc.struct_field(pc.extract_regex(
+                    batch.column(source), r'^(?P<prefix>[^:]*):'), [0]))
+                    for source in prefix_columns.values()]
+                rows += batch.num_rows
+                yield pa.RecordBatch.from_arrays(batch.columns + prefixes, schema=schema)
+
+        if os.path.isfile(dataset_dir):  # e.g. a Parquet file of an earlier version
+            os.remove(dataset_dir)
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        os.makedirs(dataset_dir)
+        partition = schema.field(PARTITION_COLUMNS[kind])
+        ds.write_dataset(batches(), dataset_dir, schema=schema, format='parquet',
+                         partitioning=ds.partitioning(pa.schema([partition]), flavor='hive'),
+                         max_rows_per_group=ROW_GROUP_ROWS,
+                         min_rows_per_group=min(ROW_GROUP_ROWS, 1 << 16),
+                         file_options=ds.ParquetFileFormat().make_write_options(
+                             compression='zstd'))
+        s.count('rows', rows)
+    logging.info("Wrote {} rows of {} to {}".format(rows, tsv_file, dataset_dir))
+    return rows
+
+
+def parquet_datasets(directory: str) -> List[str]:
+    """
+    Parquet datasets (nodes.parquet, *_edges.parquet, ...) under a directory.
+
+    :param directory: directory to search
+    :return: sorted dataset directories
+    """
+
+    datasets = []
+    for root, dirs, _ in os.walk(directory):
+        for name in list(dirs):
+            if DATASET_PATTERN.search(name):
+                datasets.append(os.path.join(root, name))
+                dirs.remove(name)  # not into its partitions
+    return sorted(datasets)
+
+
+def _view_name(dataset_dir: str) -> str:
+    # chebi_nodes for ontologies/chebi_nodes.parquet, condensed_traits_NCBI_nodes for
+    # condensed_traits_NCBI/nodes.parquet
+    name = os.path.basename(dataset_dir)[:-len('.parquet')]
+    if name in ('nodes', 'edges'):
+        name = os.path.basename(os.path.dirname(os.path.abspath(dataset_dir))) + '_' + name
+    return re.sub(r'\W', '_', name)
+
+
+def _read_parquet(datasets: List[str]) -> str:
+    paths = ', '.join("'{}'".format(os.path.join(os.path.abspath(d), '**', '*.parquet')
+                                    .replace("'", "''")) for d in datasets)
+    return "read_parquet([{}], hive_partitioning = true, union_by_name = true)".format(paths)
+
+
+def create_duckdb(database_file: str, datasets: List[str]) -> Dict[str, List[str]]:
+    """
+    Create (or update) a DuckDB database with a view on each Parquet dataset, named
+    after it (e.g. chebi_nodes), and nodes and edges views on all the nodes and edges
+    datasets together. The views read the Parquet files, which stay where they are
+    (by absolute path), so the database file itself is small.
+
+    :param database_file: DuckDB database file
+    :param datasets: Parquet dataset directories, as written by tsv_to_parquet()
+    :return: the datasets of each view
+    """
+
+    try:
+        import duckdb  # type: ignore
+    except ImportError:
+        raise ImportError("Creating a DuckDB database needs the 'duckdb' package "
+                          "(pip install kg_microbe[parquet])")
+
+    views: Dict[str, List[str]] = {}
+    for dataset in datasets:
+        if not glob.glob(os.path.join(dataset, '**', '*.parquet'), recursive=True):
+            logging.warning("{} has no rows; it has no view".format(dataset))
+            continue
+        kind = DATASET_PATTERN.search(os.path.basename(dataset)).group(2)
+        views.setdefault(kind, []).append(dataset)
+        views[_view_name(dataset)] = [dataset]
+    with duckdb.connect(database_file) as con:
+        for name, sources in views.items():
+            con.execute('CREATE OR REPLACE VIEW "{}" AS SELECT * FROM {}'.format(
+                name, _read_parquet(sources)))
+    logging.info("Created views {} in {}".format(', '.join(sorted(views)), database_file))
+    return views
+
+
+def export_parquet(tsv_files: List[str], database_file: Optional[str] = None,
+                   database_dir: Optional[str] = None) -> List[Tuple[str, int]]:
+    """
+    Convert KGX TSVs to Parquet datasets next to them with tsv_to_parquet(), and create
+    a DuckDB database on them with create_duckdb(), if asked for.
+
+    :param tsv_files: KGX nodes and edges TSVs
+    :param database_file: DuckDB database file [None]
+    :param database_dir: put views on all the datasets under this directory in the
+                         database, rather than only those of tsv_files [None]
+    :return: (dataset directory, rows) of each TSV
+    """
+
+    written = [(parquet_dataset_name(f), tsv_to_parquet(f)) for f in tsv_files]
+    if database_file:
+        datasets = parquet_datasets(database_dir) if database_dir else \
+            [dataset for dataset, _ in written]
+        create_duckdb(database_file, datasets)
+    return written
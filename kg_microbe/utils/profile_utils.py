@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import cProfile
+import json
+import logging
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+# Setting this environment variable (to anything but '' or '0') turns profiling on
+# without the --profile flag; if it names a directory, the report goes there.
+PROFILE_ENV_VAR = 'KG_MICROBE_PROFILE'
+DEFAULT_PROFILE_DIR = os.path.join('data', 'profile')
+REPORT_FILENAME = 'run_report.json'
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process so far, in MB.
+
+    :return: peak RSS in MB
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Span:
+    """
+    A named, timed stage of the pipeline, with counters such as rows_in, rows_out,
+    bytes_read and bytes_written.
+    """
+
+    def __init__(self, name: str, parent: Optional['Span'] = None) -> None:
+        self.name = name
+        self.path = parent.path + '/' + name if parent else name
+        self.counters: Dict[str, float] = {}
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_mb = 0.0
+        self.peak_traced_mb: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def count(self, counter: str, value: float = 1) -> None:
+        """
+        Add to one of this span's counters.
+
+        :param counter: counter name, e.g. 'rows_in'
+        :param value: amount to add [1]
+        :return: None.
+        """
+
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def as_dict(self) -> Dict[str, Any]:
+        d: Dict[str, Any] = {'name': self.path,
+                             'wall_seconds': round(self.wall_seconds, 6),
+                             'cpu_seconds': round(self.cpu_seconds, 6),
+                             'peak_rss_mb': round(self.peak_rss_mb, 1),
+                             'counters': self.counters}
+        if self.peak_traced_mb is not None:
+            d['peak_traced_mb'] = round(self.peak_traced_mb, 1)
+        if self.error:
+            d['error'] = self.error
+        return d
+
+
+class Profiler:
+    """
+    Collects spans for a run and writes them out as a JSON report. While disabled,
+    spans are still handed out (so counters can be called unconditionally) but
+    nothing is timed or recorded.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.output_dir = DEFAULT_PROFILE_DIR
+        self.cprofile = False
+        self.tracemalloc = False
+        self.spans: List[Span] = []
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def configure(self, enabled: bool = True, output_dir: Optional[str] = None,
+                  cprofile: bool = False, trace_memory: bool = False) -> None:
+        """
+        Turn profiling on or off.
+
+        :param enabled: record spans and write a report
+        :param output_dir: directory for the report and dumps [data/profile]
+        :param cprofile: also dump cProfile stats for each top-level span
+        :param trace_memory: also trace Python allocations with tracemalloc for each
+                             top-level span
+        :return: None.
+        """
+
+        self.enabled = enabled
+        self.output_dir = output_dir or self.output_dir
+        self.cprofile = cprofile
+        self.tracemalloc = trace_memory
+        self.spans = []
+        self.started = time.time()
+
+    def configure_from_env(self) -> None:
+        """
+        Turn profiling on if the KG_MICROBE_PROFILE environment variable is set.
+
+        :return: None.
+        """
+
+        value = os.environ.get(PROFILE_ENV_VAR, '')
+        if value and value != '0':
+            self.configure(output_dir=value if value not in ('1', 'true') else None,
+                           cprofile=self.cprofile, trace_memory=self.tracemalloc)
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self) -> Optional[Span]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Span]:
+        """
+        Time a stage of the pipeline. Spans nest: a span opened inside another is
+        reported as 'outer/inner'.
+
+        :param name: name of the stage
+        :return: context manager yielding the Span
+        """
+
+        stack = self._stack()
+        s = Span(name, stack[-1] if stack else None)
+        if not self.enabled:
+            yield s
+            return
+
+        # cProfile and tracemalloc cover top-level spans in the main thread only: only
+        # one profiler can be active at a time, and nested spans would reset the
+        # traced memory peak
+        top_level = not stack and threading.current_thread() is threading.main_thread()
+        profile = cProfile.Profile() if self.cprofile and top_level else None
+        trace = self.tracemalloc and top_level
+        started_tracing = was_tracing = False
+        if trace:
+            was_tracing = tracemalloc.is_tracing()
+            if hasattr(tracemalloc, 'reset_peak'):
+                if not was_tracing:
+                    tracemalloc.start()
+                    started_tracing = True
+                tracemalloc.reset_peak()
+            else:
+                # Python < 3.9 has no reset_peak(): start tracing afresh for the span
+                if was_tracing:
+                    tracemalloc.stop()
+                tracemalloc.start()
+                started_tracing = True
+
+        stack.append(s)
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield s
+        except BaseException as e:
+            s.error = repr(e)
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+            s.wall_seconds = time.perf_counter() - wall
+            s.cpu_seconds = time.process_time() - cpu
+            s.peak_rss_mb = peak_rss_mb()
+            stack.pop()
+            if trace:
+                s.peak_traced_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                self._dump_tracemalloc(s)
+                if started_tracing:
+                    tracemalloc.stop()
+                    if was_tracing:
+                        tracemalloc.start()
+            if profile is not None:
+                self._dump_cprofile(s, profile)
+            with self._lock:
+                self.spans.append(s)
+            logging.info("%s took %.2fs (%.2fs CPU) %s" %
+                         (s.path, s.wall_seconds, s.cpu_seconds, s.counters or ''))
+
+    def _dump_path(self, s: Span, suffix: str) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, re.sub(r'[^\w.-]+', '_', s.path) + suffix)
+
+    def _dump_cprofile(self, s: Span, profile: cProfile.Profile) -> None:
+        profile.dump_stats(self._dump_path(s, '.prof'))
+
+    def _dump_tracemalloc(self, s: Span, top: int = 25) -> None:
+        stats = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        with open(self._dump_path(s, '.tracemalloc.txt'), 'w') as f:
+            for stat in stats:
+                f.write(str(stat) + '\n')
+
+    def report(self) -> Dict[str, Any]:
+        """
+        The run report: process-wide totals and one entry per finished span.
+
+        :return: report dict
+        """
+
+        with self._lock:
+            spans = [s.as_dict() for s in self.spans]
+        return {'argv': sys.argv,
+                'started': self.started,
+                'wall_seconds': round(time.time() - self.started, 6),
+                'peak_rss_mb': round(peak_rss_mb(), 1),
+                'spans': spans}
+
+    def write_report(self, filename: Optional[str] = None) -> Optional[str]:
+        """
+        Write the run report as JSON, if profiling is enabled.
+
+        :param filename: report file [<output_dir>/run_report.json]
+        :return: the report filename, or None if profiling is disabled
+        """
+
+        if not self.enabled:
+            return None
+        filename = filename or os.path.join(self.output_dir, REPORT_FILENAME)
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        logging.info("Wrote run report to {}".format(filename))
+        return filename
+
+
+profiler = Profiler()
+profiler.configure_from_env()
+
+
+def span(name: str):
+    """
+    Time a stage of the pipeline with the global profiler; see Profiler.span.
+
+    :param name: name of the stage
+    :return: context manager yielding the Span
+    """
+
+    return profiler.span(name)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import re
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from kg_microbe.utils.io_utils import open_input
+
+
+# columns of OGER's TSV output (it has no header)
+OGER_COLUMNS = ['TaxId', 'Biolink', 'BeginTerm', 'EndTerm', 'TokenizedTerm', 'PreferredTerm',
+                'CURIE', 'NaN1', 'SentenceID', 'NaN2', 'UMLS_CUI']
+
+# columns of the rows reported for unresolved terms: the OGER match and, if any, its SSSOM mapping
+RESOLUTION_COLUMNS = ['TaxId', 'Biolink', 'TokenizedTerm', 'PreferredTerm', 'CURIE', 'StringMatch',
+                      'subject_label', 'object_id', 'object_label', 'object_match_field',
+                      'match_category']
+
+EXACT_STRING_MATCH = 'ExactStringMatch'
+
+
+class Annotation(NamedTuple):
+    """One OGER match of a term in a taxon's traits."""
+    tax_id: int
+    biolink: str
+    tokenized_term: str
+    preferred_term: str
+    curie: str
+    string_match: str
+
+
+class Resolution(NamedTuple):
+    """
+    Result of resolving a term: the (curie, biolink category, match description) of each node
+    to write, and, if the term was not cleanly resolved, why and the rows behind it.
+    """
+    candidates: Tuple[Tuple[str, str, str], ...]
+    reason: Optional[str] = None
+    rows: Tuple[Dict[str, Any], ...] = ()
+
+
+def string_match_rating(tokenized_term: str, preferred_term: str) -> str:
+    """
+    Level of match between an OGER TokenizedTerm and PreferredTerm.
+
+    :param tokenized_term: term as found in the text
+    :param preferred_term: preferred label of the matched ontology term
+    :return: 'Exact', 'Partial' or 'NoMatch'
+    """
+
+    if tokenized_term == preferred_term:
+        return 'Exact'
+    elif tokenized_term in preferred_term:
+        return 'Partial'
+    return 'NoMatch'
+
+
+def _oger_annotation(row: List[str], tax_ids: Optional[Set[int]] = None
+                     ) -> Optional[Annotation]:
+    # the Annotation of a row of OGER output, or None if it isn't one or is of another taxon
+    if len(row) < 7:
+        return None
+    try:
+        tax_id = int(row[0])
+    except ValueError:
+        return None
+    if tax_ids is not None and tax_id not in tax_ids:
+        return None
+    return Annotation(tax_id, row[1], row[4], row[5], row[6],
+                      string_match_rating(row[4], row[5]))
+
+
+def iter_oger_annotations(filename: str, tax_ids: Optional[Set[int]] = None) -> Iterator[Annotation]:
+    """
+    Stream the annotations in an OGER TSV output file.
+
+    :param filename: OGER output TSV, e.g. data/nlp/output/nlpCHEBI.tsv
+    :param tax_ids: only yield annotations of these taxa [all]
+    :return: iterator of Annotations
+    """
+
+    with open(filename, newline='') as f:
+        for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+            annotation = _oger_annotation(row, tax_ids)
+            if annotation is not None:
+                yield annotation
+
+
+class OgerIndex:
+
+    """
+    Byte offsets of the lines of an OGER TSV output file, sorted by tax_id, from one pass
+    over it, so that the annotations of a block of taxa are read without rereading the
+    whole file: the lines of the block's taxa are read in file order, with a seek to each.
+
+    It holds 16 bytes per line, against a few hundred per annotation in a TermResolver.
+    """
+
+    def __init__(self, filename: str) -> None:
+        """
+        :param filename: OGER output TSV, e.g. data/nlp/output/nlpCHEBI.tsv
+        """
+
+        import numpy as np
+
+        self.filename = filename
+        tax_ids, offsets = array('q'), array('q')
+        offset = 0
+        with open(filename, 'rb') as f:
+            for line in f:
+                try:
+                    tax_ids.append(int(line.split(b'\t', 1)[0]))
+                    offsets.append(offset)
+                except ValueError:
+                    pass
+                offset += len(line)
+        tax_ids, offsets = np.frombuffer(tax_ids, dtype=np.int64), np.frombuffer(offsets, dtype=np.int64)
+        order = np.argsort(tax_ids, kind='stable')
+        self._tax_ids, self._offsets = tax_ids[order], offsets[order]
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def annotations(self, tax_ids: Iterable[int]) -> Iterator[Annotation]:
+        """
+        Read the annotations of some taxa.
+
+        :param tax_ids: NCBITaxon ids
+        :return: iterator of Annotations, in file order
+        """
+
+        import numpy as np
+
+        wanted = np.fromiter(set(tax_ids), dtype=np.int64)
+        starts = np.searchsorted(self._tax_ids, wanted, 'left')
+        ends = np.searchsorted(self._tax_ids, wanted, 'right')
+        lengths = ends - starts
+        # the positions starts[i]..ends[i] - 1 of every taxon, in one array
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - starts,
+                                                         lengths)
+        with open(self.filename, 'rb') as f:
+            for offset in np.sort(self._offsets[positions]).tolist():
+                f.seek(offset)
+                row = f.readline().decode('utf-8').rstrip('\r\n').split('\t')
+                annotation = _oger_annotation(row)
+                if annotation is not None:
+                    yield annotation
+
+
+def load_sssom(filename: str, underscores_to_spaces: bool = False
+               ) -> Dict[Tuple[str, str], Tuple[Tuple[str, str, str], ...]]:
+    """
+    Load the mappings of an SSSOM table, keyed the way OGER matches are looked up in it.
+
+    :param filename: SSSOM TSV, e.g. schemas/chemicals.sssom.tsv
+    :param underscores_to_spaces: replace '_' with ' ' in subject labels, as the traits
+                                  transform does for pathways
+    :return: dict of (subject_label, object_id) to (object_match_field, object_label,
+             match_category) of each mapping
+    """
+
+    mappings: Dict[Tuple[str, str], Dict[Tuple[str, str, str], None]] = {}
+    with open_input(filename, newline='') as f:
+        reader = csv.DictReader((line for line in f if not line.startswith('#')), delimiter='\t')
+        for row in reader:
+            label = re.sub(r"[\'\",]", "", row['subject_label'] or '')
+            if underscores_to_spaces:
+                label = label.replace('_', ' ')
+            key = (sys.intern(label), sys.intern(row['object_id']))
+            value = (sys.intern(row['object_match_field'] or ''), row['object_label'] or '',
+                     sys.intern(row['match_category'] or ''))
+            # a dict rather than a set keeps the table's order
+            mappings.setdefault(key, {})[value] = None
+    return {key: tuple(values) for key, values in mappings.items()}
+
+
+class TermResolver:
+
+    """
+    Resolves the terms of a traits column (e.g. carbon_substrates) to ontology CURIEs from
+    OGER annotations and an SSSOM table.
+
+    Annotations are held as tuples of interned strings in a dict keyed by (tax_id, term),
+    so resolving a term is a dict lookup rather than a scan of the OGER output, and the
+    strings shared between annotations (categories, CURIEs, terms) are stored once.
+
+    A term resolves to the CURIEs of its exact OGER matches, else to the CURIEs whose SSSOM
+    mapping has the first of synonym_fields that any of its matches has.
+    """
+
+    def __init__(self, sssom: Dict[Tuple[str, str], Tuple[Tuple[str, str, str], ...]],
+                 synonym_fields: List[str]) -> None:
+        """
+        :param sssom: SSSOM mappings, from load_sssom()
+        :param synonym_fields: object_match_fields to accept, in order of preference,
+                               e.g. ['oio:hasExactSynonym', 'oio:hasRelatedSynonym']
+        """
+        self.sssom = sssom
+        self.synonym_fields = synonym_fields
+        self._annotations: Dict[Tuple[int, str], List[Tuple[str, str, str, str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._annotations)
+
+    def add(self, annotation: Annotation) -> None:
+        intern = sys.intern
+        key = (int(annotation.tax_id), intern(str(annotation.tokenized_term)))
+        value = (intern(str(annotation.biolink)), str(annotation.preferred_term),
+                 intern(str(annotation.curie)), intern(str(annotation.string_match)))
+        values = self._annotations.setdefault(key, [])
+        if value not in values:
+            values.append(value)
+
+    def add_all(self, annotations: Iterable) -> int:
+        """
+        Add annotations, e.g. from iter_oger_annotations() or the rows of the DataFrame
+        returned by nlp_utils.process_oger_output().
+
+        :param annotations: Annotations, or tuples in Annotation field order
+        :return: number of annotations read
+        """
+
+        n = 0
+        for annotation in annotations:
+            self.add(Annotation(*annotation))
+            n += 1
+        return n
+
+    def clear(self) -> None:
+        self._annotations = {}
+
+    def resolve(self, tax_id: int, term: str) -> Resolution:
+        """
+        Resolve a term found in a taxon's traits.
+
+        :param tax_id: NCBITaxon id of the taxon
+        :param term: the term, as tokenized by OGER
+        :return: Resolution; reason is 'not_annotated' (no OGER match), 'no_sssom_match'
+                 (inexact matches without an SSSOM mapping), 'no_synonym_match' (SSSOM
+                 mappings without an accepted synonym field), 'ambiguous' (several
+                 candidates), or None
+        """
+
+        matches = self._annotations.get((tax_id, term))
+        if not matches:
+            return Resolution((), 'not_annotated')
+
+        exact = [m for m in matches if m[3] == 'Exact']
+        if exact:
+            candidates = tuple((curie, biolink, EXACT_STRING_MATCH)
+                               for biolink, _, curie, _ in exact)
+            if len(candidates) > 1:
+                return Resolution(candidates, 'ambiguous', self._rows(tax_id, term, exact))
+            return Resolution(candidates)
+
+        mapped = [(m, s) for m in matches for s in self.sssom.get((term, m[2]), ())]
+        for field in self.synonym_fields:
+            hits = [(m, s) for m, s in mapped if s[0] == field]
+            if hits:
+                candidates = tuple((m[2], m[0], field) for m, _ in hits)
+                if len(candidates) > 1:
+                    return Resolution(candidates, 'ambiguous', self._rows(tax_id, term, hits))
+                return Resolution(candidates)
+
+        if mapped:
+            return Resolution((), 'no_synonym_match', self._rows(tax_id, term, mapped))
+        return Resolution((), 'no_sssom_match', self._rows(tax_id, term, matches))
+
+    @staticmethod
+    def _rows(tax_id: int, term: str, matches: List) -> Tuple[Dict[str, Any], ...]:
+        rows = []
+        for match in matches:
+            (biolink, preferred, curie, string_match), sssom = \
+                match if isinstance(match[0], tuple) else (match, None)
+            row = {'TaxId': tax_id, 'Biolink': biolink, 'TokenizedTerm': term,
+                   'PreferredTerm': preferred, 'CURIE': curie, 'StringMatch': string_match}
+            if sssom:
+                row.update({'subject_label': term, 'object_id': curie, 'object_label': sssom[1],
+                            'object_match_field': sssom[0], 'match_category': sssom[2]})
+            rows.append(row)
+        return tuple(rows)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import logging
+import os
+from typing import Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kg_microbe.utils.io_utils import open_input
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.taxonomy_utils import NCBITAXON_PREFIX, NO_PARENT, TaxonomyIndex, \
+    taxon_number
+
+
+# the organism -> trait edges of TraitsTransform
+TRAIT_PREDICATES = ['biolink:capable_of', 'biolink:has_phenotype', 'biolink:interacts_with',
+                    'biolink:location_of']
+
+ROLLUP_NODE_COLUMNS = ['id', 'category']
+# has_count: taxa at or below the subject with the trait; has_total: taxa at or below
+# the subject with any of the rolled-up traits (as Biolink's frequency qualifiers)
+ROLLUP_EDGE_COLUMNS = ['subject', 'predicate', 'object', 'relation', 'has_count', 'has_total']
+
+
+def rollup_traits(edges_file: str, taxonomy: TaxonomyIndex, rank: str, output_dir: str,
+                  predicates: Iterable[str] = TRAIT_PREDICATES) -> Tuple[int, int]:
+    """
+    Roll trait edges up from the taxa they were reported for to their ancestors at
+    a rank, e.g. from species to genus, counting the taxa behind each rolled-up edge.
+
+    Taxa, predicates and objects are integer-encoded, so that the rollup is a few
+    group-bys over integer columns. A taxon is counted once per trait however many
+    times its edge appears (e.g. from several traits datasets).
+
+    :param edges_file: KGX edges TSV with trait edges, e.g. TraitsTransform's, optionally
+                       compressed
+    :param taxonomy: TaxonomyIndex with ranks (TaxonomyIndex.from_taxdump)
+    :param rank: rank to roll up to, e.g. genus
+    :param output_dir: directory for the nodes.tsv and edges.tsv of the rollup
+    :param predicates: predicates of the trait edges [TRAIT_PREDICATES]
+    :return: number of nodes and edges written
+    """
+
+    with span('rollup') as s:
+        with open_input(edges_file) as f:
+            edges = pd.read_csv(f, sep='\t', dtype=str, quoting=csv.QUOTE_NONE,
+                                usecols=lambda c: c in ROLLUP_EDGE_COLUMNS[:4])
+        if 'relation' not in edges.columns:
+            edges['relation'] = ''
+        edges = edges[edges.predicate.isin(set(predicates))]
+        # string work on distinct subjects only, of which there are far fewer
+        subject_codes, subject_values = pd.factorize(edges.subject)
+        numbers = (taxon_number(v) for v in subject_values)
+        subject_taxa = np.array([NO_PARENT if n is None else n for n in numbers], dtype=np.int64)
+        taxa = subject_taxa[subject_codes]
+        edges = edges[taxa != NO_PARENT]
+        taxa = taxa[taxa != NO_PARENT]
+        s.count('edges_in', len(edges))
+
+        predicate_codes, predicate_values = pd.factorize(
+            edges.predicate + '\t' + edges.relation.fillna(''))
+        object_codes, object_values = pd.factorize(edges.object)
+        frame = pd.DataFrame({'taxon': taxa, 'predicate': predicate_codes,
+                              'object': object_codes}).drop_duplicates()
+        frame['group'] = taxonomy.rank_ancestors(frame.taxon.values, rank)
+        unplaced = frame.taxon[frame.group == NO_PARENT].nunique()
+        if unplaced:
+            logging.warning("{} taxa in {} have no {}; their traits aren't rolled up".format(
+                unplaced, edges_file, rank))
+        frame = frame[frame.group != NO_PARENT]
+
+        counts = frame.groupby(['group', 'predicate', 'object']).size().rename('has_count')
+        totals = frame.drop_duplicates(['group', 'taxon']).groupby('group').size()
+        rollup = counts.reset_index()
+        rollup['has_total'] = totals.reindex(rollup.group).values
+
+        # a handful of distinct (predicate, relation) pairs
+        predicate_names = np.array([v.split('\t', 1)[0] for v in predicate_values], dtype=object)
+        relation_names = np.array([v.split('\t', 1)[1] for v in predicate_values], dtype=object)
+        groups, group_codes = np.unique(rollup.group.values, return_inverse=True)
+        group_ids = np.array([NCBITAXON_PREFIX + str(g) for g in groups], dtype=object)
+        output = pd.DataFrame({
+            'subject': group_ids[group_codes],
+            'predicate': predicate_names[rollup.predicate.values],
+            'object': np.asarray(object_values, dtype=object)[rollup.object.values],
+            'relation': relation_names[rollup.predicate.values],
+            'has_count': rollup.has_count.values,
+            'has_total': rollup.has_total.values,
+        }, columns=ROLLUP_EDGE_COLUMNS)
+        nodes = pd.DataFrame({'id': group_ids,
+                              'category': 'biolink:OrganismTaxon'}, columns=ROLLUP_NODE_COLUMNS)
+
+        os.makedirs(output_dir, exist_ok=True)
+        nodes.to_csv(os.path.join(output_dir, 'nodes.tsv'), sep='\t', index=False)
+        output.to_csv(os.path.join(output_dir, 'edges.tsv'), sep='\t', index=False)
+        s.count('nodes_out', len(nodes))
+        s.count('edges_out', len(output))
+
+    logging.info("Rolled {} trait edges up to {} edges on {} taxa of rank {}".format(
+        len(edges), len(output), len(nodes), rank))
+    return len(nodes), len(output)
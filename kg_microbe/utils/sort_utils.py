@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from collections import deque
+from typing import IO, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from kg_microbe.utils.io_utils import COMPRESSION_SUFFIXES, input_compression, line_ranges, \
+    open_binary_input, strip_compression_suffix
+from kg_microbe.utils.package_utils import open_compressed_output
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.transform_utils import TransformError
+
+
+NODE_SORT_KEY = ['id']
+EDGE_SORT_KEY = ['subject', 'predicate', 'object']
+DEFAULT_SORT_MEMORY_MB = 512
+# most runs merged at once; more are merged in several passes
+MERGE_FAN_IN = 64
+MIN_RUN_BYTES = 1 << 20
+KGX_TSV_PATTERN = re.compile(r'(^|_)(nodes|edges)\.tsv(\.gz|\.zst)?$')
+
+
+class LineKey:
+
+    """
+    Sort key of a TSV line: its key columns, then the whole line, so that lines with the
+    same key are still always in the same order. Compares bytes, i.e. by code point.
+    """
+
+    def __init__(self, columns: List[int], sep: bytes = b'\t') -> None:
+        """
+        :param columns: indexes of the key columns
+        :param sep: separator [\t]
+        """
+        self.columns = columns
+        self.sep = sep
+
+    def __call__(self, line: bytes) -> Tuple[bytes, ...]:
+        line = line.rstrip(b'\n')
+        fields = line.split(self.sep)
+        n = len(fields)
+        return tuple(fields[i] if i < n else b'' for i in self.columns) + (line,)
+
+
+def kgx_sort_key(header: List[str]) -> List[str]:
+    """
+    Columns to sort a KGX TSV by: (subject, predicate, object) for edges, id for nodes.
+
+    :param header: header of the TSV
+    :return: EDGE_SORT_KEY or NODE_SORT_KEY
+    """
+
+    for key in (EDGE_SORT_KEY, NODE_SORT_KEY):
+        if all(c in header for c in key):
+            return key
+    raise TransformError("Not a KGX nodes or edges header: {}".format(header))
+
+
+def _split_lines(data: bytes) -> List[bytes]:
+    lines = data.split(b'\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _sort_run(task: Tuple[Union[bytes, Tuple[str, int, int]], LineKey, str]) -> Tuple[str, int]:
+    # sort a block of lines, given as bytes or as a byte range of a file, into a run file
+    source, key, run_file = task
+    if isinstance(source, tuple):
+        filename, start, end = source
+        with open(filename, 'rb') as f:
+            f.seek(start)
+            source = f.read(end - start)
+    lines = _split_lines(source)
+    del source
+    lines.sort(key=key)
+    with open(run_file, 'wb') as f:
+        if lines:
+            f.write(b'\n'.join(lines) + b'\n')
+    return run_file, len(lines)
+
+
+def _merge_runs(run_files: List[str], out: IO[bytes], key: LineKey) -> None:
+    files = [open(run_file, 'rb', buffering=1 << 20) for run_file in run_files]
+    try:
+        out.writelines(heapq.merge(*files, key=key))
+    finally:
+        for f in files:
+            f.close()
+
+
+def sort_kgx_tsv(input_file: str, output_file: Optional[str] = None,
+                 key_columns: Optional[List[str]] = None,
+                 memory_mb: float = DEFAULT_SORT_MEMORY_MB, processes: Optional[int] = None,
+                 tmp_dir: Optional[str] = None) -> int:
+    """
+    Sort a KGX TSV by its key, with an external merge sort in bounded memory, so that
+    the same nodes or edges are always written in the same order.
+
+    The lines are cut into runs that fit in memory, each sorted (in parallel processes)
+    and written to a temporary file, and the runs are then merged. Uncompressed input is
+    split into runs by the processes themselves, each reading its own byte range.
+    Lines are compared as bytes, key columns first, then the whole line.
+
+    :param input_file: KGX nodes or edges TSV, optionally compressed
+    :param output_file: sorted TSV to write, gzip or zstd compressed if it ends in .gz or
+                        .zst; the input is replaced if not given
+    :param key_columns: columns to sort by [kgx_sort_key() of the header]
+    :param memory_mb: approximate memory to use for sorting, in MB [512]
+    :param processes: processes to sort runs with [number of CPUs]
+    :param tmp_dir: directory for the runs [that of the output]
+    :return: number of lines sorted, not counting the header
+    """
+
+    output_file = output_file or input_file
+    processes = processes or os.cpu_count() or 1
+    compression = next((c for c, suffix in COMPRESSION_SUFFIXES.items()
+                        if output_file.endswith(suffix)), None)
+    if compression is None and strip_compression_suffix(output_file) != output_file:
+        raise TransformError("Can't write {}: sorted output can be compressed with {}".format(
+            output_file, ', '.join(sorted(COMPRESSION_SUFFIXES))))
+    # Python's lines and sort keys take several times the size of the text
+    run_bytes = max(MIN_RUN_BYTES, int(memory_mb * (1 << 20)) // (4 * processes))
+
+    with open_binary_input(input_file) as f:
+        header_line = f.readline()
+    header = header_line.rstrip(b'\r\n').decode('utf-8').split('\t')
+    key_columns = key_columns or kgx_sort_key(header)
+    key = LineKey([header.index(c) for c in key_columns])
+
+    def blocks() -> Iterator[Union[bytes, Tuple[str, int, int]]]:
+        if processes > 1 and input_compression(input_file) is None:
+            for start, end in line_ranges(input_file, len(header_line), run_bytes):
+                yield input_file, start, end
+            return
+        with open_binary_input(input_file) as f:
+            f.readline()
+            while True:
+                lines = f.readlines(run_bytes)
+                if not lines:
+                    return
+                yield b''.join(lines)
+
+    run_dir = tempfile.mkdtemp(prefix='sort_', dir=tmp_dir or os.path.dirname(
+        os.path.abspath(output_file)))
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        with span('sort') as s:
+            sorted_runs: List[Tuple[str, int]] = []
+            pending: Deque = deque()
+            for i, block in enumerate(blocks()):
+                task = (block, key, os.path.join(run_dir, 'run{}'.format(i)))
+                if pool is None:
+                    sorted_runs.append(_sort_run(task))
+                    continue
+                # a few blocks in flight at most, to bound memory
+                pending.append(pool.apply_async(_sort_run, (task,)))
+                while len(pending) > processes:
+                    sorted_runs.append(pending.popleft().get())
+            sorted_runs.extend(p.get() for p in pending)
+            runs = [run_file for run_file, _ in sorted_runs]
+            lines = sum(n for _, n in sorted_runs)
+            s.count('runs', len(runs))
+            s.count('rows', lines)
+
+            passes = 0
+            while len(runs) > MERGE_FAN_IN:
+                merged = []
+                for i in range(0, len(runs), MERGE_FAN_IN):
+                    run_file = os.path.join(run_dir, 'pass{}_{}'.format(passes, i))
+                    with open(run_file, 'wb', buffering=1 << 20) as out:
+                        _merge_runs(runs[i:i + MERGE_FAN_IN], out, key)
+                    merged.append(run_file)
+                for run_file in runs:
+                    os.remove(run_file)
+                runs = merged
+                passes += 1
+
+            tmp_file = os.path.join(run_dir, 'sorted')
+            raw = open(tmp_file, 'wb', buffering=1 << 20)
+            with (open_compressed_output(raw, compression) if compression else raw) as out:
+                out.write(header_line if header_line.endswith(b'\n') else header_line + b'\n')
+                _merge_runs(runs, out, key)
+            os.replace(tmp_file, output_file)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    logging.info("Sorted {} lines of {} by {} into {}".format(
+        lines, input_file, ', '.join(key_columns), output_file))
+    return lines
+
+
+def kgx_tsv_files(directory: str) -> Dict[str, float]:
+    """
+    KGX node and edge TSVs (nodes.tsv, *_edges.tsv.gz, ...) under a directory, with
+    their modification times, to tell which files a step wrote.
+
+    :param directory: directory to search
+    :return: filename -> modification time
+    """
+
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if KGX_TSV_PATTERN.search(name):
+                path = os.path.join(root, name)
+                files[path] = os.path.getmtime(path)
+    return files
+
+
+def sort_kgx_files(files: Iterable[str], memory_mb: float = DEFAULT_SORT_MEMORY_MB,
+                   processes: Optional[int] = None) -> None:
+    """
+    Sort KGX TSVs in place, nodes by id and edges by (subject, predicate, object).
+
+    :param files: KGX nodes and edges TSVs
+    :param memory_mb: approximate memory to use for sorting, in MB [512]
+    :param processes: processes to sort with [number of CPUs]
+    :return: None.
+    """
+
+    for filename in files:
+        sort_kgx_tsv(filename, memory_mb=memory_mb, processes=processes)
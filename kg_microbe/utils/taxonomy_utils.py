@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import logging
+import os
+import tarfile
+from array import array
+from typing import Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kg_microbe.utils.io_utils import open_input
+from kg_microbe.utils.transform_utils import NodeEdgeWriter, TransformError
+
+
+NCBITAXON_PREFIX = 'NCBITaxon:'
+SUBCLASS_PREDICATES = {'biolink:subclass_of', 'rdfs:subClassOf'}
+NO_PARENT = -1
+
+
+def taxon_number(curie: str) -> Optional[int]:
+    """
+    Number of an NCBITaxon CURIE, e.g. 562 for NCBITaxon:562.
+
+    :param curie: CURIE
+    :return: the number, or None if it isn't a numbered NCBITaxon CURIE
+    """
+
+    if curie.startswith(NCBITAXON_PREFIX):
+        number = curie[len(NCBITAXON_PREFIX):]
+        if number.isdigit():
+            return int(number)
+    return None
+
+
+class TaxonomyIndex:
+
+    """
+    The NCBITaxon is_a tree as a parent-pointer array: parents[t] is the parent of
+    NCBITaxon:t, or -1. Indexed directly by taxon number, it takes a few MB for the
+    whole taxonomy, and is cached as a .npy file next to the edges file it was built from.
+    Built from NCBI's taxdump instead, it also has the rank of each taxon, as codes
+    into rank_names.
+    """
+
+    def __init__(self, parents: np.ndarray, ranks: Optional[np.ndarray] = None,
+                 rank_names: Optional[List[str]] = None) -> None:
+        """
+        :param parents: parent-pointer array
+        :param ranks: rank codes, indexed like parents [None]
+        :param rank_names: names of the rank codes [None]
+        """
+        self.parents = parents
+        self.ranks = ranks
+        self.rank_names = rank_names
+
+    @classmethod
+    def from_edges(cls, edges_file: str, sep: str = '\t') -> 'TaxonomyIndex':
+        """
+        Build the index from the subclass edges of a KGX edges TSV.
+
+        :param edges_file: KGX edges TSV, e.g. of the full NCBITaxon, optionally compressed
+        :param sep: separator [\t]
+        :return: TaxonomyIndex
+        """
+
+        children = array('q')
+        parents = array('q')
+        with open_input(edges_file) as f:
+            header = f.readline().rstrip('\n').split(sep)
+            try:
+                s, p, o = [header.index(c) for c in ['subject', 'predicate', 'object']]
+            except ValueError:
+                raise TransformError("{} is not a KGX edges file".format(edges_file))
+            for line in f:
+                items = line.rstrip('\n').split(sep)
+                if items[p] not in SUBCLASS_PREDICATES:
+                    continue
+                child, parent = taxon_number(items[s]), taxon_number(items[o])
+                if child is not None and parent is not None:
+                    children.append(child)
+                    parents.append(parent)
+
+        child_array = np.frombuffer(children, dtype=np.int64)
+        parent_array = np.frombuffer(parents, dtype=np.int64)
+        size = int(max(child_array.max(initial=0), parent_array.max(initial=0))) + 1
+        index = np.full(size, NO_PARENT, dtype=np.int32)
+        # NCBITaxon is a tree; should a taxon have several parents, keep the first
+        index[child_array[::-1]] = parent_array[::-1]
+        n_extra = len(child_array) - len(np.unique(child_array))
+        if n_extra:
+            logging.warning("{} taxa in {} have more than one parent; kept the first".format(
+                n_extra, edges_file))
+        return cls(index)
+
+    @classmethod
+    def from_taxdump(cls, taxdump_file: str) -> 'TaxonomyIndex':
+        """
+        Build the index, with ranks, from NCBI's taxdump (nodes.dmp, or the
+        taxdump.tar.gz it comes in).
+
+        :param taxdump_file: nodes.dmp or taxdump.tar.gz
+        :return: TaxonomyIndex
+        """
+
+        def read(f) -> pd.DataFrame:
+            # nodes.dmp rows are tax_id\t|\tparent tax_id\t|\trank\t|\t...
+            return pd.read_csv(f, sep='\t', header=None, usecols=[0, 2, 4],
+                               names=['taxon', 'parent', 'rank'], quoting=csv.QUOTE_NONE,
+                               dtype={'taxon': np.int64, 'parent': np.int64, 'rank': str})
+
+        if tarfile.is_tarfile(taxdump_file):
+            with tarfile.open(taxdump_file) as tar:
+                nodes = read(tar.extractfile('nodes.dmp'))
+        else:
+            with open_input(taxdump_file) as f:
+                nodes = read(f)
+
+        size = int(nodes.taxon.max()) + 1
+        parents = np.full(size, NO_PARENT, dtype=np.int32)
+        is_root = (nodes.taxon == nodes.parent).values  # the root is its own parent
+        parents[nodes.taxon.values[~is_root]] = nodes.parent.values[~is_root]
+        codes, rank_names = pd.factorize(nodes['rank'], sort=True)
+        ranks = np.full(size, NO_PARENT, dtype=np.int16)
+        ranks[nodes.taxon.values] = codes
+        return cls(parents, ranks, list(rank_names))
+
+    @classmethod
+    def load(cls, edges_file: str, cache_file: Optional[str] = None) -> 'TaxonomyIndex':
+        """
+        Load the index from its cache, building and caching it first if the cache is
+        missing or older than the edges file.
+
+        :param edges_file: KGX edges TSV
+        :param cache_file: .npy cache [<edges_file>.parents.npy]
+        :return: TaxonomyIndex
+        """
+
+        cache_file = cache_file or edges_file + '.parents.npy'
+        if os.path.isfile(cache_file) and \
+                os.path.getmtime(cache_file) >= os.path.getmtime(edges_file):
+            return cls(np.load(cache_file))
+        index = cls.from_edges(edges_file)
+        np.save(cache_file, index.parents)
+        return index
+
+    def ancestors(self, taxa: Iterable[int]) -> np.ndarray:
+        """
+        Ancestor closure of a set of taxa: the taxa and all their ancestors.
+
+        All the taxa are walked up together, one vectorized step per level, and a
+        lineage is dropped as soon as it reaches a taxon already in the closure, so
+        the work is proportional to the size of the closure rather than to the
+        number of taxa times their depth.
+
+        :param taxa: taxon numbers
+        :return: sorted array of taxon numbers
+        """
+
+        parents = self.parents
+        seeds = np.unique(np.fromiter(taxa, dtype=np.int64))
+        outside = seeds[seeds >= len(parents)]  # not in the taxonomy: no ancestors
+        frontier = seeds[seeds < len(parents)]
+        in_closure = np.zeros(len(parents), dtype=bool)
+        in_closure[frontier] = True
+        while frontier.size:
+            frontier = np.unique(parents[frontier])
+            frontier = frontier[frontier != NO_PARENT]
+            frontier = frontier[~in_closure[frontier]]
+            in_closure[frontier] = True
+        return np.union1d(np.flatnonzero(in_closure), outside)
+
+    def rank_ancestors(self, taxa: np.ndarray, rank: str) -> np.ndarray:
+        """
+        The ancestor of each taxon at a rank, e.g. its genus: the taxon itself if it
+        has that rank, or -1 if neither it nor any ancestor has. Like ancestors(), all
+        the lineages go up together, one vectorized step per level.
+
+        :param taxa: taxon numbers
+        :param rank: rank, e.g. 'genus'
+        :return: array of taxon numbers, aligned with taxa
+        """
+
+        if self.ranks is None:
+            raise TransformError("Ranks are only known for an index built from NCBI's taxdump")
+        if rank not in self.rank_names:
+            raise TransformError("Unknown rank {}; known ranks are {}".format(
+                rank, ', '.join(self.rank_names)))
+        code = self.rank_names.index(rank)
+
+        # walk up from each distinct taxon once
+        unique, inverse = np.unique(np.asarray(taxa, dtype=np.int64), return_inverse=True)
+        result = np.full(len(unique), NO_PARENT, dtype=np.int64)
+        current = unique.copy()
+        active = np.flatnonzero((current >= 0) & (current < len(self.parents)))
+        while active.size:
+            found = self.ranks[current[active]] == code
+            result[active[found]] = current[active[found]]
+            active = active[~found]
+            current[active] = self.parents[current[active]]
+            active = active[current[active] != NO_PARENT]
+        return result[inverse]
+
+
+def taxdump_to_tsv(taxdump_file: str, output_node_file: str, output_edge_file: str,
+                   sep: str = '\t') -> Tuple[int, int]:
+    """
+    Write KGX TSVs of the whole taxonomy from NCBI's taxdump, with the ids, names and
+    subclass edges of NCBITaxon (which is built from the same dump), for subset_taxonomy().
+
+    :param taxdump_file: taxdump.tar.gz, with nodes.dmp and names.dmp
+    :param output_node_file: nodes TSV to write
+    :param output_edge_file: edges TSV to write
+    :param sep: separator [\t]
+    :return: number of nodes and edges written
+    """
+
+    def read(name: str, columns: List[int], names: List[str]) -> pd.DataFrame:
+        # .dmp rows are field\t|\tfield\t|\t...
+        return pd.read_csv(tar.extractfile(name), sep='\t', header=None, usecols=columns,
+                           names=names, quoting=csv.QUOTE_NONE, dtype=str)
+
+    with tarfile.open(taxdump_file) as tar:
+        names = read('names.dmp', [0, 2, 6], ['taxon', 'name', 'class'])
+        names = names[names['class'] == 'scientific name'].set_index('taxon')['name']
+        nodes = read('nodes.dmp', [0, 2], ['taxon', 'parent'])
+
+    node_header = ['id', 'category', 'name', 'iri']
+    edge_header = ['subject', 'predicate', 'object', 'relation']
+    with NodeEdgeWriter(output_node_file, output_edge_file, node_header, edge_header,
+                        sep=sep, compact=True) as writer:
+        for taxon, name in zip(nodes.taxon, nodes.taxon.map(names).fillna('')):
+            writer.write_node([NCBITAXON_PREFIX + taxon, 'biolink:OrganismTaxon',
+                               name.replace(sep, ' '),
+                               'http://purl.obolibrary.org/obo/NCBITaxon_' + taxon])
+        for taxon, parent in zip(nodes.taxon, nodes.parent):
+            if taxon != parent:  # the root is its own parent
+                writer.write_edge([NCBITAXON_PREFIX + taxon, 'biolink:subclass_of',
+                                   NCBITAXON_PREFIX + parent, 'rdfs:subClassOf'])
+
+    logging.info("Wrote {} taxa and {} edges from {}".format(
+        writer.node_count, writer.edge_count, taxdump_file))
+    return writer.node_count, writer.edge_count
+
+
+def read_terms(terms_file: str) -> Set[int]:
+    """
+    NCBITaxon numbers in a terms file (one CURIE per line, e.g. subset_terms.tsv).
+
+    :param terms_file: terms file
+    :return: set of taxon numbers
+    """
+
+    with open(terms_file, 'r') as f:
+        numbers = (taxon_number(line.strip()) for line in f)
+        return {n for n in numbers if n is not None}
+
+
+def subset_taxonomy(nodes_file: str, edges_file: str, terms_file: str, output_node_file: str,
+                    output_edge_file: str, cache_file: Optional[str] = None,
+                    sep: str = '\t', compression: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Write the part of a taxonomy made of the taxa in a terms file and all their
+    ancestors, as ROBOT's BOT extraction does, from KGX TSVs of the whole taxonomy.
+
+    :param nodes_file: KGX nodes TSV of the whole taxonomy, optionally compressed
+    :param edges_file: KGX edges TSV of the whole taxonomy, optionally compressed
+    :param terms_file: file of NCBITaxon CURIEs to keep, one per line
+    :param output_node_file: nodes TSV to write (without compression suffix)
+    :param output_edge_file: edges TSV to write (without compression suffix)
+    :param cache_file: cache of the parent-pointer array [<edges_file>.parents.npy]
+    :param sep: separator [\t]
+    :param compression: None, 'gz' or 'zst' [None]
+    :return: number of nodes and edges written
+    """
+
+    index = TaxonomyIndex.load(edges_file, cache_file)
+    closure = {NCBITAXON_PREFIX + str(n) for n in index.ancestors(read_terms(terms_file))}
+
+    with open_input(nodes_file) as nodes, open_input(edges_file) as edges:
+        node_header = nodes.readline().rstrip('\n').split(sep)
+        edge_header = edges.readline().rstrip('\n').split(sep)
+        with NodeEdgeWriter(output_node_file, output_edge_file, node_header, edge_header,
+                            sep=sep, compression=compression) as writer:
+            i = node_header.index('id')
+            for line in nodes:
+                items = line.rstrip('\n').split(sep)
+                if items[i] in closure:
+                    writer.write_node(items)
+            s, o = edge_header.index('subject'), edge_header.index('object')
+            for line in edges:
+                items = line.rstrip('\n').split(sep)
+                if items[s] in closure and items[o] in closure:
+                    writer.write_edge(items)
+
+    logging.info("Wrote {} taxa and {} edges to {}".format(
+        writer.node_count, writer.edge_count, output_node_file))
+    return writer.node_count, writer.edge_count
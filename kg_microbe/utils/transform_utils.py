@@ -1,15 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import gzip
+import hashlib
 import logging
 import os
 import re
 import shutil
 import tempfile
 import zipfile
-from typing import Any, Dict, List, Union
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Union
 from tqdm import tqdm  # type: ignore
 
+from kg_microbe.utils.io_utils import open_binary_input, open_output, strip_compression_suffix
+
 
 class TransformError(Exception):
     """Base class for other exceptions"""
@@ -86,6 +91,303 @@ def write_node_edge_item(fh: Any, header: List, data: List, sep: str = '\t'):
         logging.warning("Can't write data for {}".format(data))
 
 
+class DigestSet:
+
+    """
+    Set of strings held as fixed-width 8-byte blake2b digests in an open-addressing
+    table, for de-duplicating millions of node ids or edges in a fraction of the memory
+    of a set of strings (about 16 bytes per member rather than well over 100).
+
+    Membership is by digest, so two different strings could in principle collide; at
+    64 bits the chance of any collision is about 1 in 40 million for a million members
+    and 1 in 4000 for a hundred million.
+    """
+
+    def __init__(self, capacity: int = 1 << 16) -> None:
+        """
+        :param capacity: initial number of slots, rounded up to a power of two [65536]
+        """
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self._table = array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self._len = 0
+
+    @staticmethod
+    def digest(key: str) -> int:
+        d = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        return d or 1  # 0 marks an empty slot
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __contains__(self, key: str) -> bool:
+        d = self.digest(key)
+        table, mask = self._table, self._mask
+        i = d & mask
+        while table[i]:
+            if table[i] == d:
+                return True
+            i = (i + 1) & mask
+        return False
+
+    def add(self, key: str) -> bool:
+        """
+        Add a string.
+
+        :param key: string to add
+        :return: True if it was not already in the set
+        """
+
+        if 2 * (self._len + 1) > len(self._table):
+            self._grow()
+        d = self.digest(key)
+        table, mask = self._table, self._mask
+        i = d & mask
+        while table[i]:
+            if table[i] == d:
+                return False
+            i = (i + 1) & mask
+        table[i] = d
+        self._len += 1
+        return True
+
+    def _grow(self) -> None:
+        old = self._table
+        self._table = array('Q', bytes(16 * len(old)))
+        self._mask = len(self._table) - 1
+        table, mask = self._table, self._mask
+        for d in old:
+            if d:
+                i = d & mask
+                while table[i]:
+                    i = (i + 1) & mask
+                table[i] = d
+
+
+# columns that identify an edge, for NodeEdgeWriter's de-duplication
+EDGE_KEY = ['subject', 'predicate', 'object']
+
+
+class NodeEdgeWriter:
+
+    """
+    Buffered writer for a transform's nodes and edges files.
+
+    Rows are collected and written in batches rather than one write per row, and
+    repeated nodes (by id) and edges (by subject, predicate, object, or the columns of
+    edge_key) are dropped, so
+    transforms don't need to keep their own seen_node/seen_edge bookkeeping. With
+    compact=True, the ids and edges seen are kept in DigestSets instead of sets of
+    strings, for large outputs.
+
+    Output is KGX TSV, optionally gzip or zstd compressed.
+
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(self, node_file: str, edge_file: str, node_header: List[str],
+                 edge_header: List[str], sep: str = '\t', compression: Optional[str] = None,
+                 batch_size: int = 10000, compact: bool = False,
+                 edge_key: Optional[List[str]] = None) -> None:
+        """
+        :param node_file: nodes TSV file to write (without compression suffix)
+        :param edge_file: edges TSV file to write (without compression suffix)
+        :param node_header: list of node header items
+        :param edge_header: list of edge header items
+        :param sep: separator [\t]
+        :param compression: None, 'gz' or 'zst'
+        :param batch_size: number of rows to buffer before writing [10000]
+        :param compact: de-duplicate with DigestSets rather than sets of strings [False]
+        :param edge_key: columns that identify an edge [EDGE_KEY]
+        """
+        self.node_header = node_header
+        self.edge_header = edge_header
+        self.sep = sep
+        self.batch_size = batch_size
+        self.edge_key_idx = [edge_header.index(k) if k in edge_header else i
+                             for i, k in enumerate(edge_key or EDGE_KEY)]
+
+        self.compact = compact
+        self.seen_nodes: Union[Set, DigestSet] = DigestSet() if compact else set()
+        self.seen_edges: Union[Set, DigestSet] = DigestSet() if compact else set()
+        self.node_count = 0
+        self.edge_count = 0
+
+        self._files = {'node': open_output(node_file, compression),
+                       'edge': open_output(edge_file, compression)}
+        self._headers = {'node': node_header, 'edge': edge_header}
+        self._buffers: Dict[str, List[List[str]]] = {'node': [], 'edge': []}
+        for kind, fh in self._files.items():
+            fh.write(sep.join(self._headers[kind]) + "\n")
+
+        self._closed = False
+
+    def __enter__(self) -> 'NodeEdgeWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def has_node(self, node_id: str) -> bool:
+        return node_id in self.seen_nodes
+
+    def _edge_key(self, key: tuple) -> Union[tuple, str]:
+        return '\t'.join(key) if self.compact else key
+
+    def has_edge(self, subject: str, predicate: str, object: str, *rest: str) -> bool:
+        # rest: the values of any further edge_key columns
+        return self._edge_key((subject, predicate, object) + rest) in self.seen_edges
+
+    def write_node(self, data: List[str]) -> bool:
+        """
+        Write a node, unless a node with the same id has already been written.
+
+        :param data: node data, in node_header order
+        :return: True if the node was written
+        """
+
+        if data[0] in self.seen_nodes:
+            return False
+        self.seen_nodes.add(data[0])
+        self._add('node', data)
+        self.node_count += 1
+        return True
+
+    def write_edge(self, data: List[str]) -> bool:
+        """
+        Write an edge, unless an edge with the same key (subject/predicate/object by
+        default) has already been written.
+
+        :param data: edge data, in edge_header order
+        :return: True if the edge was written
+        """
+
+        key = self._edge_key(tuple(data[i] for i in self.edge_key_idx))
+        if key in self.seen_edges:
+            return False
+        self.seen_edges.add(key)
+        self._add('edge', data)
+        self.edge_count += 1
+        return True
+
+    def _add(self, kind: str, data: List[str]) -> None:
+        if len(data) != len(self._headers[kind]):
+            raise TransformError('Header and data are not the same length: {}'.format(data))
+        buffer = self._buffers[kind]
+        buffer.append(data)
+        if len(buffer) >= self.batch_size:
+            self._flush(kind)
+
+    def _flush(self, kind: str) -> None:
+        buffer = self._buffers[kind]
+        if not buffer:
+            return
+        sep = self.sep
+        self._files[kind].write(''.join([sep.join(row) + "\n" for row in buffer]))
+        self._buffers[kind] = []
+
+    def flush(self) -> None:
+        for kind in self._buffers:
+            self._flush(kind)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        for fh in self._files.values():
+            fh.close()
+        self._closed = True
+
+
+class TermDiagnostics:
+
+    """
+    Streaming sink for terms a transform could not resolve (no match, no usable
+    SSSOM mapping, or several candidate CURIEs).
+
+    Each occurrence is written to a TSV as soon as it is recorded, and only a count
+    per (term, reason) is kept in memory, so memory grows with the number of distinct
+    terms rather than the number of misses. On close, the counts are written to a
+    <name>_summary.tsv next to the TSV, most frequent first, and the top terms are
+    logged.
+
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(self, filename: str, header: List[str], top_n: int = 20,
+                 sep: str = '\t') -> None:
+        """
+        :param filename: TSV file to write occurrences to
+        :param header: columns to write from each recorded row, after 'reason' and 'term'
+        :param top_n: number of terms to log on close [20]
+        :param sep: separator [\t]
+        """
+        self.filename = filename
+        self.header = header
+        self.top_n = top_n
+        self.sep = sep
+        self.counts: Counter = Counter()
+        self.summary_file = os.path.splitext(filename)[0] + '_summary.tsv'
+
+        self._file = open(filename, 'w')
+        self._file.write(sep.join(['reason', 'term'] + header) + '\n')
+        self._closed = False
+
+    def __enter__(self) -> 'TermDiagnostics':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def record(self, term: str, reason: str, rows: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        Record one occurrence of an unresolved term.
+
+        :param term: the term as it appears in the input
+        :param reason: why it was not resolved, e.g. 'no_sssom_match'
+        :param rows: candidate rows (e.g. OGER/SSSOM matches) to write, as dicts keyed
+                     by header; a single row with only reason and term if None
+        :return: None.
+        """
+
+        self.counts[(term, reason)] += 1
+        for row in rows or [{}]:
+            self._file.write(self.sep.join(
+                [reason, term] + ['' if row.get(col) is None else str(row.get(col))
+                                  for col in self.header]) + '\n')
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def most_common(self, n: Optional[int] = None) -> List:
+        """
+        The most frequent unresolved terms.
+
+        :param n: number of (term, reason) pairs to return [all]
+        :return: list of ((term, reason), count), most frequent first
+        """
+
+        return self.counts.most_common(n)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._file.close()
+        with open(self.summary_file, 'w') as f:
+            f.write(self.sep.join(['term', 'reason', 'count']) + '\n')
+            for (term, reason), count in self.counts.most_common():
+                f.write(self.sep.join([term, reason, str(count)]) + '\n')
+        if self.counts:
+            logging.info("{} unresolved term occurrences ({} distinct) written to {}; most common: {}".format(
+                self.total, len(self.counts), self.filename,
+                ', '.join("{} ({}, {})".format(term, reason, count)
+                          for (term, reason), count in self.most_common(self.top_n))))
+        self._closed = True
+
+
 def get_item_by_priority(items_dict: dict, keys_by_priority: list) -> str:
 
     """
@@ -123,7 +425,8 @@ def uniprot_make_name_to_id_mapping(dat_gz_file: str) -> dict:
 
     """Given a Uniprot dat.gz file, like this:
     ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/idmapping/by_organism/HUMAN_9606_idmapping.dat.gz
-    makes dict with name to id mapping
+    makes dict with name to id mapping (see idmapping_utils.uniprot_make_name_to_id_index
+    for a memory-mapped index that is built only once)
 
     :param dat_gz_file: 
     :return: dict with mapping
@@ -143,7 +446,7 @@ def uniprot_name_to_id(name_to_id_map: dict, name: str) -> Union[str, None]:
     """
     Uniprot name to ID mapping
 
-    :param name_to_id_map: mapping dict[name] -> id
+    :param name_to_id_map: mapping dict[name] -> id, or an IdMappingIndex
     :param name: name
     :return id: string, or None
     """
@@ -191,12 +494,19 @@ def unzip_to_tempdir(zip_file_name: str, tempdir: str) -> None:
 
 
 def ungzip_to_tempdir(gzipped_file: str, tempdir: str) -> str:
-    ungzipped_file = os.path.join(tempdir, os.path.basename(gzipped_file))
-    if ungzipped_file.endswith('.gz'):
-        ungzipped_file = os.path.splitext(ungzipped_file)[0]
+    """
+    Decompress a gzip (or bzip2, xz, zstd or single-file zip) file into tempdir, for
+    tools that can't read it compressed; anything else should stream it with
+    io_utils.open_input() instead.
+
+    :param gzipped_file: compressed file
+    :param tempdir: directory to decompress it to
+    :return: the decompressed file
+    """
 
-    with gzip.open(gzipped_file, 'rb') as f_in, open(ungzipped_file, 'wb') as f_out:
-        shutil.copyfileobj(f_in, f_out)
+    ungzipped_file = os.path.join(tempdir, strip_compression_suffix(os.path.basename(gzipped_file)))
+    with open_binary_input(gzipped_file) as f_in, open(ungzipped_file, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out, 1 << 20)
     return ungzipped_file
 
 
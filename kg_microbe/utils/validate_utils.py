@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import logging
+import multiprocessing
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, \
+    Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kg_microbe.utils.io_utils import input_compression, line_ranges, open_input
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.transform_utils import TransformError
+
+
+# prefixes of the CURIEs kg-microbe writes; microtraits.* are the traits' own namespaces
+KNOWN_PREFIXES = {'BFO', 'biolink', 'CHEBI', 'CL', 'EC', 'ECOCORE', 'ENVO', 'GO', 'HP', 'IAO',
+                  'MONDO', 'NCBITaxon', 'OBO', 'owl', 'PATO', 'PR', 'rdfs', 'RO', 'SO',
+                  'UBERON', 'UniProtKB'}
+KNOWN_PREFIX_STEMS = ('microtraits.',)
+
+NODE_CHECKS = ['duplicate_node', 'unknown_prefix', 'empty_category']
+EDGE_CHECKS = ['dangling_subject', 'dangling_object', 'duplicate_edge', 'unknown_predicate']
+EDGE_KEY = ['subject', 'predicate', 'object']
+
+CHUNK_ROWS = 500000
+RANGE_BYTES = 1 << 26
+
+
+class ChunkResult(NamedTuple):
+    """What checking a block of rows found"""
+    rows: int
+    counts: Counter
+    samples: Dict[str, List[Tuple[int, List[str]]]]  # check -> (row in block, row values)
+    hashes: np.ndarray  # hash of each row's key, for finding duplicates across blocks
+
+
+def hash_ids(values: pd.Series) -> np.ndarray:
+    """
+    64-bit hashes of strings, vectorized (pandas' hash_array, which is the same in every
+    process); used for the set of node ids and the keys of duplicate checks.
+
+    :param values: strings
+    :return: uint64 array
+    """
+
+    return pd.util.hash_pandas_object(values, index=False).values
+
+
+def unknown_prefixes(curies: pd.Series, known: Set[str], distinct: bool = False) -> np.ndarray:
+    """
+    Which CURIEs have a prefix not in known, or no prefix.
+
+    :param curies: CURIEs
+    :param known: known prefixes, besides those starting with KNOWN_PREFIX_STEMS
+    :param distinct: check each distinct CURIE once, for columns with few, such as
+                     predicates [False]
+    :return: boolean mask
+    """
+
+    if distinct:
+        codes, values = pd.factorize(curies)
+        return unknown_prefixes(pd.Series(values, dtype=object), known)[codes]
+    prefixes = curies.str.partition(':')
+    unknown = ~prefixes[0].isin(known) | (prefixes[1] != ':')
+    if unknown.any():
+        unknown &= ~prefixes[0].str.startswith(KNOWN_PREFIX_STEMS)
+    return unknown.values
+
+
+def _sample(frame: pd.DataFrame, mask: np.ndarray, limit: int) -> List[Tuple[int, List[str]]]:
+    rows = np.flatnonzero(mask)[:limit]
+    return [(int(i), frame.iloc[i].tolist()) for i in rows]
+
+
+def check_nodes(frame: pd.DataFrame, known: Set[str], sample_size: int) -> ChunkResult:
+    """
+    Check a block of nodes: unknown prefixes and empty categories. Duplicate ids are
+    found across blocks, from the hashes.
+
+    :param frame: nodes, with all values as strings
+    :param known: known prefixes
+    :param sample_size: offending rows to keep per check
+    :return: ChunkResult
+    """
+
+    counts: Counter = Counter()
+    samples = {}
+    masks = {'unknown_prefix': unknown_prefixes(frame['id'], known)}
+    if 'category' in frame.columns:
+        masks['empty_category'] = (frame['category'].str.strip() == '').values
+    else:
+        masks['empty_category'] = np.ones(len(frame), dtype=bool)
+    for check, mask in masks.items():
+        counts[check] = int(mask.sum())
+        if counts[check]:
+            samples[check] = _sample(frame, mask, sample_size)
+    return ChunkResult(len(frame), counts, samples, hash_ids(frame['id']))
+
+
+# the node id hashes, sorted, in the processes checking edges
+_node_hashes: Optional[np.ndarray] = None
+
+
+def _set_node_hashes(node_hashes: np.ndarray) -> None:
+    global _node_hashes
+    _node_hashes = node_hashes
+
+
+def _missing(hashes: np.ndarray) -> np.ndarray:
+    i = np.searchsorted(_node_hashes, hashes)
+    found = np.zeros(len(hashes), dtype=bool)
+    inside = i < len(_node_hashes)
+    found[inside] = _node_hashes[i[inside]] == hashes[inside]
+    return ~found
+
+
+def check_edges(frame: pd.DataFrame, known: Set[str], sample_size: int) -> ChunkResult:
+    """
+    Check a block of edges: endpoints missing from the nodes (whose hashes are set with
+    _set_node_hashes) and predicates with unknown prefixes. Duplicate edges are found
+    across blocks, from the hashes.
+
+    :param frame: edges, with all values as strings
+    :param known: known prefixes
+    :param sample_size: offending rows to keep per check
+    :return: ChunkResult
+    """
+
+    counts: Counter = Counter()
+    samples = {}
+    masks = {
+        'dangling_subject': _missing(hash_ids(frame['subject'])),
+        'dangling_object': _missing(hash_ids(frame['object'])),
+        'unknown_predicate': unknown_prefixes(frame['predicate'], known, distinct=True),
+    }
+    for check, mask in masks.items():
+        counts[check] = int(mask.sum())
+        if counts[check]:
+            samples[check] = _sample(frame, mask, sample_size)
+    key = pd.util.hash_pandas_object(frame[EDGE_KEY], index=False).values
+    return ChunkResult(len(frame), counts, samples, key)
+
+
+CHECKERS: Dict[str, Callable[[pd.DataFrame, Set[str], int], ChunkResult]] = {
+    'nodes': check_nodes,
+    'edges': check_edges,
+}
+
+
+def _read_header(filename: str) -> Tuple[List[str], int]:
+    with open_input(filename, 'rb') as f:
+        line = f.readline()
+    return line.rstrip(b'\r\n').decode('utf-8').split('\t'), len(line)
+
+
+def _parse(data, header: List[str], chunksize: Optional[int] = None):
+    return pd.read_csv(data, sep='\t', header=None, names=header, dtype=str,
+                       quoting=csv.QUOTE_NONE, keep_default_na=False, na_filter=False,
+                       chunksize=chunksize)
+
+
+def _check_range(args: Tuple[str, str, List[str], int, int, Set[str], int]) -> ChunkResult:
+    kind, filename, header, start, end, known, sample_size = args
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return CHECKERS[kind](_parse(io.BytesIO(data), header), known, sample_size)
+
+
+def _iter_results(kind: str, filename: str, known: Set[str], sample_size: int,
+                  pool: Optional[Any]) -> Iterator[ChunkResult]:
+    header, header_bytes = _read_header(filename)
+    missing = [c for c in (['id'] if kind == 'nodes' else EDGE_KEY) if c not in header]
+    if missing:
+        raise TransformError("{} has no {} column".format(filename, ', '.join(missing)))
+    if pool is not None and input_compression(filename) is None:
+        # uncompressed: the processes read and check ranges of the file in parallel
+        tasks = [(kind, filename, header, a, b, known, sample_size)
+                 for a, b in line_ranges(filename, header_bytes, RANGE_BYTES)]
+        yield from pool.imap(_check_range, tasks)
+        return
+    with open_input(filename) as f:
+        f.readline()
+        for frame in _parse(f, header, chunksize=CHUNK_ROWS):
+            yield CHECKERS[kind](frame, known, sample_size)
+
+
+def _read_rows(filename: str, rows: Iterable[int]) -> Dict[int, List[str]]:
+    # the given data rows (0 is the first after the header) of a file
+    wanted = set(rows)
+    found = {}
+    if not wanted:
+        return found
+    last = max(wanted)
+    with open_input(filename) as f:
+        f.readline()
+        for i, line in enumerate(f):
+            if i in wanted:
+                found[i] = line.rstrip('\r\n').split('\t')
+            if i >= last:
+                break
+    return found
+
+
+def validate_kgx(node_files: List[str], edge_files: List[str],
+                 prefixes: Iterable[str] = (), sample_size: int = 5,
+                 processes: int = 1) -> Dict[str, Any]:
+    """
+    Check the referential integrity of KGX node and edge TSVs, streaming them.
+
+    Node ids are kept as a sorted array of 64-bit hashes (8 bytes per node), against
+    which the subjects and objects of each block of edges are looked up at once. The
+    keys of nodes (id) and edges (subject, predicate, object) are hashed too, to find
+    duplicates across all the files at the end. Uncompressed files are checked in
+    parallel, each process reading its own ranges of the file; compressed ones (see
+    io_utils.open_input) are read sequentially.
+
+    :param node_files: KGX nodes TSVs
+    :param edge_files: KGX edges TSVs
+    :param prefixes: CURIE prefixes to accept besides KNOWN_PREFIXES
+    :param sample_size: offending rows to report per check [5]
+    :param processes: processes to check with [1]
+    :return: report: numbers of nodes and edges, and the count and sample rows
+             (file, line, row) of each check
+    """
+
+    known = KNOWN_PREFIXES | set(prefixes)
+    report: Dict[str, Any] = {'nodes': 0, 'edges': 0, 'checks': {}}
+
+    def record(check: str, filename: str, row: int, values: Any) -> None:
+        entry = report['checks'].setdefault(check, {'count': 0, 'samples': []})
+        if len(entry['samples']) < sample_size:
+            entry['samples'].append({'file': filename, 'line': row + 2, 'row': values})
+
+    def scan(kind: str, files: List[str], pool: Optional[Any]) -> np.ndarray:
+        # run the checks of a kind over its files; return the hashes of all the rows
+        hashes, offsets = [], []
+        total = 0
+        for filename in files:
+            offsets.append((total, filename))
+            row = 0
+            for result in _iter_results(kind, filename, known, sample_size, pool):
+                for check, count in result.counts.items():
+                    if count:
+                        report['checks'].setdefault(check, {'count': 0, 'samples': []})
+                        report['checks'][check]['count'] += count
+                for check, rows in result.samples.items():
+                    for i, values in rows:
+                        record(check, filename, row + i, values)
+                hashes.append(result.hashes)
+                row += result.rows
+            total += row
+        report[kind] = total
+        all_hashes = np.concatenate(hashes) if hashes else np.array([], dtype=np.uint64)
+
+        # duplicates: rows whose key hash was seen at an earlier row
+        check = 'duplicate_node' if kind == 'nodes' else 'duplicate_edge'
+        order = np.argsort(all_hashes, kind='stable')
+        repeated = np.flatnonzero(all_hashes[order][1:] == all_hashes[order][:-1]) + 1
+        if len(repeated):
+            report['checks'][check] = {'count': int(len(repeated)), 'samples': []}
+            # the offending lines are read back from their files, by row number
+            rows = np.sort(order[repeated])[:sample_size]
+            starts = np.array([start for start, _ in offsets])
+            in_files = np.searchsorted(starts, rows, side='right') - 1
+            for k, (start, filename) in enumerate(offsets):
+                in_file = (rows[in_files == k] - start).tolist()
+                for r, values in sorted(_read_rows(filename, in_file).items()):
+                    record(check, filename, r, values)
+        return all_hashes
+
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        with span('validate.nodes') as s:
+            node_hashes = np.unique(scan('nodes', node_files, pool))
+            s.count('rows_in', report['nodes'])
+        # edge checks, in this process and (through a pool started with them) in others
+        _set_node_hashes(node_hashes)
+        if pool is not None:
+            pool.close()
+            pool.join()
+            pool = multiprocessing.Pool(processes, initializer=_set_node_hashes,
+                                        initargs=(node_hashes,))
+        with span('validate.edges') as s:
+            scan('edges', edge_files, pool)
+            s.count('rows_in', report['edges'])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    report['checks'] = {c: report['checks'][c] for c in NODE_CHECKS + EDGE_CHECKS
+                        if report['checks'].get(c, {}).get('count')}
+    logging.info("Validated {} nodes and {} edges: {}".format(
+        report['nodes'], report['edges'],
+        ', '.join('{} {}'.format(v['count'], c) for c, v in report['checks'].items()) or 'OK'))
+    return report
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import logging
+import multiprocessing
+import os
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from kg_microbe.utils.io_utils import COMPRESSION_SUFFIXES, open_binary_input, open_output, \
+    strip_compression_suffix
+from kg_microbe.utils.profile_utils import span
+from kg_microbe.utils.transform_utils import TransformError
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:  # Python 3.7: worker processes get copies of the arrays instead
+    SharedMemory = None
+
+
+WALK_LENGTH = 80
+WALKS_PER_NODE = 10
+# walks generated at a time, by one process
+BATCH_WALKS = 1 << 14
+# node of the steps after a walk reached a node without neighbors
+PAD = -1
+# proposals for a biased step before its node's neighbors are all weighed instead
+MAX_REJECTIONS = 64
+
+# the arrays of the graph being walked, in each process
+_walk_arrays: Dict[str, np.ndarray] = {}
+_walk_ids: Optional[np.ndarray] = None
+_shared: List[Any] = []
+
+
+class WalkGraph:
+
+    """
+    Adjacency of a graph in CSR form, with nodes numbered 0..n-1 in the order of their
+    sorted CURIEs, for generating random walks: the neighbors of node i are
+    neighbors[offsets[i]:offsets[i + 1]], sorted and without duplicates, however many
+    edges (of different predicates) join two nodes.
+
+    Build with from_edges() or from_tsv(); save() and load() keep it in a .npz file.
+    """
+
+    def __init__(self, ids: np.ndarray, offsets: np.ndarray, neighbors: np.ndarray) -> None:
+        """
+        :param ids: sorted CURIEs of the nodes
+        :param offsets: CSR offsets into neighbors, per node, and the number of neighbors
+        :param neighbors: neighbors of each node
+        """
+        self.ids = ids
+        self.offsets = offsets
+        self.neighbors = neighbors
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def degrees(self) -> np.ndarray:
+        """
+        :return: number of neighbors of each node
+        """
+        return np.diff(self.offsets)
+
+    @classmethod
+    def from_edges(cls, subjects: np.ndarray, objects: np.ndarray,
+                   directed: bool = False) -> 'WalkGraph':
+        """
+        Build the graph from the subjects and objects of edges.
+
+        :param subjects: subject CURIEs
+        :param objects: object CURIEs, one per subject
+        :param directed: walk edges from subject to object only, rather than both ways
+        :return: WalkGraph
+        """
+
+        import pandas as pd
+
+        codes, ids = pd.factorize(np.concatenate([subjects, objects]), sort=True)
+        n, m = len(ids), len(subjects)
+        sources, targets = codes[:m].astype(np.int64), codes[m:].astype(np.int64)
+        if not directed:
+            sources, targets = np.concatenate([sources, targets]), \
+                np.concatenate([targets, sources])
+        keys = np.unique(sources * n + targets)
+        sources, targets = keys // n, keys % n
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+        return cls(np.asarray(ids, dtype=object), offsets, targets.astype(np.int32))
+
+    @classmethod
+    def from_tsv(cls, edges_file: str, directed: bool = False) -> 'WalkGraph':
+        """
+        Build the graph from a KGX edges TSV, e.g. of the merged graph.
+
+        :param edges_file: KGX edges TSV, optionally compressed
+        :param directed: walk edges from subject to object only, rather than both ways
+        :return: WalkGraph
+        """
+
+        import pandas as pd
+
+        with open_binary_input(edges_file) as f:
+            try:
+                edges = pd.read_csv(f, sep='\t', usecols=['subject', 'object'], dtype=str,
+                                    quoting=csv.QUOTE_NONE, keep_default_na=False)
+            except ValueError:
+                raise TransformError("{} is not a KGX edges file".format(edges_file))
+        return cls.from_edges(edges['subject'].to_numpy(object),
+                              edges['object'].to_numpy(object), directed=directed)
+
+    def save(self, filename: str) -> None:
+        """
+        Save the graph.
+
+        :param filename: .npz file
+        :return: None.
+        """
+
+        np.savez(filename, ids=self.ids.astype(str), offsets=self.offsets,
+                 neighbors=self.neighbors)
+
+    @classmethod
+    def load(cls, filename: str) -> 'WalkGraph':
+        """
+        Load a graph saved with save().
+
+        :param filename: .npz file
+        :return: WalkGraph
+        """
+
+        with np.load(filename) as data:
+            return cls(data['ids'].astype(object), data['offsets'], data['neighbors'])
+
+
+def _is_neighbor(offsets: np.ndarray, neighbors: np.ndarray, sources: np.ndarray,
+                 targets: np.ndarray) -> np.ndarray:
+    # whether each target is a neighbor of its source: a binary search of all the sorted
+    # neighbor lists at once, each in its own, where a search of all edges would miss the
+    # cache at nearly every step
+    lo, end = offsets[sources], offsets[sources + 1]
+    hi = end.copy()
+    searching = lo < hi
+    while searching.any():
+        mid = (lo + hi) // 2
+        below = neighbors[np.minimum(mid, len(neighbors) - 1)] < targets
+        lo = np.where(searching & below, mid + 1, lo)
+        hi = np.where(searching & ~below, mid, hi)
+        searching = lo < hi
+    found = lo < end
+    found[found] = neighbors[lo[found]] == targets[found]
+    return found
+
+
+def _weights(offsets: np.ndarray, neighbors: np.ndarray, previous: np.ndarray,
+             proposed: np.ndarray, p: float, q: float) -> np.ndarray:
+    # node2vec's unnormalized probability of stepping to proposed, having come from previous
+    return np.where(proposed == previous, 1 / p,
+                    np.where(_is_neighbor(offsets, neighbors, previous, proposed), 1.0, 1 / q))
+
+
+def walk_batch(arrays: Dict[str, np.ndarray], starts: np.ndarray, walk_length: int,
+               p: float, q: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    Random walks from some nodes, all advanced a step at a time with NumPy.
+
+    Walks are uniform if p and q are 1, and otherwise node2vec's second-order walks:
+    from the current node, stepping back to the previous node has weight 1/p, to
+    a neighbor of the previous node 1, and further away 1/q. Those steps are sampled
+    by rejection, proposing uniform neighbors and accepting them in proportion to their
+    weight, so no per-edge probabilities are precomputed; the few steps still rejected
+    after MAX_REJECTIONS proposals are sampled from the weights of all their neighbors.
+
+    :param arrays: offsets and neighbors of a WalkGraph
+    :param starts: first node of each walk
+    :param walk_length: nodes per walk
+    :param p: return parameter
+    :param q: in-out parameter
+    :param rng: random generator
+    :return: int32 array of walks, padded with PAD after nodes without neighbors
+    """
+
+    offsets, neighbors = arrays['offsets'], arrays['neighbors']
+    walks = np.full((len(starts), walk_length), PAD, dtype=np.int32)
+    walks[:, 0] = starts
+    biased = p != 1 or q != 1
+    max_weight = max(1 / p, 1, 1 / q)
+    alive = np.arange(len(starts))
+    for step in range(1, walk_length):
+        current = walks[alive, step - 1]
+        first = offsets[current]
+        degrees = offsets[current + 1] - first
+        moving = degrees > 0
+        alive, current, first, degrees = alive[moving], current[moving], first[moving], \
+            degrees[moving]
+        if not len(alive):
+            break
+        if not biased or step == 1:
+            walks[alive, step] = neighbors[first + (rng.random(len(alive)) * degrees)
+                                           .astype(np.int64)]
+            continue
+        previous = walks[alive, step - 2]
+        chosen = np.empty(len(alive), dtype=np.int32)
+        todo = np.arange(len(alive))
+        for _ in range(MAX_REJECTIONS):
+            if not len(todo):
+                break
+            proposed = neighbors[first[todo] + (rng.random(len(todo)) * degrees[todo])
+                                 .astype(np.int64)]
+            weights = _weights(offsets, neighbors, previous[todo], proposed, p, q)
+            # the only neighbor is the next step, whatever its weight
+            accepted = (rng.random(len(todo)) * max_weight < weights) | (degrees[todo] == 1)
+            chosen[todo[accepted]] = proposed[accepted]
+            todo = todo[~accepted]
+        # walks whose steps are all unlikely, e.g. only back with a large p: from all the
+        # weights of their neighbors
+        for i in todo:
+            candidates = neighbors[first[i]:first[i] + degrees[i]]
+            weights = _weights(offsets, neighbors, np.full(len(candidates), previous[i]),
+                               candidates, p, q)
+            chosen[i] = candidates[np.searchsorted(np.cumsum(weights),
+                                                   rng.random() * weights.sum(), side='right')]
+        walks[alive, step] = chosen
+    return walks
+
+
+def _attach(specs: Dict[str, Union[Tuple[str, Tuple[int, ...], str], np.ndarray]],
+            ids: Optional[np.ndarray]) -> None:
+    # map the graph arrays shared by the parent process, or take the copies it passed
+    global _walk_ids
+    for name, spec in specs.items():
+        if isinstance(spec, np.ndarray):
+            _walk_arrays[name] = spec
+            continue
+        shm_name, shape, dtype = spec
+        shm = SharedMemory(name=shm_name)
+        _shared.append(shm)
+        _walk_arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _walk_ids = ids
+
+
+def _walk_task(task: Tuple[int, int, int, int, int, float, float, int]) -> Any:
+    # the walks of a batch, as an array, or as text lines of CURIEs if ids were given
+    batch, lo, hi, n, walk_length, p, q, seed = task
+    # seeded by batch, so the walks don't depend on the number of processes
+    rng = np.random.default_rng([seed, batch])
+    walks = walk_batch(_walk_arrays, (np.arange(lo, hi) % n).astype(np.int32), walk_length,
+                       p, q, rng)
+    if _walk_ids is None:
+        return walks
+    return ''.join(' '.join(_walk_ids[walk[walk != PAD]]) + '\n' for walk in walks)
+
+
+def write_walks(graph: WalkGraph, output_file: str, walk_length: int = WALK_LENGTH,
+                walks_per_node: int = WALKS_PER_NODE, p: float = 1, q: float = 1,
+                seed: int = 0, processes: Optional[int] = None,
+                batch_walks: int = BATCH_WALKS) -> Dict[str, int]:
+    """
+    Generate random walks over a graph as a corpus for graph embeddings (node2vec,
+    DeepWalk), walks_per_node from every node, in rounds over all the nodes in order.
+
+    The walks are generated in batches by walk_batch(), in parallel processes that map
+    the graph's arrays from shared memory rather than each getting a copy (which they
+    do on Python 3.7, that has no multiprocessing.shared_memory). Each batch
+    has its own seed, derived from seed, so the same seed gives the same walks whatever
+    the number of processes.
+
+    An output file ending in .npy gets the walks as an int32 array, one row per walk,
+    of node numbers (PAD after the end of walks that reached a node without neighbors),
+    with the CURIE of each node number, one per line, in <name>_ids.txt. Any other file
+    gets a text corpus, a line of space separated CURIEs per walk, gzip or zstd
+    compressed if it ends in .gz or .zst.
+
+    :param graph: WalkGraph
+    :param output_file: .npy, or text file
+    :param walk_length: nodes per walk [80]
+    :param walks_per_node: walks from each node [10]
+    :param p: node2vec return parameter [1]
+    :param q: node2vec in-out parameter [1]
+    :param seed: random seed [0]
+    :param processes: processes to walk with [number of CPUs]
+    :param batch_walks: walks per batch [16384]
+    :return: number of nodes, walks and steps
+    """
+
+    global _walk_ids
+    if p <= 0 or q <= 0:
+        raise ValueError("p and q must be positive, not {} and {}".format(p, q))
+    processes = processes or os.cpu_count() or 1
+    n = len(graph)
+    total = n * walks_per_node
+    arrays = {'offsets': graph.offsets, 'neighbors': graph.neighbors}
+    as_array = output_file.endswith('.npy')
+    ids = None if as_array else graph.ids
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    if as_array:
+        out = np.lib.format.open_memmap(output_file, mode='w+', dtype=np.int32,
+                                        shape=(total, walk_length))
+        with open(output_file[:-len('.npy')] + '_ids.txt', 'w') as f:
+            f.writelines(i + '\n' for i in graph.ids)
+    else:
+        compression = next((c for c, suffix in COMPRESSION_SUFFIXES.items()
+                            if output_file.endswith(suffix)), None)
+        out = open_output(strip_compression_suffix(output_file), compression)
+
+    shared: List[Any] = []
+    pool = None
+    try:
+        if processes > 1:
+            specs: Dict[str, Any] = {}
+            for name, a in arrays.items():
+                if SharedMemory is None:
+                    specs[name] = a
+                    continue
+                shm = SharedMemory(create=True, size=max(a.nbytes, 1))
+                shared.append(shm)
+                np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[:] = a
+                specs[name] = (shm.name, a.shape, a.dtype.str)
+            pool = multiprocessing.Pool(processes, initializer=_attach, initargs=(specs, ids))
+        else:
+            _walk_arrays.clear()
+            _walk_arrays.update(arrays)
+            _walk_ids = ids
+
+        steps = 0
+
+        def write(lo: int, result: Any) -> None:
+            nonlocal steps
+            if as_array:
+                out[lo:lo + len(result)] = result
+                steps += int((result != PAD).sum())
+            else:
+                out.write(result)
+                steps += result.count(' ') + result.count('\n')
+
+        with span('walks') as s:
+            pending: Deque = deque()
+            for batch, lo in enumerate(range(0, total, batch_walks)):
+                task = (batch, lo, min(lo + batch_walks, total), n, walk_length, p, q, seed)
+                if pool is None:
+                    write(lo, _walk_task(task))
+                    continue
+                # a few batches in flight at most, to bound memory
+                pending.append((lo, pool.apply_async(_walk_task, (task,))))
+                while len(pending) > processes:
+                    lo, result = pending.popleft()
+                    write(lo, result.get())
+            for lo, result in pending:
+                write(lo, result.get())
+            s.count('walks', total)
+            s.count('steps', steps)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for shm in shared:
+            shm.close()
+            shm.unlink()
+        if as_array:
+            out.flush()
+            del out
+        else:
+            out.close()
+
+    logging.info("Wrote {} walks of up to {} nodes over {} nodes to {}".format(
+        total, walk_length, n, output_file))
+    return {'nodes': n, 'walks': total, 'steps': steps}
@@ -6,14 +6,34 @@ import click
 from kg_microbe import download as kg_download
 from kg_microbe import transform as kg_transform
 #from kg_microbe.make_holdouts import make_holdouts
-from kg_microbe.merge_utils.merge_kg import load_and_merge
-#from kg_microbe.query import run_query, parse_query_yaml, result_dict_to_tsv
+from kg_microbe.utils.profile_utils import profiler, PROFILE_ENV_VAR, DEFAULT_PROFILE_DIR
+from kg_microbe.utils.cache_utils import QueryCache, graph_version, DEFAULT_CACHE_DIR, \
+    DEFAULT_TTL, DEFAULT_GRAPH_STATS_FILE, DEFAULT_PAGE_SIZE
 from kg_microbe.transform import DATA_SOURCES
 
+# Anything slow to import (KGX, OGER, pandas) is imported inside the subcommand that
+# needs it, so that 'run.py --help' and 'run.py download' start quickly.
+
 
 @click.group()
-def cli():
-    pass
+@click.option("profile", "--profile", is_flag=True, default=False,
+              help='time each pipeline stage and write a JSON run report '
+                   '(or set %s) [false]' % PROFILE_ENV_VAR)
+@click.option("profile_dir", "--profile-dir", default=None,
+              help='directory for the run report and profile dumps [%s]' % DEFAULT_PROFILE_DIR)
+@click.option("cprofile", "--cprofile", is_flag=True, default=False,
+              help='with --profile, also dump cProfile stats per stage [false]')
+@click.option("trace_memory", "--tracemalloc", is_flag=True, default=False,
+              help='with --profile, also dump tracemalloc allocation stats per stage [false]')
+@click.pass_context
+def cli(ctx, profile: bool, profile_dir: str, cprofile: bool, trace_memory: bool):
+    if profile:
+        profiler.configure(output_dir=profile_dir, cprofile=cprofile, trace_memory=trace_memory)
+    elif profiler.enabled:
+        # turned on by the environment variable
+        profiler.configure(output_dir=profile_dir or profiler.output_dir, cprofile=cprofile,
+                           trace_memory=trace_memory)
+    ctx.call_on_close(profiler.write_report)
 
 
 @cli.command()
@@ -44,6 +64,26 @@ def download(*args, **kwargs) -> None:
 @click.option("output_dir", "-o", default="data/transformed")
 @click.option("sources", "-s", default=None, multiple=True,
               type=click.Choice(DATA_SOURCES.keys()))
+@click.option("compression", "--compression", default=None, type=click.Choice(['gz', 'zst']),
+              help='compress node/edge TSVs (adds .gz/.zst to the filenames)')
+@click.option("parquet", "--parquet", is_flag=True, default=False,
+              help='also write node/edge Parquet datasets, and a DuckDB database of views on '
+                   'them [false]')
+@click.option("chunk_size", "--chunk-size", default=None, type=int,
+              help='process input in blocks of this many rows, to bound memory (traits)')
+@click.option("memory_limit_mb", "--memory-limit", default=None, type=float,
+              help='size input blocks to stay under this many MB (traits), and sort in '
+                   'this much memory with --sorted [no limit]')
+@click.option("traits_files", "--traits-file", default=None, multiple=True,
+              help='traits CSV in the input dir, e.g. condensed_traits_GTDB.csv; given several '
+                   'times, the files are ingested together [condensed_traits_NCBI.csv]')
+@click.option("ontology_converter", "--ontology-converter", default='native',
+              type=click.Choice(['native', 'kgx']),
+              help='convert ontology JSON with the streaming converter (falling back to KGX '
+                   'where needed) or always with KGX [native]')
+@click.option("sort_output", "--sorted", is_flag=True, default=False,
+              help='sort node/edge TSVs, nodes by id and edges by (subject, predicate, object), '
+                   'in --memory-limit MB (or 512) [false]')
 
 def transform(*args, **kwargs) -> None:
     """
@@ -53,6 +93,13 @@ def transform(*args, **kwargs) -> None:
     :param input_dir: A string pointing to the directory to import data from.
     :param output_dir: A string pointing to the directory to output data to.
     :param sources: A list of sources to transform.
+    :param compression: Compression for node/edge TSVs (gz or zst).
+    :param parquet: Also write node/edge Parquet datasets and a DuckDB database.
+    :param chunk_size: Rows per input block, for transforms that support it.
+    :param memory_limit_mb: Memory limit in MB used to size input blocks instead.
+    :param traits_files: Traits CSV file(s) for TraitsTransform.
+    :param ontology_converter: Converter for ontology JSON (native or kgx).
+    :param sort_output: Sort node/edge TSVs by id and by (subject, predicate, object).
     :return: None.
     """
 
@@ -65,24 +112,380 @@ def transform(*args, **kwargs) -> None:
 @cli.command()
 @click.option('yaml', '-y', default="merge.yaml", type=click.Path(exists=True))
 @click.option('processes', '-p', default=1, type=int)
-
-def merge(yaml: str, processes: int) -> None:
+@click.option('closure_index', '--closure-index', default=None, type=click.Path(),
+              help='also save the subclass_of closure index of the merged graph to this '
+                   '.npz file (see the closure command)')
+@click.option('package', '--package', default='tar.gz',
+              type=click.Choice(['tar.gz', 'tar.zst', 'gz', 'zst', 'none']),
+              help='compress uncompressed TSV destinations in parallel, with checksums and '
+                   'a manifest (see the package command) [tar.gz]')
+@click.option('sort_output', '--sorted', is_flag=True, default=False,
+              help='sort uncompressed TSV destinations, nodes by id and edges by '
+                   '(subject, predicate, object), before packaging [false]')
+@click.option('parquet', '--parquet', is_flag=True, default=False,
+              help='also write uncompressed TSV destinations as Parquet datasets, with a '
+                   'DuckDB database of views on them [false]')
+@click.option('engine', '--engine', default='auto', type=click.Choice(['auto', 'kgx', 'arrow']),
+              help='merge with KGX, or with Arrow, which reads Parquet/Arrow sources as they '
+                   'are; auto uses Arrow if there are any [auto]')
+
+def merge(yaml: str, processes: int, closure_index: str, package: str,
+          sort_output: bool, parquet: bool, engine: str) -> None:
     """
     Use KGX to load subgraphs to create a merged graph.
 
     :param yaml: A string pointing to a KGX compatible config YAML.
     :param processes: Number of processes to use.
+    :param closure_index: .npz file for the subclass_of closure index [None]
+    :param package: package format for the merged TSVs, or none [tar.gz]
+    :param sort_output: sort the merged TSVs [False]
+    :param parquet: also write Parquet and DuckDB [False]
+    :param engine: merge engine, auto, kgx or arrow [auto]
+    :return: None.
+    """
+    from kg_microbe.merge_utils.merge_kg import load_and_merge
+
+    load_and_merge(yaml, processes, closure_index=closure_index,
+                   package=None if package == 'none' else package, sort=sort_output,
+                   parquet=parquet, engine=engine)
+
+
+@cli.command()
+@click.option("files", "-i", multiple=True, type=click.Path(exists=True),
+              help="file to package (can be repeated) "
+                   "[data/merged/merged-kg_nodes.tsv, data/merged/merged-kg_edges.tsv]")
+@click.option("output_dir", "-o", default="data/merged", type=click.Path(),
+              help="output directory [data/merged]")
+@click.option("name", "-n", default="merged-kg", help="package name [merged-kg]")
+@click.option("fmt", "-f", "--format", default="tar.gz",
+              type=click.Choice(['tar.gz', 'tar.zst', 'gz', 'zst']),
+              help="one archive (tar.gz, tar.zst) or one file each (gz, zst) [tar.gz]")
+@click.option("level", "-l", "--level", default=None, type=int,
+              help="compression level [6 for gzip, 3 for zstd]")
+@click.option("threads", "-t", "--threads", default=None, type=int,
+              help="compression threads [number of CPUs]")
+def package(files: tuple, output_dir: str, name: str, fmt: str, level: int,
+            threads: int) -> None:
+    """
+    Compress KG files for release using all cores, with checksums and a manifest.
+
+    Writes <name>.tar.gz (or the other formats) with multi-member gzip, which gzip and
+    tar read as usual, plus <name>.sha256 and <name>.manifest.json.
+    \f
+
+    :param files: files to package [the merged KG's nodes and edges TSVs]
+    :param output_dir: output directory [data/merged]
+    :param name: package name [merged-kg]
+    :param fmt: package format [tar.gz]
+    :param level: compression level [None]
+    :param threads: compression threads [None]
+    :return: None.
+    """
+    from kg_microbe.utils.package_utils import package_files
+
+    files = list(files) or [os.path.join('data', 'merged', 'merged-kg_%s.tsv' % kind)
+                            for kind in ['nodes', 'edges']]
+    for f in files:
+        if not os.path.isfile(f):
+            raise click.BadParameter("%s not found" % f)
+    package_files(files, output_dir, name, fmt, level=level, threads=threads)
+
+
+@cli.command()
+@click.option("files", "-i", required=True, multiple=True, type=click.Path(exists=True),
+              help="KGX nodes or edges TSV to sort (can be repeated)")
+@click.option("output", "-o", default=None, type=click.Path(),
+              help="sorted file to write, with one -i [sort in place]")
+@click.option("memory_mb", "-m", "--memory", default=512, type=float,
+              help="approximate memory to sort in, in MB [512]")
+@click.option("processes", "-p", "--processes", default=None, type=int,
+              help="processes to sort with [number of CPUs]")
+def sort(files: tuple, output: str, memory_mb: float, processes: int) -> None:
+    """
+    Sort KGX TSVs, nodes by id and edges by (subject, predicate, object), with an
+    external merge sort in bounded memory. Sorted files make stable release diffs and
+    can be compared or de-duplicated in one pass.
+    \f
+
+    :param files: KGX TSVs
+    :param output: output file, for a single input [None]
+    :param memory_mb: memory to sort in, in MB [512]
+    :param processes: number of processes [None]
+    :return: None.
+    """
+    from kg_microbe.utils.sort_utils import sort_kgx_tsv
+
+    if output and len(files) > 1:
+        raise click.BadParameter("-o can only be given with a single -i")
+    for f in files:
+        sort_kgx_tsv(f, output, memory_mb=memory_mb, processes=processes)
+
+
+@cli.command()
+@click.option("nodes", "-n", nargs=2, default=None, type=click.Path(exists=True),
+              metavar="OLD NEW", help="nodes TSVs of the old and new builds")
+@click.option("edges", "-e", nargs=2, default=None, type=click.Path(exists=True),
+              metavar="OLD NEW", help="edges TSVs of the old and new builds")
+@click.option("output_dir", "-o", default="data/diff", type=click.Path(),
+              help="directory for the delta files and diff.json [data/diff]")
+@click.option("presorted", "--presorted", is_flag=True, default=False,
+              help="the TSVs are already sorted, e.g. by 'merge --sorted' [false]")
+@click.option("memory_mb", "-m", "--memory", default=512, type=float,
+              help="approximate memory to sort in, in MB [512]")
+@click.option("processes", "-p", "--processes", default=None, type=int,
+              help="processes to sort with [number of CPUs]")
+def diff(nodes: tuple, edges: tuple, output_dir: str, presorted: bool, memory_mb: float,
+         processes: int) -> None:
+    """
+    Compare the nodes and edges of two KG builds in bounded memory.
+
+    Writes the added, changed and removed nodes and edges as delta files (see
+    apply-delta) and a report of the counts per source and predicate to diff.json.
+    \f
+
+    :param nodes: old and new nodes TSVs [None]
+    :param edges: old and new edges TSVs [None]
+    :param output_dir: output directory [data/diff]
+    :param presorted: the TSVs are sorted [False]
+    :param memory_mb: memory to sort in, in MB [512]
+    :param processes: number of processes [None]
     :return: None.
     """
+    from kg_microbe.utils.diff_utils import DIFF_STATUSES, diff_kgx
+
+    if not nodes and not edges:
+        raise click.UsageError("give the nodes (-n) or edges (-e) TSVs to compare")
+    report = diff_kgx(*(nodes or (None, None)), *(edges or (None, None)), output_dir,
+                      presorted=presorted, memory_mb=memory_mb, processes=processes)
+    for kind, result in report.items():
+        click.echo("%s: %s" % (kind, ', '.join('%d %s' % (result['total'][status], status)
+                                               for status in DIFF_STATUSES)))
+
+
+@cli.command(name="apply-delta")
+@click.option("old_file", "-i", required=True, type=click.Path(exists=True),
+              help="nodes or edges TSV of the old build")
+@click.option("delta_dir", "-d", default="data/diff", type=click.Path(exists=True),
+              help="directory of the delta files written by diff [data/diff]")
+@click.option("output_file", "-o", required=True, type=click.Path(),
+              help="TSV to write the new build's nodes or edges to")
+@click.option("presorted", "--presorted", is_flag=True, default=False,
+              help="the old TSV is already sorted [false]")
+def apply_delta(old_file: str, delta_dir: str, output_file: str, presorted: bool) -> None:
+    """
+    Apply a delta written by diff to the old build's nodes or edges, giving the new
+    build's, sorted.
+    \f
 
-    load_and_merge(yaml, processes)
+    :param old_file: old build's TSV
+    :param delta_dir: delta directory [data/diff]
+    :param output_file: output TSV
+    :param presorted: the old TSV is sorted [False]
+    :return: None.
+    """
+    from kg_microbe.utils.diff_utils import apply_kgx_delta
+
+    apply_kgx_delta(old_file, delta_dir, output_file, presorted=presorted)
+
+
+@cli.command()
+@click.option("nodes", "-n", multiple=True, type=click.Path(exists=True),
+              help="KGX nodes TSV (can be repeated) [data/merged/merged-kg_nodes.tsv]")
+@click.option("edges", "-e", multiple=True, type=click.Path(exists=True),
+              help="KGX edges TSV (can be repeated) [data/merged/merged-kg_edges.tsv]")
+@click.option("output_dir", "-o", default="data/neo4j", type=click.Path(),
+              help="directory for the CSVs and neo4j-admin-import.sh [data/neo4j]")
+@click.option("processes", "-p", "--processes", default=None, type=int,
+              help="processes to write the CSVs with [number of CPUs]")
+def neo4j(nodes: tuple, edges: tuple, output_dir: str, processes: int) -> None:
+    """
+    Export KGX TSVs as CSVs for neo4j-admin's offline bulk import, with labels from
+    categories and relationship types from predicates. Load them with the
+    neo4j-admin-import.sh written next to them.
+    \f
+
+    :param nodes: nodes TSVs [the merged KG's]
+    :param edges: edges TSVs [the merged KG's]
+    :param output_dir: output directory [data/neo4j]
+    :param processes: number of processes [None]
+    :return: None.
+    """
+    from kg_microbe.utils.neo4j_utils import export_neo4j_csv
+
+    if not nodes and not edges:
+        nodes = (os.path.join('data', 'merged', 'merged-kg_nodes.tsv'),)
+        edges = (os.path.join('data', 'merged', 'merged-kg_edges.tsv'),)
+    for f in nodes + edges:
+        if not os.path.isfile(f):
+            raise click.BadParameter("%s not found" % f)
+    summary = export_neo4j_csv(list(nodes), list(edges), output_dir, processes=processes)
+    click.echo("%d nodes, %d relationships; import with %s" % (
+        summary['nodes'], summary['relationships'], summary['script']))
+
+
+@cli.command()
+@click.option("files", "-i", multiple=True, type=click.Path(exists=True),
+              help="KGX nodes or edges TSV (can be repeated) "
+                   "[data/merged/merged-kg_nodes.tsv, data/merged/merged-kg_edges.tsv]")
+@click.option("database", "-d", "--duckdb", default=None, type=click.Path(),
+              help="DuckDB database to create views on the datasets in [none]")
+def parquet(files: tuple, database: str) -> None:
+    """
+    Convert KGX TSVs to Parquet datasets next to them (nodes.tsv to nodes.parquet/),
+    partitioned by id prefix or predicate, with dictionary-encoded categorical
+    columns, and optionally create a DuckDB database with views on them.
+    \f
+
+    :param files: KGX TSVs [the merged KG's]
+    :param database: DuckDB database file [None]
+    :return: None.
+    """
+    from kg_microbe.utils.parquet_utils import export_parquet
+
+    files = list(files) or [os.path.join('data', 'merged', 'merged-kg_%s.tsv' % kind)
+                            for kind in ['nodes', 'edges']]
+    for f in files:
+        if not os.path.isfile(f):
+            raise click.BadParameter("%s not found" % f)
+    for dataset, rows in export_parquet(files, database_file=database):
+        click.echo("%s: %d rows" % (dataset, rows))
+
+
+@cli.command()
+@click.option("index_file", "-i", required=True, type=click.Path(),
+              help="closure index .npz file, built by 'merge --closure-index' or with -e")
+@click.option("edges", "-e", default=None, type=click.Path(exists=True),
+              help="KGX edges TSV to build the index from (and save to -i)")
+@click.option("descendants", "--descendants", multiple=True,
+              help="print the descendants of this class (can be repeated)")
+@click.option("ancestors", "--ancestors", multiple=True,
+              help="print the ancestors of this class (can be repeated)")
+@click.option("is_a", "--is-a", nargs=2, multiple=True, metavar="CHILD PARENT",
+              help="print whether CHILD is a subclass of PARENT (can be repeated)")
+@click.option("include_self", "--include-self", is_flag=True, default=False,
+              help="include the class itself in --descendants and --ancestors [false]")
+def closure(index_file: str, edges: str, descendants: tuple, ancestors: tuple,
+            is_a: tuple, include_self: bool) -> None:
+    """
+    Query the subclass_of closure of a graph: is-a checks and descendants or
+    ancestors of classes, one per line.
+
+    :param index_file: closure index .npz file
+    :param edges: KGX edges TSV to build the index from [None]
+    :param descendants: classes to list the descendants of
+    :param ancestors: classes to list the ancestors of
+    :param is_a: (child, parent) pairs to check
+    :param include_self: include the class itself in lists [False]
+    :return: None.
+    """
+    from kg_microbe.utils.closure_utils import ClosureIndex
+
+    if edges:
+        index = ClosureIndex.from_tsv(edges)
+        index.save(index_file)
+        click.echo("Saved the closure of %d classes to %s" % (len(index), index_file), err=True)
+    elif os.path.isfile(index_file):
+        index = ClosureIndex.load(index_file)
+    else:
+        raise click.BadParameter("%s not found; build it with -e" % index_file)
+
+    try:
+        for child, parent in is_a:
+            click.echo("%s\t%s\t%s" % (child, parent, index.is_a(child, parent)))
+        for curie in descendants:
+            for d in index.descendants(curie, include_self=include_self):
+                click.echo("%s\t%s" % (curie, d))
+        for curie in ancestors:
+            for a in index.ancestors(curie, include_self=include_self):
+                click.echo("%s\t%s" % (curie, a))
+    except KeyError as e:
+        raise click.ClickException(e.args[0])
+
+
+@cli.command()
+@click.option("nodes", "-n", multiple=True, type=click.Path(exists=True),
+              help="KGX nodes TSV (can be repeated) [data/merged/merged-kg_nodes.tsv]")
+@click.option("edges", "-e", multiple=True, type=click.Path(exists=True),
+              help="KGX edges TSV (can be repeated) [data/merged/merged-kg_edges.tsv]")
+@click.option("prefixes", "--prefix", multiple=True,
+              help="CURIE prefix to accept besides kg-microbe's own (can be repeated)")
+@click.option("samples", "--samples", default=5, type=int,
+              help="offending rows to show per check [5]")
+@click.option("processes", "-p", "--processes", default=1, type=int,
+              help="processes to check uncompressed files with [1]")
+@click.option("report_file", "-o", "--report", default=None, type=click.Path(),
+              help="write the report as JSON to this file")
+def validate(nodes: tuple, edges: tuple, prefixes: tuple, samples: int, processes: int,
+             report_file: str) -> None:
+    """
+    Check KGX node and edge TSVs: edges whose subject or object isn't a node,
+    duplicate nodes and edges, unknown CURIE prefixes and nodes without a category.
+
+    Prints a summary with sample offending rows, and exits with an error if any
+    check fails.
+    \f
+
+    :param nodes: nodes TSVs [the merged KG's]
+    :param edges: edges TSVs [the merged KG's]
+    :param prefixes: CURIE prefixes to accept besides KNOWN_PREFIXES
+    :param samples: offending rows to show per check [5]
+    :param processes: number of processes [1]
+    :param report_file: JSON report file [None]
+    :return: None.
+    """
+    import json
+    from kg_microbe.utils.validate_utils import validate_kgx
+
+    if not nodes and not edges:
+        nodes = (os.path.join('data', 'merged', 'merged-kg_nodes.tsv'),)
+        edges = (os.path.join('data', 'merged', 'merged-kg_edges.tsv'),)
+    for f in nodes + edges:
+        if not os.path.isfile(f):
+            raise click.BadParameter("%s not found" % f)
+
+    report = validate_kgx(list(nodes), list(edges), prefixes, sample_size=samples,
+                          processes=processes)
+    if report_file:
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+    click.echo("%d nodes, %d edges" % (report['nodes'], report['edges']))
+    for check, result in report['checks'].items():
+        click.echo("%s: %d" % (check, result['count']))
+        for sample in result['samples']:
+            click.echo("  %s:%d\t%s" % (sample['file'], sample['line'],
+                                        '\t'.join(sample['row'])))
+    if report['checks']:
+        raise click.ClickException("%d checks failed" % len(report['checks']))
+    click.echo("OK")
 
 
 @cli.command()
 @click.option("yaml", "-y", required=True, default=None, multiple=False)
 @click.option("output_dir", "-o", default="data/queries/")
+@click.option("page_size", "--page-size", default=DEFAULT_PAGE_SIZE, type=int,
+              help='rows per LIMIT/OFFSET page of a query with an ORDER BY (others are '
+                   'fetched at once), 0 to fetch everything at once [%d]' % DEFAULT_PAGE_SIZE)
+@click.option("workers", "--workers", default=1, type=int,
+              help='number of pages to fetch in parallel [1]')
+@click.option("retries", "--retries", default=3, type=int,
+              help='number of retries per page on network/endpoint errors [3]')
+@click.option("compress", "--gzip", is_flag=True, default=False,
+              help='gzip the output file [false]')
+@click.option("no_cache", "--no-cache", is_flag=True, default=False,
+              help='always query the endpoint, bypassing the result cache [false]')
+@click.option("cache_dir", "--cache-dir", default=DEFAULT_CACHE_DIR,
+              help='directory for cached results [%s]' % DEFAULT_CACHE_DIR)
+@click.option("cache_ttl", "--cache-ttl", default=DEFAULT_TTL, type=float,
+              help='seconds before a cached result expires [%d]' % DEFAULT_TTL)
+@click.option("graph_stats", "--graph-stats", default=DEFAULT_GRAPH_STATS_FILE,
+              help='merged KG stats file used to version cached results '
+                   '[%s]' % DEFAULT_GRAPH_STATS_FILE)
 
 def query(yaml: str, output_dir: str,
+          page_size: int = DEFAULT_PAGE_SIZE, workers: int = 1, retries: int = 3,
+          compress: bool = False, no_cache: bool = False,
+          cache_dir: str = DEFAULT_CACHE_DIR, cache_ttl: float = DEFAULT_TTL,
+          graph_stats: str = DEFAULT_GRAPH_STATS_FILE,
           query_key: str='query', endpoint_key: str='endpoint',
           outfile_ext: str=".tsv") -> None:
     """
@@ -90,19 +493,176 @@ def query(yaml: str, output_dir: str,
 
     :param yaml: A YAML file containing a SPARQL query (see queries/sparql/ for examples)
     :param output_dir: Directory to output results of query
+    :param page_size: Number of rows per page of a query with an ORDER BY (0 disables paging)
+    :param workers: Number of pages to fetch in parallel
+    :param retries: Number of retries per page on network/endpoint errors
+    :param compress: gzip the output file
+    :param no_cache: Don't use cached results
+    :param cache_dir: Directory for cached results
+    :param cache_ttl: Seconds before a cached result expires
+    :param graph_stats: Merged KG stats file used as the graph version stamp
     :param query_key: the key in the yaml file containing the query string
     :param endpoint_key: the key in the yaml file containing the sparql endpoint URL
     :param outfile_ext: file extension for output file [.tsv]
     :return: None.
     """
+    from kg_microbe.query import parse_query_yaml, cached_query_to_tsv
 
     query = parse_query_yaml(yaml)
-    result_dict = run_query(query=query[query_key], endpoint=query[endpoint_key])
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     outfile = os.path.join(output_dir, os.path.splitext(os.path.basename(yaml))[0] +
                            outfile_ext)
-    result_dict_to_tsv(result_dict, outfile)
+    if compress:
+        outfile += ".gz"
+    cache = None if no_cache else QueryCache(cache_dir=cache_dir, ttl=cache_ttl)
+    cached_query_to_tsv(query=query[query_key], endpoint=query[endpoint_key],
+                        outfile=outfile, cache=cache, version=graph_version(graph_stats),
+                        page_size=page_size, workers=workers, retries=retries,
+                        compress=compress)
+
+
+@cli.command(name="query-batch")
+@click.option("yaml_dir", "-d", required=True, type=click.Path(exists=True, file_okay=False),
+              help='directory of query YAML files')
+@click.option("output_dir", "-o", default="data/queries/")
+@click.option("workers", "--workers", default=4, type=int,
+              help='number of queries to run at once [4]')
+@click.option("max_per_endpoint", "--max-per-endpoint", default=2, type=int,
+              help='number of requests to send at once to one endpoint [2]')
+@click.option("page_size", "--page-size", default=DEFAULT_PAGE_SIZE, type=int,
+              help='rows per LIMIT/OFFSET page of queries with an ORDER BY (others are '
+                   'fetched at once), 0 to fetch everything at once [%d]' % DEFAULT_PAGE_SIZE)
+@click.option("page_workers", "--page-workers", default=1, type=int,
+              help='number of pages of each query to fetch in parallel [1]')
+@click.option("retries", "--retries", default=3, type=int,
+              help='number of retries per page on network/endpoint errors [3]')
+@click.option("compress", "--gzip", is_flag=True, default=False,
+              help='gzip the output files [false]')
+@click.option("no_cache", "--no-cache", is_flag=True, default=False,
+              help='always query the endpoints, bypassing the result cache [false]')
+@click.option("cache_dir", "--cache-dir", default=DEFAULT_CACHE_DIR,
+              help='directory for cached results [%s]' % DEFAULT_CACHE_DIR)
+@click.option("cache_ttl", "--cache-ttl", default=DEFAULT_TTL, type=float,
+              help='seconds before a cached result expires [%d]' % DEFAULT_TTL)
+@click.option("graph_stats", "--graph-stats", default=DEFAULT_GRAPH_STATS_FILE,
+              help='merged KG stats file used to version cached results '
+                   '[%s]' % DEFAULT_GRAPH_STATS_FILE)
+
+def query_batch(yaml_dir: str, output_dir: str, workers: int, max_per_endpoint: int,
+                page_size: int, page_workers: int, retries: int, compress: bool,
+                no_cache: bool, cache_dir: str, cache_ttl: float, graph_stats: str) -> None:
+    """
+    Run every query YAML in a directory concurrently, in a single process.
+
+    Writes one result TSV per YAML to the output directory, along with
+    query_summary.tsv listing each query's status, row count and latency.
+
+    :param yaml_dir: Directory of YAML files, each containing a SPARQL query
+    :param output_dir: Directory to output results of queries
+    :param workers: Number of queries to run at once
+    :param max_per_endpoint: Number of requests to send at once to one endpoint
+    :param page_size: Number of rows per page of a query with an ORDER BY (0 disables paging)
+    :param page_workers: Number of pages of each query to fetch in parallel
+    :param retries: Number of retries per page on network/endpoint errors
+    :param compress: gzip the output files
+    :param no_cache: Don't use cached results
+    :param cache_dir: Directory for cached results
+    :param cache_ttl: Seconds before a cached result expires
+    :param graph_stats: Merged KG stats file used as the graph version stamp
+    :return: None.
+    """
+    from kg_microbe.query import run_query_batch, SUMMARY_HEADER
+
+    cache = None if no_cache else QueryCache(cache_dir=cache_dir, ttl=cache_ttl)
+    summaries = run_query_batch(yaml_dir=yaml_dir, output_dir=output_dir, workers=workers,
+                                max_per_endpoint=max_per_endpoint, cache=cache,
+                                version=graph_version(graph_stats), page_size=page_size,
+                                page_workers=page_workers, retries=retries,
+                                compress=compress)
+    click.echo("\t".join(SUMMARY_HEADER))
+    for summary in summaries:
+        click.echo("\t".join(str(summary[k]) for k in SUMMARY_HEADER))
+    failed = [s for s in summaries if s['status'] == 'failed']
+    if failed:
+        raise click.ClickException("%d of %d queries failed" % (len(failed), len(summaries)))
+
+
+@cli.command()
+@click.option("edges", "-e", help="edges KGX TSV file with trait edges",
+              default="data/transformed/condensed_traits_NCBI/edges.tsv",
+              type=click.Path(exists=True))
+@click.option("taxdump", "-t", help="NCBI taxdump, as nodes.dmp or taxdump.tar.gz",
+              default="data/raw/taxdump.tar.gz", type=click.Path(exists=True))
+@click.option("rank", "-r", default="genus",
+              help="NCBI rank to roll traits up to, e.g. genus, family or phylum [genus]")
+@click.option("output_dir", "-o", help="output directory",
+              default="data/transformed/traits_rollup", type=click.Path())
+def rollup(edges: str, taxdump: str, rank: str, output_dir: str) -> None:
+    """
+    Roll trait edges up to a taxonomic rank, with counts.
+
+    Each trait (capable_of, has_phenotype, interacts_with, location_of) of a taxon
+    becomes a trait of its ancestor at the rank, with has_count, the number of
+    taxa at or below the ancestor with the trait, and has_total, the number with any
+    trait. The output is a KGX source for merge (see merge.yaml).
+
+    :param edges: trait edges [data/transformed/condensed_traits_NCBI/edges.tsv]
+    :param taxdump: NCBI taxdump [data/raw/taxdump.tar.gz]
+    :param rank: rank to roll up to [genus]
+    :param output_dir: directory for nodes.tsv and edges.tsv [data/transformed/traits_rollup]
+    :return: None.
+    """
+    from kg_microbe.utils.rollup_utils import rollup_traits
+    from kg_microbe.utils.taxonomy_utils import TaxonomyIndex
+
+    rollup_traits(edges, TaxonomyIndex.from_taxdump(taxdump), rank, output_dir)
+
+
+@cli.command()
+@click.option("edges", "-e", default="data/merged/merged-kg_edges.tsv",
+              type=click.Path(exists=True),
+              help="KGX edges TSV to walk [data/merged/merged-kg_edges.tsv]")
+@click.option("output", "-o", default="data/walks/walks.txt", type=click.Path(),
+              help="walks: a .npy int32 array (node CURIEs in <name>_ids.txt), or else a "
+                   "text corpus, optionally .gz/.zst [data/walks/walks.txt]")
+@click.option("walk_length", "-l", "--length", default=80, type=int,
+              help="nodes per walk [80]")
+@click.option("walks_per_node", "-r", "--walks", default=10, type=int,
+              help="walks from each node [10]")
+@click.option("p", "--p", default=1.0, type=float, help="node2vec return parameter [1]")
+@click.option("q", "--q", default=1.0, type=float, help="node2vec in-out parameter [1]")
+@click.option("seed", "--seed", default=0, type=int, help="random seed [0]")
+@click.option("directed", "--directed", is_flag=True, default=False,
+              help="walk edges from subject to object only [false]")
+@click.option("processes", "-p", default=None, type=int,
+              help="processes to walk with [number of CPUs]")
+def walks(edges: str, output: str, walk_length: int, walks_per_node: int, p: float, q: float,
+          seed: int, directed: bool, processes: int) -> None:
+    """
+    Generate random walks over the graph of a KGX edges TSV, uniform or node2vec-biased,
+    as a corpus to train node embeddings on.
+    \f
+
+    :param edges: KGX edges TSV [data/merged/merged-kg_edges.tsv]
+    :param output: .npy or text file for the walks [data/walks/walks.txt]
+    :param walk_length: nodes per walk [80]
+    :param walks_per_node: walks from each node [10]
+    :param p: node2vec return parameter [1]
+    :param q: node2vec in-out parameter [1]
+    :param seed: random seed [0]
+    :param directed: walk edges one way only [False]
+    :param processes: processes to use [number of CPUs]
+    :return: None.
+    """
+    from kg_microbe.utils.walk_utils import WalkGraph, write_walks
+
+    graph = WalkGraph.from_tsv(edges, directed=directed)
+    summary = write_walks(graph, output, walk_length=walk_length,
+                          walks_per_node=walks_per_node, p=p, q=q, seed=seed,
+                          processes=processes)
+    click.echo("%d walks (%d steps) over %d nodes written to %s" % (
+        summary['walks'], summary['steps'], summary['nodes'], output))
 
 
 @cli.command()
@@ -40,6 +40,9 @@ test_deps = [
 
 extras = {
     'test': test_deps,
+    # optional output formats
+    'parquet': ['pyarrow', 'duckdb'],
+    'zstd': ['zstandard'],
 }
 
 setup(
@@ -82,6 +85,8 @@ setup(
         'validate_version_code',
         'pandas',
         'networkx',
+        'SPARQLWrapper',
+        'ijson',
         # Extra packages added
         'six', # needed by rdflib
         'ordered-set', #needed by kgx
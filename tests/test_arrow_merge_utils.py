@@ -0,0 +1,145 @@
+import os
+import tarfile
+import tempfile
+from unittest import TestCase, mock
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import yaml
+from parameterized import parameterized
+
+from kg_microbe.merge_utils.merge_kg import load_and_merge, merge_engine
+from kg_microbe.utils.arrow_merge_utils import arrow_merge_problems, concat_tables, \
+    kgx_columns, merge_kgx_tables
+from kg_microbe.utils.parquet_utils import tsv_to_parquet
+from kg_microbe.utils.transform_utils import TransformError
+
+
+def table(rows, names):
+    return pa.table(list(zip(*rows)), names=names)
+
+
+class TestArrowMergeUtils(TestCase):
+    """Tests merging KGX sources with Arrow."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tempdir, 'merged')
+
+    def write(self, name, header, lines):
+        filename = os.path.join(self.tempdir, name)
+        with open(filename, 'w') as f:
+            f.write('\n'.join([header] + lines) + '\n')
+        return filename
+
+    def config(self, sources, compression=None):
+        destination = {'format': 'tsv', 'filename': ['merged-kg']}
+        if compression:
+            destination['compression'] = compression
+        config = {'configuration': {'output_directory': self.output_dir},
+                  'merged_graph': {
+                      'name': 'test',
+                      'source': {name: {'input': {'name': name, 'format': fmt,
+                                                  'filename': files}}
+                                 for name, (fmt, files) in sources.items()},
+                      'destination': {'merged-kg-tsv': destination}}}
+        filename = os.path.join(self.tempdir, 'merge.yaml')
+        with open(filename, 'w') as f:
+            yaml.dump(config, f, sort_keys=False)
+        return filename, config
+
+    def read(self, name):
+        with open(os.path.join(self.output_dir, name)) as f:
+            return [line.rstrip('\n').split('\t') for line in f]
+
+    def test_merge_nodes(self):
+        merged = merge_kgx_tables([
+            table([['A:1', 'a', 'biolink:NamedThing', 'x'], ['A:2', '', 'biolink:Gene', '']],
+                  ['id', 'name', 'category', 'provided_by']),
+            table([['A:2', 'two', 'biolink:Gene|biolink:Protein', 'y'], ['B:1', 'b', '', 'y']],
+                  ['id', 'name', 'category', 'provided_by']),
+            table([['A:1', 'one', 'z']], ['id', 'name', 'description'])], 'nodes')
+        self.assertEqual([
+            {'id': 'A:1', 'name': 'a', 'category': 'biolink:NamedThing', 'provided_by': 'x',
+             'description': 'z'},
+            {'id': 'A:2', 'name': 'two', 'category': 'biolink:Gene|biolink:Protein',
+             'provided_by': 'y', 'description': ''},
+            {'id': 'B:1', 'name': 'b', 'category': '', 'provided_by': 'y', 'description': ''}],
+            merged.to_pylist())
+
+    def test_merge_edges(self):
+        names = ['subject', 'predicate', 'object', 'provided_by']
+        merged = merge_kgx_tables([
+            table([['A:1', 'p', 'A:2', 'x'], ['A:2', 'p', 'A:1', 'x']], names),
+            table([['A:1', 'p', 'A:2', 'y'], ['A:1', 'q', 'A:2', 'y'], ['A:1', 'p', 'A:2', 'x']],
+                  names)], 'edges')
+        self.assertEqual([['A:1', 'p', 'A:2', 'x|y'], ['A:2', 'p', 'A:1', 'x'],
+                          ['A:1', 'q', 'A:2', 'y']],
+                         [list(r.values()) for r in merged.to_pylist()])
+
+    @parameterized.expand([['15.0.0'], ['12.0.1']])
+    def test_concat_tables(self, version):
+        tables = [table([['A:1', 'a']], ['id', 'name']), table([['A:2', 'x']], ['id', 'xref'])]
+        concat = pa.concat_tables
+        with mock.patch.object(pa, '__version__', version), \
+                mock.patch.object(pa, 'concat_tables', wraps=concat) as concat_tables_mock:
+            merged = concat_tables(tables)
+        self.assertEqual({'promote_options': 'default'} if version == '15.0.0'
+                         else {'promote': True}, concat_tables_mock.call_args[1])
+        self.assertEqual([{'id': 'A:1', 'name': 'a', 'xref': None},
+                          {'id': 'A:2', 'name': None, 'xref': 'x'}], merged.to_pylist())
+
+    def test_columns(self):
+        self.assertEqual(['id', 'category', 'name', 'iri', 'z', '_x'],
+                         kgx_columns(['z', '_x', 'iri', 'name', 'category', 'id'], 'nodes'))
+
+    def test_problems(self):
+        _, config = self.config({'a': ('tsv', []), 'b': ('obojson', [])}, compression='gz')
+        config['merged_graph']['source']['a']['input']['node_filters'] = {'category': ['x']}
+        self.assertEqual(3, len(arrow_merge_problems(config)))
+        with self.assertRaises(TransformError):
+            merge_engine(config, 'arrow')
+        self.assertEqual('kgx', merge_engine(config))
+
+    @parameterized.expand([[None], ['tar.gz']])
+    def test_load_and_merge(self, compression):
+        nodes = self.write('traits_nodes.tsv', 'id\tname\tcategory\tprovided_by', [
+            'NCBITaxon:%d\ttaxon %d\tbiolink:OrganismTaxon\ttraits' % (i, i)
+            for i in range(1, 100)] + ['CHEBI:1\tglucose\tbiolink:ChemicalSubstance\ttraits'])
+        edges = self.write('traits_edges.tsv', 'subject\tpredicate\tobject\tprovided_by', [
+            'NCBITaxon:%d\tbiolink:consumes\tCHEBI:1\ttraits' % i for i in range(1, 100)])
+        tsv_to_parquet(nodes)
+        tsv_to_parquet(edges)
+        ontology_nodes = self.write('ncbitaxon_nodes.tsv', 'id\tname\tcategory\tprovided_by', [
+            'NCBITaxon:%d\t%d\tbiolink:OrganismTaxon\tncbitaxon' % (i, i) for i in range(1, 201)])
+        ontology_edges = os.path.join(self.tempdir, 'ncbitaxon_edges.arrow')
+        feather.write_feather(pa.table({
+            'subject': ['NCBITaxon:%d' % i for i in range(2, 201)],
+            'predicate': ['biolink:subclass_of'] * 199,
+            'object': ['NCBITaxon:%d' % (i // 2) for i in range(2, 201)],
+            'provided_by': ['ncbitaxon'] * 199}), ontology_edges)
+        yaml_file, _ = self.config({
+            'traits': ('parquet', [os.path.join(self.tempdir, 'traits_nodes.parquet'),
+                                   os.path.join(self.tempdir, 'traits_edges.parquet')]),
+            'ncbitaxon': ('tsv', [ontology_nodes]),
+            'ncbitaxon-edges': ('arrow', [ontology_edges])}, compression)
+        closure_index = os.path.join(self.tempdir, 'closure.npz')
+
+        self.assertIsNone(load_and_merge(yaml_file, processes=2, package=None,
+                                         closure_index=None if compression else closure_index))
+        if compression:
+            with tarfile.open(os.path.join(self.output_dir, 'merged-kg.tar.gz')) as tar:
+                self.assertEqual(['merged-kg_nodes.tsv', 'merged-kg_edges.tsv'],
+                                 tar.getnames())
+                tar.extractall(self.output_dir)
+        else:
+            self.assertTrue(os.path.isfile(closure_index))
+        nodes = self.read('merged-kg_nodes.tsv')
+        self.assertEqual(['id', 'category', 'name', 'provided_by'], nodes[0])
+        self.assertEqual(201, len(nodes) - 1)
+        self.assertIn(['NCBITaxon:5', 'biolink:OrganismTaxon', 'taxon 5', 'traits|ncbitaxon'],
+                      nodes)
+        self.assertIn(['NCBITaxon:150', 'biolink:OrganismTaxon', '150', 'ncbitaxon'], nodes)
+        edges = self.read('merged-kg_edges.tsv')
+        self.assertEqual(['subject', 'predicate', 'object', 'provided_by'], edges[0])
+        self.assertEqual(99 + 199, len(edges) - 1)
@@ -0,0 +1,92 @@
+import csv
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from benchmarks import generate
+from benchmarks.run_benchmarks import compare, wait_for_result
+
+
+class TestGenerate(TestCase):
+    """Tests the synthetic benchmark inputs."""
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.mkdtemp()
+        self.vocab = generate.vocabulary(n_substrates=10, n_pathways=10, n_environments=5)
+
+    def test_traits_csv_shape(self):
+        traits_file = os.path.join(self.tmpdir, 'traits.csv')
+        annotations = generate.generate_traits_csv(traits_file, 50, self.vocab,
+                                                   quote_fraction=0.5)
+        with open(traits_file) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(50, len(rows))
+        self.assertEqual(generate.traits_columns(), list(rows[0].keys()))
+        substrates = {(int(r['tax_id']), 'carbon_substrates', s) for r in rows
+                      for s in r['carbon_substrates'].split(', ') if s != 'NA'}
+        self.assertEqual(substrates, {a for a in annotations if a[1] == 'carbon_substrates'})
+
+    def test_oger_output_matches_sssom(self):
+        annotations = generate.generate_traits_csv(os.path.join(self.tmpdir, 'traits.csv'),
+                                                   50, self.vocab)
+        oger_file = os.path.join(self.tmpdir, 'nlpGO.tsv')
+        sssom_file = os.path.join(self.tmpdir, 'pathways.sssom.tsv')
+        generate.generate_oger_output(oger_file, annotations, 'pathways', 'GO',
+                                      'biolink:BiologicalProcess')
+        generate.generate_sssom(sssom_file, self.vocab['pathways'], 'GO')
+        with open(oger_file) as f:
+            oger = [line.rstrip('\n').split('\t') for line in f]
+        with open(sssom_file) as f:
+            sssom = list(csv.DictReader((line for line in f if not line.startswith('#')),
+                                        delimiter='\t'))
+        mapped = {(r['subject_label'].replace('_', ' '), r['object_id']) for r in sssom}
+        self.assertEqual(len(generate.OGER_COLUMNS), len(oger[0]))
+        for row in oger:
+            self.assertIn((row[4], row[6]), mapped)
+
+    def test_obograph_json(self):
+        json_file = os.path.join(self.tmpdir, 'go.json')
+        generate.generate_obograph_json(json_file, 'GO', 20)
+        with open(json_file) as f:
+            graph = json.load(f)['graphs'][0]
+        self.assertEqual(20, len(graph['nodes']))
+        self.assertGreaterEqual(len(graph['edges']), 19)
+
+
+class TestCompare(TestCase):
+    """Tests finding regressions against a baseline run."""
+
+    def test_compare(self):
+        baseline = [{'benchmark': 'merge', 'input_rows': 10, 'status': 'ok', 'wall_seconds': 1.0},
+                    {'benchmark': 'stats', 'input_rows': 10, 'status': 'ok', 'wall_seconds': 1.0}]
+        results = [{'benchmark': 'merge', 'input_rows': 10, 'status': 'ok', 'wall_seconds': 1.5},
+                   {'benchmark': 'stats', 'input_rows': 10, 'status': 'ok', 'wall_seconds': 1.1},
+                   {'benchmark': 'holdouts', 'input_rows': 10, 'status': 'skipped'}]
+        regressions = compare(results, baseline, threshold=0.2)
+        self.assertEqual(1, len(regressions))
+        self.assertTrue(regressions[0].startswith('merge'))
+
+
+class TestWaitForResult(TestCase):
+    """Tests waiting for a benchmark process that dies or hangs."""
+
+    def test_dead_process(self):
+        ctx = multiprocessing.get_context('spawn')
+        process = ctx.Process(target=os._exit, args=(3,))
+        process.start()
+        result = wait_for_result(process, ctx.Queue())
+        process.join()
+        self.assertEqual({'status': 'failed', 'reason': 'benchmark process exited with code 3'},
+                         result)
+
+    def test_timeout(self):
+        ctx = multiprocessing.get_context('spawn')
+        process = ctx.Process(target=time.sleep, args=(60,))
+        process.start()
+        result = wait_for_result(process, ctx.Queue(), timeout=1)
+        process.join()
+        self.assertEqual('failed', result['status'])
+        self.assertFalse(process.is_alive())
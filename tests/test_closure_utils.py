@@ -0,0 +1,71 @@
+import os
+import tempfile
+from itertools import product
+from unittest import TestCase
+
+import networkx as nx
+from parameterized import parameterized
+
+from kg_microbe.utils.closure_utils import ClosureIndex
+
+# a tree (NCBITaxon-like) and a DAG with several parents per class (CHEBI-like)
+TREE = [('B', 'A'), ('C', 'A'), ('D', 'B'), ('E', 'B'), ('F', 'C')]
+DAG = [('b', 'a'), ('c', 'a'), ('d', 'b'), ('d', 'c'), ('e', 'c'), ('f', 'd'), ('g', 'e'),
+       ('g', 'b'), ('h', 'x'), ('f', 'x')]
+
+
+class TestClosureIndex(TestCase):
+    """Tests the subclass_of closure index against networkx's reachability."""
+
+    def check(self, pairs):
+        index = ClosureIndex.from_pairs(pairs)
+        graph = nx.DiGraph(pairs)  # child -> parent
+        for child, parent in product(graph.nodes, repeat=2):
+            expected = child == parent or parent in nx.descendants(graph, child)
+            self.assertEqual(expected, index.is_a(child, parent), (child, parent))
+        for curie in graph.nodes:
+            self.assertEqual(sorted(nx.ancestors(graph, curie)),
+                             sorted(index.descendants(curie)))
+            self.assertEqual(sorted(nx.descendants(graph, curie)), index.ancestors(curie))
+        return index
+
+    @parameterized.expand([['tree', TREE], ['dag', DAG]])
+    def test_closure(self, name, pairs):
+        self.check(pairs)
+
+    def test_tree_has_no_extra_intervals(self):
+        self.assertEqual(0, len(self.check(TREE).intervals))
+
+    def test_cycle(self):
+        with self.assertLogs(level='WARNING'):
+            index = ClosureIndex.from_pairs([('a', 'b'), ('b', 'a'), ('c', 'a')])
+        self.assertTrue(index.is_a('c', 'a'))
+        self.assertEqual(['a', 'b', 'c'], sorted(index.descendants('a', include_self=True)))
+
+    def test_unknown_class(self):
+        index = ClosureIndex.from_pairs(TREE)
+        self.assertNotIn('Z', index)
+        self.assertFalse(index.is_a('Z', 'A'))
+        with self.assertRaises(KeyError):
+            index.descendants('Z')
+
+    def test_save_load_and_sources(self):
+        tempdir = tempfile.mkdtemp()
+        edges_file = os.path.join(tempdir, 'edges.tsv')
+        with open(edges_file, 'w') as f:
+            f.write('subject\tpredicate\tobject\n')
+            for child, parent in DAG:
+                f.write('%s\tbiolink:subclass_of\t%s\n' % (child, parent))
+            f.write('a\tbiolink:has_part\tz\n')
+        index = ClosureIndex.from_tsv(edges_file)
+        self.assertNotIn('z', index)
+
+        graph = nx.MultiDiGraph()
+        graph.add_edges_from((c, p, {'predicate': 'biolink:subclass_of'}) for c, p in DAG)
+        self.assertEqual(index.descendants('a'), ClosureIndex.from_graph(graph).descendants('a'))
+
+        index.save(os.path.join(tempdir, 'closure.npz'))
+        loaded = ClosureIndex.load(os.path.join(tempdir, 'closure.npz'))
+        self.assertEqual(index.descendants('a', include_self=True),
+                         loaded.descendants('a', include_self=True))
+        self.assertEqual(['a', 'b', 'c', 'd', 'x'], loaded.ancestors('f'))
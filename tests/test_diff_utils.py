@@ -0,0 +1,84 @@
+import json
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from kg_microbe.utils.diff_utils import apply_kgx_delta, diff_kgx
+from kg_microbe.utils.sort_utils import sort_kgx_tsv
+
+
+class TestDiffUtils(TestCase):
+    """Tests the release-to-release diff of KGX TSVs and applying its delta."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tempdir, 'diff')
+        rng = random.Random(0)
+        old_edges = ['NCBITaxon:%d\tbiolink:%s\tCHEBI:%d\tRO:1\t%s' % (
+            i, rng.choice(['capable_of', 'has_phenotype']), i % 7,
+            rng.choice(['traits', 'chebi'])) for i in range(1000)]
+        new_edges = old_edges[5:] + [
+            'NCBITaxon:2000\tbiolink:capable_of\tCHEBI:1\tRO:1\ttraits',
+            'NCBITaxon:2001\tbiolink:capable_of\tCHEBI:1\tRO:1\ttraits']
+        new_edges[0] = new_edges[0].replace('RO:1', 'RO:2')
+        rng.shuffle(new_edges)
+        header = 'subject\tpredicate\tobject\trelation\tprovided_by'
+        self.old_edges = self.write('old_edges.tsv', header, old_edges)
+        self.new_edges = self.write('new_edges.tsv', header, new_edges)
+        # new columns, in another order, don't change the nodes that kept their values
+        self.old_nodes = self.write('old_nodes.tsv', 'id\tname\tcategory', [
+            'CHEBI:1\tone\tbiolink:ChemicalSubstance', 'CHEBI:2\ttwo\tbiolink:ChemicalSubstance',
+            'CHEBI:3\tthree\tbiolink:ChemicalSubstance'])
+        self.new_nodes = self.write('new_nodes.tsv', 'id\tcategory\tname\tprovided_by', [
+            'CHEBI:4\tbiolink:ChemicalSubstance\tfour\tchebi',
+            'CHEBI:2\tbiolink:ChemicalSubstance\tTWO\tchebi',
+            'CHEBI:1\tbiolink:ChemicalSubstance\tone\t'])
+
+    def write(self, name, header, lines):
+        filename = os.path.join(self.tempdir, name)
+        with open(filename, 'w') as f:
+            f.write('\n'.join([header] + lines) + '\n')
+        return filename
+
+    def read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def test_diff_and_apply(self):
+        report = diff_kgx(self.old_nodes, self.new_nodes, self.old_edges, self.new_edges,
+                          self.output_dir)
+        self.assertEqual({'added': 2, 'removed': 5, 'changed': 1, 'unchanged': 994},
+                         report['edges']['total'])
+        self.assertEqual({'added': 1, 'removed': 1, 'changed': 1, 'unchanged': 1},
+                         report['nodes']['total'])
+        self.assertEqual({'added': 1, 'changed': 1}, report['nodes']['by_source']['chebi'])
+        self.assertEqual(2, sum(c.get('added', 0)
+                                for c in report['edges']['by_predicate'].values()))
+        self.assertEqual(2, report['edges']['by_source']['traits']['added'])
+        with open(os.path.join(self.output_dir, 'diff.json')) as f:
+            self.assertEqual(report, json.load(f))
+        self.assertEqual('subject\tpredicate\tobject\trelation\tprovided_by\n'
+                         'NCBITaxon:2000\tbiolink:capable_of\tCHEBI:1\tRO:1\ttraits\n'
+                         'NCBITaxon:2001\tbiolink:capable_of\tCHEBI:1\tRO:1\ttraits\n',
+                         self.read(os.path.join(self.output_dir, 'edges_added.tsv')))
+        self.assertEqual('id\tname\tcategory\nCHEBI:3\tthree\tbiolink:ChemicalSubstance\n',
+                         self.read(os.path.join(self.output_dir, 'nodes_removed.tsv')))
+
+        # the old build and the delta give the new build, sorted
+        for kind, old, new in [('nodes', self.old_nodes, self.new_nodes),
+                               ('edges', self.old_edges, self.new_edges)]:
+            applied = os.path.join(self.tempdir, 'applied_%s.tsv' % kind)
+            apply_kgx_delta(old, self.output_dir, applied)
+            sort_kgx_tsv(new, processes=1)
+            self.assertEqual(self.read(new), self.read(applied))
+
+    def test_presorted_and_identical(self):
+        sort_kgx_tsv(self.old_edges, processes=1)
+        report = diff_kgx(None, None, self.old_edges, self.old_edges, self.output_dir,
+                          presorted=True)
+        self.assertEqual({'added': 0, 'removed': 0, 'changed': 0, 'unchanged': 1000},
+                         report['edges']['total'])
+        self.assertNotIn('nodes', report)
+        self.assertEqual(['diff.json', 'edges_added.tsv', 'edges_changed.tsv',
+                          'edges_removed.tsv'], sorted(os.listdir(self.output_dir)))
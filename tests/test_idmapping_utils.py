@@ -0,0 +1,89 @@
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from kg_microbe.utils.idmapping_utils import IdMappingIndex
+from kg_microbe.utils.transform_utils import TransformError, \
+    uniprot_make_name_to_id_mapping, uniprot_name_to_id
+
+IDMAPPING = [('P0A7V0', 'UniProtKB-ID', 'RS2_ECOLI'),
+             ('P0A7V0', 'Gene_Name', 'rpsB'),
+             ('P0A7V0', 'GeneID', '949098'),
+             ('P0A6F5', 'UniProtKB-ID', 'CH60_ECOLI'),
+             ('P0A6F5', 'Gene_Name', 'groL'),
+             ('P0A6F5', 'Gene_Synonym', 'mopA'),
+             ('Q47710', 'Gene_Name', 'mopA'),
+             ('Q47710', 'Gene_Synonym', 'groL'),
+             ('P0A6Y8', 'Gene_Name', 'dnaKé')]
+
+
+class TestIdMappingIndex(TestCase):
+    """Tests the memory-mapped UniProt ID mapping index."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.dat_file = os.path.join(self.tempdir, 'ECOLI_83333_idmapping.dat.gz')
+        with gzip.open(self.dat_file, 'wt') as f:
+            for row in IDMAPPING:
+                f.write('\t'.join(row) + '\n')
+        self.index = IdMappingIndex.load(self.dat_file)
+
+    @parameterized.expand([
+        ['RS2_ECOLI', None, 'P0A7V0'],
+        ['949098', None, 'P0A7V0'],
+        ['groL', None, 'Q47710'],
+        ['groL', 'Gene_Name', 'P0A6F5'],
+        ['mopA', None, 'Q47710'],
+        ['mopA', 'Gene_Synonym', 'P0A6F5'],
+        ['groL', 'Gene_Synonym', 'Q47710'],
+        ['mopA', 'Gene_Name', 'Q47710'],
+        ['rpsB', 'UniProtKB-ID', None],
+        ['dnaKé', None, 'P0A6Y8'],
+        ['rpsBB', None, None],
+        ['rps', None, None],
+    ])
+    def test_get(self, name, id_type, accession):
+        self.assertEqual(accession, self.index.get(name, id_type))
+
+    def test_lookup(self):
+        self.assertEqual(['P0A6F5', None, 'P0A7V0', 'Q47710'],
+                         self.index.lookup(['groL', 'nope', 'rpsB', 'mopA'], 'Gene_Name'))
+        self.assertEqual([], self.index.lookup([]))
+        self.assertEqual(['P0A6F5', 'Q47710'], self.index.get_all('groL'))
+        with self.assertRaises(TransformError):
+            self.index.lookup(['groL'], 'EMBL')
+
+    def test_name_to_id_map(self):
+        self.assertEqual('P0A6F5', uniprot_name_to_id(self.index, 'CH60_ECOLI'))
+        self.assertIsNone(uniprot_name_to_id(self.index, 'CH61_ECOLI'))
+        # the same accessions as the dict, for IDs with several too
+        name_to_id_map = uniprot_make_name_to_id_mapping(self.dat_file)
+        names = sorted(name_to_id_map)
+        self.assertEqual([name_to_id_map[n] for n in names], self.index.lookup(names))
+
+    def test_load_memory_maps_and_rebuilds(self):
+        index_dir = self.dat_file + '.index'
+        self.assertTrue(os.path.isfile(os.path.join(index_dir, 'ids.npy')))
+        reloaded = IdMappingIndex.load(self.dat_file)
+        self.assertEqual(len(IDMAPPING), len(reloaded))
+        self.assertIsNotNone(getattr(reloaded.ids, 'filename', None))  # a memmap
+        filtered = IdMappingIndex.build(self.dat_file, os.path.join(self.tempdir, 'genes'),
+                                        id_types=['Gene_Name'])
+        self.assertEqual(['Gene_Name'], filtered.type_names)
+        self.assertIsNone(filtered.get('RS2_ECOLI'))
+
+    def test_load_rebuilds_for_other_types(self):
+        index_dir = os.path.join(self.tempdir, 'types')
+        genes = IdMappingIndex.load(self.dat_file, index_dir, id_types=['Gene_Name'])
+        self.assertEqual(['Gene_Name'], genes.id_types)
+        self.assertIsNone(genes.get('RS2_ECOLI'))
+        all_types = IdMappingIndex.load(self.dat_file, index_dir)
+        self.assertIsNone(all_types.id_types)
+        self.assertEqual('P0A7V0', all_types.get('RS2_ECOLI'))
+        # built for the same types, it is only opened
+        stamp = os.path.getmtime(os.path.join(index_dir, 'types.json'))
+        self.assertEqual(len(IDMAPPING), len(IdMappingIndex.load(self.dat_file, index_dir)))
+        self.assertEqual(stamp, os.path.getmtime(os.path.join(index_dir, 'types.json')))
@@ -0,0 +1,94 @@
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from kg_microbe.utils.io_utils import find_input, input_compression, open_input, \
+    strip_compression_suffix
+from kg_microbe.utils.transform_utils import ungzip_to_tempdir
+
+LINES = ['id\tname\n'] + ['CHEBI:%d\tchemical %d é\n' % (i, i) for i in range(50000)]
+
+
+def write_zst(filename: str, data: bytes) -> None:
+    import zstandard
+    with open(filename, 'wb') as f:
+        f.write(zstandard.ZstdCompressor().compress(data))
+
+
+def write_zip(filename: str, data: bytes) -> None:
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('terms.tsv', data)
+
+
+WRITERS = {
+    None: lambda f, data: open(f, 'wb').write(data),
+    'gz': lambda f, data: open(f, 'wb').write(gzip.compress(data)),
+    'bz2': lambda f, data: open(f, 'wb').write(bz2.compress(data)),
+    'xz': lambda f, data: open(f, 'wb').write(lzma.compress(data)),
+    'zst': write_zst,
+    'zip': write_zip,
+}
+
+
+class TestOpenInput(TestCase):
+    """Tests reading compressed inputs without decompressing them to disk first."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.data = ''.join(LINES).encode('utf-8')
+
+    def write(self, compression, suffix=None):
+        filename = os.path.join(self.tempdir, 'terms.tsv' + (suffix or ''))
+        WRITERS[compression](filename, self.data)
+        return filename
+
+    @parameterized.expand([(c, p) for c in WRITERS for p in (True, False)])
+    def test_open_input(self, compression, parallel):
+        filename = self.write(compression, '.' + compression if compression else '')
+        self.assertEqual(compression, input_compression(filename))
+        with open_input(filename, parallel=parallel) as f:
+            self.assertEqual(LINES, list(f))
+        with open_input(filename, 'rb', parallel=parallel) as f:
+            self.assertEqual(self.data, f.read())
+
+    def test_close_before_end(self):
+        with open_input(self.write('xz', '.xz')) as f:
+            self.assertEqual(LINES[0], f.readline())
+
+    def test_corrupt_input(self):
+        filename = os.path.join(self.tempdir, 'terms.tsv.gz')
+        with open(filename, 'wb') as f:
+            f.write(gzip.compress(self.data)[:1000])
+        with self.assertRaises((IOError, EOFError)):
+            with open_input(filename) as f:
+                f.read()
+
+    def test_multi_file_zip(self):
+        filename = os.path.join(self.tempdir, 'two.zip')
+        with zipfile.ZipFile(filename, 'w') as z:
+            z.writestr('a.tsv', 'a')
+            z.writestr('b.tsv', 'b')
+        with self.assertRaises(ValueError):
+            open_input(filename)
+
+    def test_find_input(self):
+        plain = os.path.join(self.tempdir, 'terms.tsv')
+        self.assertEqual(plain, find_input(plain))
+        compressed = self.write('bz2', '.bz2')
+        self.assertEqual(compressed, find_input(plain))
+        self.write(None)
+        self.assertEqual(plain, find_input(plain))
+        self.assertEqual(plain, strip_compression_suffix(compressed))
+
+    def test_ungzip_to_tempdir(self):
+        outdir = tempfile.mkdtemp()
+        decompressed = ungzip_to_tempdir(self.write('zst', '.zst'), outdir)
+        self.assertEqual(os.path.join(outdir, 'terms.tsv'), decompressed)
+        with open(decompressed, 'rb') as f:
+            self.assertEqual(self.data, f.read())
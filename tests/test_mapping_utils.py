@@ -0,0 +1,35 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from kg_microbe.utils.mapping_utils import TraitMapping, compile_table_map, load_trait_mappings
+
+
+class TestTraitMappings(TestCase):
+    """Tests compiling the trait mappings YAML and conversion tables."""
+
+    def setUp(self) -> None:
+        self.input_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.input_dir, 'environments.csv'), 'w') as f:
+            f.write('Type,Environment,ENVO_terms,ENVO_ids\n'
+                    'host_animal_fish,fish,"animal, fish","ENVO:01, ENVO:02"\n'
+                    'host_animal_fish,fish,"animal, fish","ENVO:01, ENVO:02"\n'
+                    'soil,soil,NA,NA\n'
+                    'water,water,water,ENVO:03\n'
+                    'water,water,sea water,ENVO:04\n')
+
+    def test_load_trait_mappings(self):
+        mappings = load_trait_mappings(os.path.join('schemas', 'trait_mappings.yaml'),
+                                       self.input_dir)
+        self.assertEqual(TraitMapping('ECOCORE:00000177', 'facultative anaerobe'),
+                         mappings['metabolism']['facultative'])
+        self.assertNotIn('NA', mappings['metabolism'])
+        self.assertEqual(['metabolism', 'environments'], list(mappings))
+        with self.assertRaises(TypeError):
+            mappings['metabolism']['aerobic'] = TraitMapping('X:1', 'x')
+
+    def test_compile_table_map(self):
+        environments = compile_table_map(os.path.join(self.input_dir, 'environments.csv'),
+                                         'Type', 'ENVO_ids', 'ENVO_terms')
+        self.assertEqual({'host_animal_fish': TraitMapping('ENVO:02', 'fish')},
+                         dict(environments))
@@ -0,0 +1,80 @@
+import csv
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from kg_microbe.utils.neo4j_utils import export_neo4j_csv, neo4j_header
+from kg_microbe.utils.transform_utils import TransformError
+
+
+class TestNeo4jUtils(TestCase):
+    """Tests exporting KGX TSVs for neo4j-admin import."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tempdir, 'neo4j')
+        self.nodes = self.write('nodes.tsv', 'id\tname\tcategory\tprovided_by', [
+            'NCBITaxon:%d\ttaxon, "%d"\tbiolink:OrganismTaxon\ttraits|ncbitaxon' % (i, i)
+            for i in range(3000)] + ['CHEBI:1\tglucose\t\tchebi'])
+        self.edges = self.write('edges.tsv', 'subject\tpredicate\tobject\trelation\thas_count', [
+            'NCBITaxon:%d\tbiolink:subclass_of\tNCBITaxon:%d\trdfs:subClassOf\t' % (i, i // 2)
+            for i in range(1, 3000)] + ['NCBITaxon:1\t\tCHEBI:1\t\t3'])
+
+    def write(self, name, header, lines):
+        filename = os.path.join(self.tempdir, name)
+        with open(filename, 'w') as f:
+            f.write('\n'.join([header] + lines) + '\n')
+        return filename
+
+    def read(self, files):
+        # as neo4j-admin reads them: the header file, then the parts as one file
+        rows = []
+        for filename in files:
+            with open(filename, newline='') as f:
+                rows.extend(csv.reader(f))
+        return rows
+
+    def test_header(self):
+        self.assertEqual(['id:ID', 'name:string', 'category:string[]', ':LABEL'],
+                         neo4j_header(['id', 'name', 'category'], 'nodes'))
+        self.assertEqual([':START_ID', 'predicate:string', ':END_ID', 'has_count:long', ':TYPE'],
+                         neo4j_header(['subject', 'predicate', 'object', 'has_count'], 'edges'))
+        with self.assertRaises(TransformError):
+            neo4j_header(['subject', 'object'], 'edges')
+
+    @parameterized.expand([[1], [2]])
+    def test_export(self, processes):
+        summary = export_neo4j_csv([self.nodes], [self.edges], self.output_dir,
+                                   processes=processes, part_bytes=20000)
+        self.assertEqual(3001, summary['nodes'])
+        self.assertEqual(3000, summary['relationships'])
+        self.assertGreater(len(summary['files']['nodes']), 3)
+
+        nodes = self.read(summary['files']['nodes'])
+        self.assertEqual(['id:ID', 'name:string', 'category:string[]', 'provided_by:string[]',
+                          ':LABEL'], nodes[0])
+        self.assertEqual(['NCBITaxon:7', 'taxon, "7"', 'biolink:OrganismTaxon',
+                          'traits|ncbitaxon', 'biolink:OrganismTaxon'], nodes[8])
+        self.assertEqual(['CHEBI:1', 'glucose', '', 'chebi', 'biolink:NamedThing'], nodes[-1])
+        edges = self.read(summary['files']['edges'])
+        self.assertEqual(3001, len(edges))
+        self.assertEqual(['NCBITaxon:1', '', 'CHEBI:1', '', '3', 'biolink:related_to'], edges[-1])
+
+        with open(summary['script']) as f:
+            script = f.read()
+        self.assertIn("--nodes='nodes_header.csv,nodes_part[0-9]+\\.csv'", script)
+        self.assertIn("--relationships='edges_header.csv,edges_part[0-9]+\\.csv'", script)
+        self.assertIn("--array-delimiter='|'", script)
+
+    def test_compressed_and_several_files(self):
+        nodes_gz = self.nodes + '.gz'
+        with open(self.nodes, 'rb') as f, gzip.open(nodes_gz, 'wb') as out:
+            out.write(f.read())
+        summary = export_neo4j_csv([self.nodes, nodes_gz], [], self.output_dir, processes=2)
+        self.assertEqual(6002, summary['nodes'])
+        self.assertEqual(['nodes0', 'nodes1'], sorted(summary['files']))
+        self.assertEqual(self.read(summary['files']['nodes0']),
+                         self.read(summary['files']['nodes1']))
@@ -0,0 +1,45 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+
+from kg_microbe.utils.nlp_utils import prep_nlp_input
+
+
+class TestPrepNlpInput(TestCase):
+    """Tests preparing OGER's input from one or several traits files."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.raw_dir = os.path.join(self.tempdir, 'raw')
+        os.makedirs(self.raw_dir)
+        os.makedirs(os.path.join(self.tempdir, 'nlp', 'input'))
+
+    def write(self, name, text):
+        filename = os.path.join(self.raw_dir, name)
+        with open(filename, 'w') as f:
+            f.write(text)
+        return filename
+
+    def read(self, name):
+        return pd.read_csv(os.path.join(self.tempdir, 'nlp', 'input', name + '.tsv'), sep='\t')
+
+    def test_one_file(self):
+        traits = self.write('traits.csv', 'tax_id,org_name,pathways\n'
+                                          '1,a,methane_oxidation\n2,b,\n')
+        self.assertEqual('nlpGO', prep_nlp_input(traits, ['tax_id', 'pathways'], 'GO'))
+        self.assertEqual([[1, 'methane oxidation']], self.read('nlpGO').values.tolist())
+
+    def test_several_files(self):
+        traits = self.write('traits.csv', 'tax_id,org_name,carbon_substrates\n'
+                                          '1,a,glucose\n2,b,acetate\n')
+        species = self.write('species.csv', 'species_tax_id,species,carbon_substrates\n'
+                                            '2,b,acetate\n3,c,"glucose, sucrose"\n')
+        name = prep_nlp_input([traits, species], ['tax_id', 'carbon_substrates'], 'CHEBI',
+                              ['tax_id', 'species_tax_id'])
+        self.assertEqual('nlpCHEBI', name)
+        df = self.read(name)
+        self.assertEqual(['tax_id', 'carbon_substrates'], list(df.columns))
+        self.assertEqual([[1, 'glucose'], [2, 'acetate'], [3, 'glucose, sucrose']],
+                         df.values.tolist())
@@ -0,0 +1,63 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from kg_microbe.transform_utils.ontology.ontology_transform import OntologyTransform, \
+    remove_subset_marker, subset_marker, write_subset_marker
+
+
+class TestOntologyTransform(TestCase):
+    """Tests which ontology outputs OntologyTransform converts and which it keeps."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.transform = OntologyTransform(os.path.join(self.tempdir, 'raw'),
+                                           os.path.join(self.tempdir, 'transformed'))
+        os.makedirs(self.transform.input_base_dir)
+        self.json_file = os.path.join(self.transform.input_base_dir, 'ncbitaxon.json')
+        self.output = os.path.join(self.transform.output_dir, 'ncbitaxon')
+
+    def write_json(self, mtime):
+        shutil.copy(os.path.join('tests', 'resources', 'ontology', 'small.json'), self.json_file)
+        os.utime(self.json_file, (mtime, mtime))
+
+    def write_subset(self, suffix, mtime=None):
+        # what the traits transform's NCBITaxon subset writes
+        with gzip.open(self.output + '_nodes.tsv.gz', 'wt') if suffix == '.gz' \
+                else open(self.output + '_nodes.tsv', 'w') as f:
+            f.write('id\tcategory\nNCBITaxon:1\tbiolink:OrganismTaxon\n')
+        if mtime is not None:
+            write_subset_marker(self.output, {'nodes': 1, 'edges': 0})
+            os.utime(subset_marker(self.output), (mtime, mtime))
+
+    def converted(self):
+        self.transform.parse('ncbitaxon', self.json_file, 'ncbitaxon')
+        return os.path.isfile(self.output + '_edges.tsv')
+
+    @parameterized.expand([[''], ['.gz']])
+    def test_keeps_newer_subset(self, suffix):
+        # e.g. ncbitaxon.json left by an earlier run with ROBOT
+        self.write_json(1000)
+        self.write_subset(suffix, 2000)
+        self.assertFalse(self.converted())
+
+    def test_converts_newer_json(self):
+        self.write_subset('', 1000)
+        self.write_json(2000)
+        self.assertTrue(self.converted())
+
+    def test_converts_without_marker(self):
+        self.write_subset('', 2000)
+        remove_subset_marker(self.output)
+        self.assertFalse(os.path.isfile(subset_marker(self.output)))
+        self.write_json(1000)
+        self.assertTrue(self.converted())
+
+    @parameterized.expand([[''], ['.gz']])
+    def test_keeps_output_without_json(self, suffix):
+        self.write_subset(suffix)
+        self.assertFalse(self.converted())
@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+import zlib
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from kg_microbe.utils.io_utils import open_input
+from kg_microbe.utils.package_utils import ParallelGzipWriter, package_files
+
+
+class TestPackageUtils(TestCase):
+    """Tests packaging KG files with parallel compression."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.files = []
+        for kind, n in [('nodes', 3000), ('edges', 50000)]:
+            filename = os.path.join(self.tempdir, 'merged-kg_%s.tsv' % kind)
+            with open(filename, 'w') as f:
+                f.write('id\tcategory\n')
+                for i in range(n):
+                    f.write('CHEBI:%d\tbiolink:ChemicalSubstance\n' % i)
+            self.files.append(filename)
+        self.output_dir = os.path.join(self.tempdir, 'out')
+
+    def contents(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def test_parallel_gzip_writer(self):
+        data = b''.join(b'line %d\n' % i for i in range(100000))
+        filename = os.path.join(self.tempdir, 'data.gz')
+        with ParallelGzipWriter(open(filename, 'wb'), threads=3, block_size=100000) as f:
+            f.write(data[:12345])
+            f.write(data[12345:])
+        self.assertEqual(data, gzip.decompress(self.contents(filename)))
+        with ParallelGzipWriter(open(filename, 'wb')):
+            pass
+        self.assertEqual(b'', gzip.decompress(self.contents(filename)))
+
+    def test_parallel_gzip_writer_is_reproducible(self):
+        data = b''.join(b'line %d\n' % i for i in range(100000))
+        outputs = []
+        for threads in (1, 3, 3):
+            filename = os.path.join(self.tempdir, 'data%d.gz' % len(outputs))
+            with ParallelGzipWriter(open(filename, 'wb'), threads=threads,
+                                    block_size=100000) as f:
+                f.write(data)
+            outputs.append(self.contents(filename))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+        # one member per block, none with a timestamp
+        members, rest = [], outputs[0]
+        while rest:
+            self.assertEqual(b'\x00\x00\x00\x00', rest[4:8])
+            d = zlib.decompressobj(31)
+            members.append(d.decompress(rest))
+            rest = d.unused_data
+        self.assertEqual([data[i:i + 100000] for i in range(0, len(data), 100000)], members)
+
+    @parameterized.expand([['tar.gz'], ['tar.zst']])
+    def test_tar(self, fmt):
+        manifest = package_files(self.files, self.output_dir, 'merged-kg', fmt, threads=2)
+        archive = os.path.join(self.output_dir, 'merged-kg.' + fmt)
+        with open_input(archive, 'rb') as f, tarfile.open(fileobj=f, mode='r|') as tar:
+            members = {m.name: tar.extractfile(m).read() for m in tar}
+        self.assertEqual({os.path.basename(f): self.contents(f) for f in self.files}, members)
+        self.assertEqual([3001, 50001], [e['lines'] for e in manifest['files']])
+        with open(os.path.join(self.output_dir, 'merged-kg.manifest.json')) as f:
+            self.assertEqual(manifest, json.load(f))
+        if fmt == 'tar.gz':
+            with tarfile.open(archive, 'r:gz') as tar:  # as consumers of KGX's tar.gz do
+                self.assertEqual(list(members), tar.getnames())
+
+    def test_per_file_and_checksums(self):
+        manifest = package_files(self.files, self.output_dir, 'merged-kg', 'gz')
+        self.assertEqual(['merged-kg_nodes.tsv.gz', 'merged-kg_edges.tsv.gz'],
+                         [e['name'] for e in manifest['archives']])
+        with gzip.open(os.path.join(self.output_dir, 'merged-kg_edges.tsv.gz'), 'rb') as f:
+            self.assertEqual(self.contents(self.files[1]), f.read())
+        with open(os.path.join(self.output_dir, 'merged-kg.sha256')) as f:
+            checksums = dict(reversed(line.split()) for line in f)
+        self.assertEqual({e['name'] for e in manifest['archives']}, set(checksums))
+        for name, checksum in checksums.items():  # as sha256sum -c checks them
+            self.assertEqual(checksum, hashlib.sha256(
+                self.contents(os.path.join(self.output_dir, name))).hexdigest())
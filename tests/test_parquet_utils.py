@@ -0,0 +1,111 @@
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from parameterized import parameterized
+
+from kg_microbe.utils.parquet_utils import create_duckdb, export_parquet, \
+    parquet_dataset_name, parquet_datasets, tsv_to_parquet
+
+
+class TestParquetUtils(TestCase):
+    """Tests the Parquet and DuckDB export of KGX TSVs."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.nodes = self.write('nodes.tsv', 'id\tname\tcategory\tprovided_by', [
+            'NCBITaxon:%d\ttaxon %d\tbiolink:OrganismTaxon\ttraits' % (i, i)
+            for i in range(3000)] + ['CHEBI:1\t"glucose"\tbiolink:ChemicalSubstance\tchebi'])
+        self.edges = self.write('edges.tsv', 'subject\tpredicate\tobject\trelation', [
+            'NCBITaxon:%d\tbiolink:subclass_of\tNCBITaxon:%d\trdfs:subClassOf' % (i, i // 2)
+            for i in range(1, 3000)] + ['NCBITaxon:1\tbiolink:capable_of\tCHEBI:1\tRO:0002215'])
+
+    def write(self, name, header, lines):
+        filename = os.path.join(self.tempdir, name)
+        with open(filename, 'w') as f:
+            f.write('\n'.join([header] + lines) + '\n')
+        return filename
+
+    def test_dataset_name(self):
+        self.assertEqual('a/chebi_nodes.parquet', parquet_dataset_name('a/chebi_nodes.tsv'))
+        self.assertEqual('edges.parquet', parquet_dataset_name('edges.tsv.gz'))
+
+    @parameterized.expand([[False], [True]])
+    def test_tsv_to_parquet(self, compressed):
+        nodes, edges = self.nodes, self.edges
+        if compressed:
+            for f in (nodes, edges):
+                with open(f, 'rb') as i, gzip.open(f + '.gz', 'wb') as o:
+                    o.write(i.read())
+                os.remove(f)
+            nodes, edges = nodes + '.gz', edges + '.gz'
+        self.assertEqual(3001, tsv_to_parquet(nodes, block_bytes=10000))
+        self.assertEqual(3000, tsv_to_parquet(edges, block_bytes=10000))
+
+        node_dir = os.path.join(self.tempdir, 'nodes.parquet')
+        self.assertEqual(['prefix=CHEBI', 'prefix=NCBITaxon'], sorted(os.listdir(node_dir)))
+        df = pd.read_parquet(node_dir)
+        self.assertEqual(3001, len(df))
+        row = df[df['id'] == 'CHEBI:1'].iloc[0]
+        self.assertEqual('"glucose"', row['name'])
+        self.assertEqual('CHEBI', row['prefix'])
+
+        dataset = ds.dataset(os.path.join(self.tempdir, 'edges.parquet'), partitioning='hive')
+        schema = dataset.schema
+        # predicate is in the directory names
+        for c in ('relation', 'subject_prefix', 'object_prefix'):
+            self.assertTrue(pa.types.is_dictionary(schema.field(c).type), c)
+        self.assertEqual(pa.string(), schema.field('subject').type)
+        table = dataset.to_table(columns=['subject', 'object_prefix'],
+                                 filter=ds.field('predicate') == 'biolink:capable_of')
+        self.assertEqual([{'subject': 'NCBITaxon:1', 'object_prefix': 'CHEBI'}],
+                         table.to_pylist())
+
+    def test_rewrite(self):
+        # an earlier dataset, or a Parquet file of an earlier version, is replaced
+        dataset_dir = parquet_dataset_name(self.edges)
+        with open(dataset_dir, 'w') as f:
+            f.write('not parquet')
+        tsv_to_parquet(self.edges)
+        tsv_to_parquet(self.edges)
+        self.assertEqual(3000, len(pd.read_parquet(dataset_dir)))
+
+    def test_duckdb(self):
+        os.makedirs(os.path.join(self.tempdir, 'chebi'))
+        chebi = self.write(os.path.join('chebi', 'nodes.tsv'), 'id\tcategory',
+                           ['CHEBI:2\tbiolink:ChemicalSubstance'])
+        database = os.path.join(self.tempdir, 'kg.duckdb')
+        written = export_parquet([self.nodes, self.edges, chebi], database_file=database,
+                                 database_dir=self.tempdir)
+        self.assertEqual([3001, 3000, 1], [rows for _, rows in written])
+        self.assertEqual([os.path.join(self.tempdir, 'chebi', 'nodes.parquet'),
+                          os.path.join(self.tempdir, 'edges.parquet'),
+                          os.path.join(self.tempdir, 'nodes.parquet')],
+                         parquet_datasets(self.tempdir))
+
+        with duckdb.connect(database, read_only=True) as con:
+            views = {r[0] for r in con.execute(
+                "SELECT view_name FROM duckdb_views() WHERE NOT internal").fetchall()}
+            name = os.path.basename(self.tempdir)
+            self.assertEqual({'nodes', 'edges', 'chebi_nodes', name + '_nodes',
+                              name + '_edges'}, views)
+            self.assertEqual(3002, con.execute("SELECT count(*) FROM nodes").fetchone()[0])
+            self.assertEqual([('CHEBI:1',), ('CHEBI:2',)], con.execute(
+                "SELECT id FROM nodes WHERE prefix = 'CHEBI' ORDER BY id").fetchall())
+            self.assertEqual([('NCBITaxon:1', 'CHEBI:1')], con.execute(
+                "SELECT subject, object FROM edges "
+                "WHERE predicate = 'biolink:capable_of'").fetchall())
+
+    def test_duckdb_empty_dataset(self):
+        empty = self.write('empty_edges.tsv', 'subject\tpredicate\tobject', [])
+        self.assertEqual(0, tsv_to_parquet(empty))
+        tsv_to_parquet(self.edges)
+        views = create_duckdb(os.path.join(self.tempdir, 'kg.duckdb'),
+                              parquet_datasets(self.tempdir))
+        self.assertEqual([os.path.join(self.tempdir, 'edges.parquet')], views['edges'])
+        self.assertNotIn('empty_edges', views)
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import tracemalloc
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from kg_microbe.utils.profile_utils import Profiler
+
+
+class TestProfiler(TestCase):
+    """Tests the profiling spans and run report."""
+
+    def setUp(self) -> None:
+        self.profiler = Profiler()
+        self.output_dir = tempfile.mkdtemp()
+
+    def test_disabled_records_nothing(self):
+        with self.profiler.span('stage') as s:
+            s.count('rows_in', 10)
+        self.assertEqual([], self.profiler.spans)
+        self.assertIsNone(self.profiler.write_report())
+
+    def test_nested_spans_and_counters(self):
+        self.profiler.configure(output_dir=self.output_dir)
+        with self.profiler.span('traits') as outer:
+            with self.profiler.span('main_loop') as inner:
+                inner.count('rows_in', 3)
+                inner.count('rows_in')
+            outer.count('bytes_read', 100)
+        report_file = self.profiler.write_report()
+        with open(report_file) as f:
+            report = json.load(f)
+        spans = {s['name']: s for s in report['spans']}
+        self.assertEqual(['traits', 'traits/main_loop'], sorted(spans))
+        self.assertEqual({'rows_in': 4}, spans['traits/main_loop']['counters'])
+        self.assertGreaterEqual(spans['traits']['wall_seconds'],
+                                spans['traits/main_loop']['wall_seconds'])
+
+    def test_dumps(self):
+        self.profiler.configure(output_dir=self.output_dir, cprofile=True, trace_memory=True)
+        with self.profiler.span('merge'):
+            sum(range(1000))
+        self.assertTrue(os.path.isfile(os.path.join(self.output_dir, 'merge.prof')))
+        self.assertTrue(os.path.isfile(os.path.join(self.output_dir, 'merge.tracemalloc.txt')))
+        self.assertIn('peak_traced_mb', self.profiler.report()['spans'][0])
+
+    @parameterized.expand([[False], [True]])
+    def test_tracemalloc_without_reset_peak(self, was_tracing):
+        # as on Python < 3.9, where tracing is restarted for each span instead
+        self.profiler.configure(output_dir=self.output_dir, trace_memory=True)
+        reset_peak = tracemalloc.reset_peak
+        del tracemalloc.reset_peak
+        if was_tracing:
+            tracemalloc.start()
+        try:
+            for name in ('first', 'second'):
+                with self.profiler.span(name):
+                    data = [bytes(1000) for _ in range(1000)] if name == 'first' else []
+                    del data
+            first, second = self.profiler.report()['spans']
+            self.assertGreater(first['peak_traced_mb'], 0.9)
+            self.assertLess(second['peak_traced_mb'], 0.5)
+            self.assertEqual(was_tracing, tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+            tracemalloc.reset_peak = reset_peak
+
+    def test_error_is_recorded(self):
+        self.profiler.configure(output_dir=self.output_dir)
+        with self.assertRaises(ValueError):
+            with self.profiler.span('download'):
+                raise ValueError('no such file')
+        self.assertIn('ValueError', self.profiler.report()['spans'][0]['error'])
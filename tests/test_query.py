@@ -1,13 +1,19 @@
 import csv
+import gzip
 import os
 import pickle
 import tempfile
-from unittest import TestCase
+import threading
+import time
+from unittest import TestCase, mock
+from urllib.error import URLError
 
 import pandas as pd
 from parameterized import parameterized
 
-from kg_microbe.query import parse_query_yaml, result_dict_to_tsv
+from kg_microbe.query import is_ordered, parse_query_yaml, result_dict_to_tsv, \
+    run_query_to_tsv, run_query_with_retry, cached_query_to_tsv, run_query_batch
+from kg_microbe.utils.cache_utils import QueryCache, normalize_query
 
 
 class TestQuery(TestCase):
@@ -53,6 +59,147 @@ class TestQuery(TestCase):
         self.assertEqual(['v1', 'v0'], list(df.columns))
         self.assertEqual([10384, 'human_phenotype'], list(df.iloc[1]))
 
+    @mock.patch('kg_microbe.query.run_query')
+    def test_run_query_to_tsv_pages(self, mock_run_query):
+        result_dict = load_obj(self.test_result_dict_file)
+        mock_run_query.side_effect = lambda query, endpoint, **kwargs: \
+            page_of(result_dict, query)
+        n_rows = run_query_to_tsv('SELECT ?v1 ?v0 WHERE {} ORDER BY ?v0', 'http://zombo.com',
+                                  self.tempfile, page_size=5, workers=2)
+        self.assertEqual(18, n_rows)
+        self.assertTrue(all('LIMIT 5' in c[1]['query'] for c in mock_run_query.call_args_list))
+        df = pd.read_csv(self.tempfile, sep="\t")
+        self.assertEqual((18, 2), df.shape)
+        self.assertEqual([10384, 'human_phenotype'], list(df.iloc[1]))
+
+    @mock.patch('kg_microbe.query.run_query')
+    def test_run_query_to_tsv_unordered(self, mock_run_query):
+        # without ORDER BY, pages could overlap or miss rows: fetched at once
+        mock_run_query.return_value = load_obj(self.test_result_dict_file)
+        with self.assertLogs(level='WARNING'):
+            n_rows = run_query_to_tsv('SELECT ?v1 ?v0 WHERE {}', 'http://zombo.com',
+                                      self.tempfile, page_size=5, workers=2)
+        self.assertEqual(18, n_rows)
+        self.assertEqual(1, mock_run_query.call_count)
+        self.assertNotIn('LIMIT', mock_run_query.call_args[1]['query'])
+
+    @parameterized.expand([
+        ['SELECT ?x WHERE { ?x a ?y } ORDER BY ?x', True],
+        ['SELECT ?x WHERE { ?x a ?y }\norder  by desc(?x)', True],
+        ['SELECT ?x WHERE { { SELECT ?x WHERE { ?x a ?y } ORDER BY ?x } }', False],
+        ['SELECT (COUNT(?x) AS ?n) WHERE { ?x a ?y } GROUP BY ?y', False],
+    ])
+    def test_is_ordered(self, query, ordered):
+        self.assertEqual(ordered, is_ordered(query))
+
+    @mock.patch('kg_microbe.query.run_query')
+    def test_run_query_to_tsv_gzip(self, mock_run_query):
+        mock_run_query.return_value = load_obj(self.test_result_dict_file)
+        outfile = self.tempfile + '.gz'
+        run_query_to_tsv('SELECT ?v1 ?v0 WHERE {}', 'http://zombo.com', outfile,
+                         page_size=0)
+        with gzip.open(outfile, 'rt') as f:
+            self.assertEqual(19, len(f.readlines()))
+
+    @mock.patch('kg_microbe.query.time.sleep')
+    @mock.patch('kg_microbe.query.run_query')
+    def test_run_query_with_retry(self, mock_run_query, mock_sleep):
+        mock_run_query.side_effect = [URLError('down'), URLError('down'), {'ok': True}]
+        self.assertEqual({'ok': True}, run_query_with_retry('q', 'http://zombo.com',
+                                                            retries=2))
+        self.assertEqual(2, mock_sleep.call_count)
+        mock_run_query.side_effect = URLError('down')
+        with self.assertRaises(URLError):
+            run_query_with_retry('q', 'http://zombo.com', retries=1)
+
+    @mock.patch('kg_microbe.query.run_query')
+    def test_cached_query_to_tsv(self, mock_run_query):
+        mock_run_query.return_value = load_obj(self.test_result_dict_file)
+        cache = QueryCache(cache_dir=tempfile.mkdtemp())
+        query = parse_query_yaml(self.test_yaml)
+        for version, hit in [('v1', False), ('v1', True), ('v2', False)]:
+            self.assertEqual(hit, cached_query_to_tsv(query['query'], query['endpoint'],
+                                                      self.tempfile, cache,
+                                                      version=version, page_size=0))
+            df = pd.read_csv(self.tempfile, sep="\t")
+            self.assertEqual((18, 2), df.shape)
+        self.assertEqual(2, mock_run_query.call_count)
+
+    def test_query_cache_lru_and_ttl(self):
+        cache = QueryCache(cache_dir=tempfile.mkdtemp(), max_entries=2)
+        with open(self.tempfile, 'w') as f:
+            f.write('v0\n')
+        for key in ['a', 'b']:
+            cache.put(key, self.tempfile)
+        self.assertTrue(cache.get('a', self.tempfile))
+        cache.put('c', self.tempfile)
+        self.assertFalse(cache.get('b', self.tempfile))
+        self.assertTrue(cache.get('a', self.tempfile))
+        cache.ttl = 0
+        self.assertTrue(cache.get('c', self.tempfile))
+        cache.ttl = 1e-9
+        self.assertFalse(cache.get('c', self.tempfile))
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("SELECT ?x\n  # comment\nWHERE {  ?x a ?y }"),
+                         normalize_query("SELECT ?x WHERE { ?x a ?y }\n"))
+
+    @mock.patch('kg_microbe.query.run_query')
+    def test_run_query_batch(self, mock_run_query):
+        mock_run_query.return_value = load_obj(self.test_result_dict_file)
+        yaml_dir, output_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        with open(self.test_yaml) as f:
+            template = f.read()
+        for name in ['q1', 'q2', 'q3']:
+            with open(os.path.join(yaml_dir, name + '.yaml'), 'w') as f:
+                f.write(template)
+        with open(os.path.join(yaml_dir, 'broken.yaml'), 'w') as f:
+            f.write('title: no query here\n')
+        summaries = run_query_batch(yaml_dir, output_dir, workers=3, max_per_endpoint=2,
+                                    page_size=0)
+        self.assertEqual(['broken', 'q1', 'q2', 'q3'], [s['query'] for s in summaries])
+        self.assertEqual(['failed', 'ok', 'ok', 'ok'], [s['status'] for s in summaries])
+        self.assertEqual([0, 18, 18, 18], [s['rows'] for s in summaries])
+        self.assertTrue(os.path.isfile(os.path.join(output_dir, 'q2.tsv')))
+        summary_df = pd.read_csv(os.path.join(output_dir, 'query_summary.tsv'), sep="\t")
+        self.assertEqual((4, 6), summary_df.shape)
+
+    @mock.patch('kg_microbe.query.run_query')
+    def test_run_query_batch_limits_requests(self, mock_run_query):
+        result_dict = load_obj(self.test_result_dict_file)
+        lock = threading.Lock()
+        in_flight, max_in_flight, session_threads = [0], [0], {}
+
+        def run_query(query, endpoint, session=None, **kwargs):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+                session_threads.setdefault(session, set()).add(threading.get_ident())
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return page_of(result_dict, query)
+
+        mock_run_query.side_effect = run_query
+        yaml_dir, output_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        for name in ['q1', 'q2', 'q3']:
+            with open(os.path.join(yaml_dir, name + '.yaml'), 'w') as f:
+                f.write('endpoint: http://zombo.com\n'
+                        'query: SELECT ?v1 ?v0 WHERE {} ORDER BY ?v0\n')
+        summaries = run_query_batch(yaml_dir, output_dir, workers=3, max_per_endpoint=2,
+                                    page_size=5, page_workers=3)
+        self.assertEqual([18, 18, 18], [s['rows'] for s in summaries])
+        # pages count against the endpoint's limit, and each page worker has its own Session
+        self.assertLessEqual(max_in_flight[0], 2)
+        self.assertNotIn(None, session_threads)
+        self.assertTrue(all(len(threads) == 1 for threads in session_threads.values()))
+
+
+def page_of(result_dict, query):
+    limit, offset = [int(line.split()[1]) for line in query.splitlines()[-2:]]
+    bindings = result_dict['results']['bindings'][offset:offset + limit]
+    return {'head': result_dict['head'], 'results': {'bindings': bindings}}
+
 
 def save_obj(obj, name):
     with open(name + '.pkl', 'wb') as f:
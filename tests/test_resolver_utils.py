@@ -0,0 +1,74 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from kg_microbe.utils.resolver_utils import Annotation, OgerIndex, TermResolver, \
+    iter_oger_annotations, load_sssom
+
+
+class TestTermResolver(TestCase):
+    """Tests resolving traits terms from OGER annotations and SSSOM mappings."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        sssom_file = os.path.join(self.tempdir, 'chemicals.sssom.tsv')
+        with open(sssom_file, 'w') as f:
+            f.write('# curie_map:\n'
+                    'subject_label\tobject_id\tobject_label\tobject_match_field\tmatch_category\n'
+                    'glucose,\tCHEBI:1\tglucose\toio:hasExactSynonym\tSSSOMC:1\n'
+                    'sugar\tCHEBI:2\tsugars\toio:hasRelatedSynonym\tSSSOMC:1\n'
+                    'salt\tCHEBI:3\tsalts\trdfs:label\tSSSOMC:1\n')
+        self.sssom = load_sssom(sssom_file)
+        self.resolver = TermResolver(self.sssom, ['oio:hasExactSynonym', 'oio:hasRelatedSynonym'])
+        self.resolver.add_all([
+            (1, 'biolink:ChemicalSubstance', 'glucose', 'glucose', 'CHEBI:1', 'Exact'),
+            (1, 'biolink:ChemicalSubstance', 'acetate', 'acetate', 'CHEBI:4', 'Exact'),
+            (1, 'biolink:ChemicalSubstance', 'acetate', 'acetate', 'CHEBI:5', 'Exact'),
+            (2, 'biolink:ChemicalSubstance', 'sugar', 'sugars', 'CHEBI:2', 'Partial'),
+            (2, 'biolink:ChemicalSubstance', 'salt', 'salts', 'CHEBI:3', 'Partial'),
+            (2, 'biolink:ChemicalSubstance', 'iron', 'iron ion', 'CHEBI:6', 'Partial'),
+        ])
+
+    def test_load_sssom(self):
+        self.assertEqual((('oio:hasExactSynonym', 'glucose', 'SSSOMC:1'),),
+                         self.sssom[('glucose', 'CHEBI:1')])
+
+    @parameterized.expand([
+        [1, 'glucose', ('CHEBI:1',), None],
+        [1, 'acetate', ('CHEBI:4', 'CHEBI:5'), 'ambiguous'],
+        [2, 'sugar', ('CHEBI:2',), None],
+        [2, 'salt', (), 'no_synonym_match'],
+        [2, 'iron', (), 'no_sssom_match'],
+        [1, 'sugar', (), 'not_annotated'],
+    ])
+    def test_resolve(self, tax_id, term, curies, reason):
+        resolution = self.resolver.resolve(tax_id, term)
+        self.assertEqual(curies, tuple(c[0] for c in resolution.candidates))
+        self.assertEqual(reason, resolution.reason)
+        if reason not in (None, 'not_annotated'):
+            self.assertTrue(all(row['TokenizedTerm'] == term for row in resolution.rows))
+
+    def test_iter_oger_annotations(self):
+        oger_file = os.path.join(self.tempdir, 'nlpCHEBI.tsv')
+        with open(oger_file, 'w') as f:
+            f.write('1\tbiolink:ChemicalSubstance\t0\t7\tglucose\tglucose\tCHEBI:1\t\t1\t\t\n'
+                    '2\tbiolink:ChemicalSubstance\t0\t5\tsugar\tsugars\tCHEBI:2\t\t1\t\t\n'
+                    'x\tbroken\n')
+        self.assertEqual(
+            [Annotation(2, 'biolink:ChemicalSubstance', 'sugar', 'sugars', 'CHEBI:2', 'Partial')],
+            list(iter_oger_annotations(oger_file, tax_ids={2})))
+
+    def test_oger_index(self):
+        oger_file = os.path.join(self.tempdir, 'nlpCHEBI.tsv')
+        with open(oger_file, 'w') as f:
+            for i in range(30):
+                f.write('%d\tbiolink:ChemicalSubstance\t0\t2\tc%d\tc%d\tCHEBI:%d\t\t1\t\t\n'
+                        % (i % 10, i, i, i))
+            f.write('x\tbroken\n')
+        index = OgerIndex(oger_file)
+        self.assertEqual(30, len(index))
+        for tax_ids in ({3}, {7, 2}, {2, 99}, set()):
+            self.assertEqual(list(iter_oger_annotations(oger_file, tax_ids)),
+                             list(index.annotations(tax_ids)))
@@ -0,0 +1,69 @@
+import os
+import tarfile
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from kg_microbe.utils.rollup_utils import rollup_traits
+from kg_microbe.utils.taxonomy_utils import TaxonomyIndex
+from kg_microbe.utils.transform_utils import TransformError
+
+# taxon: (parent, rank); 561 Escherichia <- 562, 564 (species) and 83333 (strain of 562)
+TAXDUMP = {1: (1, 'no rank'), 2: (1, 'superkingdom'), 543: (2, 'family'), 561: (543, 'genus'),
+           562: (561, 'species'), 564: (561, 'species'), 83333: (562, 'strain'),
+           590: (543, 'genus'), 28901: (590, 'species'), 9999: (2, 'species')}
+
+
+class TestRollupUtils(TestCase):
+    """Tests rolling trait edges up to a taxonomic rank."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        nodes_dmp = os.path.join(self.tempdir, 'nodes.dmp')
+        with open(nodes_dmp, 'w') as f:
+            for taxon, (parent, rank) in TAXDUMP.items():
+                f.write('%d\t|\t%d\t|\t%s\t|\t\t|\n' % (taxon, parent, rank))
+        self.taxdump = os.path.join(self.tempdir, 'taxdump.tar.gz')
+        with tarfile.open(self.taxdump, 'w:gz') as tar:
+            tar.add(nodes_dmp, arcname='nodes.dmp')
+        self.edges_file = os.path.join(self.tempdir, 'edges.tsv')
+        rows = [('562', 'biolink:capable_of', 'GO:1', 'RO:0002215'),
+                ('562', 'biolink:capable_of', 'GO:1', 'RO:0002215'),  # duplicate
+                ('83333', 'biolink:capable_of', 'GO:1', 'RO:0002215'),
+                ('564', 'biolink:capable_of', 'GO:1', 'RO:0002215'),
+                ('564', 'biolink:has_phenotype', 'cell_shape:rod', 'RO:0002200'),
+                ('28901', 'biolink:has_phenotype', 'cell_shape:rod', 'RO:0002200'),
+                ('9999', 'biolink:location_of', 'ENVO:1', 'RO:0001015'),
+                ('562', 'biolink:subclass_of', 'NCBITaxon:561', 'rdfs:subClassOf')]
+        with open(self.edges_file, 'w') as f:
+            f.write('subject\tpredicate\tobject\trelation\n')
+            for taxon, predicate, obj, relation in rows:
+                f.write('NCBITaxon:%s\t%s\t%s\t%s\n' % (taxon, predicate, obj, relation))
+
+    def test_rank_ancestors(self):
+        index = TaxonomyIndex.from_taxdump(self.taxdump)
+        self.assertEqual([561, 561, 561, -1, -1, 561],
+                         list(index.rank_ancestors(np.array([562, 83333, 561, 2, 10 ** 7, 562]),
+                                                   'genus')))
+        self.assertEqual(-1, index.parents[1])
+        with self.assertRaises(TransformError):
+            index.rank_ancestors(np.array([562]), 'kingdom')
+        with self.assertRaises(TransformError):
+            TaxonomyIndex(index.parents).rank_ancestors(np.array([562]), 'genus')
+
+    def test_rollup(self):
+        index = TaxonomyIndex.from_taxdump(os.path.join(self.tempdir, 'nodes.dmp'))
+        output_dir = os.path.join(self.tempdir, 'rollup')
+        with self.assertLogs(level='WARNING'):  # 9999 has no genus
+            self.assertEqual((2, 3), rollup_traits(self.edges_file, index, 'genus', output_dir))
+        edges = pd.read_csv(os.path.join(output_dir, 'edges.tsv'), sep='\t', dtype=str)
+        self.assertEqual([['NCBITaxon:561', 'biolink:capable_of', 'GO:1', 'RO:0002215', '3', '3'],
+                          ['NCBITaxon:561', 'biolink:has_phenotype', 'cell_shape:rod',
+                           'RO:0002200', '1', '3'],
+                          ['NCBITaxon:590', 'biolink:has_phenotype', 'cell_shape:rod',
+                           'RO:0002200', '1', '1']],
+                         sorted(edges.values.tolist()))
+        nodes = pd.read_csv(os.path.join(output_dir, 'nodes.tsv'), sep='\t', dtype=str)
+        self.assertEqual(['NCBITaxon:561', 'NCBITaxon:590'], sorted(nodes.id))
@@ -1,8 +1,11 @@
+import json
+import subprocess
+import sys
 from unittest import TestCase, skip
 from click.testing import CliRunner
 from unittest import mock
 
-from run import download, transform, merge, holdouts, query
+from run import cli, download, transform, merge, holdouts, query
 
 
 class TestRun(TestCase):
@@ -31,4 +34,23 @@ class TestRun(TestCase):
             self.assertNotEqual(result.exit_code, 0)
             self.assertRegexpMatches(result.output, "does not exist")
 
+    def test_help(self):
+        result = self.runner.invoke(cli=cli, args=['--help'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('transform', result.output)
 
+
+class TestImportTime(TestCase):
+    """Guards the startup time of run.py against heavy module-level imports."""
+
+    HEAVY_MODULES = ['kgx', 'oger', 'pandas', 'networkx', 'SPARQLWrapper', 'requests']
+    MAX_IMPORT_SECONDS = 1.0
+
+    def test_import_run_is_fast(self):
+        script = ("import json, sys, time; start = time.time(); import run; "
+                  "print(json.dumps([time.time() - start, "
+                  "[m for m in %r if m in sys.modules]]))" % self.HEAVY_MODULES)
+        output = subprocess.check_output([sys.executable, '-c', script])
+        seconds, heavy_modules = json.loads(output.decode().strip().splitlines()[-1])
+        self.assertEqual([], heavy_modules)
+        self.assertLess(seconds, self.MAX_IMPORT_SECONDS)
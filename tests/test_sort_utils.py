@@ -0,0 +1,79 @@
+import gzip
+import os
+import random
+import tempfile
+from unittest import TestCase, mock
+
+from parameterized import parameterized
+
+from kg_microbe.utils import sort_utils
+from kg_microbe.utils.sort_utils import kgx_tsv_files, sort_kgx_tsv
+from kg_microbe.utils.transform_utils import TransformError
+
+
+class TestSortUtils(TestCase):
+    """Tests the external merge sort of KGX TSVs."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        rng = random.Random(0)
+        self.edges = ['NCBITaxon:%d\tbiolink:%s\tCHEBI:%d\tRO:%d' % (
+            rng.randrange(500), rng.choice(['capable_of', 'has_phenotype']),
+            rng.randrange(50), rng.randrange(3)) for _ in range(20000)]
+        self.edges_file = self.write('edges.tsv', 'subject\tpredicate\tobject\trelation',
+                                     self.edges)
+
+    def write(self, name, header, lines):
+        filename = os.path.join(self.tempdir, name)
+        with (gzip.open(filename, 'wt') if name.endswith('.gz') else open(filename, 'w')) as f:
+            f.write('\n'.join([header] + lines) + '\n')
+        return filename
+
+    def read(self, filename):
+        with (gzip.open(filename, 'rt') if filename.endswith('.gz') else open(filename)) as f:
+            return f.read().split('\n')[:-1]
+
+    def expected(self, lines):
+        return sorted(lines, key=lambda l: tuple(l.split('\t')[:3]) + (l,))
+
+    @parameterized.expand([
+        # several runs, merged in more than one pass
+        [1, 10], [2, 2], [3, 64],
+    ])
+    def test_sort_edges(self, processes, fan_in):
+        output = os.path.join(self.tempdir, 'sorted_edges.tsv')
+        with mock.patch.object(sort_utils, 'MIN_RUN_BYTES', 20000), \
+                mock.patch.object(sort_utils, 'MERGE_FAN_IN', fan_in):
+            lines = sort_kgx_tsv(self.edges_file, output, memory_mb=0.05, processes=processes)
+        self.assertEqual(len(self.edges), lines)
+        self.assertEqual(['subject\tpredicate\tobject\trelation'] + self.expected(self.edges),
+                         self.read(output))
+        self.assertEqual([], [f for f in os.listdir(self.tempdir) if f.startswith('sort_')])
+
+    def test_sort_in_place_compressed_and_deterministic(self):
+        nodes = ['CHEBI:%d\tname %d\tbiolink:ChemicalSubstance' % (i % 700, i)
+                 for i in range(2000, 0, -1)]
+        nodes_file = self.write('nodes.tsv.gz', 'id\tname\tcategory', nodes)
+        shuffled = list(nodes)
+        random.Random(1).shuffle(shuffled)
+        other_file = self.write('other_nodes.tsv.gz', 'id\tname\tcategory', shuffled)
+        for f in [nodes_file, other_file]:
+            sort_kgx_tsv(f, processes=1)
+        self.assertEqual(self.read(nodes_file), self.read(other_file))
+        self.assertEqual(sorted(nodes, key=lambda l: (l.split('\t')[0], l)),
+                         self.read(nodes_file)[1:])
+        with open(nodes_file, 'rb') as f:
+            self.assertEqual(b'\x1f\x8b', f.read(2))
+
+    def test_not_kgx(self):
+        other = self.write('other.tsv', 'a\tb', ['1\t2'])
+        with self.assertRaises(TransformError):
+            sort_kgx_tsv(other)
+        with self.assertRaises(TransformError):
+            sort_kgx_tsv(self.edges_file, self.edges_file + '.bz2')
+
+    def test_kgx_tsv_files(self):
+        os.makedirs(os.path.join(self.tempdir, 'ontologies'))
+        chebi = self.write(os.path.join('ontologies', 'chebi_nodes.tsv'), 'id', [])
+        self.write('edges.tsv.parquet', 'id', [])
+        self.assertEqual(sorted([chebi, self.edges_file]), sorted(kgx_tsv_files(self.tempdir)))
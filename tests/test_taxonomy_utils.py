@@ -0,0 +1,94 @@
+import os
+import tarfile
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+
+from kg_microbe.utils.taxonomy_utils import TaxonomyIndex, subset_taxonomy, taxdump_to_tsv, \
+    taxon_number
+
+
+class TestTaxonomyUtils(TestCase):
+    """Tests subsetting NCBITaxon to the ancestors of a set of taxa."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        # 1 <- 2 <- 1224 <- 1236 <- 562, 2 <- 1239, 1 <- 2157
+        self.lineage = {2: 1, 1224: 2, 1236: 1224, 562: 1236, 1239: 2, 2157: 1}
+        self.nodes_file = os.path.join(self.tempdir, 'ncbitaxon_nodes.tsv')
+        self.edges_file = os.path.join(self.tempdir, 'ncbitaxon_edges.tsv')
+        with open(self.nodes_file, 'w') as f:
+            f.write('id\tcategory\tname\n')
+            for taxon in [1] + list(self.lineage):
+                f.write('NCBITaxon:%d\tbiolink:OrganismTaxon\ttaxon %d\n' % (taxon, taxon))
+            f.write('OBO:ncbitaxon#species\tbiolink:OntologyClass\tspecies\n')
+        with open(self.edges_file, 'w') as f:
+            f.write('subject\tpredicate\tobject\trelation\n')
+            for child, parent in self.lineage.items():
+                f.write('NCBITaxon:%d\tbiolink:subclass_of\tNCBITaxon:%d\trdfs:subClassOf\n'
+                        % (child, parent))
+        self.terms_file = os.path.join(self.tempdir, 'subset_terms.tsv')
+        with open(self.terms_file, 'w') as f:
+            f.write('NCBITaxon:562\nNCBITaxon:1239\nNCBITaxon:999999\n')
+
+    def test_taxon_number(self):
+        self.assertEqual(562, taxon_number('NCBITaxon:562'))
+        self.assertIsNone(taxon_number('OBO:ncbitaxon#species'))
+
+    def test_ancestors(self):
+        index = TaxonomyIndex.from_edges(self.edges_file)
+        self.assertEqual([1, 2, 562, 1224, 1236, 1239], list(index.ancestors([562, 1239])))
+        self.assertEqual([1, 2157], list(index.ancestors([2157])))
+
+    def test_cache(self):
+        cache_file = os.path.join(self.tempdir, 'parents.npy')
+        index = TaxonomyIndex.load(self.edges_file, cache_file)
+        self.assertTrue(os.path.isfile(cache_file))
+        self.assertEqual(list(index.parents), list(TaxonomyIndex.load(self.edges_file, cache_file).parents))
+
+    def test_subset_taxonomy(self):
+        output_nodes = os.path.join(self.tempdir, 'subset_nodes.tsv')
+        output_edges = os.path.join(self.tempdir, 'subset_edges.tsv')
+        self.assertEqual((6, 5), subset_taxonomy(self.nodes_file, self.edges_file, self.terms_file,
+                                                 output_nodes, output_edges))
+        nodes = pd.read_csv(output_nodes, sep='\t')
+        self.assertEqual(['id', 'category', 'name'], list(nodes.columns))
+        self.assertNotIn('NCBITaxon:2157', list(nodes.id))
+
+    def test_taxdump_to_tsv(self):
+        # the same taxonomy as a taxdump; the root is its own parent
+        dmp = {'nodes.dmp': ['1\t|\t1\t|\tno rank\t|\t\t|'] + [
+                   '%d\t|\t%d\t|\tno rank\t|\t\t|' % (child, parent)
+                   for child, parent in self.lineage.items()],
+               'names.dmp': ['%d\t|\ttaxon %d\t|\t\t|\tscientific name\t|' % (t, t)
+                             for t in [1] + list(self.lineage)] +
+                            ['562\t|\tE. coli\t|\t\t|\tsynonym\t|']}
+        taxdump = os.path.join(self.tempdir, 'taxdump.tar.gz')
+        with tarfile.open(taxdump, 'w:gz') as tar:
+            for name, lines in dmp.items():
+                filename = os.path.join(self.tempdir, name)
+                with open(filename, 'w') as f:
+                    f.write('\n'.join(lines) + '\n')
+                tar.add(filename, arcname=name)
+
+        nodes_file = os.path.join(self.tempdir, 'taxdump_nodes.tsv')
+        edges_file = os.path.join(self.tempdir, 'taxdump_edges.tsv')
+        self.assertEqual((7, 6), taxdump_to_tsv(taxdump, nodes_file, edges_file))
+        nodes = pd.read_csv(nodes_file, sep='\t')
+        self.assertEqual({'id': 'NCBITaxon:562', 'category': 'biolink:OrganismTaxon',
+                          'name': 'taxon 562',
+                          'iri': 'http://purl.obolibrary.org/obo/NCBITaxon_562'},
+                         nodes[nodes.id == 'NCBITaxon:562'].iloc[0].to_dict())
+        expected = pd.read_csv(self.edges_file, sep='\t').sort_values('subject')
+        edges = pd.read_csv(edges_file, sep='\t').sort_values('subject')
+        self.assertEqual(expected.values.tolist(), edges.values.tolist())
+        self.assertEqual(list(TaxonomyIndex.from_edges(self.edges_file).parents),
+                         list(TaxonomyIndex.from_edges(edges_file).parents))
+
+    def test_subset_taxonomy_compressed(self):
+        output = os.path.join(self.tempdir, 'subset')
+        self.assertEqual((6, 5), subset_taxonomy(self.nodes_file, self.edges_file, self.terms_file,
+                                                 output + '_nodes.tsv', output + '_edges.tsv',
+                                                 compression='gz'))
+        self.assertEqual(6, len(pd.read_csv(output + '_nodes.tsv.gz', sep='\t')))
@@ -1,12 +1,18 @@
+import csv
 import os
-#import tempfile
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 import pandas as pd
 from kg_microbe.transform_utils.traits import TraitsTransform
-from kg_microbe.transform_utils.traits.traits import parse_line
-from kg_microbe.utils.transform_utils import parse_header
+from kg_microbe.transform_utils.traits.traits import COMBINED_SOURCE_NAME, parse_line, \
+    process_oger_output
+from kg_microbe.utils.transform_utils import parse_header, TransformError
 from parameterized import parameterized
 
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 class TestTraits(unittest.TestCase):
 
@@ -97,3 +103,137 @@ class TestTraits(unittest.TestCase):
             ['subject', 'predicate', 'object', 'relation'],
              list(edge_df.columns)
         )
+
+
+# CURIEs the stubbed OGER finds for terms; other terms are left unannotated
+OGER_CURIES = {'glucose': ('CHEBI:17234', 'biolink:ChemicalSubstance'),
+               'acetate': ('CHEBI:30089', 'biolink:ChemicalSubstance'),
+               'methanogenesis': ('GO:0015948', 'biolink:BiologicalProcess')}
+TRAITS_COLUMNS = ['metabolism', 'pathways', 'carbon_substrates', 'cell_shape', 'isolation_source']
+
+
+def stub_run_oger(path, input_file_name, n_workers=1, load=True):
+    # annotate each term of OGER's input that is in OGER_CURIES with an exact match
+    with open(os.path.join(path, 'input', input_file_name + '.tsv')) as f, \
+            open(os.path.join(path, 'output', input_file_name + '.tsv'), 'w') as out:
+        for tax_id, text in list(csv.reader(f, delimiter='\t'))[1:]:
+            for term in (t.strip() for t in text.split(',')):
+                if term in OGER_CURIES:
+                    curie, biolink = OGER_CURIES[term]
+                    out.write('\t'.join([tax_id, biolink, '0', str(len(term)), term, term,
+                                         curie, '', '1', '', 'CUI-less']) + '\n')
+    return process_oger_output(path, input_file_name) if load else None
+
+
+class TestTraitsDatasets(unittest.TestCase):
+    """Tests ingesting several bacteria-archaea-traits files in one run."""
+
+    def setUp(self) -> None:
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.mkdtemp()
+        shutil.copy(os.path.join(REPO_DIR, 'stopwords.yaml'), self.tempdir)
+        shutil.copytree(os.path.join(REPO_DIR, 'schemas'), os.path.join(self.tempdir, 'schemas'))
+        os.chdir(self.tempdir)
+        os.makedirs(os.path.join('data', 'raw'))
+        self.write('condensed_traits_NCBI.csv', ['tax_id', 'org_name'], [
+            ['1', 'Alpha one', 'aerobic', 'NA', 'glucose, acetate', 'coccus', 'NA'],
+            ['2', 'Beta two', 'anaerobic', 'methanogenesis', 'glucose', 'bacillus', 'NA']])
+        # a taxon in both files, and one only in this one, under the species columns
+        self.write('condensed_species_NCBI.csv', ['species_tax_id', 'species'], [
+            ['2', 'Beta two', 'anaerobic', 'methanogenesis', 'glucose', 'bacillus', 'NA'],
+            ['3', 'Gamma three', 'aerobic', 'NA', 'acetate, sucrose', 'coccus', 'NA']])
+        with open(os.path.join('data', 'raw', 'environments.csv'), 'w') as f:
+            f.write('Type,Environment,ENVO_terms,ENVO_ids\n')
+
+        module = 'kg_microbe.transform_utils.traits.traits.'
+        for name, stub in [('convert_to_json', None), ('extract_convert_to_json', None),
+                           ('create_termlist', None), ('create_settings_file', None),
+                           ('run_oger', stub_run_oger)]:
+            patcher = mock.patch(module + name, stub or mock.Mock())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def write(self, name, id_columns, rows):
+        with open(os.path.join('data', 'raw', name), 'w', newline='') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(id_columns + TRAITS_COLUMNS)
+            writer.writerows(rows)
+
+    def read(self, source_name, kind):
+        with open(os.path.join('data', 'transformed', source_name, kind + '.tsv')) as f:
+            rows = [tuple(line.rstrip('\n').split('\t')) for line in f]
+        self.assertEqual(len(rows), len(set(rows)))
+        return rows[0], set(rows[1:])
+
+    @parameterized.expand([
+        ('condensed_traits_NCBI.csv', ('tax_id', 'org_name')),
+        ('condensed_species_NCBI.csv', ('species_tax_id', 'species')),
+    ])
+    def test_dataset_columns(self, name, columns):
+        self.assertEqual(columns, TraitsTransform.dataset_columns(os.path.join('data', 'raw', name)))
+
+    def test_dataset_columns_missing(self):
+        self.write('other.csv', ['taxon', 'org_name'], [])
+        with self.assertRaises(TransformError):
+            TraitsTransform.dataset_columns(os.path.join('data', 'raw', 'other.csv'))
+
+    def test_run(self):
+        TraitsTransform().run(['condensed_traits_NCBI.csv', 'condensed_species_NCBI.csv'])
+
+        # one OGER run over the de-duplicated terms of both files
+        nlp_input = pd.read_csv(os.path.join('data', 'nlp', 'input', 'nlpCHEBI.tsv'), sep='\t')
+        self.assertEqual(['tax_id', 'carbon_substrates'], list(nlp_input.columns))
+        self.assertEqual([1, 2, 3], sorted(nlp_input['tax_id']))
+
+        node_header, ncbi_nodes = self.read('condensed_traits_NCBI', 'nodes')
+        edge_header, ncbi_edges = self.read('condensed_traits_NCBI', 'edges')
+        self.assertEqual(('id', 'name', 'category', 'match_description'), node_header)
+        self.assertEqual(('subject', 'predicate', 'object', 'relation'), edge_header)
+        ncbi_ids = {row[0] for row in ncbi_nodes}
+        self.assertTrue({'NCBITaxon:1', 'NCBITaxon:2', 'CHEBI:17234', 'CHEBI:30089',
+                         'GO:0015948'} <= ncbi_ids)
+        self.assertNotIn('NCBITaxon:3', ncbi_ids)
+        self.assertIn(('NCBITaxon:2', 'biolink:capable_of', 'GO:0015948', 'RO:0002215'),
+                      ncbi_edges)
+
+        _, species_nodes = self.read('condensed_species_NCBI', 'nodes')
+        _, species_edges = self.read('condensed_species_NCBI', 'edges')
+        self.assertIn(('NCBITaxon:3', 'Gamma three', 'biolink:OrganismTaxon', ''), species_nodes)
+        species_ids = {row[0] for row in species_nodes}
+        self.assertIn('microtraits.carbon_substrates:sucrose', species_ids)
+        self.assertNotIn('NCBITaxon:1', species_ids)
+        self.assertIn(('NCBITaxon:2', 'biolink:interacts_with', 'CHEBI:17234', 'RO:0002438'),
+                      species_edges)
+
+        # the combined output is the union, each node (the first written with its id)
+        # and edge once
+        _, combined_nodes = self.read(COMBINED_SOURCE_NAME, 'nodes')
+        _, combined_edges = self.read(COMBINED_SOURCE_NAME, 'edges')
+        combined_ids = [row[0] for row in combined_nodes]
+        self.assertEqual(len(combined_ids), len(set(combined_ids)))
+        self.assertEqual(ncbi_ids | species_ids, set(combined_ids))
+        self.assertTrue(combined_nodes <= ncbi_nodes | species_nodes)
+        self.assertEqual(ncbi_edges | species_edges, combined_edges)
+
+        with open(os.path.join('data', 'raw', 'subset_terms.tsv')) as f:
+            self.assertEqual(['NCBITaxon:1', 'NCBITaxon:2', 'NCBITaxon:3'], f.read().split())
+
+    def test_run_one_file(self):
+        TraitsTransform().run('condensed_species_NCBI.csv')
+        _, nodes = self.read('condensed_traits_NCBI', 'nodes')
+        self.assertIn(('NCBITaxon:3', 'Gamma three', 'biolink:OrganismTaxon', ''), nodes)
+        self.assertFalse(os.path.exists(os.path.join('data', 'transformed', COMBINED_SOURCE_NAME)))
+
+    def test_run_in_blocks(self):
+        TraitsTransform().run(['condensed_traits_NCBI.csv', 'condensed_species_NCBI.csv'])
+        expected = {kind: self.read(COMBINED_SOURCE_NAME, kind) for kind in ('nodes', 'edges')}
+        # OGER annotations are read per block of rows, through an index of OGER's output
+        t = TraitsTransform()
+        t.chunk_size = 1
+        t.run(['condensed_traits_NCBI.csv', 'condensed_species_NCBI.csv'])
+        for kind in ('nodes', 'edges'):
+            self.assertEqual(expected[kind], self.read(COMBINED_SOURCE_NAME, kind))
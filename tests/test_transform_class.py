@@ -2,7 +2,7 @@ import os
 from unittest import TestCase
 
 from parameterized import parameterized
-from kg_microbe.transform import DATA_SOURCES
+from kg_microbe.transform import DATA_SOURCES, get_transform_class
 from kg_microbe.transform_utils.transform import Transform
 from kg_microbe.transform_utils.traits.traits import TraitsTransform
 from kg_microbe.transform_utils.ontology import OntologyTransform
@@ -56,7 +56,7 @@ class TestTransform(TestCase):
         def_input_dir = os.path.join('data', 'raw')
         def_output_dir = os.path.join('data', 'transformed')
 
-        t = DATA_SOURCES[src_name](input_dir=input_dir, output_dir=output_dir)
+        t = get_transform_class(src_name)(input_dir=input_dir, output_dir=output_dir)
         self.assertEqual(t.input_base_dir, input_dir)
         self.assertEqual(t.output_base_dir, output_dir)
         self.assertTrue(hasattr(t, 'run'))
@@ -1,6 +1,11 @@
+import gzip
+import os
+import tempfile
 import unittest
+import pandas as pd
 from parameterized import parameterized
-from kg_microbe.utils.transform_utils import guess_bl_category, collapse_uniprot_curie
+from kg_microbe.utils.transform_utils import guess_bl_category, collapse_uniprot_curie, \
+    DigestSet, NodeEdgeWriter, TermDiagnostics, TransformError
 
 
 class TestTransformUtils(unittest.TestCase):
@@ -23,3 +28,89 @@ class TestTransformUtils(unittest.TestCase):
     def test_collapse_uniprot_curie(self, curie, collapsed_curie):
         self.assertEqual(collapsed_curie, collapse_uniprot_curie(curie))
 
+
+class TestNodeEdgeWriter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.node_file = os.path.join(self.tempdir, 'nodes.tsv')
+        self.edge_file = os.path.join(self.tempdir, 'edges.tsv')
+        self.node_header = ['id', 'name', 'category']
+        self.edge_header = ['subject', 'predicate', 'object', 'relation']
+
+    def write_some(self, **kwargs) -> NodeEdgeWriter:
+        with NodeEdgeWriter(self.node_file, self.edge_file, self.node_header,
+                            self.edge_header, batch_size=2, **kwargs) as writer:
+            for i in [1, 2, 1, 3, 2]:
+                writer.write_node(['NCBITaxon:%d' % i, 'taxon %d' % i, 'biolink:OrganismTaxon'])
+            for o in ['GO:1', 'GO:2', 'GO:1']:
+                writer.write_edge(['NCBITaxon:1', 'biolink:capable_of', o, 'RO:0002215'])
+            writer.write_edge(['NCBITaxon:1', 'biolink:interacts_with', 'GO:1', 'RO:0002438'])
+        return writer
+
+    def test_dedup(self):
+        writer = self.write_some()
+        self.assertEqual((3, 3), (writer.node_count, writer.edge_count))
+        nodes = pd.read_csv(self.node_file, sep='\t')
+        self.assertEqual(['NCBITaxon:1', 'NCBITaxon:2', 'NCBITaxon:3'], list(nodes.id))
+        edges = pd.read_csv(self.edge_file, sep='\t')
+        self.assertEqual(self.edge_header, list(edges.columns))
+        self.assertEqual(3, len(edges))
+
+    @parameterized.expand([[False], [True]])
+    def test_edge_key(self, compact):
+        with NodeEdgeWriter(self.node_file, self.edge_file, self.node_header, self.edge_header,
+                            compact=compact, edge_key=self.edge_header) as writer:
+            for relation in ['OBO:chebi#has_functional_parent', 'OBO:chebi#is_conjugate_base_of',
+                             'OBO:chebi#has_functional_parent']:
+                writer.write_edge(['CHEBI:1', 'biolink:related_to', 'CHEBI:2', relation])
+        self.assertEqual(2, writer.edge_count)
+        self.assertTrue(writer.has_edge('CHEBI:1', 'biolink:related_to', 'CHEBI:2',
+                                        'OBO:chebi#is_conjugate_base_of'))
+        edges = pd.read_csv(self.edge_file, sep='\t')
+        self.assertEqual(['OBO:chebi#has_functional_parent', 'OBO:chebi#is_conjugate_base_of'],
+                         list(edges.relation))
+
+    def test_compact_dedup(self):
+        writer = self.write_some(compact=True)
+        self.assertEqual((3, 3), (writer.node_count, writer.edge_count))
+        self.assertIsInstance(writer.seen_edges, DigestSet)
+
+    def test_gzip(self):
+        self.write_some(compression='gz')
+        with gzip.open(self.node_file + '.gz', 'rt') as f:
+            self.assertEqual(4, len(f.readlines()))
+
+    def test_bad_row(self):
+        with NodeEdgeWriter(self.node_file, self.edge_file, self.node_header,
+                            self.edge_header) as writer:
+            with self.assertRaises(TransformError):
+                writer.write_node(['NCBITaxon:1'])
+
+
+class TestDigestSet(unittest.TestCase):
+    def test_add_and_grow(self):
+        digests = DigestSet(capacity=4)
+        for i in range(1000):
+            self.assertTrue(digests.add('NCBITaxon:%d' % i))
+        self.assertFalse(digests.add('NCBITaxon:7'))
+        self.assertEqual(1000, len(digests))
+        self.assertIn('NCBITaxon:999', digests)
+        self.assertNotIn('NCBITaxon:1000', digests)
+
+
+class TestTermDiagnostics(unittest.TestCase):
+    def test_record_and_summary(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'remnants.tsv')
+        with TermDiagnostics(filename, ['TaxId', 'CURIE']) as diagnostics:
+            diagnostics.record('glucose', 'not_annotated')
+            diagnostics.record('lactose', 'ambiguous', [{'TaxId': 1, 'CURIE': 'CHEBI:1'},
+                                                        {'TaxId': 1, 'CURIE': 'CHEBI:2'}])
+            diagnostics.record('glucose', 'not_annotated')
+        self.assertEqual(3, diagnostics.total)
+        self.assertEqual([(('glucose', 'not_annotated'), 2)], diagnostics.most_common(1))
+        remnants = pd.read_csv(filename, sep='\t')
+        self.assertEqual(['reason', 'term', 'TaxId', 'CURIE'], list(remnants.columns))
+        self.assertEqual(4, len(remnants))
+        summary = pd.read_csv(diagnostics.summary_file, sep='\t')
+        self.assertEqual(['glucose', 'lactose'], list(summary.term))
+        self.assertEqual([2, 1], list(summary['count']))
@@ -0,0 +1,89 @@
+import bz2
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from parameterized import parameterized
+
+from kg_microbe.utils import validate_utils
+from kg_microbe.utils.transform_utils import TransformError
+from kg_microbe.utils.validate_utils import validate_kgx
+
+
+class TestValidateUtils(TestCase):
+    """Tests the referential-integrity checks of KGX TSVs."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.nodes = self.write('nodes.tsv', ['id\tcategory\tname'] + [
+            'NCBITaxon:%d\tbiolink:OrganismTaxon\ttaxon %d' % (i, i) for i in range(1000)] + [
+            'CHEBI:1\t\tno category',
+            'NCBITaxon:7\tbiolink:OrganismTaxon\tduplicate',
+            'FOO:1\tbiolink:NamedThing\tunknown prefix',
+            'microtraits.cell_shape_enum:bacillus\tbiolink:PhenotypicQuality\tshape',
+        ])
+        self.edges = self.write('edges.tsv', ['subject\tpredicate\tobject\trelation'] + [
+            'NCBITaxon:%d\tbiolink:subclass_of\tNCBITaxon:%d\trdfs:subClassOf' % (i, i // 2)
+            for i in range(1, 1000)] + [
+            'NCBITaxon:3\tbiolink:has_phenotype\tmicrotraits.cell_shape_enum:bacillus\tRO:0002200',
+            'NCBITaxon:5\tbiolink:subclass_of\tNCBITaxon:2\trdfs:subClassOf',
+            'NCBITaxon:5000\tbiolink:has_phenotype\tCHEBI:1\tRO:0002200',
+            'NCBITaxon:6\tbiolink:has_phenotype\tCHEBI:404\tRO:0002200',
+            'NCBITaxon:6\tfoo:bar\tCHEBI:1\tRO:0002200',
+        ])
+
+    def write(self, name, lines):
+        filename = os.path.join(self.tempdir, name)
+        with open(filename, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return filename
+
+    def check(self, report, edges_file=None):
+        self.assertEqual(1004, report['nodes'])
+        self.assertEqual(1004, report['edges'])
+        checks = report['checks']
+        self.assertEqual({'duplicate_node': 1, 'unknown_prefix': 1, 'empty_category': 1,
+                          'dangling_subject': 1, 'dangling_object': 1, 'duplicate_edge': 1,
+                          'unknown_predicate': 1},
+                         {c: v['count'] for c, v in checks.items()})
+        self.assertEqual([{'file': self.nodes, 'line': 1003,
+                           'row': ['NCBITaxon:7', 'biolink:OrganismTaxon', 'duplicate']}],
+                         checks['duplicate_node']['samples'])
+        self.assertEqual('FOO:1', checks['unknown_prefix']['samples'][0]['row'][0])
+        self.assertEqual(1002, checks['empty_category']['samples'][0]['line'])
+        self.assertEqual(edges_file or self.edges, checks['duplicate_edge']['samples'][0]['file'])
+        self.assertEqual(1002, checks['duplicate_edge']['samples'][0]['line'])
+        self.assertEqual(1003, checks['dangling_subject']['samples'][0]['line'])
+        self.assertEqual('CHEBI:404', checks['dangling_object']['samples'][0]['row'][2])
+        self.assertEqual('foo:bar', checks['unknown_predicate']['samples'][0]['row'][1])
+
+    @parameterized.expand([[1], [2]])
+    def test_validate(self, processes):
+        # small ranges, so that the processes check the files in several pieces
+        with mock.patch.object(validate_utils, 'RANGE_BYTES', 4096):
+            self.check(validate_kgx([self.nodes], [self.edges], processes=processes))
+
+    def test_compressed_and_several_files(self):
+        edges_bz2 = self.edges + '.bz2'
+        with open(self.edges, 'rb') as f, bz2.open(edges_bz2, 'wb') as out:
+            out.write(f.read())
+        with mock.patch.object(validate_utils, 'CHUNK_ROWS', 100):
+            self.check(validate_kgx([self.nodes], [edges_bz2], processes=2), edges_bz2)
+        # the same edges in two files are duplicates of each other
+        report = validate_kgx([self.nodes], [self.edges, edges_bz2], sample_size=2)
+        self.assertEqual(1005, report['checks']['duplicate_edge']['count'])
+        self.assertEqual([(self.edges, 1002), (edges_bz2, 2)],
+                         [(s['file'], s['line'])
+                          for s in report['checks']['duplicate_edge']['samples']])
+
+    def test_clean_and_prefixes(self):
+        nodes = self.write('clean_nodes.tsv', ['id\tcategory', 'FOO:1\tbiolink:NamedThing',
+                                               'CHEBI:2\tbiolink:ChemicalSubstance'])
+        edges = self.write('clean_edges.tsv', ['subject\tpredicate\tobject',
+                                               'FOO:1\tbiolink:related_to\tCHEBI:2'])
+        report = validate_kgx([nodes], [edges], prefixes=['FOO'])
+        self.assertEqual({'nodes': 2, 'edges': 1, 'checks': {}}, report)
+
+    def test_not_kgx(self):
+        with self.assertRaises(TransformError):
+            validate_kgx([self.edges], [])
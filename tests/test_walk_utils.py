@@ -0,0 +1,123 @@
+import gzip
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+from parameterized import parameterized
+
+from kg_microbe.utils.walk_utils import PAD, WalkGraph, walk_batch, write_walks
+
+
+class TestWalkUtils(TestCase):
+    """Tests random walks over a KGX graph."""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        # a cycle of 20 nodes, with a chemical off one of them
+        self.edges = os.path.join(self.tempdir, 'edges.tsv')
+        with open(self.edges, 'w') as f:
+            f.write('subject\tpredicate\tobject\n')
+            for i in range(20):
+                f.write('NCBITaxon:%d\tbiolink:related_to\tNCBITaxon:%d\n' % (i, (i + 1) % 20))
+            f.write('NCBITaxon:0\tbiolink:consumes\tCHEBI:1\n')
+            f.write('NCBITaxon:0\tbiolink:produces\tCHEBI:1\n')
+        self.graph = WalkGraph.from_tsv(self.edges)
+
+    def id(self, curie):
+        return int(np.searchsorted(self.graph.ids, curie))
+
+    def assertWalks(self, graph, walks):
+        edges = {(int(a), int(b)) for a, b in zip(
+            np.repeat(np.arange(len(graph)), graph.degrees()), graph.neighbors)}
+        for walk in walks:
+            walk = walk[walk != PAD]
+            for a, b in zip(walk[:-1], walk[1:]):
+                self.assertIn((int(a), int(b)), edges)
+
+    def test_graph(self):
+        self.assertEqual(21, len(self.graph))
+        self.assertEqual('CHEBI:1', self.graph.ids[0])
+        # both ways, and once for the two edges to CHEBI:1
+        self.assertEqual([self.id('NCBITaxon:0')], list(self.graph.neighbors[
+            self.graph.offsets[0]:self.graph.offsets[1]]))
+        self.assertEqual(3, self.graph.degrees()[self.id('NCBITaxon:0')])
+        self.assertEqual(42, len(self.graph.neighbors))
+
+        directed = WalkGraph.from_tsv(self.edges, directed=True)
+        self.assertEqual(0, directed.degrees()[0])
+        self.assertEqual(21, len(directed.neighbors))
+
+        npz = os.path.join(self.tempdir, 'graph.npz')
+        self.graph.save(npz)
+        loaded = WalkGraph.load(npz)
+        self.assertEqual(list(self.graph.ids), list(loaded.ids))
+        np.testing.assert_array_equal(self.graph.neighbors, loaded.neighbors)
+
+    def test_walk_batch(self):
+        arrays = {'offsets': self.graph.offsets, 'neighbors': self.graph.neighbors}
+        starts = np.arange(1, 21, dtype=np.int32)
+        uniform = walk_batch(arrays, np.repeat(starts, 20), 30, 1, 1, np.random.default_rng(0))
+        self.assertEqual((400, 30), uniform.shape)
+        self.assertWalks(self.graph, uniform)
+        # with a large p, walks don't step back where they came from
+        forward = walk_batch(arrays, np.repeat(starts, 20), 30, 1e9, 1,
+                             np.random.default_rng(0))
+        self.assertWalks(self.graph, forward)
+        degrees = self.graph.degrees()
+        back = (forward[:, 2:] == forward[:, :-2]) & (degrees[forward[:, 1:-1]] > 1)
+        self.assertFalse(back.any())
+        self.assertTrue((uniform[:, 2:] == uniform[:, :-2]).any())
+
+        directed = WalkGraph.from_tsv(self.edges, directed=True)
+        walks = walk_batch({'offsets': directed.offsets, 'neighbors': directed.neighbors},
+                           np.array([self.id('NCBITaxon:0')], dtype=np.int32), 5, 1, 1,
+                           np.random.default_rng(0))
+        self.assertWalks(directed, walks)
+
+        sink = walk_batch({'offsets': directed.offsets, 'neighbors': directed.neighbors},
+                          np.array([0], dtype=np.int32), 5, 1, 1, np.random.default_rng(0))
+        self.assertEqual([[0, PAD, PAD, PAD, PAD]], sink.tolist())
+
+    @parameterized.expand([[1, 1], [1, 0.5]])
+    def test_write_walks(self, p, q):
+        npy = os.path.join(self.tempdir, 'walks.npy')
+        summary = write_walks(self.graph, npy, walk_length=10, walks_per_node=3, p=p, q=q,
+                              processes=1, batch_walks=16)
+        self.assertEqual({'nodes': 21, 'walks': 63, 'steps': 630}, summary)
+        walks = np.load(npy)
+        self.assertEqual((63, 10), walks.shape)
+        self.assertEqual(np.int32, walks.dtype)
+        self.assertEqual(list(range(21)) * 3, walks[:, 0].tolist())
+        self.assertWalks(self.graph, walks)
+        with open(os.path.join(self.tempdir, 'walks_ids.txt')) as f:
+            self.assertEqual(list(self.graph.ids), f.read().split())
+
+        # the same walks with another number of processes, and as text
+        text = os.path.join(self.tempdir, 'walks.txt.gz')
+        write_walks(self.graph, text, walk_length=10, walks_per_node=3, p=p, q=q,
+                    processes=2, batch_walks=16)
+        with gzip.open(text, 'rt') as f:
+            lines = f.read().splitlines()
+        self.assertEqual([' '.join(self.graph.ids[walk]) for walk in walks], lines)
+
+    def test_seed(self):
+        walks = []
+        for seed in (0, 0, 1):
+            npy = os.path.join(self.tempdir, 'walks%d.npy' % len(walks))
+            write_walks(self.graph, npy, walk_length=10, walks_per_node=2, seed=seed,
+                        processes=1)
+            walks.append(np.load(npy))
+        np.testing.assert_array_equal(walks[0], walks[1])
+        self.assertFalse(np.array_equal(walks[0], walks[2]))
+
+    def test_without_shared_memory(self):
+        # as on Python 3.7, where the processes get copies of the graph instead
+        walks = []
+        for processes in (1, 2):
+            npy = os.path.join(self.tempdir, 'walks%d.npy' % processes)
+            with mock.patch('kg_microbe.utils.walk_utils.SharedMemory', None):
+                write_walks(self.graph, npy, walk_length=10, walks_per_node=2,
+                            processes=processes, batch_walks=8)
+            walks.append(np.load(npy))
+        np.testing.assert_array_equal(walks[0], walks[1])